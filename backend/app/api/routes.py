@@ -1,7 +1,9 @@
 """
 API路由定义
 """
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Header, Response, WebSocket
 from app.models.requests import (
     CreateAvatarRequest,
     GenerateSituationRequest,
@@ -9,6 +11,7 @@ from app.models.requests import (
     AutoDecisionRequest,
     SessionStartRequest,
     SessionAdvanceRequest,
+    WorldTickRequest,
     SessionFinishRequest,
     AIChatRequest,
 )
@@ -19,9 +22,9 @@ from app.models.auth import (
     DeleteAccountRequest, DeleteUserRequest
 )
 from app.services.game_service import GameService
+from app.services.executors import offload_db, offload_cpu, run_db, run_cpu, get_executor_stats
 import sys
 import os
-import requests
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 from core.systems.asset_manager import AssetManager
 
@@ -29,6 +32,17 @@ router = APIRouter()
 game_service = GameService()
 asset_manager = AssetManager()
 
+@router.on_event("shutdown")
+def flush_session_cache():
+    """进程退出前把常驻的 AI 化身写回数据库"""
+    game_service.game_sessions.flush()
+
+@router.on_event("shutdown")
+async def close_llm_clients():
+    """关闭 LLM 异步客户端的连接池"""
+    from core.ai.llm_transport import aclose_transports
+    await aclose_transports()
+
 # 管理员密钥（生产环境应该从环境变量读取）
 ADMIN_KEY = os.environ.get('ADMIN_KEY', 'echopolis_admin_2024')
 
@@ -41,10 +55,11 @@ async def get_fate_wheel():
     return game_service.get_fate_wheel()
 
 @router.post("/create-avatar")
-async def create_avatar(request: CreateAvatarRequest):
+@offload_db
+def create_avatar(request: CreateAvatarRequest):
     try:
         print(f"Creating avatar: name={request.name}, mbti={request.mbti}, session_id={request.session_id}")
-        result = await game_service.create_avatar(request.name, request.mbti, request.session_id)
+        result = game_service.create_avatar(request.name, request.mbti, request.session_id)
         print(f"Avatar created successfully: {result}")
         return {"success": True, "avatar": result}
     except Exception as e:
@@ -75,7 +90,8 @@ async def auto_decision(request: AutoDecisionRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/login")
-async def login(request: LoginRequest):
+@offload_db
+def login(request: LoginRequest):
     try:
         success = game_service.verify_account(request.username, request.password)
         if success:
@@ -86,7 +102,8 @@ async def login(request: LoginRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/register")
-async def register(request: RegisterRequest):
+@offload_db
+def register(request: RegisterRequest):
     try:
         print(f"[注册] 用户名: {request.username}")
         if not game_service.db:
@@ -107,21 +124,24 @@ async def register(request: RegisterRequest):
         return AuthResponse(success=False, message=f"注册失败: {str(e)}")
 
 @router.get("/investments/{username}")
-async def get_investments(username: str):
+@offload_db
+def get_investments(username: str):
     try:
         return game_service.get_user_investments(username)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/transactions/{username}")
-async def get_transactions(username: str, limit: int = 10):
+@offload_db
+def get_transactions(username: str, limit: int = 10):
     try:
         return game_service.get_user_transactions(username, limit)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/user/{username}")
-async def get_user_info(username: str):
+@offload_db
+def get_user_info(username: str):
     try:
         user_info = game_service.get_user_info(username)
         if user_info:
@@ -133,7 +153,8 @@ async def get_user_info(username: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/avatar/status")
-async def get_avatar_status(session_id: str = None):
+@offload_db
+def get_avatar_status(session_id: str = None):
     try:
         print(f"[Avatar Status] 收到session_id: {session_id}")
         
@@ -152,13 +173,10 @@ async def get_avatar_status(session_id: str = None):
             raise Exception("数据库未初始化")
         
         # 从数据库获取角色数据
-        import sqlite3
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             # 检查列是否存在
-            cursor.execute("PRAGMA table_info(users)")
-            columns = [col[1] for col in cursor.fetchall()]
-            has_stats = 'happiness' in columns
+            has_stats = game_service.db.has_column('users', 'happiness')
             
             if has_stats:
                 cursor.execute('''
@@ -224,7 +242,8 @@ async def get_avatar_status(session_id: str = None):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/investments")
-async def get_investments(session_id: str = None):
+@offload_db
+def get_investments(session_id: str = None):
     try:
         print(f"[投资列表] session_id: {session_id}")
         
@@ -232,8 +251,7 @@ async def get_investments(session_id: str = None):
             return []
         
         # 从数据库获取投资
-        import sqlite3
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT username FROM users WHERE session_id = ?
@@ -284,6 +302,12 @@ async def ai_chat(request: AIChatRequest):
     try:
         if not request.message:
             raise HTTPException(status_code=400, detail="message required")
+        if request.stream:
+            from app.services.streaming import sse_response
+            return sse_response(
+                game_service.ai_chat_stream(request.message, session_id=request.session_id),
+                lambda text: {"response": text, "reflection": "数据流分析完成", "monologue": "记录人类交互样本"}
+            )
         return await game_service.ai_chat(request.message, session_id=request.session_id)
     except HTTPException:
         raise
@@ -291,14 +315,14 @@ async def ai_chat(request: AIChatRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/characters/{username}")
-async def get_characters(username: str):
+@offload_db
+def get_characters(username: str):
     try:
         if not game_service.db:
             return []
         
         # 从数据库获取用户的所有角色
-        import sqlite3
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT session_id, name, mbti, credits FROM users WHERE username = ?
@@ -320,7 +344,8 @@ async def get_characters(username: str):
         return []
 
 @router.post("/characters/create")
-async def create_character(data: dict):
+@offload_db
+def create_character(data: dict):
     try:
         username = data.get("username")
         name = data.get("name")
@@ -373,7 +398,8 @@ async def create_character(data: dict):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.delete("/characters/session/{session_id}")
-async def delete_character(session_id: str):
+@offload_db
+def delete_character(session_id: str):
     try:
         print(f"Deleting character: {session_id}")
         success = game_service.delete_character(session_id)
@@ -409,20 +435,67 @@ async def make_ai_decision(session_id: str, name: str, mbti: str, cash: int, sit
             "player_echo": None
         }
         
-        result = engine.make_decision(context)
+        result = await engine.make_decision_async(context)
         print(f"[AI决策] 结果: {result}")
         return result
     except Exception as e:
         print(f"[AI决策] 失败: {e}")
         return None
 
+def _settle_time_advance(session_id: str, new_cash: int, monthly_income: int) -> int:
+    """时间推进的数据库结算：入账月收入、推进投资并结算到期收益，返回新现金"""
+    with game_service.db.connect() as conn:
+        cursor = conn.cursor()
+        # 更新现金
+        cursor.execute('''
+            UPDATE users SET credits = ? WHERE id = ?
+        ''', (new_cash, session_id))
+        
+        # 更新投资的剩余月数
+        cursor.execute('''
+            UPDATE investments 
+            SET remaining_months = remaining_months - 1
+            WHERE session_id = ? AND remaining_months > 0
+        ''', (session_id,))
+        
+        # 处理到期投资（将收益加到现金）
+        cursor.execute('''
+            SELECT id, name, amount, return_rate, monthly_return
+            FROM investments
+            WHERE session_id = ? AND remaining_months = 0
+        ''', (session_id,))
+        
+        matured_investments = cursor.fetchall()
+        total_matured_return = 0
+        
+        for inv in matured_investments:
+            inv_id, inv_name, inv_amount, return_rate, monthly_ret = inv
+            # 计算收益
+            if monthly_ret > 0:
+                # 月收益型，返还本金
+                total_return = inv_amount
+            else:
+                # 一次性收益型
+                total_return = int(inv_amount * (1 + return_rate))
+        
+            total_matured_return += total_return
+            print(f"[投资到期] {inv_name}: 本金{inv_amount}, 收益{total_return}")
+        
+        # 将到期收益加到现金
+        if total_matured_return > 0:
+            new_cash += total_matured_return
+            cursor.execute('''
+                UPDATE users SET credits = ? WHERE id = ?
+            ''', (new_cash, session_id))
+        
+        conn.commit()
+        print(f"[时间推进] 月收入: {monthly_income}, 到期收益: {total_matured_return}, 新现金: {new_cash}")
+    return new_cash
+
 @router.post("/time/advance")
 async def advance_time(data: dict):
     try:
         from core.ai.deepseek_engine import DeepSeekEngine
-        from core.systems.market_engine import market_engine
-        import json
-        import os
         
         session_id = data.get('session_id')
         name = data.get('name', '用户')
@@ -432,19 +505,20 @@ async def advance_time(data: dict):
         
         print(f"[时间推进] 角色: {name} ({mbti}), 现金: {cash}, 总资产: {total_assets}")
         
-        # ============ 推进股票市场 ============
+        # ============ 股票市场：读取世界时间线上本会话下个月的月报 ============
         market_report = None
         try:
-            market_report = market_engine.advance_month_with_report("expansion")
+            from core.systems.market_timeline import market_timeline
+            month = market_timeline.world_month
+            if game_service.db and session_id:
+                month = await run_db(game_service.db.get_session_month, session_id)
+            market_report = await run_cpu(market_timeline.report_for, month + 1, "expansion")
             print(f"[时间推进] 股票市场已更新: 指数变化={market_report.get('index_change')}%")
         except Exception as e:
             print(f"[时间推进] 股票市场更新失败: {e}")
         
-        # 加载API key
-        config_path = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'config.json')
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            api_key = config.get('deepseek_api_key')
+        # 复用服务的 AI 引擎（共享连接池）
+        engine = game_service.ai_engine or DeepSeekEngine()
         
         # 计算月收入（简化版）
         monthly_income = int(total_assets * 0.005)  # 假设0.5%月收益
@@ -472,26 +546,19 @@ async def advance_time(data: dict):
         print(f"[时间推进] 传递给AI: 现金={cash:,}, 总资产={total_assets:,}, 月收入={monthly_income:,}")
         
         print(f"[时间推进] 调用DeepSeek API...")
-        response = requests.post(
-            "https://api.deepseek.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "deepseek-chat",
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.8,
-                "max_tokens": 300
-            },
-            timeout=30
-        )
-        print(f"[时间推进] API响应: {response.status_code}")
+        try:
+            ai_text = await engine.complete_async(
+                [{"role": "user", "content": prompt}],
+                cache_namespace="time_advance",
+                persona_name=name,
+                temperature=0.8,
+                max_tokens=300
+            )
+        except Exception as e:
+            print(f"[时间推进] API调用失败: {e}")
+            ai_text = None
         
-        if response.status_code == 200:
-            result = response.json()
-            ai_text = result["choices"][0]["message"]["content"]
-            
+        if ai_text:
             # 解析情况
             lines = ai_text.split('\n')
             situation = ""
@@ -510,53 +577,7 @@ async def advance_time(data: dict):
             # 更新数据库中的资产（添加月收入）
             new_cash = cash + monthly_income
             if game_service.db and session_id:
-                import sqlite3
-                with sqlite3.connect(game_service.db.db_path) as conn:
-                    cursor = conn.cursor()
-                    # 更新现金
-                    cursor.execute('''
-                        UPDATE users SET credits = ? WHERE id = ?
-                    ''', (new_cash, session_id))
-                    
-                    # 更新投资的剩余月数
-                    cursor.execute('''
-                        UPDATE investments 
-                        SET remaining_months = remaining_months - 1
-                        WHERE session_id = ? AND remaining_months > 0
-                    ''', (session_id,))
-                    
-                    # 处理到期投资（将收益加到现金）
-                    cursor.execute('''
-                        SELECT id, name, amount, return_rate, monthly_return
-                        FROM investments
-                        WHERE session_id = ? AND remaining_months = 0
-                    ''', (session_id,))
-                    
-                    matured_investments = cursor.fetchall()
-                    total_matured_return = 0
-                    
-                    for inv in matured_investments:
-                        inv_id, inv_name, inv_amount, return_rate, monthly_ret = inv
-                        # 计算收益
-                        if monthly_ret > 0:
-                            # 月收益型，返还本金
-                            total_return = inv_amount
-                        else:
-                            # 一次性收益型
-                            total_return = int(inv_amount * (1 + return_rate))
-                        
-                        total_matured_return += total_return
-                        print(f"[投资到期] {inv_name}: 本金{inv_amount}, 收益{total_return}")
-                    
-                    # 将到期收益加到现金
-                    if total_matured_return > 0:
-                        new_cash += total_matured_return
-                        cursor.execute('''
-                            UPDATE users SET credits = ? WHERE id = ?
-                        ''', (new_cash, session_id))
-                    
-                    conn.commit()
-                    print(f"[时间推进] 月收入: {monthly_income}, 到期收益: {total_matured_return}, 新现金: {new_cash}")
+                new_cash = await run_db(_settle_time_advance, session_id, new_cash, monthly_income)
             
             return {
                 "success": True,
@@ -642,14 +663,13 @@ async def ai_invest(data: dict):
             "player_echo": None
         }
         
-        result = engine.make_decision(context)
+        result = await engine.make_decision_async(context)
         print(f"[AI投资] 决策结果: {result}")
         
         # 如果有投资，保存到数据库
         if result.get('investment'):
             inv = result['investment']
-            import sqlite3
-            with sqlite3.connect(game_service.db.db_path) as conn:
+            with game_service.db.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('SELECT username FROM users WHERE id = ?', (session_id,))
                 user_row = cursor.fetchone()
@@ -698,7 +718,8 @@ async def ai_invest(data: dict):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/world/action")
-async def world_action(action: dict):
+@offload_db
+def world_action(action: dict):
     try:
         action_name = action.get("action_name")
         action_type = action.get("action")
@@ -710,14 +731,11 @@ async def world_action(action: dict):
             raise HTTPException(status_code=400, detail="session_id required")
         
         # 从数据库获取用户信息
-        import sqlite3
-        conn = sqlite3.connect(game_service.db.db_path, timeout=10.0)
+        conn = game_service.db.connect()
         try:
             cursor = conn.cursor()
             # 检查列是否存在
-            cursor.execute("PRAGMA table_info(users)")
-            columns = [col[1] for col in cursor.fetchall()]
-            has_stats = 'happiness' in columns
+            has_stats = game_service.db.has_column('users', 'happiness')
             
             if has_stats:
                 cursor.execute('SELECT credits, username, happiness, energy, health FROM users WHERE id = ?', (session_id,))
@@ -758,7 +776,7 @@ async def world_action(action: dict):
         ai_message = ""
         message = f"成功执行: {action_name}"
         
-        conn = sqlite3.connect(game_service.db.db_path, timeout=10.0)
+        conn = game_service.db.connect()
         try:
             cursor = conn.cursor()
             
@@ -920,40 +938,57 @@ async def world_action(action: dict):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/session/start")
-async def session_start(req: SessionStartRequest):
+@offload_db
+def session_start(req: SessionStartRequest):
     """统一的会话启动接口：创建角色+会话+首月快照"""
     try:
-      return game_service.start_session(req.username, req.name, req.mbti)
+      return game_service.start_session(req.username, req.name, req.mbti, seed=req.seed)
     except Exception as e:
       raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/session/state")
-async def session_state(session_id: str):
+@offload_db
+def session_state(session_id: str):
     try:
       return game_service.get_session_state(session_id)
     except Exception as e:
       raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/session/advance")
-async def session_advance(req: SessionAdvanceRequest):
+@offload_db
+def session_advance(req: SessionAdvanceRequest):
     try:
       print(f"[API] session_advance called for {req.session_id}")
-      result = game_service.advance_session(req.session_id, req.echo_text)
+      result = game_service.advance_session(req.session_id, req.echo_text, months=req.months)
       print(f"[API] session_advance success: month={result.get('new_month')}")
       return result
     except Exception as e:
       print(f"[session_advance] error: {e}")
       raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/world/tick")
+@offload_db
+def world_tick_advance(req: WorldTickRequest):
+    """批量推进：把选中的会话（默认全部）各推进一个月，宏观与市场整批共用，返回吞吐（会话/秒）"""
+    from app.services.world_tick import world_tick, TICK_WORKERS
+    try:
+        return world_tick.run(session_ids=req.session_ids, idle_minutes=req.idle_minutes, limit=req.limit,
+                              workers=TICK_WORKERS if req.workers is None else req.workers)
+    except Exception as e:
+        print(f"[world_tick] error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/session/finish")
-async def session_finish(req: SessionFinishRequest):
+@offload_db
+def session_finish(req: SessionFinishRequest):
     try:
       return game_service.finish_session(req.session_id)
     except Exception as e:
       raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/session/timeline")
-async def session_timeline(session_id: str, limit: int = 36):
+@offload_db
+def session_timeline(session_id: str, limit: int = 36):
     try:
       if not game_service.db:
         raise Exception("数据库未初始化")
@@ -962,14 +997,16 @@ async def session_timeline(session_id: str, limit: int = 36):
       raise HTTPException(status_code=400, detail=str(e))
 
 @router.get('/city/state')
-async def city_state(session_id: str):
+@offload_db
+def city_state(session_id: str):
     try:
         return game_service.get_city_snapshot(session_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post('/city/district/{district_id}')
-async def city_district_event(district_id: str, payload: dict):
+@offload_db
+def city_district_event(district_id: str, payload: dict):
     session_id = payload.get('session_id')
     if not session_id:
         raise HTTPException(status_code=400, detail='session_id required')
@@ -979,14 +1016,16 @@ async def city_district_event(district_id: str, payload: dict):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/macro/indicators")
-async def get_macro_indicators():
+@offload_db
+def get_macro_indicators():
     try:
         return game_service.get_macro_indicators()
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/decide")
-async def make_decision(request: dict):
+@offload_db
+def make_decision(request: dict):
     try:
         session_id = request.get("session_id")
         option_index = request.get("option_index")
@@ -1007,7 +1046,8 @@ async def make_decision(request: dict):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/session/transactions")
-async def get_session_transactions(session_id: str, limit: int = 20):
+@offload_db
+def get_session_transactions(session_id: str, limit: int = 20):
     try:
         return game_service.get_session_transactions(session_id, limit)
     except Exception as e:
@@ -1030,8 +1070,8 @@ def _aggregate_kline_weekly(daily_data: list) -> list:
         date_str = d.get("date", "")
         try:
             date = datetime.strptime(date_str, "%Y-%m-%d")
-            week_num = date.isocalendar()[1]
-            year = date.year
+            # ISO 周所属的年份可能与自然年不同（跨年的那一周）
+            year, week_num, _ = date.isocalendar()
             week_key = f"{year}-{week_num}"
         except:
             continue
@@ -1117,57 +1157,41 @@ def _aggregate_kline_monthly(daily_data: list) -> list:
     return monthly
 
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否命中当前 ETag"""
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+def _snapshot_response(kind: str, if_none_match: Optional[str]) -> Response:
+    """由行情快照板的当前快照生成响应：ETag 命中返回 304，否则返回缓存的 JSON 编码"""
+    from core.systems.market_engine import market_engine
+    snapshot = market_engine.quote_board.snapshot
+    etag = snapshot.etag(kind)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.encode(kind), media_type="application/json", headers=headers)
+
+
 @router.get("/market/stocks")
-async def get_market_stocks():
-    """获取所有股票列表及当前价格 - 从数据库获取真实数据"""
+@offload_db
+def get_market_stocks(format: str = "full", if_none_match: Optional[str] = Header(None)):
+    """
+    获取所有股票列表及当前价格 - 读取行情引擎每次推进后发布的报价快照（纯内存，不查询数据库）
+    format=compact 时返回 {fields, rows} 的数组格式；响应带 ETag，数据未变化时返回 304
+    """
+    if format not in ("full", "compact"):
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {format}")
     try:
-        from core.systems.longbridge_client import longbridge_client, STOCK_MAPPING
-        from core.systems.market_engine import market_engine
-        
-        stocks = []
-        for game_code, mapping in STOCK_MAPPING.items():
-            real_symbol = mapping[0]
-            real_name = mapping[3] if len(mapping) > 3 else real_symbol
-            
-            # 从数据库获取最新K线数据来计算价格
-            kline = longbridge_client.get_kline_from_db(game_code, 2)
-            
-            if kline and len(kline) > 0:
-                latest = kline[-1]
-                prev = kline[-2] if len(kline) > 1 else latest
-                price = latest.get("close", 0)
-                change_pct = ((price - prev.get("close", price)) / prev.get("close", price) * 100) if prev.get("close", 0) > 0 else 0
-            else:
-                # 如果没有数据库数据，使用 market_engine 的数据
-                quote = market_engine.get_stock_quote(game_code)
-                if quote:
-                    price = quote.get("price", 0)
-                    change_pct = quote.get("change_pct", 0)
-                else:
-                    continue
-            
-            # 获取股票基础信息
-            stock_info = market_engine.stocks.get(game_code)
-            
-            stocks.append({
-                "code": game_code,
-                "name": stock_info.name if stock_info else game_code,
-                "real_name": real_name,
-                "real_symbol": real_symbol,
-                "sector": stock_info.sector.value if stock_info else "其他",
-                "price": round(price, 2),
-                "change_pct": round(change_pct, 2),
-                "pe_ratio": stock_info.pe_ratio if stock_info else 0,
-                "dividend_yield": stock_info.dividend_yield * 100 if stock_info else 0,
-                "description": stock_info.description if stock_info else ""
-            })
-        
-        return {"success": True, "stocks": stocks}
+        return _snapshot_response("stocks" if format == "full" else "compact", if_none_match)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/market/stock/{stock_id}")
-async def get_stock_detail(stock_id: str, days: int = 30):
+@offload_db
+def get_stock_detail(stock_id: str, days: int = 30):
     """获取单只股票详情和K线数据"""
     try:
         from core.systems.market_engine import market_engine
@@ -1182,62 +1206,68 @@ async def get_stock_detail(stock_id: str, days: int = 30):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/market/state")
-async def get_market_state():
-    """获取市场整体状态"""
+@offload_db
+def get_market_state(if_none_match: Optional[str] = Header(None)):
+    """获取市场整体状态（读取报价快照中的市场概览，带 ETag）"""
     try:
-        from core.systems.market_engine import market_engine
-        state = market_engine.get_market_overview()
-        return {"success": True, "state": state}
+        return _snapshot_response("state", if_none_match)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+KLINE_PERIOD_BARS = {"day": 60, "week": 52, "month": 24, "quarter": 12}  # 各周期返回的K线根数
+
+
 @router.get("/market/kline/{stock_id}")
-async def get_stock_kline(stock_id: str, period: str = "day"):
-    """获取股票K线数据 - 从 stock.db 数据库读取真实数据"""
+@offload_db
+def get_stock_kline(stock_id: str, response: Response, period: str = "day",
+                    if_none_match: Optional[str] = Header(None)):
+    """
+    获取股票K线数据：日K取自行情引擎的列式存储，周K/月K/季K取自随日K增量维护的K线金字塔。
+    响应带 ETag（数据版本），客户端携带 If-None-Match 且数据未变化时返回 304。
+    """
     try:
         from core.systems.market_engine import market_engine
         from core.systems.longbridge_client import longbridge_client
         
-        # 获取当前股票信息
-        stock = market_engine.get_stock_quote(stock_id)
-        if not stock:
+        if stock_id not in market_engine.stocks:
             raise HTTPException(status_code=404, detail="股票不存在")
-        
-        # 从数据库获取K线数据
-        days = 60 if period == "day" else (52 if period == "week" else 24)
-        kline_data = longbridge_client.get_kline_from_db(stock_id, days * 5)  # 获取更多数据用于周K/月K聚合
-        
-        if not kline_data or len(kline_data) == 0:
-            # 如果数据库没有数据，尝试从 API 获取
-            kline_data = longbridge_client.get_game_stock_kline(stock_id, days, force_refresh=True)
+        if period not in KLINE_PERIOD_BARS:
+            raise HTTPException(status_code=400, detail=f"不支持的K线周期: {period}")
+        
+        days = KLINE_PERIOD_BARS[period]
+        etag = f'W/"{stock_id}-{period}-{market_engine.kline_store.version}"'
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        
+        kline_data = market_engine.get_stock_kline(stock_id, days, period)
+        if kline_data:
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = "no-cache"
+        else:
+            # 行情引擎中没有该股票的数据：沿用从数据库/API 获取日K并现场聚合的方式（不带 ETag）
+            kline_data = longbridge_client.get_kline_from_db(stock_id, days * 5)
+            if not kline_data:
+                kline_data = longbridge_client.get_game_stock_kline(stock_id, days, force_refresh=True)
+            if period == "week":
+                kline_data = _aggregate_kline_weekly(kline_data or [])
+            elif period in ("month", "quarter"):
+                kline_data = _aggregate_kline_monthly(kline_data or [])
         
         if not kline_data:
             raise HTTPException(status_code=404, detail="K线数据不存在")
         
-        # 根据周期聚合数据
-        if period == "week":
-            kline_data = _aggregate_kline_weekly(kline_data)
-        elif period == "month":
-            kline_data = _aggregate_kline_monthly(kline_data)
-        
         # 格式化日期显示
         formatted_kline = []
         for k in kline_data[-days:]:  # 只取最近的数据
             date_str = k.get("date", "")
-            if period == "day":
-                # 日K: 显示 MM/DD
-                if len(date_str) >= 10:
-                    formatted_date = f"{date_str[5:7]}/{date_str[8:10]}"
-                else:
-                    formatted_date = date_str
-            elif period == "week":
-                # 周K: 显示 MM/DD
+            if period in ("day", "week"):
+                # 日K/周K: 显示 MM/DD
                 if len(date_str) >= 10:
                     formatted_date = f"{date_str[5:7]}/{date_str[8:10]}"
                 else:
                     formatted_date = date_str
             else:
-                # 月K: 显示 YYYY/MM
+                # 月K/季K: 显示 YYYY/MM
                 if len(date_str) >= 7:
                     formatted_date = f"{date_str[0:4]}/{date_str[5:7]}"
                 else:
@@ -1258,8 +1288,29 @@ async def get_stock_kline(stock_id: str, period: str = "day"):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/market/indicators/{stock_id}")
+@offload_db
+def get_stock_indicators(stock_id: str):
+    """获取股票技术指标：MA5/10/20/60、RSI、MACD、布林带（服务端增量计算，前端无需自行计算）"""
+    try:
+        from core.systems.market_engine import market_engine
+        indicators = market_engine.get_indicators(stock_id)
+        if indicators is None:
+            raise HTTPException(status_code=404, detail="股票不存在")
+        return {
+            "success": True,
+            "code": stock_id,
+            "price": round(market_engine.current_prices.get(stock_id, 0), 2),
+            "indicators": indicators
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/market/simulate")
-async def simulate_market_day():
+@offload_cpu
+def simulate_market_day():
     """模拟一天的市场变化（供测试用）"""
     try:
         from core.systems.market_engine import market_engine
@@ -1269,7 +1320,8 @@ async def simulate_market_day():
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/stock/buy")
-async def buy_stock(data: dict):
+@offload_db
+def buy_stock(data: dict):
     """买入股票"""
     try:
         from core.systems.market_engine import market_engine
@@ -1289,8 +1341,7 @@ async def buy_stock(data: dict):
         total_cost = int(price * shares)
         
         # 检查现金
-        import sqlite3
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT credits, username FROM users WHERE session_id = ?', (session_id,))
             row = cursor.fetchone()
@@ -1364,40 +1415,25 @@ async def buy_stock(data: dict):
         # 检查成就解锁（首次买股票）
         unlocked_achievements = []
         try:
-            from core.systems.achievement_system import achievement_system
+            from core.systems.session_state import session_state
+            with session_state.scope(session_id) as scope:
+                achievements = scope.instance("achievements")
             
-            # 获取已解锁成就
-            with sqlite3.connect(game_service.db.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT achievement_id, unlocked_month FROM achievements_unlocked WHERE session_id = ?', (session_id,))
-                unlocked_rows = cursor.fetchall()
-                unlocked_list = [{"achievement_id": r[0], "unlocked_month": r[1]} for r in unlocked_rows]
+                # 获取已解锁成就
+                with game_service.db.connect() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('SELECT achievement_id, unlocked_month FROM achievements_unlocked WHERE session_id = ?', (session_id,))
+                    unlocked_rows = cursor.fetchall()
+                    unlocked_list = [{"achievement_id": r[0], "unlocked_month": r[1]} for r in unlocked_rows]
             
-            # 加载已解锁成就到系统
-            achievement_system.load_unlocked_from_list(unlocked_list)
+                # 加载已解锁成就到系统
+                achievements.load_unlocked_from_list(unlocked_list)
             
-            # 检查首次买股票成就
-            first_stock_result = achievement_system.record_first_action("stock_buy", current_month)
-            if first_stock_result:
-                ach = first_stock_result["achievement"]
-                rewards = first_stock_result["rewards"]
-                game_service.db.save_achievement_unlock(session_id, {
-                    "achievement_id": ach["id"],
-                    "achievement_name": ach["name"],
-                    "rarity": ach["rarity"],
-                    "reward_coins": rewards["coins"],
-                    "reward_exp": rewards["exp"],
-                    "reward_title": rewards.get("title"),
-                    "unlocked_month": current_month
-                })
-                unlocked_achievements.append(first_stock_result)
-                
-            # 如果是第一个月投资，还有早起鸟儿成就
-            if current_month <= 1:
-                early_bird_result = achievement_system.record_special_event("early_invest", current_month)
-                if early_bird_result:
-                    ach = early_bird_result["achievement"]
-                    rewards = early_bird_result["rewards"]
+                # 检查首次买股票成就
+                first_stock_result = achievements.record_first_action("stock_buy", current_month)
+                if first_stock_result:
+                    ach = first_stock_result["achievement"]
+                    rewards = first_stock_result["rewards"]
                     game_service.db.save_achievement_unlock(session_id, {
                         "achievement_id": ach["id"],
                         "achievement_name": ach["name"],
@@ -1407,7 +1443,24 @@ async def buy_stock(data: dict):
                         "reward_title": rewards.get("title"),
                         "unlocked_month": current_month
                     })
-                    unlocked_achievements.append(early_bird_result)
+                    unlocked_achievements.append(first_stock_result)
+                
+                # 如果是第一个月投资，还有早起鸟儿成就
+                if current_month <= 1:
+                    early_bird_result = achievements.record_special_event("early_invest", current_month)
+                    if early_bird_result:
+                        ach = early_bird_result["achievement"]
+                        rewards = early_bird_result["rewards"]
+                        game_service.db.save_achievement_unlock(session_id, {
+                            "achievement_id": ach["id"],
+                            "achievement_name": ach["name"],
+                            "rarity": ach["rarity"],
+                            "reward_coins": rewards["coins"],
+                            "reward_exp": rewards["exp"],
+                            "reward_title": rewards.get("title"),
+                            "unlocked_month": current_month
+                        })
+                        unlocked_achievements.append(early_bird_result)
         except Exception as e:
             print(f"[Achievement] Failed to check achievements: {e}")
         
@@ -1425,7 +1478,8 @@ async def buy_stock(data: dict):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/stock/sell")
-async def sell_stock(data: dict):
+@offload_db
+def sell_stock(data: dict):
     """卖出股票"""
     try:
         from core.systems.market_engine import market_engine
@@ -1442,8 +1496,7 @@ async def sell_stock(data: dict):
         
         price = stock["price"]
         
-        import sqlite3
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             
             # 检查持仓
@@ -1528,7 +1581,8 @@ async def sell_stock(data: dict):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/stock/holdings")
-async def get_stock_holdings(session_id: str):
+@offload_db
+def get_stock_holdings(session_id: str):
     """获取股票持仓"""
     try:
         from core.systems.market_engine import market_engine
@@ -1566,7 +1620,8 @@ async def get_stock_holdings(session_id: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/stock/transactions")
-async def get_stock_transactions(session_id: str, limit: int = 50):
+@offload_db
+def get_stock_transactions(session_id: str, limit: int = 50):
     """获取股票交易历史"""
     try:
         transactions = game_service.db.get_stock_transactions(session_id, limit)
@@ -1611,6 +1666,40 @@ async def get_products_by_category(category: str):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/products/compare")
+@offload_cpu
+def compare_financial_products(data: dict):
+    """
+    金融产品蒙特卡洛对比：同一金额分别投入各产品，返回分位带、VaR/CVaR、爆仓概率
+    可选 portfolio（产品ID -> 金额）同时返回组合情景
+    """
+    try:
+        from core.systems.financial_products import product_library
+        product_ids = data.get("product_ids") or []
+        portfolio = data.get("portfolio") or {}
+        if not product_ids and not portfolio:
+            raise HTTPException(status_code=400, detail="请提供 product_ids 或 portfolio")
+        amount = int(data.get("amount", 100000))
+        months = int(data.get("months", 12))
+        paths = int(data.get("paths", 5000))
+        seed = data.get("seed")
+        market_modifier = float(data.get("market_modifier", 0))
+        if amount <= 0:
+            raise HTTPException(status_code=400, detail="投资金额必须大于0")
+
+        result = {"success": True, "months": months, "paths": paths}
+        if product_ids:
+            result["products"] = product_library.compare_products(
+                product_ids, amount, months, paths, seed, market_modifier)
+        if portfolio:
+            result["portfolio"] = product_library.simulate_scenarios(
+                {pid: int(value) for pid, value in portfolio.items()}, months, paths, seed, market_modifier)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
 # ============ 贷款系统 API ============
 
@@ -1625,10 +1714,11 @@ async def get_loan_products():
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/loans/apply")
-async def apply_loan(data: dict):
+@offload_db
+def apply_loan(data: dict):
     """申请贷款"""
     try:
-        from core.systems.debt_system import debt_system
+        from core.systems.session_state import session_state
         session_id = data.get("session_id")
         product_id = data.get("product_id")
         amount = data.get("amount", 0)
@@ -1641,7 +1731,8 @@ async def apply_loan(data: dict):
         credit_score = game_service.db.get_latest_credit_score(session_id)
         current_month = game_service.db.get_session_month(session_id)
         
-        success, result = debt_system.apply_loan(product_id, amount, term_months, credit_score, current_month)
+        with session_state.scope(session_id) as scope:
+            success, result = scope.instance("debt").apply_loan(product_id, amount, term_months, credit_score, current_month)
         
         if success:
             loan = result
@@ -1661,8 +1752,7 @@ async def apply_loan(data: dict):
             })
             
             # 增加现金
-            import sqlite3
-            with sqlite3.connect(game_service.db.db_path) as conn:
+            with game_service.db.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('SELECT credits FROM users WHERE session_id = ?', (session_id,))
                 cash = cursor.fetchone()[0]
@@ -1690,33 +1780,35 @@ async def apply_loan(data: dict):
             # 检查成就解锁（首次贷款）
             unlocked_achievements = []
             try:
-                from core.systems.achievement_system import achievement_system
+                from core.systems.session_state import session_state
+                with session_state.scope(session_id) as scope:
+                    achievements = scope.instance("achievements")
                 
-                # 获取已解锁成就
-                with sqlite3.connect(game_service.db.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute('SELECT achievement_id, unlocked_month FROM achievements_unlocked WHERE session_id = ?', (session_id,))
-                    unlocked_rows = cursor.fetchall()
-                    unlocked_list = [{"achievement_id": r[0], "unlocked_month": r[1]} for r in unlocked_rows]
+                    # 获取已解锁成就
+                    with game_service.db.connect() as conn:
+                        cursor = conn.cursor()
+                        cursor.execute('SELECT achievement_id, unlocked_month FROM achievements_unlocked WHERE session_id = ?', (session_id,))
+                        unlocked_rows = cursor.fetchall()
+                        unlocked_list = [{"achievement_id": r[0], "unlocked_month": r[1]} for r in unlocked_rows]
                 
-                # 加载已解锁成就到系统
-                achievement_system.load_unlocked_from_list(unlocked_list)
+                    # 加载已解锁成就到系统
+                    achievements.load_unlocked_from_list(unlocked_list)
                 
-                # 检查首次贷款成就
-                first_loan_result = achievement_system.record_first_action("loan", current_month)
-                if first_loan_result:
-                    ach = first_loan_result["achievement"]
-                    rewards = first_loan_result["rewards"]
-                    game_service.db.save_achievement_unlock(session_id, {
-                        "achievement_id": ach["id"],
-                        "achievement_name": ach["name"],
-                        "rarity": ach["rarity"],
-                        "reward_coins": rewards["coins"],
-                        "reward_exp": rewards["exp"],
-                        "reward_title": rewards.get("title"),
-                        "unlocked_month": current_month
-                    })
-                    unlocked_achievements.append(first_loan_result)
+                    # 检查首次贷款成就
+                    first_loan_result = achievements.record_first_action("loan", current_month)
+                    if first_loan_result:
+                        ach = first_loan_result["achievement"]
+                        rewards = first_loan_result["rewards"]
+                        game_service.db.save_achievement_unlock(session_id, {
+                            "achievement_id": ach["id"],
+                            "achievement_name": ach["name"],
+                            "rarity": ach["rarity"],
+                            "reward_coins": rewards["coins"],
+                            "reward_exp": rewards["exp"],
+                            "reward_title": rewards.get("title"),
+                            "unlocked_month": current_month
+                        })
+                        unlocked_achievements.append(first_loan_result)
             except Exception as e:
                 print(f"[Achievement] Failed to check achievements: {e}")
             
@@ -1739,7 +1831,8 @@ async def apply_loan(data: dict):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/loans/active")
-async def get_active_loans(session_id: str):
+@offload_db
+def get_active_loans(session_id: str):
     """获取活跃贷款列表"""
     try:
         loans = game_service.db.get_loans(session_id, active_only=True)
@@ -1748,7 +1841,8 @@ async def get_active_loans(session_id: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/credit/score")
-async def get_credit_score(session_id: str):
+@offload_db
+def get_credit_score(session_id: str):
     """获取信用分"""
     try:
         score = game_service.db.get_latest_credit_score(session_id)
@@ -1784,10 +1878,11 @@ async def get_insurance_products():
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/insurance/purchase")
-async def purchase_insurance(data: dict):
+@offload_db
+def purchase_insurance(data: dict):
     """购买保险"""
     try:
-        from core.systems.insurance_system import insurance_system
+        from core.systems.session_state import session_state
         session_id = data.get("session_id")
         product_id = data.get("product_id")
         term_months = data.get("term_months", -1)
@@ -1796,9 +1891,10 @@ async def purchase_insurance(data: dict):
             raise HTTPException(status_code=400, detail="参数错误")
         
         current_month = game_service.db.get_session_month(session_id)
-        insurance_system.current_month = current_month
-        
-        success, result = insurance_system.purchase_insurance(product_id, term_months)
+        with session_state.scope(session_id) as scope:
+            insurance = scope.instance("insurance")
+            insurance.current_month = current_month
+            success, result = insurance.purchase_insurance(product_id, term_months)
         
         if success:
             policy = result
@@ -1836,34 +1932,35 @@ async def purchase_insurance(data: dict):
             # 检查成就解锁（首次购买保险）
             unlocked_achievements = []
             try:
-                from core.systems.achievement_system import achievement_system
-                import sqlite3
+                from core.systems.session_state import session_state
+                with session_state.scope(session_id) as scope:
+                    achievements = scope.instance("achievements")
                 
-                # 获取已解锁成就
-                with sqlite3.connect(game_service.db.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute('SELECT achievement_id, unlocked_month FROM achievements_unlocked WHERE session_id = ?', (session_id,))
-                    unlocked_rows = cursor.fetchall()
-                    unlocked_list = [{"achievement_id": r[0], "unlocked_month": r[1]} for r in unlocked_rows]
+                    # 获取已解锁成就
+                    with game_service.db.connect() as conn:
+                        cursor = conn.cursor()
+                        cursor.execute('SELECT achievement_id, unlocked_month FROM achievements_unlocked WHERE session_id = ?', (session_id,))
+                        unlocked_rows = cursor.fetchall()
+                        unlocked_list = [{"achievement_id": r[0], "unlocked_month": r[1]} for r in unlocked_rows]
                 
-                # 加载已解锁成就到系统
-                achievement_system.load_unlocked_from_list(unlocked_list)
+                    # 加载已解锁成就到系统
+                    achievements.load_unlocked_from_list(unlocked_list)
                 
-                # 检查首次保险成就
-                first_insurance_result = achievement_system.record_first_action("insurance", current_month)
-                if first_insurance_result:
-                    ach = first_insurance_result["achievement"]
-                    rewards = first_insurance_result["rewards"]
-                    game_service.db.save_achievement_unlock(session_id, {
-                        "achievement_id": ach["id"],
-                        "achievement_name": ach["name"],
-                        "rarity": ach["rarity"],
-                        "reward_coins": rewards["coins"],
-                        "reward_exp": rewards["exp"],
-                        "reward_title": rewards.get("title"),
-                        "unlocked_month": current_month
-                    })
-                    unlocked_achievements.append(first_insurance_result)
+                    # 检查首次保险成就
+                    first_insurance_result = achievements.record_first_action("insurance", current_month)
+                    if first_insurance_result:
+                        ach = first_insurance_result["achievement"]
+                        rewards = first_insurance_result["rewards"]
+                        game_service.db.save_achievement_unlock(session_id, {
+                            "achievement_id": ach["id"],
+                            "achievement_name": ach["name"],
+                            "rarity": ach["rarity"],
+                            "reward_coins": rewards["coins"],
+                            "reward_exp": rewards["exp"],
+                            "reward_title": rewards.get("title"),
+                            "unlocked_month": current_month
+                        })
+                        unlocked_achievements.append(first_insurance_result)
             except Exception as e:
                 print(f"[Achievement] Failed to check achievements: {e}")
             
@@ -1886,7 +1983,8 @@ async def purchase_insurance(data: dict):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/insurance/policies")
-async def get_insurance_policies(session_id: str):
+@offload_db
+def get_insurance_policies(session_id: str):
     """获取保险保单列表"""
     try:
         policies = game_service.db.get_insurance_policies(session_id)
@@ -1898,7 +1996,8 @@ async def get_insurance_policies(session_id: str):
 # ============ 成就系统 API ============
 
 @router.get("/achievements/all")
-async def get_all_achievements():
+@offload_cpu
+def get_all_achievements():
     """获取所有成就定义"""
     try:
         from core.systems.achievement_system import ACHIEVEMENTS
@@ -1922,7 +2021,8 @@ async def get_all_achievements():
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/achievements/unlocked")
-async def get_unlocked_achievements(session_id: str):
+@offload_db
+def get_unlocked_achievements(session_id: str):
     """获取已解锁成就"""
     try:
         achievements = game_service.db.get_unlocked_achievements(session_id)
@@ -1932,58 +2032,61 @@ async def get_unlocked_achievements(session_id: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/achievements/check")
-async def check_achievements(data: dict):
+@offload_db
+def check_achievements(data: dict):
     """检查并解锁成就"""
     try:
-        from core.systems.achievement_system import achievement_system
+        from core.systems.session_state import session_state
         session_id = data.get("session_id")
         
         if not session_id:
             raise HTTPException(status_code=400, detail="session_id required")
         
-        # 获取玩家状态
-        import sqlite3
-        with sqlite3.connect(game_service.db.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT credits FROM users WHERE session_id = ?', (session_id,))
-            row = cursor.fetchone()
-            if not row:
-                raise HTTPException(status_code=404, detail="用户不存在")
-            cash = row[0]
+        with session_state.scope(session_id) as scope:
+            achievements = scope.instance("achievements")
             
-            # 计算总资产
-            cursor.execute('SELECT SUM(amount) FROM investments WHERE session_id = ? AND remaining_months > 0', (session_id,))
-            invested = cursor.fetchone()[0] or 0
-            total_assets = cash + invested
+            # 获取玩家状态
+            with game_service.db.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT credits FROM users WHERE session_id = ?', (session_id,))
+                row = cursor.fetchone()
+                if not row:
+                    raise HTTPException(status_code=404, detail="用户不存在")
+                cash = row[0]
             
-            # 获取该用户已解锁的成就，避免重复解锁
-            cursor.execute('SELECT achievement_id, unlocked_month FROM achievements_unlocked WHERE session_id = ?', (session_id,))
-            unlocked_rows = cursor.fetchall()
-            unlocked_list = [{"achievement_id": r[0], "unlocked_month": r[1]} for r in unlocked_rows]
+                # 计算总资产
+                cursor.execute('SELECT SUM(amount) FROM investments WHERE session_id = ? AND remaining_months > 0', (session_id,))
+                invested = cursor.fetchone()[0] or 0
+                total_assets = cash + invested
+            
+                # 获取该用户已解锁的成就，避免重复解锁
+                cursor.execute('SELECT achievement_id, unlocked_month FROM achievements_unlocked WHERE session_id = ?', (session_id,))
+                unlocked_rows = cursor.fetchall()
+                unlocked_list = [{"achievement_id": r[0], "unlocked_month": r[1]} for r in unlocked_rows]
         
-        # 加载已解锁成就到系统内存
-        achievement_system.load_unlocked_from_list(unlocked_list)
+            # 加载已解锁成就到系统内存
+            achievements.load_unlocked_from_list(unlocked_list)
         
-        current_month = game_service.db.get_session_month(session_id)
+            current_month = game_service.db.get_session_month(session_id)
         
-        # 检查财富成就
-        unlocked = achievement_system.check_wealth_achievements(total_assets, current_month)
-        
-        # 保存解锁的成就
-        for unlock in unlocked:
-            ach = unlock["achievement"]
-            rewards = unlock["rewards"]
-            game_service.db.save_achievement_unlock(session_id, {
-                "achievement_id": ach["id"],
-                "achievement_name": ach["name"],
-                "rarity": ach["rarity"],
-                "reward_coins": rewards["coins"],
-                "reward_exp": rewards["exp"],
-                "reward_title": rewards.get("title"),
-                "unlocked_month": current_month
-            })
+            # 检查财富成就
+            unlocked = achievements.check_wealth_achievements(total_assets, current_month)
         
-        return {"success": True, "unlocked": unlocked}
+            # 保存解锁的成就
+            for unlock in unlocked:
+                ach = unlock["achievement"]
+                rewards = unlock["rewards"]
+                game_service.db.save_achievement_unlock(session_id, {
+                    "achievement_id": ach["id"],
+                    "achievement_name": ach["name"],
+                    "rarity": ach["rarity"],
+                    "reward_coins": rewards["coins"],
+                    "reward_exp": rewards["exp"],
+                    "reward_title": rewards.get("title"),
+                    "unlocked_month": current_month
+                })
+        
+            return {"success": True, "unlocked": unlocked}
     except HTTPException:
         raise
     except Exception as e:
@@ -1993,7 +2096,8 @@ async def check_achievements(data: dict):
 # ============ 现金流 API ============
 
 @router.get("/cashflow/summary")
-async def get_cashflow_summary(session_id: str):
+@offload_db
+def get_cashflow_summary(session_id: str):
     """获取现金流汇总"""
     try:
         history = game_service.db.get_cashflow_history(session_id, 12)
@@ -2005,7 +2109,8 @@ async def get_cashflow_summary(session_id: str):
 # ============ 宏观经济 API ============
 
 @router.get("/economy/state")
-async def get_economy_state():
+@offload_db
+def get_economy_state():
     """获取当前经济状态"""
     try:
         from core.systems.macro_economy import macro_economy
@@ -2027,7 +2132,8 @@ async def get_economy_state():
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/economy/advice")
-async def get_economy_advice():
+@offload_db
+def get_economy_advice():
     """获取投资建议"""
     try:
         from core.systems.macro_economy import macro_economy
@@ -2041,87 +2147,111 @@ async def get_economy_advice():
 # ==================== 职业系统路由 ====================
 
 @router.get("/career/jobs")
-async def get_available_jobs():
+@offload_db
+def get_available_jobs():
     """获取所有可用职位"""
     from core.systems.career_system import career_system
     return career_system.get_available_jobs()
 
 @router.get("/career/current/{session_id}")
-async def get_current_career(session_id: str):
+@offload_db
+def get_current_career(session_id: str):
     """获取玩家当前职业状态"""
     from core.systems.career_system import career_system
-    career_info = career_system.get_career_status(session_id)
+    from core.systems.session_state import session_state
+    with session_state.scope(session_id):
+        career_info = career_system.get_career_status(session_id)
     return {"success": True, "career": career_info}
 
 @router.post("/career/apply")
-async def apply_for_job(request: dict):
+@offload_db
+def apply_for_job(request: dict):
     """申请职位"""
     from core.systems.career_system import career_system
+    from core.systems.session_state import session_state
     session_id = request.get("session_id")
     job_id = request.get("job_id")
     player_skills = request.get("skills", {})
     
-    result = career_system.apply_for_job(session_id, job_id, player_skills)
+    with session_state.scope(session_id):
+        result = career_system.apply_for_job(session_id, job_id, player_skills)
     return result
 
 @router.post("/career/resign")
-async def resign_job(request: dict):
+@offload_db
+def resign_job(request: dict):
     """辞职"""
     from core.systems.career_system import career_system
+    from core.systems.session_state import session_state
     session_id = request.get("session_id")
-    result = career_system.resign(session_id)
+    with session_state.scope(session_id):
+        result = career_system.resign(session_id)
     return result
 
 @router.get("/career/skills")
-async def get_all_skills():
+@offload_db
+def get_all_skills():
     """获取所有可学习技能"""
     from core.systems.career_system import career_system
     return career_system.get_all_skills()
 
 @router.post("/career/learn-skill")
-async def learn_skill(request: dict):
+@offload_db
+def learn_skill(request: dict):
     """学习技能"""
     from core.systems.career_system import career_system
+    from core.systems.session_state import session_state
     session_id = request.get("session_id")
     skill_id = request.get("skill_id")
-    result = career_system.learn_skill(session_id, skill_id)
+    with session_state.scope(session_id):
+        result = career_system.learn_skill(session_id, skill_id)
     return result
 
 @router.get("/career/side-businesses")
-async def get_side_businesses():
+@offload_db
+def get_side_businesses():
     """获取可用的副业"""
     from core.systems.career_system import career_system
     return career_system.get_available_side_businesses()
 
 @router.post("/career/start-side-business")
-async def start_side_business(request: dict):
+@offload_db
+def start_side_business(request: dict):
     """开始副业"""
     from core.systems.career_system import career_system
+    from core.systems.session_state import session_state
     session_id = request.get("session_id")
     business_id = request.get("business_id")
-    result = career_system.start_side_business(session_id, business_id)
+    with session_state.scope(session_id):
+        result = career_system.start_side_business(session_id, business_id)
     return result
 
 @router.get("/career/salary/{session_id}")
-async def calculate_salary(session_id: str):
+@offload_db
+def calculate_salary(session_id: str):
     """计算当前薪资"""
     from core.systems.career_system import career_system
-    salary = career_system.calculate_monthly_salary(session_id)
+    from core.systems.session_state import session_state
+    with session_state.scope(session_id):
+        salary = career_system.calculate_monthly_salary(session_id)
     return {"success": True, "salary": salary}
 
 
 # ==================== 事件系统路由 ====================
 
 @router.post("/events/generate")
-async def generate_events(request: dict):
+@offload_db
+def generate_events(request: dict):
     """生成随机事件"""
     try:
         from core.systems.event_system import event_system
+        from core.systems.session_state import session_state
         session_id = request.get("session_id")
         player_state = request.get("player_state", {})
         count = request.get("count", 1)
         
-        events = event_system.get_random_events(session_id, player_state, count)
+        with session_state.scope(session_id):
+            events = event_system.get_random_events(session_id, player_state, count)
         # 转换为可序列化的格式
         events_data = []
         for event in events:
@@ -2151,47 +2281,59 @@ async def generate_events(request: dict):
         return {"success": False, "error": str(e)}
 
 @router.post("/events/respond")
-async def respond_to_event(request: dict):
+@offload_db
+def respond_to_event(request: dict):
     """响应事件选择"""
     try:
         from core.systems.event_system import event_system
+        from core.systems.session_state import session_state
         session_id = request.get("session_id")
         event_id = request.get("event_id")
         option_id = request.get("option_id")
         player_state = request.get("player_state", {})
         
-        result = event_system.apply_event_choice(session_id, event_id, option_id, player_state)
+        with session_state.scope(session_id):
+            result = event_system.apply_event_choice(session_id, event_id, option_id, player_state)
         return {"success": True, "result": result}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 @router.get("/events/history/{session_id}")
-async def get_event_history(session_id: str):
+@offload_db
+def get_event_history(session_id: str):
     """获取事件历史"""
     try:
         from core.systems.event_system import event_system
-        history = event_system.get_event_history(session_id)
+        from core.systems.session_state import session_state
+        with session_state.scope(session_id):
+            history = event_system.get_event_history(session_id)
         return {"success": True, "history": history}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 @router.get("/events/active-effects/{session_id}")
-async def get_active_effects(session_id: str):
+@offload_db
+def get_active_effects(session_id: str):
     """获取当前活跃的持续效果"""
     try:
         from core.systems.event_system import event_system
-        effects = event_system.get_active_effects(session_id)
+        from core.systems.session_state import session_state
+        with session_state.scope(session_id):
+            effects = event_system.get_active_effects(session_id)
         return {"success": True, "effects": effects}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 @router.post("/events/update-effects")
-async def update_effects(request: dict):
+@offload_db
+def update_effects(request: dict):
     """更新活跃效果（时间推进时调用）"""
     try:
         from core.systems.event_system import event_system
+        from core.systems.session_state import session_state
         session_id = request.get("session_id")
-        active_effects = event_system.update_active_effects(session_id)
+        with session_state.scope(session_id):
+            active_effects = event_system.update_active_effects(session_id)
         return {"success": True, "active_effects": active_effects}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -2200,12 +2342,12 @@ async def update_effects(request: dict):
 # ==================== 银行系统路由 ====================
 
 @router.get("/banking/deposits/{session_id}")
-async def get_deposits(session_id: str):
+@offload_db
+def get_deposits(session_id: str):
     """获取存款信息"""
     try:
-        import sqlite3
         # 直接从数据库查询存款信息
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT id, product_id, product_name, amount, buy_price, current_value, 
@@ -2247,10 +2389,10 @@ async def get_deposits(session_id: str):
         return {"success": True, "deposits": [], "total": 0, "monthly_interest": 0}
 
 @router.post("/banking/deposit")
-async def make_deposit(request: dict):
+@offload_db
+def make_deposit(request: dict):
     """存款"""
     try:
-        import sqlite3
         session_id = request.get("session_id")
         amount = request.get("amount", 0)
         deposit_type = request.get("type", "demand")
@@ -2262,7 +2404,7 @@ async def make_deposit(request: dict):
         current_month = game_service.db.get_session_month(session_id) if hasattr(game_service.db, 'get_session_month') else 1
         
         # 直接从数据库获取现金
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT credits, username FROM users WHERE session_id = ?', (session_id,))
             row = cursor.fetchone()
@@ -2319,34 +2461,35 @@ async def make_deposit(request: dict):
         # 检查成就解锁（首次存款）
         unlocked_achievements = []
         try:
-            from core.systems.achievement_system import achievement_system
-            import sqlite3
+            from core.systems.session_state import session_state
+            with session_state.scope(session_id) as scope:
+                achievements = scope.instance("achievements")
             
-            # 获取已解锁成就
-            with sqlite3.connect(game_service.db.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT achievement_id, unlocked_month FROM achievements_unlocked WHERE session_id = ?', (session_id,))
-                unlocked_rows = cursor.fetchall()
-                unlocked_list = [{"achievement_id": r[0], "unlocked_month": r[1]} for r in unlocked_rows]
+                # 获取已解锁成就
+                with game_service.db.connect() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('SELECT achievement_id, unlocked_month FROM achievements_unlocked WHERE session_id = ?', (session_id,))
+                    unlocked_rows = cursor.fetchall()
+                    unlocked_list = [{"achievement_id": r[0], "unlocked_month": r[1]} for r in unlocked_rows]
             
-            # 加载已解锁成就到系统
-            achievement_system.load_unlocked_from_list(unlocked_list)
+                # 加载已解锁成就到系统
+                achievements.load_unlocked_from_list(unlocked_list)
             
-            # 检查首次存款成就
-            first_deposit_result = achievement_system.record_first_action("deposit", current_month)
-            if first_deposit_result:
-                ach = first_deposit_result["achievement"]
-                rewards = first_deposit_result["rewards"]
-                game_service.db.save_achievement_unlock(session_id, {
-                    "achievement_id": ach["id"],
-                    "achievement_name": ach["name"],
-                    "rarity": ach["rarity"],
-                    "reward_coins": rewards["coins"],
-                    "reward_exp": rewards["exp"],
-                    "reward_title": rewards.get("title"),
-                    "unlocked_month": current_month
-                })
-                unlocked_achievements.append(first_deposit_result)
+                # 检查首次存款成就
+                first_deposit_result = achievements.record_first_action("deposit", current_month)
+                if first_deposit_result:
+                    ach = first_deposit_result["achievement"]
+                    rewards = first_deposit_result["rewards"]
+                    game_service.db.save_achievement_unlock(session_id, {
+                        "achievement_id": ach["id"],
+                        "achievement_name": ach["name"],
+                        "rarity": ach["rarity"],
+                        "reward_coins": rewards["coins"],
+                        "reward_exp": rewards["exp"],
+                        "reward_title": rewards.get("title"),
+                        "unlocked_month": current_month
+                    })
+                    unlocked_achievements.append(first_deposit_result)
         except Exception as e:
             print(f"[Achievement] Failed to check achievements: {e}")
         
@@ -2357,7 +2500,8 @@ async def make_deposit(request: dict):
         return {"success": False, "error": str(e)}
 
 @router.get("/banking/loans/{session_id}")
-async def get_user_loans(session_id: str):
+@offload_db
+def get_user_loans(session_id: str):
     """获取用户贷款列表"""
     try:
         loans = game_service.db.get_loans(session_id) if hasattr(game_service.db, 'get_loans') else []
@@ -2382,10 +2526,10 @@ async def get_user_loans(session_id: str):
         return {"success": True, "loans": []}
 
 @router.post("/banking/loan")
-async def apply_bank_loan(request: dict):
+@offload_db
+def apply_bank_loan(request: dict):
     """申请银行贷款"""
     try:
-        import sqlite3
         import uuid
         
         session_id = request.get("session_id")
@@ -2411,7 +2555,7 @@ async def apply_bank_loan(request: dict):
         if amount > product["max_amount"]:
             return {"success": False, "error": f"超过最大贷款额度 ¥{product['max_amount']:,}"}
         
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             
             # 获取当前现金和用户名
@@ -2469,34 +2613,35 @@ async def apply_bank_loan(request: dict):
         # 检查成就解锁（首次贷款）
         unlocked_achievements = []
         try:
-            from core.systems.achievement_system import achievement_system
-            import sqlite3
+            from core.systems.session_state import session_state
+            with session_state.scope(session_id) as scope:
+                achievements = scope.instance("achievements")
             
-            # 获取已解锁成就
-            with sqlite3.connect(game_service.db.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT achievement_id, unlocked_month FROM achievements_unlocked WHERE session_id = ?', (session_id,))
-                unlocked_rows = cursor.fetchall()
-                unlocked_list = [{"achievement_id": r[0], "unlocked_month": r[1]} for r in unlocked_rows]
+                # 获取已解锁成就
+                with game_service.db.connect() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('SELECT achievement_id, unlocked_month FROM achievements_unlocked WHERE session_id = ?', (session_id,))
+                    unlocked_rows = cursor.fetchall()
+                    unlocked_list = [{"achievement_id": r[0], "unlocked_month": r[1]} for r in unlocked_rows]
             
-            # 加载已解锁成就到系统
-            achievement_system.load_unlocked_from_list(unlocked_list)
+                # 加载已解锁成就到系统
+                achievements.load_unlocked_from_list(unlocked_list)
             
-            # 检查首次贷款成就
-            first_loan_result = achievement_system.record_first_action("loan", current_month)
-            if first_loan_result:
-                ach = first_loan_result["achievement"]
-                rewards = first_loan_result["rewards"]
-                game_service.db.save_achievement_unlock(session_id, {
-                    "achievement_id": ach["id"],
-                    "achievement_name": ach["name"],
-                    "rarity": ach["rarity"],
-                    "reward_coins": rewards["coins"],
-                    "reward_exp": rewards["exp"],
-                    "reward_title": rewards.get("title"),
-                    "unlocked_month": current_month
-                })
-                unlocked_achievements.append(first_loan_result)
+                # 检查首次贷款成就
+                first_loan_result = achievements.record_first_action("loan", current_month)
+                if first_loan_result:
+                    ach = first_loan_result["achievement"]
+                    rewards = first_loan_result["rewards"]
+                    game_service.db.save_achievement_unlock(session_id, {
+                        "achievement_id": ach["id"],
+                        "achievement_name": ach["name"],
+                        "rarity": ach["rarity"],
+                        "reward_coins": rewards["coins"],
+                        "reward_exp": rewards["exp"],
+                        "reward_title": rewards.get("title"),
+                        "unlocked_month": current_month
+                    })
+                    unlocked_achievements.append(first_loan_result)
         except Exception as e:
             print(f"[Achievement] Failed to check achievements: {e}")
             
@@ -2518,12 +2663,12 @@ async def apply_bank_loan(request: dict):
         return {"success": False, "error": str(e)}
 
 @router.get("/banking/credit/{session_id}")
-async def get_credit_score_api(session_id: str):
+@offload_db
+def get_credit_score_api(session_id: str):
     """获取信用评分"""
     try:
-        import sqlite3
         
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             
             # 获取用户资产
@@ -2554,14 +2699,16 @@ async def get_credit_score_api(session_id: str):
 # ==================== 保护系统路由 ====================
 
 @router.get("/protection/status/{session_id}")
-async def get_protection_status(session_id: str):
+@offload_db
+def get_protection_status(session_id: str):
     """获取玩家保护状态"""
     from core.systems.protection_system import protection_system
     status = protection_system.get_protection_status(session_id)
     return {"success": True, "status": status}
 
 @router.post("/protection/check-trade")
-async def check_trade_allowed(request: dict):
+@offload_db
+def check_trade_allowed(request: dict):
     """检查交易是否被允许"""
     from core.systems.protection_system import protection_system
     session_id = request.get("session_id")
@@ -2573,7 +2720,8 @@ async def check_trade_allowed(request: dict):
     return result
 
 @router.post("/protection/declare-bankruptcy")
-async def declare_bankruptcy(request: dict):
+@offload_db
+def declare_bankruptcy(request: dict):
     """宣布破产"""
     from core.systems.protection_system import protection_system
     session_id = request.get("session_id")
@@ -2583,7 +2731,8 @@ async def declare_bankruptcy(request: dict):
     return result
 
 @router.get("/protection/warnings/{session_id}")
-async def get_warnings(session_id: str):
+@offload_db
+def get_warnings(session_id: str):
     """获取风险警告"""
     from core.systems.protection_system import protection_system
     player_state = {}  # 可从数据库获取
@@ -2591,7 +2740,8 @@ async def get_warnings(session_id: str):
     return {"success": True, "warnings": warnings}
 
 @router.get("/protection/suggestions/{session_id}")
-async def get_suggestions(session_id: str):
+@offload_db
+def get_suggestions(session_id: str):
     """获取投资建议"""
     from core.systems.protection_system import protection_system
     portfolio = {}  # 可从数据库获取
@@ -2602,7 +2752,8 @@ async def get_suggestions(session_id: str):
 # ==================== 排行榜路由 ====================
 
 @router.get("/leaderboard/assets")
-async def get_asset_leaderboard(limit: int = 50):
+@offload_db
+def get_asset_leaderboard(limit: int = 50):
     """获取资产排行榜"""
     try:
         from core.systems.leaderboard_system import leaderboard_system
@@ -2615,7 +2766,8 @@ async def get_asset_leaderboard(limit: int = 50):
         return {"success": True, "leaderboard": []}
 
 @router.get("/leaderboard/growth")
-async def get_growth_leaderboard(limit: int = 50):
+@offload_db
+def get_growth_leaderboard(limit: int = 50):
     """获取增长率排行榜"""
     try:
         from core.systems.leaderboard_system import leaderboard_system
@@ -2628,7 +2780,8 @@ async def get_growth_leaderboard(limit: int = 50):
         return {"success": True, "leaderboard": []}
 
 @router.get("/leaderboard/roi")
-async def get_roi_leaderboard(limit: int = 50):
+@offload_db
+def get_roi_leaderboard(limit: int = 50):
     """获取投资回报率排行榜"""
     try:
         from core.systems.leaderboard_system import leaderboard_system
@@ -2641,7 +2794,8 @@ async def get_roi_leaderboard(limit: int = 50):
         return {"success": True, "leaderboard": []}
 
 @router.get("/leaderboard/achievements")
-async def get_achievement_leaderboard(limit: int = 50):
+@offload_db
+def get_achievement_leaderboard(limit: int = 50):
     """获取成就排行榜"""
     try:
         from core.systems.leaderboard_system import leaderboard_system
@@ -2654,7 +2808,8 @@ async def get_achievement_leaderboard(limit: int = 50):
         return {"success": True, "leaderboard": []}
 
 @router.get("/leaderboard/player/{session_id}")
-async def get_player_ranking(session_id: str):
+@offload_db
+def get_player_ranking(session_id: str):
     """获取玩家自己的排名"""
     try:
         from core.systems.leaderboard_system import leaderboard_system, LeaderboardType
@@ -2710,7 +2865,8 @@ async def get_player_ranking(session_id: str):
         return {"success": True, "ranking": {"assets_rank": None, "name": None}}
 
 @router.post("/leaderboard/update")
-async def update_player_stats(request: dict):
+@offload_db
+def update_player_stats(request: dict):
     """更新玩家统计数据"""
     from core.systems.leaderboard_system import leaderboard_system
     session_id = request.get("session_id")
@@ -2724,7 +2880,8 @@ async def update_player_stats(request: dict):
     return {"success": True, "message": "Stats updated"}
 
 @router.post("/leaderboard/record-trade")
-async def record_trade(request: dict):
+@offload_db
+def record_trade(request: dict):
     """记录交易以计算ROI"""
     from core.systems.leaderboard_system import leaderboard_system
     session_id = request.get("session_id")
@@ -2749,14 +2906,14 @@ async def get_avatar_shop():
         return {"success": False, "error": str(e)}
 
 @router.get("/avatar/user/{session_id}")
-async def get_user_avatar_info(session_id: str):
+@offload_db
+def get_user_avatar_info(session_id: str):
     """获取用户头像信息"""
     try:
         from core.systems.avatar_system import avatar_system
-        import sqlite3
         
         # 直接查询成就金币用于调试
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT achievement_id, reward_coins FROM achievements_unlocked WHERE session_id = ?', (session_id,))
             raw_achievements = cursor.fetchall()
@@ -2796,7 +2953,8 @@ async def get_user_avatar_info(session_id: str):
         return {"success": False, "error": str(e), "coins": 0, "owned_avatars": ["default_orange"], "current_avatar": "default_orange"}
 
 @router.post("/avatar/purchase")
-async def purchase_avatar(request: dict):
+@offload_db
+def purchase_avatar(request: dict):
     """购买头像"""
     try:
         from core.systems.avatar_system import avatar_system
@@ -2849,7 +3007,8 @@ async def purchase_avatar(request: dict):
         return {"success": False, "error": str(e)}
 
 @router.post("/avatar/equip")
-async def equip_avatar(request: dict):
+@offload_db
+def equip_avatar(request: dict):
     """装备头像"""
     try:
         session_id = request.get("session_id")
@@ -2877,11 +3036,11 @@ async def equip_avatar(request: dict):
 # ==================== 房产系统路由 ====================
 
 @router.get("/housing/properties/{session_id}")
-async def get_user_properties(session_id: str):
+@offload_db
+def get_user_properties(session_id: str):
     """获取用户房产列表"""
     try:
-        import sqlite3
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT id, name, property_type, purchase_price, current_value, 
@@ -2902,11 +3061,11 @@ async def get_user_properties(session_id: str):
         return {"success": True, "properties": []}
 
 @router.get("/housing/status/{session_id}")
-async def get_housing_status(session_id: str):
+@offload_db
+def get_housing_status(session_id: str):
     """获取居住状态"""
     try:
-        import sqlite3
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT living_type, property_name, monthly_cost, happiness_effect
@@ -2928,10 +3087,10 @@ async def get_housing_status(session_id: str):
         return {"success": True, "status": {"type": "租房", "propertyName": "城中村单间", "monthlyCost": 800, "happinessEffect": -5}}
 
 @router.post("/housing/buy")
-async def buy_property(request: dict):
+@offload_db
+def buy_property(request: dict):
     """购买房产"""
     try:
-        import sqlite3
         session_id = request.get("session_id")
         property_id = request.get("property_id")
         payment_method = request.get("payment_method", "full")
@@ -2950,7 +3109,7 @@ async def buy_property(request: dict):
         if not prop:
             return {"success": False, "error": "房产不存在"}
         
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT credits FROM users WHERE session_id = ?', (session_id,))
             row = cursor.fetchone()
@@ -2988,23 +3147,6 @@ async def buy_property(request: dict):
                       mortgage_term, mortgage_term, monthly_payment,
                       game_service.db.get_session_month(session_id)))
             
-            # 确保properties表存在
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS properties (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    name TEXT NOT NULL,
-                    property_type TEXT NOT NULL,
-                    purchase_price INTEGER NOT NULL,
-                    current_value INTEGER NOT NULL,
-                    monthly_rent INTEGER DEFAULT 0,
-                    is_rented INTEGER DEFAULT 0,
-                    is_self_living INTEGER DEFAULT 0,
-                    buy_month INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
             # 创建房产记录
             cursor.execute('''
                 INSERT INTO properties (session_id, name, property_type, purchase_price,
@@ -3043,10 +3185,10 @@ async def buy_property(request: dict):
         return {"success": False, "error": str(e)}
 
 @router.post("/housing/rent")
-async def rent_house(request: dict):
+@offload_db
+def rent_house(request: dict):
     """租房"""
     try:
-        import sqlite3
         session_id = request.get("session_id")
         rental_id = request.get("rental_id")
         
@@ -3061,21 +3203,8 @@ async def rent_house(request: dict):
         if not rental:
             return {"success": False, "error": "租房选项不存在"}
         
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
-            # 确保living_status表存在
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS living_status (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT UNIQUE NOT NULL,
-                    living_type TEXT NOT NULL,
-                    property_name TEXT NOT NULL,
-                    monthly_cost INTEGER NOT NULL,
-                    happiness_effect INTEGER DEFAULT 0,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
             cursor.execute('''
                 INSERT INTO living_status (session_id, living_type, property_name, monthly_cost, happiness_effect)
                 VALUES (?, '租房', ?, ?, ?)
@@ -3109,7 +3238,8 @@ async def rent_house(request: dict):
         return {"success": False, "error": str(e)}
 
 @router.get("/housing/mortgages/{session_id}")
-async def get_mortgages(session_id: str):
+@offload_db
+def get_mortgages(session_id: str):
     """获取房贷列表"""
     try:
         loans = game_service.db.get_loans(session_id, active_only=True)
@@ -3119,14 +3249,14 @@ async def get_mortgages(session_id: str):
         return {"success": True, "mortgages": []}
 
 @router.post("/housing/sell")
-async def sell_property(request: dict):
+@offload_db
+def sell_property(request: dict):
     """出售房产"""
     try:
-        import sqlite3
         session_id = request.get("session_id")
         property_id = request.get("property_id")
         
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             
             # 获取房产信息
@@ -3183,14 +3313,14 @@ async def sell_property(request: dict):
         return {"success": False, "error": str(e)}
 
 @router.post("/housing/rentout")
-async def rent_out_property(request: dict):
+@offload_db
+def rent_out_property(request: dict):
     """将房产出租"""
     try:
-        import sqlite3
         session_id = request.get("session_id")
         property_id = request.get("property_id")
         
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             
             # 获取房产信息
@@ -3226,16 +3356,13 @@ async def rent_out_property(request: dict):
 # ==================== 生活方式系统路由 ====================
 
 @router.get("/lifestyle/status/{session_id}")
-async def get_lifestyle_status(session_id: str):
+@offload_db
+def get_lifestyle_status(session_id: str):
     """获取生活状态"""
     try:
-        import sqlite3
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
-            cursor.execute("PRAGMA table_info(users)")
-            columns = [col[1] for col in cursor.fetchall()]
-            
-            if 'happiness' in columns:
+            if game_service.db.has_column('users', 'happiness'):
                 cursor.execute('''
                     SELECT happiness, energy, health FROM users WHERE session_id = ?
                 ''', (session_id,))
@@ -3255,16 +3382,16 @@ async def get_lifestyle_status(session_id: str):
         return {"success": True, "status": {"happiness": 60, "energy": 75, "health": 80, "social": 50}}
 
 @router.post("/lifestyle/activity")
-async def do_lifestyle_activity(request: dict):
+@offload_db
+def do_lifestyle_activity(request: dict):
     """执行生活活动"""
     try:
-        import sqlite3
         session_id = request.get("session_id")
         activity_id = request.get("activity_id")
         cost = request.get("cost", 0)
         effects = request.get("effects", {})
         
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             
             # 获取当前状态
@@ -3291,19 +3418,8 @@ async def do_lifestyle_activity(request: dict):
                 UPDATE users SET credits = ?, happiness = ?, energy = ?, health = ?
                 WHERE session_id = ?
             ''', (new_cash, new_happiness, new_energy, new_health, session_id))
-            
+
             # 记录活动
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS lifestyle_activities (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    activity_id TEXT NOT NULL,
-                    cost INTEGER NOT NULL,
-                    effects TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
             import json
             cursor.execute('''
                 INSERT INTO lifestyle_activities (session_id, activity_id, cost, effects)
@@ -3352,10 +3468,10 @@ async def do_lifestyle_activity(request: dict):
         return {"success": False, "error": str(e)}
 
 @router.post("/lifestyle/business")
-async def start_side_business(request: dict):
+@offload_db
+def start_side_business(request: dict):
     """启动副业项目"""
     try:
-        import sqlite3
         session_id = request.get("session_id")
         business_id = request.get("business_id")
         investment = request.get("investment", 0)
@@ -3371,7 +3487,7 @@ async def start_side_business(request: dict):
         if not biz:
             return {"success": False, "error": "项目不存在"}
         
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             
             cursor.execute('SELECT credits FROM users WHERE session_id = ?', (session_id,))
@@ -3381,23 +3497,6 @@ async def start_side_business(request: dict):
             
             new_cash = row[0] - investment
             
-            # 创建副业表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS side_businesses (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    business_id TEXT NOT NULL,
-                    name TEXT NOT NULL,
-                    investment INTEGER NOT NULL,
-                    expected_return INTEGER NOT NULL,
-                    risk_rate REAL NOT NULL,
-                    status TEXT DEFAULT 'running',
-                    start_month INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(session_id, business_id)
-                )
-            ''')
-            
             cursor.execute('''
                 INSERT INTO side_businesses (session_id, business_id, name, investment, expected_return, risk_rate, start_month)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -3414,11 +3513,11 @@ async def start_side_business(request: dict):
         return {"success": False, "error": str(e)}
 
 @router.get("/lifestyle/businesses/{session_id}")
-async def get_side_businesses(session_id: str):
+@offload_db
+def get_side_businesses(session_id: str):
     """获取副业列表"""
     try:
-        import sqlite3
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT business_id, name, investment, expected_return, status, start_month
@@ -3443,8 +3542,7 @@ def resolve_session_id(session_id_or_user_id: str) -> str:
     # 如果是纯数字，认为是用户ID，需要查询对应的session_id
     if session_id_or_user_id.isdigit():
         try:
-            import sqlite3
-            with sqlite3.connect(game_service.db.db_path) as conn:
+            with game_service.db.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('SELECT session_id FROM users WHERE id = ?', (int(session_id_or_user_id),))
                 result = cursor.fetchone()
@@ -3455,7 +3553,8 @@ def resolve_session_id(session_id_or_user_id: str) -> str:
     return session_id_or_user_id
 
 @router.get("/insights/personal/{session_id}")
-async def get_personal_insights(session_id: str):
+@offload_cpu
+def get_personal_insights(session_id: str):
     """获取个人行为洞察"""
     try:
         if not game_service.behavior_system:
@@ -3466,9 +3565,8 @@ async def get_personal_insights(session_id: str):
         insights = game_service.behavior_system.get_personal_insights(resolved_id)
         
         # 获取用户自选标签
-        import sqlite3
         user_tags = ""
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT tags FROM users WHERE session_id = ?', (resolved_id,))
             row = cursor.fetchone()
@@ -3490,7 +3588,8 @@ async def get_personal_insights(session_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/insights/cohort")
-async def get_cohort_insights(insight_type: str = None, limit: int = 20):
+@offload_db
+def get_cohort_insights(insight_type: str = None, limit: int = 20):
     """获取群体洞察"""
     try:
         if not game_service.db:
@@ -3506,7 +3605,8 @@ async def get_cohort_insights(insight_type: str = None, limit: int = 20):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/insights/statistics/{session_id}")
-async def get_behavior_statistics(session_id: str):
+@offload_cpu
+def get_behavior_statistics(session_id: str):
     """获取行为统计数据（用于图表）"""
     try:
         if not game_service.behavior_system:
@@ -3523,19 +3623,34 @@ async def get_behavior_statistics(session_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/insights/ai/{session_id}")
-async def get_ai_insight(session_id: str):
-    """获取AI生成的个性化洞察"""
+async def get_ai_insight(session_id: str, stream: bool = False):
+    """获取AI生成的个性化洞察（stream=true 时以 SSE 逐段返回）"""
     try:
         if not game_service.behavior_system:
             return {"success": False, "error": "行为洞察系统未初始化"}
         
-        resolved_id = resolve_session_id(session_id)
+        resolved_id = await run_db(resolve_session_id, session_id)
         
         # 设置AI引擎
         if game_service.ai_engine and not game_service.behavior_system.ai_engine:
             game_service.behavior_system.set_ai_engine(game_service.ai_engine)
         
-        current_month = game_service.db.get_session_month(resolved_id)
+        current_month = await run_db(game_service.db.get_session_month, resolved_id)
+        
+        if stream:
+            behavior_system = game_service.behavior_system
+            if not behavior_system.ai_engine or not behavior_system.ai_engine.api_key:
+                return {"success": False, "error": "AI引擎不可用"}
+            prompt = await run_db(behavior_system.build_ai_insight_prompt, resolved_id)
+            if not prompt:
+                return {"success": False, "error": "无法生成AI洞察，请确保有足够的行为数据"}
+            
+            from app.services.streaming import sse_response
+            return sse_response(
+                behavior_system.ai_engine.generate_response_stream(prompt, cache_namespace="insight"),
+                lambda text: {"success": True, "data": behavior_system.parse_ai_insight(text, current_month)}
+            )
+        
         insight = await game_service.behavior_system.generate_ai_insight(resolved_id, current_month)
         
         if insight:
@@ -3551,7 +3666,8 @@ async def get_ai_insight(session_id: str):
 
 # ========== 行为预警 API ==========
 @router.get("/insights/warnings/{session_id}")
-async def get_behavior_warnings(session_id: str):
+@offload_cpu
+def get_behavior_warnings(session_id: str):
     """获取行为预警信息"""
     try:
         if not game_service.behavior_system:
@@ -3596,7 +3712,8 @@ async def get_behavior_warnings(session_id: str):
 
 # ========== 同龄人对比 API ==========
 @router.get("/insights/peer-comparison/{session_id}")
-async def get_peer_comparison(session_id: str):
+@offload_cpu
+def get_peer_comparison(session_id: str):
     """获取与同龄人的行为对比"""
     try:
         if not game_service.behavior_system:
@@ -3621,7 +3738,8 @@ async def get_peer_comparison(session_id: str):
 
 # ========== 行为演变趋势 API ==========
 @router.get("/insights/evolution/{session_id}")
-async def get_behavior_evolution(session_id: str):
+@offload_cpu
+def get_behavior_evolution(session_id: str):
     """获取行为演变趋势数据"""
     try:
         if not game_service.behavior_system:
@@ -3644,7 +3762,8 @@ async def get_behavior_evolution(session_id: str):
 
 # ========== 行为日志列表 API ==========
 @router.get("/behavior-logs/{session_id}")
-async def get_behavior_logs_list(session_id: str, limit: int = 50):
+@offload_db
+def get_behavior_logs_list(session_id: str, limit: int = 50):
     """获取行为日志列表（用于时间线展示）"""
     try:
         if not game_service.db:
@@ -3673,14 +3792,14 @@ async def get_behavior_logs_list(session_id: str, limit: int = 50):
 # ============ 统一时间线 API ============
 
 @router.get("/timeline/{session_id}")
-async def get_unified_timeline(session_id: str, limit: int = 100):
+@offload_db
+def get_unified_timeline(session_id: str, limit: int = 100):
     """获取统一时间线 - 整合所有事件类型"""
     try:
-        import sqlite3
         
         timeline_items = []
         
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             
             # 1. 获取交易记录
@@ -3884,10 +4003,10 @@ async def get_unified_timeline(session_id: str, limit: int = 100):
 # ============ 档案库 API（按类别分组）============
 
 @router.get("/archives/{session_id}")
-async def get_archives(session_id: str):
+@offload_db
+def get_archives(session_id: str):
     """获取档案库 - 按标签分类"""
     try:
-        import sqlite3
         
         archives = {
             "ai_thoughts": [],      # AI想法
@@ -3897,7 +4016,7 @@ async def get_archives(session_id: str):
             "asset_change": []       # 资产变化
         }
         
-        with sqlite3.connect(game_service.db.db_path) as conn:
+        with game_service.db.connect() as conn:
             cursor = conn.cursor()
             
             # 1. AI想法 - 从交易记录和投资记录中提取
@@ -4032,7 +4151,8 @@ async def admin_login(request: AdminLoginRequest):
         return AdminAuthResponse(success=False, message="管理员密钥错误", is_admin=False)
 
 @router.get("/admin/stats")
-async def admin_get_stats(admin_key: str = None):
+@offload_db
+def admin_get_stats(admin_key: str = None):
     """获取管理员统计数据"""
     if admin_key != ADMIN_KEY:
         raise HTTPException(status_code=403, detail="无权限访问")
@@ -4047,8 +4167,84 @@ async def admin_get_stats(admin_key: str = None):
         print(f"[Admin] Error getting stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/system/executors")
+async def get_executors_status():
+    """执行器指标：排队深度、等待时间，用于调整线程池大小"""
+    return {"success": True, "executors": get_executor_stats()}
+
+@router.get("/system/llm-cache")
+async def get_llm_cache_status():
+    """LLM 响应缓存与请求合并指标：命中/未命中次数、命中率、淘汰数、被合并的调用数"""
+    from core.ai.response_cache import llm_cache
+    from core.ai.single_flight import llm_single_flight
+    return {"success": True, "cache": llm_cache.get_stats(), "single_flight": llm_single_flight.get_stats()}
+
+@router.get("/system/situation-pool")
+async def get_situation_pool_status():
+    """情况预生成池指标：各原型（MBTI × 命运 × 财富档位）的库存水位"""
+    from core.ai.situation_pool import situation_pool
+    return {"success": True, "pool": situation_pool.get_stats()}
+
+@router.get("/system/market-writes")
+@offload_db
+def get_market_write_status():
+    """市场数据写入指标：每模拟月写入 stock.db 的行数（写放大）、事务数"""
+    from core.systems.market_engine import market_engine
+    from core.systems.longbridge_client import longbridge_client
+    return {"success": True, "engine": market_engine.get_write_stats(), "database": dict(longbridge_client.write_stats)}
+
+@router.get("/system/market-timeline")
+@offload_db
+def get_market_timeline_status():
+    """市场时间线指标：世界月份、缓存的月报数、命中率、每次模拟与查表的平均耗时"""
+    from core.systems.market_timeline import market_timeline
+    return {"success": True, "timeline": market_timeline.get_stats()}
+
+@router.get("/system/push")
+async def get_push_status():
+    """WebSocket 推送指标：连接数、已发送帧数、被合并的消息数、因发送超时断开的慢客户端数"""
+    from app.services.push_hub import push_hub
+    return {"success": True, "push": push_hub.get_stats()}
+
+@router.get("/system/session-cache")
+async def get_session_cache_status():
+    """AI 化身会话缓存指标：命中率、常驻会话数与估算字节数、各类淘汰与写回次数"""
+    return {"success": True, "cache": game_service.game_sessions.get_stats()}
+
+@router.get("/system/advance-pipeline")
+async def get_advance_pipeline_status():
+    """月度推进流水线指标：推进次数，各阶段（读取 / 计算 / 提交 / 情境 …）的平均、最大与累计耗时"""
+    from app.services.advance_pipeline import advance_pipeline
+    return {"success": True, "pipeline": advance_pipeline.get_stats()}
+
+@router.get("/system/world-tick")
+async def get_world_tick_status():
+    """批量推进指标：累计批次与会话数、冲突 / 失败数、平均吞吐，以及最近一次批量推进的分段耗时"""
+    from app.services.world_tick import world_tick
+    return {"success": True, "tick": world_tick.get_stats()}
+
+@router.websocket("/ws")
+async def push_channel(websocket: WebSocket, topics: str = "market", session_id: Optional[str] = None):
+    """
+    推送通道：topics 为逗号分隔的 market / session（session 需要 session_id）。
+    订阅 market 后首帧为完整报价快照，之后每次市场推进推送变化的股票；
+    订阅 session 后每次 advance_session 完成推送该会话的月度摘要
+    """
+    from app.services.push_hub import push_hub, MARKET_TOPIC, SESSION_TOPIC
+    requested = {topic.strip() for topic in topics.split(",") if topic.strip()}
+    subscribed = []
+    if MARKET_TOPIC in requested:
+        subscribed.append(MARKET_TOPIC)
+    if SESSION_TOPIC in requested and session_id:
+        subscribed.append(f"{SESSION_TOPIC}:{session_id}")
+    if not subscribed:
+        await websocket.close(code=1008)
+        return
+    await push_hub.serve(websocket, subscribed)
+
 @router.get("/admin/accounts")
-async def admin_get_accounts(admin_key: str = None):
+@offload_db
+def admin_get_accounts(admin_key: str = None):
     """获取所有账户"""
     if admin_key != ADMIN_KEY:
         raise HTTPException(status_code=403, detail="无权限访问")
@@ -4064,7 +4260,8 @@ async def admin_get_accounts(admin_key: str = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/admin/users")
-async def admin_get_users(admin_key: str = None):
+@offload_db
+def admin_get_users(admin_key: str = None):
     """获取所有角色"""
     if admin_key != ADMIN_KEY:
         raise HTTPException(status_code=403, detail="无权限访问")
@@ -4080,7 +4277,8 @@ async def admin_get_users(admin_key: str = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/admin/delete-account")
-async def admin_delete_account(request: DeleteAccountRequest, admin_key: str = None):
+@offload_db
+def admin_delete_account(request: DeleteAccountRequest, admin_key: str = None):
     """删除账户"""
     if admin_key != ADMIN_KEY:
         raise HTTPException(status_code=403, detail="无权限访问")
@@ -4099,7 +4297,8 @@ async def admin_delete_account(request: DeleteAccountRequest, admin_key: str = N
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/admin/delete-user")
-async def admin_delete_user(request: DeleteUserRequest, admin_key: str = None):
+@offload_db
+def admin_delete_user(request: DeleteUserRequest, admin_key: str = None):
     """删除角色"""
     if admin_key != ADMIN_KEY:
         raise HTTPException(status_code=403, detail="无权限访问")
@@ -4118,7 +4317,8 @@ async def admin_delete_user(request: DeleteUserRequest, admin_key: str = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/admin/update-credits")
-async def admin_update_credits(request: UpdateCreditsRequest, admin_key: str = None):
+@offload_db
+def admin_update_credits(request: UpdateCreditsRequest, admin_key: str = None):
     """更新角色金币"""
     if admin_key != ADMIN_KEY:
         raise HTTPException(status_code=403, detail="无权限访问")
@@ -4137,7 +4337,8 @@ async def admin_update_credits(request: UpdateCreditsRequest, admin_key: str = N
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/admin/update-status")
-async def admin_update_status(request: UpdateStatusRequest, admin_key: str = None):
+@offload_db
+def admin_update_status(request: UpdateStatusRequest, admin_key: str = None):
     """更新角色状态"""
     if admin_key != ADMIN_KEY:
         raise HTTPException(status_code=403, detail="无权限访问")
@@ -4164,7 +4365,8 @@ async def admin_update_status(request: UpdateStatusRequest, admin_key: str = Non
 # ============ 事件池 API ============
 
 @router.get("/event-pool/stats")
-async def get_event_pool_stats():
+@offload_db
+def get_event_pool_stats():
     """获取事件池统计信息"""
     try:
         from core.systems.event_pool import event_pool_manager
@@ -4186,7 +4388,8 @@ async def get_event_pool_stats():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/event-pool/events")
-async def get_event_pool_events(category: str = None, limit: int = 50):
+@offload_db
+def get_event_pool_events(category: str = None, limit: int = 50):
     """获取事件池中的事件"""
     try:
         if game_service.db:
@@ -4199,7 +4402,8 @@ async def get_event_pool_events(category: str = None, limit: int = 50):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/event-pool/filter")
-async def filter_events_for_user(session_id: str, limit: int = 5):
+@offload_db
+def filter_events_for_user(session_id: str, limit: int = 5):
     """为用户筛选相关事件"""
     try:
         from core.systems.event_pool import event_pool_manager
@@ -4236,7 +4440,8 @@ async def filter_events_for_user(session_id: str, limit: int = 5):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/event-pool/game-events")
-async def get_game_events_for_user(session_id: str, limit: int = 3):
+@offload_db
+def get_game_events_for_user(session_id: str, limit: int = 3):
     """获取用户的游戏化事件（AI筛选）"""
     try:
         from core.systems.event_pool import event_pool_manager
@@ -4278,7 +4483,8 @@ async def get_game_events_for_user(session_id: str, limit: int = 3):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/event-pool/respond")
-async def respond_to_event(session_id: str, game_event_id: str, 
+@offload_db
+def respond_to_event(session_id: str, game_event_id: str, 
                            event_id: str, option_index: int, month: int):
     """用户响应事件"""
     try:
@@ -4309,7 +4515,8 @@ async def respond_to_event(session_id: str, game_event_id: str,
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/event-pool/user-history")
-async def get_user_event_history(session_id: str, limit: int = 50):
+@offload_db
+def get_user_event_history(session_id: str, limit: int = 50):
     """获取用户事件响应历史"""
     try:
         if game_service.db:
@@ -4322,7 +4529,8 @@ async def get_user_event_history(session_id: str, limit: int = 50):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/event-pool/init-samples")
-async def init_sample_events():
+@offload_db
+def init_sample_events():
     """初始化示例事件数据"""
     try:
         from core.systems.event_pool import init_event_pool_with_samples, event_pool_manager
@@ -4349,7 +4557,8 @@ async def init_sample_events():
 
 
 @router.post("/event-pool/fetch-latest")
-async def fetch_latest_events(force: bool = False):
+@offload_db
+def fetch_latest_events(force: bool = False):
     """获取最新事件（自动降级：Wide-Research失败时使用备用数据）"""
     try:
         from core.systems.event_pool import event_pool_manager, create_sample_events
@@ -4396,7 +4605,8 @@ async def fetch_latest_events(force: bool = False):
 
 
 @router.post("/event-pool/fetch-wide-research")
-async def fetch_from_wide_research(force: bool = False):
+@offload_db
+def fetch_from_wide_research(force: bool = False):
     """从Wide-Research API获取最新事件"""
     try:
         from core.systems.event_pool import event_pool_manager
@@ -4428,7 +4638,8 @@ async def fetch_from_wide_research(force: bool = False):
 
 
 @router.get("/event-pool/wide-research-status")
-async def get_wide_research_status():
+@offload_db
+def get_wide_research_status():
     """检查Wide-Research连接状态"""
     try:
         import requests
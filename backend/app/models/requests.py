@@ -2,7 +2,7 @@
 API请求模型定义
 """
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 class CreateAvatarRequest(BaseModel):
     name: str
     mbti: str
@@ -24,9 +24,17 @@ class SessionStartRequest(BaseModel):
     username: Optional[str] = None
     name: Optional[str] = None
     mbti: Optional[str] = None
+    seed: Optional[int] = None  # 模拟种子，相同种子的会话推进结果可重放
 class SessionAdvanceRequest(BaseModel):
     session_id: str
     echo_text: Optional[str] = None
+    months: int = 1  # 大于 1 时快进多个月，返回逐月的精简序列
+
+class WorldTickRequest(BaseModel):
+    session_ids: Optional[List[str]] = None  # 为空时选择所有会话
+    idle_minutes: Optional[float] = None     # 只推进超过这么多分钟没有推进过的会话
+    limit: Optional[int] = None
+    workers: Optional[int] = None            # 进程池大小，默认 ECHOPOLIS_TICK_WORKERS
 
 class SessionFinishRequest(BaseModel):
     session_id: str
@@ -34,3 +42,4 @@ class SessionFinishRequest(BaseModel):
 class AIChatRequest(BaseModel):
     session_id: Optional[str] = None
     message: str
+    stream: Optional[bool] = False  # True 时以 SSE 逐段返回
@@ -0,0 +1,508 @@
+"""
+月度推进流水线 - GameService.advance_session 按声明的阶段顺序执行
+原先一个月的推进在一个函数里交替执行十几次 SELECT/UPDATE（投资、副业、房产、贷款、保险、居住），
+随后月份、现金流、快照、成就又各自开连接写库。现在拆成：
+- load：在一个读事务里批量读出会话的全部财务状态（MonthState）
+- 计算阶段：只在内存中计算本月收支、生活状态、事件与成就，待写的行记录在 MonthState 上
+- commit：一个写事务提交全部修改（用户、投资、贷款、保险、月份、现金流、快照、成就）；
+  提交前按月份做乐观检查，读取之后会话已被其他请求（世界时钟批量推进等）推进过时抛出 SessionConflict、
+  整个事务回滚；现金按读取后的变化量累加，不覆盖期间其他请求对现金的写入；
+  会话状态存储与主库是同一个库文件时，各子系统本月的会话状态也在这个事务中写入（session_state.flush）
+- 提交之后：情境生成（可能调用 LLM）、行为洞察、财务反思（由 GameService 提供）
+快进多个月时，计算阶段在同一个 MonthState 上逐月重复执行（状态留在内存中），最后一次 commit 写入全部月份。
+每个阶段单独计时（快进时各月累加），写入 MonthState.timings 并累计到 advance_pipeline.get_stats()。
+计算阶段抽取随机数的顺序与原实现一致，相同种子的重放结果不变。
+"""
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from core.systems.session_state import session_state
+from core.systems.sim_random import sim_rng
+
+Stage = Tuple[str, Callable[["MonthState"], None]]
+
+
+class SessionConflict(Exception):
+    """提交时会话月份已不是读取时的月份（期间被其他请求推进过），本次推进未写入"""
+
+
+@dataclass
+class MonthState:
+    """一个会话一次月度推进的全部状态：load 读入，计算阶段修改，commit 一次写回"""
+    session_id: str
+    new_month: int
+    verbose: bool = True  # 是否打印本月收支（批量推进时关闭）
+    # 用户
+    has_stats: bool = False
+    name: str = ""
+    mbti: str = ""
+    username: str = ""
+    cash: int = 0
+    opening_cash: int = 0  # load 读到的现金（commit 按变化量累加）
+    happiness: int = 70
+    energy: int = 75
+    health: int = 80
+    tags: Optional[str] = None
+    # 财务明细
+    investments: List[Dict] = field(default_factory=list)       # id, amount, return_rate, investment_type, remaining_months
+    side_businesses: List[Tuple] = field(default_factory=list)  # (expected_return, risk_rate)
+    rents: List[int] = field(default_factory=list)
+    loans: List[Dict] = field(default_factory=list)             # loan_id, monthly_payment, remaining_months, remaining_principal
+    policies: List[Dict] = field(default_factory=list)          # id, monthly_premium, is_active, remaining_months
+    living: Optional[Tuple[int, int]] = None                    # (monthly_cost, happiness_effect)
+    unlocked_achievements: List[Dict] = field(default_factory=list)
+    # 宏观与市场
+    macro_stats: Dict = field(default_factory=dict)
+    asset_impact: Dict = field(default_factory=dict)
+    market_report: Optional[Dict] = None
+    # 本月计算结果
+    income: Dict[str, int] = field(default_factory=dict)
+    expense: Dict[str, int] = field(default_factory=dict)
+    invested_assets: int = 0
+    events: List[Dict] = field(default_factory=list)
+    achievements: List[Dict] = field(default_factory=list)
+    # 待写入
+    matured_ids: List[int] = field(default_factory=list)
+    records: List[Dict] = field(default_factory=list)           # 每月的现金流与快照
+    achievement_rows: List[Dict] = field(default_factory=list)
+    # 提交之后
+    situation: Optional[Dict] = None
+    behavior_achievements: List[Dict] = field(default_factory=list)
+    reflection: str = ""
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def total_income(self) -> int:
+        return sum(self.income.values())
+
+    @property
+    def total_expense(self) -> int:
+        return sum(self.expense.values())
+
+    @property
+    def net_cashflow(self) -> int:
+        return self.total_income - self.total_expense
+
+    @property
+    def total_assets(self) -> int:
+        return self.cash + self.invested_assets
+
+    @property
+    def phase(self) -> str:
+        return self.macro_stats.get('phase', 'expansion')
+
+
+# ============ 宏观与市场 ============
+
+def advance_macro(state: MonthState):
+    """推进宏观经济"""
+    from core.systems.macro_economy import macro_economy
+    state.macro_stats = macro_economy.advance_month()
+    state.asset_impact = macro_economy.get_asset_impact()
+    print(f"[AdvancePipeline] Macro stats: {state.macro_stats}")
+
+
+def advance_market(state: MonthState):
+    """市场时间线（世界时钟每个月只模拟一次，这里读取本会话所到月份的月报）"""
+    try:
+        from core.systems.market_timeline import market_timeline
+        state.market_report = market_timeline.report_for(state.new_month, state.phase)
+        print(f"[AdvancePipeline] Market updated: index_change={state.market_report.get('index_change')}%, "
+              f"gainers={len(state.market_report.get('gainers', []))}")
+    except Exception as e:
+        print(f"[AdvancePipeline] Market engine update failed: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+# ============ 批量读取与一次提交 ============
+
+def load_month_state(db, state: MonthState):
+    """在一个读事务里读出会话的用户状态与全部财务明细"""
+    sid = state.session_id
+    state.has_stats = db.has_column('users', 'happiness')
+    has_tags = db.has_column('users', 'tags')
+    columns = "name, mbti, credits, username"
+    if state.has_stats:
+        columns += ", happiness, energy, health"
+    if has_tags:
+        columns += ", tags"
+
+    conn = db.connect()
+    with conn:
+        conn.execute("BEGIN")  # 各表读到同一时刻的快照
+        row = conn.execute(f'SELECT {columns} FROM users WHERE session_id = ?', (sid,)).fetchone()
+        if not row:
+            raise Exception("会话不存在")
+        state.name, state.mbti, state.cash, state.username = row[:4]
+        state.opening_cash = state.cash
+        if state.has_stats:
+            state.happiness, state.energy, state.health = row[4:7]
+        if has_tags:
+            state.tags = row[-1]
+
+        state.investments = [
+            {"id": r[0], "amount": r[1], "return_rate": r[2], "investment_type": r[3], "remaining_months": r[4]}
+            for r in conn.execute('''
+                SELECT id, amount, return_rate, investment_type, remaining_months
+                FROM investments WHERE session_id = ?
+            ''', (sid,))
+        ]
+        state.side_businesses = conn.execute('''
+            SELECT expected_return, risk_rate FROM side_businesses
+            WHERE session_id = ? AND status = 'running'
+        ''', (sid,)).fetchall()
+        state.rents = [rent or 0 for (rent,) in conn.execute('''
+            SELECT monthly_rent FROM properties WHERE session_id = ? AND is_rented = 1
+        ''', (sid,))]
+        state.loans = [
+            {"loan_id": r[0], "monthly_payment": r[1], "remaining_months": r[2], "remaining_principal": r[3]}
+            for r in conn.execute('''
+                SELECT loan_id, monthly_payment, remaining_months, remaining_principal
+                FROM loans WHERE session_id = ? AND remaining_months > 0
+            ''', (sid,))
+        ]
+        state.policies = [
+            {"id": r[0], "monthly_premium": r[1], "is_active": r[2], "remaining_months": r[3]}
+            for r in conn.execute('''
+                SELECT id, monthly_premium, is_active, remaining_months
+                FROM insurance_policies WHERE session_id = ?
+            ''', (sid,))
+        ]
+        state.living = conn.execute('''
+            SELECT monthly_cost, happiness_effect FROM living_status WHERE session_id = ?
+        ''', (sid,)).fetchone()
+        state.unlocked_achievements = [
+            {"achievement_id": r[0], "unlocked_month": r[1]}
+            for r in conn.execute('''
+                SELECT achievement_id, unlocked_month FROM achievements_unlocked WHERE session_id = ?
+            ''', (sid,))
+        ]
+
+
+def commit_month_state(db, state: MonthState):
+    """
+    一个写事务提交本次推进的全部修改
+    先把会话月份从读取时的月份推进到 new_month（WHERE current_month = 读取时的月份），
+    月份已被其他请求推进过时抛出 SessionConflict，事务回滚、不写入任何行；
+    检查通过后投资 / 贷款 / 保单按读取的行写回剩余月数（这些行只在推进月份的事务中结算），
+    现金按本次推进的变化量累加。会话状态存储与主库是同一个库文件时，会话作用域内已有的变化
+    在同一个事务中写入；另设的会话状态库无法与主库原子提交，仍在退出作用域时写回
+    """
+    sid = state.session_id
+    months = len(state.records)
+    conn = db.connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")  # 开始就取得写锁，避免读锁升级时与其他写者死锁
+        moved = conn.execute('''
+            UPDATE sessions SET current_month = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE session_id = ? AND current_month = ?
+        ''', (state.new_month, sid, state.new_month - months)).rowcount
+        if not moved:
+            row = conn.execute('SELECT current_month FROM sessions WHERE session_id = ?', (sid,)).fetchone()
+            if row:
+                raise SessionConflict(f"会话 {sid} 已被其他请求推进到第 {row[0]} 月，"
+                                      f"本次到第 {state.new_month} 月的推进未提交")
+            db.advance_session_month(sid, months=months, conn=conn)  # 没有会话记录时创建
+
+        credits = state.cash - state.opening_cash
+        if state.has_stats:
+            conn.execute('''
+                UPDATE users SET credits = credits + ?, happiness = ?, energy = ?, health = ?
+                WHERE session_id = ?
+            ''', (credits, state.happiness, state.energy, state.health, sid))
+        else:
+            conn.execute('UPDATE users SET credits = credits + ? WHERE session_id = ?', (credits, sid))
+
+        conn.executemany('UPDATE investments SET remaining_months = ? WHERE id = ?',
+                         [(inv["remaining_months"], inv["id"]) for inv in state.investments])
+        conn.executemany('DELETE FROM investments WHERE id = ?', [(iid,) for iid in state.matured_ids])
+        conn.executemany('''
+            UPDATE loans SET remaining_months = ?, remaining_principal = ? WHERE loan_id = ?
+        ''', [(loan["remaining_months"], loan["remaining_principal"], loan["loan_id"]) for loan in state.loans])
+        conn.executemany('UPDATE insurance_policies SET remaining_months = ? WHERE id = ?',
+                         [(policy["remaining_months"], policy["id"]) for policy in state.policies])
+
+        for record in state.records:
+            db.save_monthly_cashflow(
+                sid, record["month"], record["total_income"], record["total_expense"],
+                record["net_cashflow"], record["saving_rate"], record["cash"], conn=conn
+            )
+            db.save_monthly_snapshot(
+                session_id=sid,
+                month=record["month"],
+                total_assets=record["total_assets"],
+                cash=record["cash"],
+                invested_assets=record["invested_assets"],
+                happiness=record["happiness"],
+                conn=conn,
+            )
+        for row in state.achievement_rows:
+            db.save_achievement_unlock(sid, row, conn=conn)
+        if session_state.shares_db(db.db_path):
+            session_state.flush(sid, conn=conn)
+    state.opening_cash = state.cash
+    state.matured_ids = []
+    state.records = []
+    state.achievement_rows = []
+
+
+# ============ 内存计算阶段 ============
+
+def compute_investments(state: MonthState):
+    """投资收益（按资产类型应用宏观影响）、剩余月数递减、到期兑付"""
+    impact = state.asset_impact
+    investment_income = 0
+    for inv in state.investments:
+        if inv["remaining_months"] <= 0:
+            continue
+        inv_type = inv["investment_type"]
+        impact_factor = 1.0
+        if "股票" in inv_type or "基金" in inv_type:
+            impact_factor = impact["stock"]
+        elif "房产" in inv_type:
+            impact_factor = impact["real_estate"]
+        elif "债券" in inv_type:
+            impact_factor = impact["bond"]
+        # 月收益 = 本金 * 年化收益率 / 12 * 宏观影响
+        return_rate = inv["return_rate"]
+        if return_rate and return_rate > 0:
+            investment_income += int(inv["amount"] * return_rate / 12 * impact_factor)
+
+    matured_return = 0
+    holding = []
+    for inv in state.investments:
+        if inv["remaining_months"] > 0:
+            inv["remaining_months"] -= 1
+        if inv["remaining_months"] > 0:
+            holding.append(inv)
+            continue
+        impact_factor = impact["stock"] if "股票" in (inv["investment_type"] or '') else 1.0
+        matured_return += int(inv["amount"] * impact_factor)
+        state.matured_ids.append(inv["id"])
+    state.investments = holding
+    state.invested_assets = sum(inv["amount"] for inv in holding)
+    state.income["investment"] = investment_income
+    state.income["matured"] = matured_return
+
+
+def compute_salary(state: MonthState):
+    """职业工资，没有职业时给默认收入"""
+    from core.systems.career_system import career_system
+    monthly_salary = career_system.get_monthly_salary(state.session_id).get('total', 0)
+    if monthly_salary == 0:
+        monthly_salary = 5000 + sim_rng("session").randint(-500, 1500)
+    state.income["salary"] = monthly_salary
+
+
+def compute_side_business(state: MonthState):
+    """副业收入：按风险决定盈亏"""
+    rng = sim_rng("session")
+    side_business_income = 0
+    for expected, risk in state.side_businesses:
+        if rng.random() > risk:
+            side_business_income += int(expected * rng.uniform(0.8, 1.2))
+        else:
+            # 亏损月
+            side_business_income -= int(expected * rng.uniform(0.1, 0.3))
+    state.income["side_business"] = side_business_income
+
+
+def compute_property(state: MonthState):
+    """房产租金"""
+    state.income["property"] = sum(state.rents)
+
+
+def compute_loans(state: MonthState):
+    """贷款月供与剩余本金"""
+    loan_payment = 0
+    for loan in state.loans:
+        remaining = loan["remaining_months"]
+        if remaining <= 0:
+            continue
+        loan_payment += loan["monthly_payment"]
+        loan["remaining_principal"] -= int(loan["remaining_principal"] / remaining)
+        loan["remaining_months"] = remaining - 1
+    state.expense["loan"] = loan_payment
+
+
+def compute_insurance(state: MonthState):
+    """保费（生效中的保单）与剩余月数"""
+    state.expense["insurance"] = sum(p["monthly_premium"] for p in state.policies if p["is_active"] == 1)
+    for policy in state.policies:
+        if policy["remaining_months"] > 0:
+            policy["remaining_months"] -= 1
+
+
+def compute_living(state: MonthState):
+    """居住成本（默认 800）"""
+    state.expense["living"] = state.living[0] if state.living else 800
+
+
+def compute_cashflow(state: MonthState):
+    """基本生活开支（食物、交通等）与本月现金"""
+    state.expense["basic"] = 2000 + sim_rng("session").randint(0, 500)
+    state.cash = int(state.cash + state.net_cashflow)
+    if not state.verbose:
+        return
+    income, expense = state.income, state.expense
+    print(f"[AdvancePipeline] Income: salary={income['salary']}, invest={income['investment']}, "
+          f"matured={income['matured']}, property={income['property']}, side={income['side_business']}")
+    print(f"[AdvancePipeline] Expense: loan={expense['loan']}, insurance={expense['insurance']}, "
+          f"living={expense['living']}, base={expense['basic']}")
+    print(f"[AdvancePipeline] Net: {state.net_cashflow}, New cash: {state.cash}")
+
+
+def compute_life_status(state: MonthState):
+    """每月自然恢复/消耗，居住与经济状况影响幸福度"""
+    living_effect = (state.living[1] or 0) if state.living else 0
+    state.energy = min(100, max(0, state.energy + 5))
+    state.health = max(0, state.health - 1)
+    happiness = max(0, min(100, state.happiness + living_effect))
+    if state.cash < 10000:
+        happiness = max(0, happiness - 5)
+    elif state.cash > 500000:
+        happiness = min(100, happiness + 2)
+    state.happiness = happiness
+
+
+def record_month(state: MonthState):
+    """记录本月的现金流与快照（在 commit 中写入）"""
+    total_income = state.total_income
+    state.records.append({
+        "month": state.new_month,
+        "total_income": total_income,
+        "total_expense": state.total_expense,
+        "net_cashflow": state.net_cashflow,
+        "saving_rate": state.net_cashflow / total_income if total_income > 0 else 0,
+        "cash": state.cash,
+        "total_assets": state.total_assets,
+        "invested_assets": state.invested_assets,
+        "happiness": state.happiness if state.has_stats else None,
+    })
+
+
+def compute_events(state: MonthState):
+    """随机事件"""
+    from core.systems.event_system import event_system
+    state.events = []
+    try:
+        events = event_system.get_random_events(state.session_id, state.new_month, state.total_assets, state.phase)
+        for event in events:
+            state.events.append({
+                "id": event.id,
+                "title": event.title,
+                "description": event.description,
+                "category": event.category.value,
+                "options": [
+                    {"text": opt.text, "success_rate": opt.success_rate}
+                    for opt in event.options
+                ]
+            })
+    except Exception as e:
+        print(f"[AdvancePipeline] Event generation failed: {e}")
+
+
+def compute_achievements(state: MonthState):
+    """财富成就（已解锁列表来自 load 阶段，新解锁的在 commit 中写入）"""
+    from core.systems.session_state import session_state
+    state.achievements = []
+    try:
+        achievements = session_state.instance(state.session_id, "achievements")
+        achievements.load_unlocked_from_list(state.unlocked_achievements)
+        for ach in achievements.check_wealth_achievements(state.total_assets, state.new_month):
+            state.achievements.append(ach)
+            row = {
+                "achievement_id": ach["achievement"]["id"],
+                "achievement_name": ach["achievement"]["name"],
+                "rarity": ach["achievement"]["rarity"],
+                "reward_coins": ach["rewards"]["coins"],
+                "reward_exp": ach["rewards"]["exp"],
+                "reward_title": ach["rewards"].get("title"),
+                "unlocked_month": state.new_month
+            }
+            state.achievement_rows.append(row)
+            state.unlocked_achievements.append(row)
+    except Exception as e:
+        print(f"[AdvancePipeline] Achievement check failed: {e}")
+
+
+# 计算阶段（按顺序执行；session 流的取数顺序：职业默认工资 → 副业 → 基本开支）
+COMPUTE_STAGES: List[Stage] = [
+    ("investments", compute_investments),
+    ("career", compute_salary),
+    ("side_business", compute_side_business),
+    ("property", compute_property),
+    ("loans", compute_loans),
+    ("insurance", compute_insurance),
+    ("living", compute_living),
+    ("cashflow", compute_cashflow),
+    ("life_status", compute_life_status),
+    ("record", record_month),
+    ("events", compute_events),
+    ("achievements", compute_achievements),
+]
+
+
+class AdvancePipeline:
+    """按顺序执行阶段并计时，累计各阶段的耗时统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._stages: Dict[str, List[float]] = {}  # name -> [次数, 总耗时ms, 最大耗时ms]
+
+    def run(self, stages: Sequence[Stage], state: MonthState, finish: bool = True) -> MonthState:
+        """
+        依次执行 stages 并计时
+        finish: 是否结束本次推进（汇总总耗时、计入推进次数）；快进时逐月执行的计算阶段传 False
+        """
+        for name, stage in stages:
+            t0 = time.perf_counter()
+            try:
+                stage(state)
+            finally:
+                self._record(state, name, (time.perf_counter() - t0) * 1000)
+        if finish:
+            self._finish(state)
+        return state
+
+    def _finish(self, state: MonthState):
+        stage_timings = [(ms, name) for name, ms in state.timings.items() if name != "total"]
+        total = sum(ms for ms, _ in stage_timings)
+        state.timings["total"] = round(total, 3)
+        with self._lock:
+            self._runs += 1
+        slowest = sorted(stage_timings, reverse=True)[:3]
+        print(f"[AdvancePipeline] {state.session_id} month {state.new_month}: {total:.1f}ms "
+              f"({', '.join(f'{name}={ms:.1f}ms' for ms, name in slowest)})")
+
+    def _record(self, state: MonthState, name: str, ms: float):
+        state.timings[name] = round(state.timings.get(name, 0.0) + ms, 3)
+        with self._lock:
+            entry = self._stages.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += ms
+            entry[2] = max(entry[2], ms)
+
+    def get_stats(self) -> Dict:
+        """推进次数与各阶段的次数、平均/最大/累计耗时（毫秒）"""
+        with self._lock:
+            return {
+                "runs": self._runs,
+                "stages": {
+                    name: {
+                        "count": count,
+                        "avg_ms": round(total / count, 3) if count else 0.0,
+                        "max_ms": round(peak, 3),
+                        "total_ms": round(total, 3),
+                    }
+                    for name, (count, total, peak) in self._stages.items()
+                },
+            }
+
+
+# 全局实例
+advance_pipeline = AdvancePipeline()
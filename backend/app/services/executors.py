@@ -0,0 +1,124 @@
+"""
+执行器服务 - 把阻塞的数据库与计算工作移出事件循环
+- db 池：SQLite 读写（每个工作线程持有一条池化连接），以及进入 session_state.scope 的处理函数：
+  会话作用域可能要等其他 worker 释放跨进程会话锁（最长 LOCK_TIMEOUT），不能占住只有 1 个线程的 cpu 池；
+  作用域内各会话的状态互相隔离，同一会话由会话锁串行
+- cpu 池：市场推进、产品比较、行为分析等不进入会话作用域的模拟计算。这些单例不是线程安全的，
+  默认只开 1 个线程，保持与原先在事件循环中串行执行相同的互斥语义
+两个池都记录排队深度和等待时间，供 /system/executors 查看以便调整线程数。
+"""
+import os
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+DB_WORKERS = int(os.getenv("ECHOPOLIS_DB_WORKERS", "8"))
+CPU_WORKERS = int(os.getenv("ECHOPOLIS_CPU_WORKERS", "1"))
+WAIT_SAMPLES = 512  # 用于计算 p95 的最近等待时间样本数
+
+
+class InstrumentedExecutor:
+    """带排队指标的有界线程池"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"echopolis-{name}")
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._started = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+        self._recent_waits = deque(maxlen=WAIT_SAMPLES)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """在池中执行 func 并等待结果"""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        enqueued_at = time.perf_counter()
+        with self._lock:
+            self._submitted += 1
+
+        def task():
+            started_at = time.perf_counter()
+            wait = started_at - enqueued_at
+            with self._lock:
+                self._started += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                self._recent_waits.append(wait)
+            ok = False
+            try:
+                result = ctx.run(func, *args, **kwargs)
+                ok = True
+                return result
+            finally:
+                elapsed = time.perf_counter() - started_at
+                with self._lock:
+                    self._completed += 1
+                    self._run_total += elapsed
+                    if not ok:
+                        self._failed += 1
+
+        return await loop.run_in_executor(self._executor, task)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            started = self._started
+            waits = sorted(self._recent_waits)
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self._submitted - self._started,
+                "active": self._started - self._completed,
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait_avg_ms": round(self._wait_total / started * 1000, 2) if started else 0.0,
+                "wait_p95_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2) if waits else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 2),
+                "run_avg_ms": round(self._run_total / self._completed * 1000, 2) if self._completed else 0.0,
+            }
+
+
+db_executor = InstrumentedExecutor("db", DB_WORKERS)
+cpu_executor = InstrumentedExecutor("cpu", CPU_WORKERS)
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """在 db 池中执行阻塞的数据库操作"""
+    return await db_executor.run(func, *args, **kwargs)
+
+
+async def run_cpu(func: Callable, *args, **kwargs) -> Any:
+    """在 cpu 池中执行模拟计算"""
+    return await cpu_executor.run(func, *args, **kwargs)
+
+
+def _offload(executor: InstrumentedExecutor):
+    def decorator(func: Callable):
+        # functools.wraps 保留 __wrapped__，FastAPI 据此解析原函数的参数签名
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await executor.run(func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# 路由装饰器：把同步处理函数整体放到对应的池中执行
+offload_db = _offload(db_executor)
+offload_cpu = _offload(cpu_executor)
+
+
+def get_executor_stats() -> Dict:
+    """所有执行器的指标"""
+    return {
+        "db": db_executor.get_stats(),
+        "cpu": cpu_executor.get_stats(),
+    }
@@ -1,9 +1,22 @@
 """
 游戏服务层 - 业务逻辑处理
 """
+import os
+import json
+import asyncio
 import random
 from typing import Dict, Any, Optional, List
 
+from app.services.advance_pipeline import (
+    COMPUTE_STAGES, MonthState, SessionConflict, Stage, advance_macro, advance_market, advance_pipeline,
+    commit_month_state, load_month_state,
+)
+from app.services.executors import run_db
+from app.services.push_hub import push_hub
+from app.services.session_cache import SessionCache
+from core.systems.session_state import session_state
+from core.systems.sim_random import new_session_seed, sim_rng, simulation
+
 # 尝试导入核心游戏系统
 try:
     from core.avatar.ai_avatar import AIAvatar
@@ -20,9 +33,13 @@ except ImportError as e:
     print(f"AI modules not available: {e}")
     AI_AVAILABLE = False
 
+MAX_FAST_FORWARD = int(os.getenv("ECHOPOLIS_MAX_FAST_FORWARD", "120"))  # 单次快进的最大月数
+
 class GameService:
     def __init__(self):
-        self.game_sessions = {}
+        # 常驻的 AI 化身会话：LRU + 空闲 TTL + 内存预算，淘汰时写回数据库，未命中时按需重建
+        self.game_sessions = SessionCache(serialize=self._serialize_session, loader=self._rehydrate_session,
+                                          writer=self._write_back_session)
         self.ai_engine = None
         self.behavior_system = None
         
@@ -123,7 +140,33 @@ class GameService:
             "intervention_points": 10
         }
 
-    async def create_avatar(self, name: str, mbti: str, session_id: str) -> Dict[str, Any]:
+    def _serialize_session(self, session: Dict[str, Any]) -> Optional[str]:
+        """会话缓存写回的内容：AI 化身状态（只有 avatar_data 的临时会话不需要持久化）"""
+        avatar = session.get("avatar")
+        if avatar is None:
+            return None
+        return json.dumps(avatar.save_state(), ensure_ascii=False)
+
+    def _write_back_session(self, session_id: str, state: str):
+        if self.db:
+            self.db.save_avatar_state(session_id, state)
+
+    def _rehydrate_session(self, session_id: str):
+        """会话缓存未命中：用数据库中保存的化身状态重建会话（现金以 users 表为准）"""
+        if not (AI_AVAILABLE and self.db):
+            return None
+        state = self.db.get_avatar_state(session_id)
+        if not state:
+            return None
+        avatar = AIAvatar.from_state(json.loads(state), session_id)
+        with self.db.connect() as conn:
+            row = conn.execute('SELECT credits FROM users WHERE session_id = ?', (session_id,)).fetchone()
+        if row:
+            avatar.attributes.credits = row[0]
+        print(f"[GameService] 从数据库重建会话 {session_id} 的 AI 化身")
+        return {"avatar": avatar, "avatar_data": self._build_avatar_data(avatar, session_id)}, state
+
+    def create_avatar(self, name: str, mbti: str, session_id: str) -> Dict[str, Any]:
         if AI_AVAILABLE:
             from core.systems.mbti_traits import MBTIType
             mbti_type = MBTIType(mbti.upper())
@@ -175,20 +218,25 @@ class GameService:
         
         return avatar_data
 
-    async def generate_situation(self, session_id: str, context: str = "") -> Dict[str, Any]:
-        context_str = context if isinstance(context, str) else (context or "")
-        print(f"[DEBUG] generate_situation called for session: {session_id}, context={context_str}")
-        print(f"[DEBUG] AI_AVAILABLE: {AI_AVAILABLE}")
-        print(f"[DEBUG] AI engine available: {self.ai_engine is not None}")
-        if self.ai_engine:
-            print(f"[DEBUG] AI engine has API key: {self.ai_engine.api_key is not None}")
-        
-        if session_id not in self.game_sessions:
+    def _prepare_situation(self, session_id: str):
+        """
+        generate_situation 的同步准备阶段（在 db 池中执行）：取会话（不存在时从数据库建立临时会话），
+        需要 AI 生成时创建 AI 化身并同步用户标签、行为画像和职业状态。
+        返回 (会话, 可用于 AI 生成的化身或 None)；成功返回时会话已钉住，调用方用完 release
+        """
+        session = self.game_sessions.acquire(session_id)
+        try:
+            return self._prepare_situation_session(session_id, session)
+        except BaseException:
+            self.game_sessions.release(session_id)
+            raise
+
+    def _prepare_situation_session(self, session_id: str, session: Optional[Dict[str, Any]]):
+        if session is None:
             # 如果没有session，尝试从数据库通过session_id加载用户信息
-            import sqlite3
             user_info = None
             if self.db:
-                with sqlite3.connect(self.db.db_path) as conn:
+                with self.db.connect() as conn:
                     cursor = conn.cursor()
                     cursor.execute('SELECT name, mbti, fate, credits FROM users WHERE session_id = ?', (session_id,))
                     result = cursor.fetchone()
@@ -204,10 +252,8 @@ class GameService:
                 raise Exception(f"Session {session_id} not found in database")
             
             # 创建临时session
-            self.game_sessions[session_id] = {
-                "avatar_data": user_info
-            }
-        session = self.game_sessions[session_id]
+            session = {"avatar_data": user_info}
+            self.game_sessions[session_id] = session
         print(f"[DEBUG] Session has avatar: {'avatar' in session}")
         
         # 检查是否需要创建 AI Avatar
@@ -226,53 +272,74 @@ class GameService:
                 except Exception as e:
                     print(f"[ERROR] Failed to create AI Avatar: {e}")
         
-        if AI_AVAILABLE and "avatar" in session and self.ai_engine and self.ai_engine.api_key:
+        if not (AI_AVAILABLE and "avatar" in session and self.ai_engine and self.ai_engine.api_key):
+            return session, None
+        avatar = session["avatar"]
+        
+        # 设置用户标签到 avatar
+        try:
+            with self.db.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT tags FROM users WHERE session_id = ?', (session_id,))
+                row = cursor.fetchone()
+                if row and row[0]:
+                    avatar.set_user_tags(row[0])
+                    print(f"[DEBUG] Set user tags: {row[0]}")
+        except Exception as e:
+            print(f"[DEBUG] Failed to get user tags: {e}")
+        
+        # 设置行为画像数据到 avatar
+        if self.behavior_system:
+            try:
+                behavior_profile = self.db.get_behavior_profile(session_id)
+                if behavior_profile:
+                    avatar.set_behavior_profile(behavior_profile)
+                    # 设置自动标签
+                    if behavior_profile.get('auto_tags'):
+                        avatar.set_auto_tags(behavior_profile.get('auto_tags'))
+                    print(f"[DEBUG] Set behavior profile: {behavior_profile.get('risk_preference')}")
+            except Exception as e:
+                print(f"[DEBUG] Failed to get behavior profile: {e}")
+        
+        # 设置职业状态到 avatar
+        try:
+            from core.systems.career_system import career_system
+            with session_state.scope(session_id):
+                career_info = career_system.get_career_status(session_id)
+            # career_info 可能为 None（玩家无业时），需要转换为标准格式
+            if career_info:
+                avatar.set_career_status({"current_job": career_info})
+                print(f"[DEBUG] Set career status: {career_info.get('title', '未知')}")
+            else:
+                avatar.set_career_status({"current_job": None})
+                print(f"[DEBUG] Set career status: 无业")
+        except Exception as e:
+            print(f"[DEBUG] Failed to get career status: {e}")
+        
+        return session, avatar
+
+    async def generate_situation(self, session_id: str, context: str = "") -> Dict[str, Any]:
+        context_str = context if isinstance(context, str) else (context or "")
+        print(f"[DEBUG] generate_situation called for session: {session_id}, context={context_str}")
+        print(f"[DEBUG] AI_AVAILABLE: {AI_AVAILABLE}")
+        print(f"[DEBUG] AI engine available: {self.ai_engine is not None}")
+        if self.ai_engine:
+            print(f"[DEBUG] AI engine has API key: {self.ai_engine.api_key is not None}")
+        
+        # 读取会话、用户标签、行为画像与职业状态都是阻塞的数据库操作（职业状态还要进入会话作用域，
+        # 可能等待会话锁与跨 worker 租约），整体放到 db 池中执行，不占用事件循环
+        session, avatar = await run_db(self._prepare_situation, session_id)
+        try:
+            return await self._generate_situation(session, avatar, context)
+        finally:
+            self.game_sessions.release(session_id)
+
+    async def _generate_situation(self, session: Dict[str, Any], avatar, context) -> Dict[str, Any]:
+        """generate_situation 的主体：会话在此期间保持钉住，跨越 LLM 调用的修改不会因淘汰而丢失"""
+        if avatar is not None:
             try:
                 print(f"[DEBUG] Trying AI situation generation...")
-                avatar = session["avatar"]
-                
-                # 设置用户标签到 avatar
-                try:
-                    import sqlite3
-                    with sqlite3.connect(self.db.db_path) as conn:
-                        cursor = conn.cursor()
-                        cursor.execute('SELECT tags FROM users WHERE session_id = ?', (session_id,))
-                        row = cursor.fetchone()
-                        if row and row[0]:
-                            avatar.set_user_tags(row[0])
-                            print(f"[DEBUG] Set user tags: {row[0]}")
-                except Exception as e:
-                    print(f"[DEBUG] Failed to get user tags: {e}")
-                
-                # 设置行为画像数据到 avatar
-                if self.behavior_system:
-                    try:
-                        behavior_profile = self.db.get_behavior_profile(session_id)
-                        if behavior_profile:
-                            avatar.set_behavior_profile(behavior_profile)
-                            # 设置自动标签
-                            if behavior_profile.get('auto_tags'):
-                                avatar.set_auto_tags(behavior_profile.get('auto_tags'))
-                            print(f"[DEBUG] Set behavior profile: {behavior_profile.get('risk_preference')}")
-                    except Exception as e:
-                        print(f"[DEBUG] Failed to get behavior profile: {e}")
-                
-                # 设置职业状态到 avatar
-                try:
-                    from core.systems.career_system import career_system
-                    career_info = career_system.get_career_status(session_id)
-                    # career_info 可能为 None（玩家无业时），需要转换为标准格式
-                    if career_info:
-                        avatar.set_career_status({"current_job": career_info})
-                        print(f"[DEBUG] Set career status: {career_info.get('title', '未知')}")
-                    else:
-                        avatar.set_career_status({"current_job": None})
-                        print(f"[DEBUG] Set career status: 无业")
-                except Exception as e:
-                    print(f"[DEBUG] Failed to get career status: {e}")
-                
-                # 使用 asyncio.to_thread 将阻塞的 AI 调用放到线程池，避免阻塞事件循环
-                import asyncio
+                # 阻塞的 AI 调用放到线程池，避免阻塞事件循环
                 situation = await asyncio.to_thread(avatar.generate_situation, self.ai_engine)
                 if situation:
                     print(f"[DEBUG] AI situation generated successfully")
@@ -281,7 +348,7 @@ class GameService:
                         "situation": situation.situation,
                         "options": situation.options,
                         "context_type": context,
-                        "ai_generated": True
+                        "ai_generated": situation.context_type == "ai_generated"
                     }
                 else:
                     print(f"[DEBUG] AI situation generation returned None")
@@ -314,20 +381,53 @@ class GameService:
             "ai_generated": False
         }
 
-    async def send_echo(self, session_id: str, echo_text: str) -> Dict[str, Any]:
-        if session_id not in self.game_sessions:
+    def _decide(self, session_id: str, session: Dict[str, Any], avatar, echo_text: Optional[str]):
+        """
+        AI 化身做出决策，成功后刷新化身数据并自动生成下一个情况（send_echo / auto_decision 在线程池中调用）
+        返回 (决策结果, 下一个情况或 None)
+        """
+        decision_result = avatar.make_decision(echo_text, self.ai_engine)
+        if "error" in decision_result:
+            return decision_result, None
+        session["avatar_data"] = self._build_avatar_data(avatar, session_id)
+        
+        # 自动生成下一个情况
+        next_situation = None
+        if not decision_result.get("is_bankrupt", False):
+            try:
+                next_situation = avatar.generate_situation(self.ai_engine)
+                if next_situation:
+                    session["current_situation"] = next_situation
+            except Exception as e:
+                print(f"Auto-generate next situation failed: {e}")
+        return decision_result, next_situation
+
+    def _checkout_session(self, session_id: str) -> Dict[str, Any]:
+        """
+        取会话并钉住（send_echo / auto_decision 在 db 池中调用，用完 release）：
+        缓存未命中时可能从数据库重建，没有保存的状态时从数据库加载用户信息建立临时会话
+        """
+        session = self.game_sessions.acquire(session_id)
+        if session is None:
             # 如果没有session，尝试从数据库加载用户信息
             user_info = self.get_user_info(session_id)
             if not user_info:
+                self.game_sessions.release(session_id)
                 raise Exception("Session not found")
             
             # 创建临时session
-            self.game_sessions[session_id] = {
-                "avatar_data": user_info
-            }
-        
-        session = self.game_sessions[session_id]
-        
+            session = {"avatar_data": user_info}
+            self.game_sessions[session_id] = session
+        return session
+
+    async def send_echo(self, session_id: str, echo_text: str) -> Dict[str, Any]:
+        session = await run_db(self._checkout_session, session_id)
+        try:
+            return await self._send_echo(session_id, session, echo_text)
+        finally:
+            self.game_sessions.release(session_id)
+
+    async def _send_echo(self, session_id: str, session: Dict[str, Any], echo_text: str) -> Dict[str, Any]:
         if AI_AVAILABLE and "avatar" in session and self.ai_engine:
             try:
                 avatar = session["avatar"]
@@ -336,21 +436,11 @@ class GameService:
                 if not current_situation:
                     raise Exception("No current situation")
                 
-                decision_result = avatar.make_decision(echo_text, self.ai_engine)
+                # 决策与下一个情况的生成都会阻塞（LLM 请求及重试退避、数据库读写），放到线程池执行
+                decision_result, next_situation = await asyncio.to_thread(
+                    self._decide, session_id, session, avatar, echo_text)
                 
                 if "error" not in decision_result:
-                    session["avatar_data"] = self._build_avatar_data(avatar, session_id)
-                    
-                    # 自动生成下一个情况
-                    next_situation = None
-                    if not decision_result.get("is_bankrupt", False):
-                        try:
-                            next_situation = avatar.generate_situation(self.ai_engine)
-                            if next_situation:
-                                session["current_situation"] = next_situation
-                        except Exception as e:
-                            print(f"Auto-generate next situation failed: {e}")
-                    
                     return {
                         "echo_analysis": {"type": "advisory", "confidence": 0.8, "ai_powered": True},
                         "decision": {
@@ -407,18 +497,13 @@ class GameService:
         }
 
     async def auto_decision(self, session_id: str) -> Dict[str, Any]:
-        if session_id not in self.game_sessions:
-            # 如果没有session，尝试从数据库加载用户信息
-            user_info = self.get_user_info(session_id)
-            if not user_info:
-                raise Exception("Session not found")
-            
-            # 创建临时session
-            self.game_sessions[session_id] = {
-                "avatar_data": user_info
-            }
-        
-        session = self.game_sessions[session_id]
+        session = await run_db(self._checkout_session, session_id)
+        try:
+            return await self._auto_decision(session_id, session)
+        finally:
+            self.game_sessions.release(session_id)
+
+    async def _auto_decision(self, session_id: str, session: Dict[str, Any]) -> Dict[str, Any]:
         current_situation = session.get("current_situation", {})
         
         if not current_situation:
@@ -427,21 +512,10 @@ class GameService:
         if AI_AVAILABLE and "avatar" in session and self.ai_engine:
             try:
                 avatar = session["avatar"]
-                decision_result = avatar.make_decision(None, self.ai_engine)
+                decision_result, next_situation = await asyncio.to_thread(
+                    self._decide, session_id, session, avatar, None)
                 
                 if "error" not in decision_result:
-                    session["avatar_data"] = self._build_avatar_data(avatar, session_id)
-                    
-                    # 自动生成下一个情况
-                    next_situation = None
-                    if not decision_result.get("is_bankrupt", False):
-                        try:
-                            next_situation = avatar.generate_situation(self.ai_engine)
-                            if next_situation:
-                                session["current_situation"] = next_situation
-                        except Exception as e:
-                            print(f"Auto-generate next situation failed: {e}")
-                    
                     return {
                         "decision": {
                             "chosen_option": decision_result["chosen_option"],
@@ -522,8 +596,8 @@ class GameService:
             return self.db.get_user_info(username)
         return None
 
-    def start_session(self, username: str, name: str, mbti: str) -> Dict[str, Any]:
-        """创建一个新的游戏会话并返回基础状态"""
+    def start_session(self, username: str, name: str, mbti: str, seed: Optional[int] = None) -> Dict[str, Any]:
+        """创建一个新的游戏会话并返回基础状态；seed 为模拟种子，未指定时生成一个并记录，便于重放"""
         if not self.db:
             raise Exception("数据库未初始化")
         # 简单使用 username+随机后缀 作为 session_id
@@ -535,7 +609,8 @@ class GameService:
         initial_credits = 50000
         # 保存用户与会话
         self.db.save_user(username=username, session_id=session_id, name=name, mbti=mbti, fate=fate, credits=initial_credits)
-        self.db.upsert_session(session_id=session_id, username=username)
+        sim_seed = new_session_seed(seed)
+        self.db.upsert_session(session_id=session_id, username=username, sim_seed=sim_seed)
         # 初始化月度快照（第1月）
         self.db.save_monthly_snapshot(
             session_id=session_id,
@@ -556,16 +631,16 @@ class GameService:
             "total_assets": initial_credits,
             "cash": initial_credits,
             "trust_level": 50,
+            "seed": sim_seed,
         }
 
     def get_session_state(self, session_id: str) -> Dict[str, Any]:
         """聚合会话当前状态：资产/投资/情绪"""
         if not self.db:
             raise Exception("数据库未初始化")
-        import sqlite3
         from core.systems.market_engine import market_engine
         
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT name, mbti, credits, username FROM users WHERE session_id = ?', (session_id,))
             row = cursor.fetchone()
@@ -630,335 +705,141 @@ class GameService:
             "timeline": timeline,
         }
 
-    def advance_session(self, session_id: str, echo_text: Optional[str] = None) -> Dict[str, Any]:
-        """推进一个月份：整合所有系统的月度更新"""
+    def advance_session(self, session_id: str, echo_text: Optional[str] = None, months: int = 1) -> Dict[str, Any]:
+        """
+        推进一个月份：整合所有系统的月度更新
+        在会话作用域内执行（同一会话的推进跨 worker 串行，各子系统的会话状态从会话状态存储读写），
+        并在会话种子的模拟上下文中执行（相同种子可重放）
+        months > 1 时快进多个月（见 _fast_forward），写入的数据与逐月推进相同
+        读取之后会话被世界时钟批量推进抢先推进时提交会回滚（SessionConflict），
+        此时退出作用域丢弃本次的会话状态，从新的月份重新推进一次
+        """
         print(f"[GameService] advance_session start: {session_id}")
         if not self.db:
             raise Exception("数据库未初始化")
-            
-        # 推进宏观经济
-        macro_stats = macro_economy.advance_month()
-        print(f"[GameService] Macro stats: {macro_stats}")
-        asset_impact = macro_economy.get_asset_impact()
-        
-        # ============ 推进市场引擎（股票价格更新）============
-        market_report = None
+        if not 1 <= months <= MAX_FAST_FORWARD:
+            raise ValueError(f"推进月数需在 1 到 {MAX_FAST_FORWARD} 之间")
         try:
-            from core.systems.market_engine import market_engine
-            economic_phase = macro_stats.get('phase', 'expansion')
-            market_report = market_engine.advance_month_with_report(economic_phase)
-            print(f"[GameService] Market updated: index_change={market_report.get('index_change')}%, gainers={len(market_report.get('gainers', []))}")
-        except Exception as e:
-            print(f"[GameService] Market engine update failed: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        import sqlite3
-        # 加载基本状态
-        with sqlite3.connect(self.db.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # 获取用户完整状态（包括生活属性）
-            cursor.execute("PRAGMA table_info(users)")
-            columns = [col[1] for col in cursor.fetchall()]
-            has_stats = 'happiness' in columns
-            
-            if has_stats:
-                cursor.execute('SELECT name, mbti, credits, username, happiness, energy, health FROM users WHERE session_id = ?', (session_id,))
-            else:
-                cursor.execute('SELECT name, mbti, credits, username FROM users WHERE session_id = ?', (session_id,))
-            
-            row = cursor.fetchone()
-            if not row:
-                raise Exception("会话不存在")
-            
-            name, mbti, cash, username = row[:4]
-            happiness = row[4] if has_stats and len(row) > 4 else 70
-            energy = row[5] if has_stats and len(row) > 5 else 75
-            health = row[6] if has_stats and len(row) > 6 else 80
-            
-            # ============ 1. 投资系统 ============
-            cursor.execute('SELECT SUM(amount) FROM investments WHERE session_id = ? AND remaining_months > 0', (session_id,))
-            invested = cursor.fetchone()[0] or 0
-            
-            # 投资收益计算
-            cursor.execute('''
-                SELECT id, name, amount, return_rate, monthly_return, investment_type
-                FROM investments 
-                WHERE session_id = ? AND remaining_months > 0
-            ''', (session_id,))
-            
-            investment_income = 0
-            for inv in cursor.fetchall():
-                inv_type = inv[5]
-                base_return = inv[4]
-                amount = inv[2]
-                return_rate = inv[3]
-                
-                # 根据资产类型应用宏观影响
-                impact_factor = 1.0
-                if "股票" in inv_type or "基金" in inv_type:
-                    impact_factor = asset_impact["stock"]
-                elif "房产" in inv_type:
-                    impact_factor = asset_impact["real_estate"]
-                elif "债券" in inv_type:
-                    impact_factor = asset_impact["bond"]
-                
-                # 月收益 = 本金 * 年化收益率 / 12 * 宏观影响
-                if return_rate and return_rate > 0:
-                    monthly_return = int(amount * return_rate / 12 * impact_factor)
-                    investment_income += monthly_return
+            return self._advance_in_scope(session_id, echo_text, months)
+        except SessionConflict as e:
+            print(f"[GameService] {e}，重新推进")
+            return self._advance_in_scope(session_id, echo_text, months)
 
-            # 更新投资剩余月数
-            cursor.execute('''
-                UPDATE investments SET remaining_months = remaining_months - 1
-                WHERE session_id = ? AND remaining_months > 0
-            ''', (session_id,))
-            
-            # 处理到期投资
-            cursor.execute('''
-                SELECT id, name, amount, return_rate, investment_type
-                FROM investments WHERE session_id = ? AND remaining_months <= 0
-            ''', (session_id,))
-            
-            matured_return = 0
-            for iid, iname, amount, return_rate, inv_type in cursor.fetchall():
-                impact_factor = 1.0
-                if "股票" in (inv_type or ''):
-                    impact_factor = asset_impact["stock"]
-                
-                final_amount = int(amount * impact_factor)
-                matured_return += final_amount
-                cursor.execute('DELETE FROM investments WHERE id = ?', (iid,))
-            
-            # ============ 2. 职业收入系统 ============
-            from core.systems.career_system import career_system
-            
-            # 获取职业工资
-            salary_info = career_system.get_monthly_salary(session_id)
-            monthly_salary = salary_info.get('total', 0)
-            
-            # 如果没有职业，给默认收入
-            if monthly_salary == 0:
-                monthly_salary = 5000 + random.randint(-500, 1500)
-            
-            # ============ 3. 副业收入 ============
-            side_business_income = 0
-            try:
-                cursor.execute('''
-                    SELECT name, expected_return, risk_rate FROM side_businesses
-                    WHERE session_id = ? AND status = 'running'
-                ''', (session_id,))
-                for biz_name, expected, risk in cursor.fetchall():
-                    # 根据风险决定实际收入
-                    if random.random() > risk:
-                        actual_income = int(expected * random.uniform(0.8, 1.2))
-                        side_business_income += actual_income
-                    else:
-                        # 亏损月
-                        side_business_income -= int(expected * random.uniform(0.1, 0.3))
-            except:
-                pass
-            
-            # ============ 4. 房产系统 ============
-            property_income = 0
-            try:
-                cursor.execute('''
-                    SELECT monthly_rent FROM properties
-                    WHERE session_id = ? AND is_rented = 1
-                ''', (session_id,))
-                for (rent,) in cursor.fetchall():
-                    property_income += rent or 0
-            except:
-                pass
-            
-            # ============ 5. 贷款还款 ============
-            loan_payment = 0
-            try:
-                cursor.execute('''
-                    SELECT loan_id, monthly_payment, remaining_months, remaining_principal
-                    FROM loans WHERE session_id = ? AND remaining_months > 0
-                ''', (session_id,))
-                for loan_id, payment, remaining, principal in cursor.fetchall():
-                    loan_payment += payment
-                    # 更新贷款
-                    cursor.execute('''
-                        UPDATE loans SET remaining_months = remaining_months - 1,
-                            remaining_principal = remaining_principal - ?
-                        WHERE loan_id = ?
-                    ''', (int(principal / remaining) if remaining > 0 else 0, loan_id))
-            except:
-                pass
-            
-            # ============ 6. 保险费用 ============
-            insurance_cost = 0
-            try:
-                cursor.execute('''
-                    SELECT monthly_premium FROM insurance_policies
-                    WHERE session_id = ? AND is_active = 1
-                ''', (session_id,))
-                for (premium,) in cursor.fetchall():
-                    insurance_cost += premium
-                # 更新保险剩余月数
-                cursor.execute('''
-                    UPDATE insurance_policies SET remaining_months = remaining_months - 1
-                    WHERE session_id = ? AND remaining_months > 0
-                ''', (session_id,))
-            except:
-                pass
-            
-            # ============ 7. 居住成本 ============
-            living_cost = 800  # 默认
-            living_happiness_effect = 0
-            try:
-                cursor.execute('''
-                    SELECT monthly_cost, happiness_effect FROM living_status WHERE session_id = ?
-                ''', (session_id,))
-                row = cursor.fetchone()
-                if row:
-                    living_cost = row[0]
-                    living_happiness_effect = row[1] or 0
-            except:
-                pass
-            
-            # ============ 8. 基本生活开支 ============
-            base_expense = 2000 + random.randint(0, 500)  # 食物、交通等
-            
-            # ============ 汇总现金流 ============
-            total_income = monthly_salary + investment_income + matured_return + property_income + side_business_income
-            total_expense = loan_payment + insurance_cost + living_cost + base_expense
-            net_cashflow = total_income - total_expense
-            
-            new_cash = int(cash + net_cashflow)
-            
-            print(f"[GameService] Income: salary={monthly_salary}, invest={investment_income}, matured={matured_return}, property={property_income}, side={side_business_income}")
-            print(f"[GameService] Expense: loan={loan_payment}, insurance={insurance_cost}, living={living_cost}, base={base_expense}")
-            print(f"[GameService] Net: {net_cashflow}, New cash: {new_cash}")
-            
-            # ============ 9. 更新生活状态 ============
-            # 每月自然恢复/消耗
-            new_energy = min(100, max(0, energy + 5))  # 自然恢复
-            new_health = max(0, health - 1)  # 轻微消耗
-            new_happiness = max(0, min(100, happiness + living_happiness_effect))
-            
-            # 经济状况影响幸福度
-            if new_cash < 10000:
-                new_happiness = max(0, new_happiness - 5)
-            elif new_cash > 500000:
-                new_happiness = min(100, new_happiness + 2)
-            
-            # 更新用户状态
-            if has_stats:
-                cursor.execute('''
-                    UPDATE users SET credits = ?, happiness = ?, energy = ?, health = ?
-                    WHERE session_id = ?
-                ''', (new_cash, new_happiness, new_energy, new_health, session_id))
-            else:
-                cursor.execute('UPDATE users SET credits = ? WHERE session_id = ?', (new_cash, session_id))
-            
-            conn.commit()
-            
-        # 更新月份与快照
-        new_month = self.db.advance_session_month(session_id)
-        
-        # 计算当前总投资
-        with sqlite3.connect(self.db.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT SUM(amount) FROM investments WHERE session_id = ? AND remaining_months > 0', (session_id,))
-            current_invested = cursor.fetchone()[0] or 0
-        
-        total_assets = new_cash + current_invested
-        
-        # 保存月度现金流记录
-        saving_rate = net_cashflow / total_income if total_income > 0 else 0
-        self.db.save_monthly_cashflow(
-            session_id, new_month, total_income, total_expense,
-            net_cashflow, saving_rate, new_cash
-        )
-        
-        # 保存月度快照
-        self.db.save_monthly_snapshot(
-            session_id=session_id,
-            month=new_month,
-            total_assets=total_assets,
-            cash=new_cash,
-            invested_assets=current_invested,
-            happiness=new_happiness if has_stats else None,
-        )
-        
-        # ============ 10. 事件系统 - 可能触发随机事件 ============
-        from core.systems.event_system import event_system
-        triggered_events = []
-        try:
-            events = event_system.get_random_events(
-                session_id, new_month, total_assets, macro_stats.get('phase', 'expansion')
-            )
-            for event in events:
-                triggered_events.append({
-                    "id": event.id,
-                    "title": event.title,
-                    "description": event.description,
-                    "category": event.category.value,
-                    "options": [
-                        {"text": opt.text, "success_rate": opt.success_rate}
-                        for opt in event.options
-                    ]
-                })
-        except Exception as e:
-            print(f"[GameService] Event generation failed: {e}")
-        
-        # ============ 11. 成就检查 ============
-        from core.systems.achievement_system import achievement_system
-        new_achievements = []
-        try:
-            unlocked = achievement_system.check_wealth_achievements(total_assets, new_month)
-            for ach in unlocked:
-                new_achievements.append(ach)
-                self.db.save_achievement_unlock(session_id, {
-                    "achievement_id": ach["achievement"]["id"],
-                    "achievement_name": ach["achievement"]["name"],
-                    "rarity": ach["achievement"]["rarity"],
-                    "reward_coins": ach["rewards"]["coins"],
-                    "reward_exp": ach["rewards"]["exp"],
-                    "reward_title": ach["rewards"].get("title"),
-                    "unlocked_month": new_month
-                })
-        except Exception as e:
-            print(f"[GameService] Achievement check failed: {e}")
-        
-        # 生成新情境
+    def _advance_in_scope(self, session_id: str, echo_text: Optional[str], months: int) -> Dict[str, Any]:
+        with session_state.scope(session_id):
+            target_month = self.db.get_session_month(session_id) + 1
+            if months > 1:
+                return self._fast_forward(session_id, target_month, months, echo_text)
+            with simulation(self.db.get_session_seed(session_id), target_month):
+                return self._advance_month(session_id, target_month, echo_text)
+
+    def _advance_month(self, session_id: str, target_month: int, echo_text: Optional[str] = None) -> Dict[str, Any]:
+        """advance_session 的月度更新主体：按 _advance_stages 声明的阶段执行，随机数取自 sim_rng 的各个流"""
+        state = MonthState(session_id=session_id, new_month=target_month)
+        advance_pipeline.run(self._advance_stages(), state)
+        print(f"[GameService] advance_session completed. New month: {state.new_month}, Cash: {state.cash}, Total: {state.total_assets}")
+
+        result = self._month_result(state)
+        # 推送给订阅该会话的 WebSocket 客户端
+        push_hub.publish_session(session_id, result)
+        return result
+
+    def _fast_forward(self, session_id: str, first_month: int, months: int,
+                      echo_text: Optional[str] = None) -> Dict[str, Any]:
+        """
+        快进多个月：读取一次，各月的宏观、市场与计算阶段在同一个 MonthState 上逐月执行（投资、贷款、保单、
+        现金与生活状态留在内存中），所有月份的现金流 / 快照 / 成就在一个写事务中提交；
+        情境（可能调用 LLM）、行为洞察与财务反思只在最后一个月生成。
+        每个月在自己的模拟上下文中计算，与逐月调用 advance_session 写入的数据相同。
+        返回最后一个月的完整结果，外加逐月的精简序列 series
+        """
+        seed = self.db.get_session_seed(session_id)
+        state = MonthState(session_id=session_id, new_month=first_month, verbose=False)
+        month_stages = [("macro", advance_macro), ("market", advance_market), *COMPUTE_STAGES]
+        advance_pipeline.run([("load", lambda state: load_month_state(self.db, state))], state, finish=False)
+
+        series, achievements = [], []
+        for new_month in range(first_month, first_month + months):
+            state.new_month = new_month
+            with simulation(seed, new_month):
+                advance_pipeline.run(month_stages, state, finish=False)
+            achievements.extend(state.achievements)
+            series.append({
+                "month": new_month,
+                "cash": state.cash,
+                "total_assets": state.total_assets,
+                "invested_assets": state.invested_assets,
+                "income": state.total_income,
+                "expense": state.total_expense,
+                "net_cashflow": state.net_cashflow,
+                "happiness": state.happiness,
+                "phase": state.phase,
+                "events": [event["title"] for event in state.events],
+                "achievements": [ach["achievement"]["name"] for ach in state.achievements],
+            })
+
+        with simulation(seed, state.new_month):
+            advance_pipeline.run([
+                ("commit", lambda state: commit_month_state(self.db, state)),
+                ("situation", self._stage_situation),
+                ("behavior", self._stage_behavior),
+                ("reflection", self._stage_reflection),
+            ], state)
+        state.achievements = achievements
+        print(f"[GameService] fast-forward {months} months completed. New month: {state.new_month}, "
+              f"Cash: {state.cash}, Total: {state.total_assets}")
+
+        result = self._month_result(state)
+        result["months"] = months
+        result["series"] = series
+        push_hub.publish_session(session_id, result)
+        return result
+
+    def _advance_stages(self) -> List[Stage]:
+        """月度推进的阶段：宏观与市场 → 批量读取 → 内存计算 → 一次写事务 → 情境 / 行为洞察 / 财务反思"""
+        return [
+            ("macro", advance_macro),
+            ("market", advance_market),
+            ("load", lambda state: load_month_state(self.db, state)),
+            *COMPUTE_STAGES,
+            ("commit", lambda state: commit_month_state(self.db, state)),
+            ("situation", self._stage_situation),
+            ("behavior", self._stage_behavior),
+            ("reflection", self._stage_reflection),
+        ]
+
+    def _stage_situation(self, state: MonthState):
+        """生成新情境：有 AI 引擎时由化身生成，否则按宏观与现金流给出模板情境"""
+        session_id, new_month, macro_stats = state.session_id, state.new_month, state.macro_stats
         situation_payload = None
+        pinned = False
         try:
             if AI_AVAILABLE and self.ai_engine and self.ai_engine.api_key:
-                if session_id in self.game_sessions and "avatar" in self.game_sessions[session_id]:
-                    avatar = self.game_sessions[session_id]["avatar"]
+                # 生成期间钉住缓存中的会话，化身跨越 LLM 调用的修改不会因淘汰而丢失
+                cached = self.game_sessions.acquire(session_id)
+                pinned = True
+                if cached and "avatar" in cached:
+                    avatar = cached["avatar"]
                 else:
                     from core.systems.mbti_traits import MBTIType
                     try:
-                        mbti_enum = MBTIType(mbti)
+                        mbti_enum = MBTIType(state.mbti)
                     except:
                         mbti_enum = MBTIType.INTJ
                         
-                    avatar = AIAvatar(name, mbti_enum, session_id)
+                    avatar = AIAvatar(state.name, mbti_enum, session_id)
                     self.game_sessions[session_id] = {"avatar": avatar}
                 
                 # 同步最新状态给 Avatar 实例
-                avatar.attributes.credits = new_cash
+                avatar.attributes.credits = state.cash
                 avatar.attributes.current_month = new_month
-                avatar.attributes.invested_assets = current_invested
+                avatar.attributes.invested_assets = state.invested_assets
                 avatar.attributes.decision_count = new_month  # 用月份作为决策计数
                 
-                # 从数据库加载用户标签
-                try:
-                    with sqlite3.connect(self.db.db_path) as conn:
-                        cursor = conn.cursor()
-                        cursor.execute('SELECT tags FROM users WHERE session_id = ?', (session_id,))
-                        row = cursor.fetchone()
-                        if row and row[0]:
-                            avatar.set_user_tags(row[0])
-                            print(f"[GameService] 加载用户标签: {row[0]}")
-                except Exception as e:
-                    print(f"[GameService] 加载用户标签失败: {e}")
+                # 用户标签（load 阶段已读出）
+                if state.tags:
+                    avatar.set_user_tags(state.tags)
+                    print(f"[GameService] 加载用户标签: {state.tags}")
                 
                 # 加载职业状态
                 try:
@@ -974,7 +855,7 @@ class GameService:
                     situation_payload = {
                         "situation": ctx.situation,
                         "options": ctx.options,
-                        "ai_generated": True,
+                        "ai_generated": ctx.context_type == "ai_generated",
                     }
             
             if not situation_payload:
@@ -984,10 +865,10 @@ class GameService:
                     "contraction": "经济衰退",
                     "trough": "经济萧条"
                 }
-                phase_cn = phase_map.get(macro_stats.get('phase', 'expansion'), "经济波动")
+                phase_cn = phase_map.get(state.phase, "经济波动")
                 
                 situation_payload = {
-                    "situation": f"第{new_month}个月开始了。当前经济处于{phase_cn}阶段，通胀率{macro_stats.get('inflation', 2.5):.1f}%。本月收入¥{total_income:,}，支出¥{total_expense:,}，净现金流¥{net_cashflow:,}。",
+                    "situation": f"第{new_month}个月开始了。当前经济处于{phase_cn}阶段，通胀率{macro_stats.get('inflation', 2.5):.1f}%。本月收入¥{state.total_income:,}，支出¥{state.total_expense:,}，净现金流¥{state.net_cashflow:,}。",
                     "options": [
                         "继续当前策略，保持稳健发展",
                         "调整投资组合，寻求更高收益",
@@ -1002,9 +883,14 @@ class GameService:
                 "options": ["保持现状", "调整策略", "积极投资"],
                 "ai_generated": False,
             }
-            
-        # ============ 12. 行为洞察分析 ============
-        behavior_profile = None
+        finally:
+            if pinned:
+                self.game_sessions.release(session_id)
+        state.situation = situation_payload
+
+    def _stage_behavior(self, state: MonthState):
+        """行为洞察分析：每3个月更新行为画像，每6个月生成群体洞察"""
+        session_id, new_month = state.session_id, state.new_month
         behavior_achievements = []
         try:
             if self.behavior_system:
@@ -1039,67 +925,72 @@ class GameService:
                     print(f"[GameService] Generated {len(cohort_insights)} cohort insights")
         except Exception as e:
             print(f"[GameService] Behavior insight analysis failed: {e}")
-        
-        print(f"[GameService] advance_session completed. New month: {new_month}, Cash: {new_cash}, Total: {total_assets}")
-        
-        # 生成 AI 思考/反思
-        reflection = self._generate_financial_reflection(
-            new_month, new_cash, total_assets, total_income, total_expense, 
-            net_cashflow, macro_stats, new_happiness if has_stats else 70
+        state.behavior_achievements = behavior_achievements
+
+    def _stage_reflection(self, state: MonthState):
+        """生成 AI 思考/反思"""
+        state.reflection = self._generate_financial_reflection(
+            state.new_month, state.cash, state.total_assets, state.total_income, state.total_expense,
+            state.net_cashflow, state.macro_stats, state.happiness if state.has_stats else 70
         )
-        
+
+    def _month_result(self, state: MonthState) -> Dict[str, Any]:
+        """月度推进的返回值（同时推送给 WebSocket 订阅者）"""
+        income, expense = state.income, state.expense
         return {
             "success": True,
-            "session_id": session_id,
-            "new_month": new_month,
-            "cash": new_cash,
-            "total_assets": total_assets,
-            "invested_assets": current_invested,
+            "session_id": state.session_id,
+            "new_month": state.new_month,
+            "cash": state.cash,
+            "total_assets": state.total_assets,
+            "invested_assets": state.invested_assets,
             # 收入明细
             "income_breakdown": {
-                "salary": monthly_salary,
-                "investment": investment_income,
-                "matured": matured_return,
-                "property": property_income,
-                "side_business": side_business_income,
-                "total": total_income
+                "salary": income["salary"],
+                "investment": income["investment"],
+                "matured": income["matured"],
+                "property": income["property"],
+                "side_business": income["side_business"],
+                "total": state.total_income
             },
             # 支出明细
             "expense_breakdown": {
-                "loan": loan_payment,
-                "insurance": insurance_cost,
-                "living": living_cost,
-                "basic": base_expense,
-                "total": total_expense
+                "loan": expense["loan"],
+                "insurance": expense["insurance"],
+                "living": expense["living"],
+                "basic": expense["basic"],
+                "total": state.total_expense
             },
-            "net_cashflow": net_cashflow,
+            "net_cashflow": state.net_cashflow,
             # 生活状态
             "life_status": {
-                "happiness": new_happiness if has_stats else 70,
-                "energy": new_energy if has_stats else 75,
-                "health": new_health if has_stats else 80
+                "happiness": state.happiness if state.has_stats else 70,
+                "energy": state.energy if state.has_stats else 75,
+                "health": state.health if state.has_stats else 80
             },
             # 情境
-            "situation": situation_payload["situation"],
-            "options": situation_payload["options"],
-            "ai_generated": situation_payload["ai_generated"],
+            "situation": state.situation["situation"],
+            "options": state.situation["options"],
+            "ai_generated": state.situation["ai_generated"],
             # AI 思考
-            "reflection": reflection,
+            "reflection": state.reflection,
             # 宏观经济
-            "macro_economy": macro_stats,
+            "macro_economy": state.macro_stats,
             # 股票市场报告
-            "market_report": market_report,
+            "market_report": state.market_report,
             # 触发的事件
-            "events": triggered_events,
+            "events": state.events,
             # 解锁的成就（包括行为成就）
-            "achievements": new_achievements + behavior_achievements
+            "achievements": state.achievements + state.behavior_achievements,
+            # 各阶段耗时（毫秒）
+            "timings": state.timings,
         }
 
     def _generate_financial_reflection(self, month: int, cash: int, total_assets: int, 
                                          income: int, expense: int, net_cashflow: int,
                                          macro_stats: dict, happiness: int) -> str:
         """生成 AI 财务思考/反思"""
-        import random
+        rng = sim_rng("reflection")
         
         # 经济阶段描述
         phase_desc = {
@@ -1157,7 +1048,7 @@ class GameService:
             reflections.append("生活状态良好，身心平衡是长期财富增长的基础。")
         
         # 随机选择2-3条组合
-        selected = random.sample(reflections, min(3, len(reflections)))
+        selected = rng.sample(reflections, min(3, len(reflections)))
         return " ".join(selected)
 
     def finish_session(self, session_id: str) -> Dict[str, Any]:
@@ -1274,12 +1165,41 @@ class GameService:
         return payload
 
     async def ai_chat(self, message: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        context = await run_db(self._build_chat_context, session_id)
+        
+        if self.ai_engine and self.ai_engine.api_key:
+            try:
+                return await self.ai_engine.chat(message, session_id=session_id, context=context)
+            except Exception as e:
+                print(f"[AI Chat] error: {e}")
+        
+        # Fallback
+        return {
+            "response": f"系统离线中... (收到: {message})",
+            "reflection": "连接断开",
+            "monologue": "..."
+        }
+
+    async def ai_chat_stream(self, message: str, session_id: Optional[str] = None):
+        """流式聊天：逐段产出回复文本，AI不可用时产出离线提示"""
+        context = await run_db(self._build_chat_context, session_id)
+        
+        if self.ai_engine and self.ai_engine.api_key:
+            async for text in self.ai_engine.chat_stream(message, session_id=session_id, context=context):
+                yield text
+            return
+        
+        # Fallback
+        yield f"系统离线中... (收到: {message})"
+
+    def _build_chat_context(self, session_id: Optional[str]) -> Dict[str, Any]:
+        """构建AI聊天的实时上下文（内存中的会话优先，不足时从数据库补充）"""
         context = {}
         if session_id:
             try:
                 # 优先从内存获取丰富上下文
-                if session_id in self.game_sessions:
-                    session = self.game_sessions[session_id]
+                session = self.game_sessions.get(session_id)
+                if session:
                     if "avatar_data" in session:
                         data = session["avatar_data"]
                         context.update({
@@ -1301,8 +1221,7 @@ class GameService:
 
                 # 如果内存信息不足，从数据库补充
                 if (not context.get("name") or not context.get("current_situation")) and self.db:
-                    import sqlite3
-                    with sqlite3.connect(self.db.db_path) as conn:
+                    with self.db.connect() as conn:
                         cursor = conn.cursor()
                         
                         if not context.get("name"):
@@ -1334,19 +1253,8 @@ class GameService:
             
             except Exception as e:
                 print(f"[AI Chat] Context build error: {e}")
-
-        if self.ai_engine and self.ai_engine.api_key:
-            try:
-                return await self.ai_engine.chat(message, session_id=session_id, context=context)
-            except Exception as e:
-                print(f"[AI Chat] error: {e}")
         
-        # Fallback
-        return {
-            "response": f"系统离线中... (收到: {message})",
-            "reflection": "连接断开",
-            "monologue": "..."
-        }
+        return context
 
     def get_macro_indicators(self) -> Dict[str, Any]:
         """获取宏观经济指标"""
@@ -1361,9 +1269,9 @@ class GameService:
     def delete_character(self, session_id: str) -> bool:
         """删除角色"""
         if self.db:
-            # 从内存中移除
-            if session_id in self.game_sessions:
-                del self.game_sessions[session_id]
+            # 从内存和会话状态存储中移除
+            self.game_sessions.pop(session_id, None)
+            session_state.delete(session_id)
             # 从数据库中移除
             return self.db.delete_user(session_id)
         return False
@@ -1372,8 +1280,7 @@ class GameService:
         """获取会话交易记录"""
         if not self.db:
             return []
-        import sqlite3
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT round_num, transaction_name, amount, created_at, ai_thoughts
@@ -1403,7 +1310,6 @@ class GameService:
         print(f"[GameService] Processing decision: {option_text}")
         
         import re
-        import sqlite3
         
         # 1. 解析金额
         # 匹配 "投资50万", "50万元", "50000", "5万", "50w" 等
@@ -1464,7 +1370,7 @@ class GameService:
         cash_change = 0
         ai_thoughts = f"执行操作：{option_text}"
         
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.db.connect() as conn:
             cursor = conn.cursor()
             
             # 获取当前现金
@@ -0,0 +1,219 @@
+"""
+推送服务 - 通过 WebSocket 把行情与会话更新推送给订阅的客户端，替代前端定时轮询
+主题：
+- market          MarketEngine 每次推进后发布的报价快照（与上一版本相比变化的紧凑行 + 市场概况）
+- session:<id>    GameService.advance_session 的月度结果摘要
+扇出：每条消息只编码一次，写入所有订阅者的待发槽位；所有连接共用一个事件循环，
+空闲连接只占用两个挂起的协程，单个 worker 可以服务数千个连接。
+背压：每个连接每个主题只保留一条待发消息。客户端还没收完上一条时，新消息直接覆盖旧消息
+（行情增量被覆盖时改发完整快照，保证客户端状态可以重建）；单次发送超过 SEND_TIMEOUT
+秒的慢客户端被断开，不会拖住其他连接或无限堆积内存。
+帧格式（JSON 文本）：
+- {"type": "market", "version": 12, "base": 11, "fields": [...], "rows": [[...]], "state": {...}}
+  base 为空时 rows 是全部股票（首帧或重新同步），否则只包含相对 base 版本变化的股票
+- {"type": "session", "session_id": "...", "month": 5, "cash": ..., ...}
+"""
+import os
+import json
+import asyncio
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+from app.services.executors import run_db
+
+SEND_TIMEOUT = float(os.getenv("ECHOPOLIS_PUSH_SEND_TIMEOUT", "5"))  # 单帧发送超时（秒）
+MARKET_TOPIC = "market"
+SESSION_TOPIC = "session"
+
+# 会话推送中包含的 advance_session 结果字段
+SESSION_FIELDS = ("new_month", "cash", "total_assets", "invested_assets", "net_cashflow", "life_status")
+# 行情推送中包含的市场概况字段（涨跌榜等大字段仍通过 /market/state 获取）
+MARKET_STATE_FIELDS = ("index_value", "trend", "trend_strength", "volatility", "game_date", "month",
+                       "total_stocks", "advancing", "declining")
+
+
+def _encode(message: Dict) -> str:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+class Subscriber:
+    """单个 WebSocket 连接：订阅的主题与每个主题一条待发消息"""
+
+    __slots__ = ("topics", "pending", "wake")
+
+    def __init__(self, topics: List[str]):
+        self.topics = topics
+        self.pending: Dict[str, str] = {}
+        self.wake = asyncio.Event()
+
+
+class PushHub:
+    """WebSocket 推送中心（事件循环内扇出，其他线程通过 publish 投递）"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._topics: Dict[str, Set[Subscriber]] = defaultdict(set)
+        self._market_attached = False
+        self._attach_lock = threading.Lock()
+        self._market_frame = (None, "")  # (版本, 完整快照帧) 缓存
+        self.stats = {
+            "connections": 0, "connections_total": 0, "published": 0,
+            "frames_queued": 0, "frames_sent": 0, "coalesced": 0, "slow_disconnects": 0,
+        }
+
+    # ---------- 发布 ----------
+
+    def publish(self, topic: str, message: Dict, resync: Optional[Callable[[], str]] = None):
+        """
+        发布一条消息（线程安全，可在执行器线程中调用）。没有订阅者时直接返回，不做编码。
+        resync：该主题的待发消息被覆盖时改发的完整帧（行情增量不能简单覆盖）
+        """
+        loop = self._loop
+        if loop is None or not self._topics.get(topic):
+            return
+        text = _encode(message)
+        self.stats["published"] += 1
+        try:
+            loop.call_soon_threadsafe(self._fanout, topic, text, resync)
+        except RuntimeError:  # 事件循环已关闭
+            self._loop = None
+
+    def publish_session(self, session_id: str, result: Dict):
+        """推送 advance_session 结果摘要"""
+        message = {"type": SESSION_TOPIC, "session_id": session_id}
+        message.update({field: result.get(field) for field in SESSION_FIELDS})
+        message["month"] = message.pop("new_month")
+        self.publish(f"{SESSION_TOPIC}:{session_id}", message)
+
+    def _fanout(self, topic: str, text: str, resync: Optional[Callable[[], str]]):
+        """在事件循环中把消息放入每个订阅者的待发槽位"""
+        resync_text = None
+        for subscriber in self._topics.get(topic, ()):
+            if topic in subscriber.pending:
+                # 客户端还没收完上一条：只保留最新的一条
+                self.stats["coalesced"] += 1
+                if resync is not None:
+                    if resync_text is None:
+                        resync_text = resync()
+                    subscriber.pending[topic] = resync_text
+                    continue
+            else:
+                self.stats["frames_queued"] += 1
+            subscriber.pending[topic] = text
+            subscriber.wake.set()
+
+    # ---------- 行情 ----------
+
+    def _attach_market(self):
+        """注册报价快照监听（首次有连接时执行，会触发 MarketEngine 加载）"""
+        with self._attach_lock:
+            if self._market_attached:
+                return
+            from core.systems.market_engine import market_engine
+            market_engine.quote_board.add_listener(self._on_market_publish)
+            self._market_attached = True
+
+    def _market_state(self, snapshot) -> Dict:
+        return {field: snapshot.overview.get(field) for field in MARKET_STATE_FIELDS}
+
+    def market_frame(self) -> str:
+        """当前报价快照的完整帧（按版本缓存）"""
+        from core.systems.market_engine import market_engine
+        from core.systems.quote_board import COMPACT_FIELDS
+        snapshot = market_engine.quote_board.snapshot
+        version, text = self._market_frame
+        if version != snapshot.version:
+            text = _encode({"type": MARKET_TOPIC, "version": snapshot.version, "base": None,
+                            "fields": list(COMPACT_FIELDS), "rows": snapshot.rows(),
+                            "state": self._market_state(snapshot)})
+            self._market_frame = (snapshot.version, text)
+        return text
+
+    def _on_market_publish(self, previous, snapshot):
+        """报价快照发布后推送增量（在发布线程中执行）"""
+        from core.systems.quote_board import COMPACT_FIELDS
+        if self._loop is None or not self._topics.get(MARKET_TOPIC):
+            return
+        self.publish(MARKET_TOPIC, {
+            "type": MARKET_TOPIC,
+            "version": snapshot.version,
+            "base": previous.version if previous else None,
+            "fields": list(COMPACT_FIELDS),
+            "rows": snapshot.changed_rows(previous),
+            "state": self._market_state(snapshot),
+        }, resync=self.market_frame)
+
+    # ---------- 连接 ----------
+
+    async def serve(self, websocket: WebSocket, topics: List[str]):
+        """处理一个 WebSocket 连接直到断开"""
+        await websocket.accept()
+        self._loop = asyncio.get_running_loop()
+        if MARKET_TOPIC in topics and not self._market_attached:
+            await run_db(self._attach_market)
+
+        subscriber = Subscriber(topics)
+        for topic in topics:
+            self._topics[topic].add(subscriber)
+        self.stats["connections"] += 1
+        self.stats["connections_total"] += 1
+        if MARKET_TOPIC in topics:
+            # 首帧：当前完整快照
+            subscriber.pending[MARKET_TOPIC] = self.market_frame()
+            subscriber.wake.set()
+
+        tasks = [asyncio.create_task(self._writer(websocket, subscriber)),
+                 asyncio.create_task(self._reader(websocket, subscriber))]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            for topic in topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._topics[topic]
+            self.stats["connections"] -= 1
+
+    async def _writer(self, websocket: WebSocket, subscriber: Subscriber):
+        """逐条发送待发消息；发送超时视为慢客户端并断开"""
+        while True:
+            await subscriber.wake.wait()
+            subscriber.wake.clear()
+            while subscriber.pending:
+                topic = next(iter(subscriber.pending))
+                text = subscriber.pending.pop(topic)
+                try:
+                    await asyncio.wait_for(websocket.send_text(text), SEND_TIMEOUT)
+                except asyncio.TimeoutError:
+                    self.stats["slow_disconnects"] += 1
+                    print(f"[PushHub] 客户端发送超时（>{SEND_TIMEOUT}s），断开连接")
+                    return
+                except Exception:  # 连接已关闭
+                    return
+                self.stats["frames_sent"] += 1
+
+    async def _reader(self, websocket: WebSocket, subscriber: Subscriber):
+        """读取客户端消息以感知断开；收到 "ping" 时由发送协程回复 "pong"（同一连接只有一个协程发送）"""
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("text") == "ping":
+                subscriber.pending["pong"] = "pong"
+                subscriber.wake.set()
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats["topics"] = len(self._topics)
+        stats["market_subscribers"] = len(self._topics.get(MARKET_TOPIC, ()))
+        return stats
+
+
+# 全局实例
+push_hub = PushHub()
@@ -0,0 +1,312 @@
+"""
+会话缓存 - GameService 中常驻的 AI 化身会话（avatar / avatar_data / 当前情况）
+原先 game_sessions 是普通字典，访问过 /generate-situation、/echo、/auto-decision 的会话
+连同 AIAvatar 及其全部决策历史一直留在内存里，长时间运行的 worker 内存只增不减。现在：
+- LRU + 空闲 TTL：超过 SESSION_CACHE_TTL 秒没有访问的会话被淘汰
+- 内存预算：按会话状态序列化后的字节数估算常驻内存，超过 SESSION_CACHE_BYTES
+  或会话数超过 SESSION_CACHE_MAX 时从最久未访问的会话开始淘汰
+- 写回：淘汰时把 AIAvatar.save_state() 写回数据库（内容与上次写回相同则跳过），进程退出时 flush()
+- 懒加载：未命中时由 loader 从数据库读取状态，经 AIAvatar.load_state 重建
+- 钉住：acquire / checkout 取到的会话在 release 之前不会被淘汰，调用方跨越 LLM 调用持有的字典
+  不会在写回之后继续被修改而丢失；正在写回的会话再次被访问时直接放回缓存
+访问过的会话在下一次整理时重新估算大小（调用方会直接修改取到的会话字典），
+同一会话每 MEASURE_INTERVAL 秒最多估算一次。全局锁只保护索引结构：loader、序列化和写回都在锁外执行，
+这些阻塞操作由调用方放在线程池中（异步处理函数经 run_db 调用）。
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+SESSION_CACHE_MAX = int(os.getenv("ECHOPOLIS_SESSION_CACHE_MAX", "1000"))                  # 最多常驻会话数
+SESSION_CACHE_BYTES = int(os.getenv("ECHOPOLIS_SESSION_CACHE_BYTES", str(64 * 1024 * 1024)))  # 常驻内存预算（估算字节）
+SESSION_CACHE_TTL = float(os.getenv("ECHOPOLIS_SESSION_CACHE_TTL", "1800"))                 # 空闲淘汰时间（秒）
+MEASURE_INTERVAL = 1.0  # 同一会话重新估算大小的最短间隔（秒），避免热门会话每次访问都完整序列化
+
+
+def _digest(state: Optional[str]) -> Optional[str]:
+    return hashlib.sha1(state.encode("utf-8")).hexdigest() if state else None
+
+
+class _Entry:
+    __slots__ = ("session", "size", "last_access", "measured_at", "persisted", "write_lock", "pending")
+
+    def __init__(self, session: Dict, persisted: Optional[str]):
+        self.session = session
+        self.size = 0
+        self.last_access = time.monotonic()
+        self.measured_at = None
+        self.persisted = persisted  # 上次写回（或加载）时的状态摘要
+        self.write_lock = threading.Lock()  # 同一会话的写回按顺序执行，较早的写回不会覆盖较新的状态
+        self.pending = 0                    # 尚未完成的淘汰写回次数
+
+
+class SessionCache:
+    """带内存预算、空闲 TTL 与写回的 LRU 会话缓存"""
+
+    def __init__(self, serialize: Callable[[Dict], Optional[str]],
+                 loader: Optional[Callable[[str], Optional[tuple]]] = None,
+                 writer: Optional[Callable[[str, str], None]] = None,
+                 max_entries: int = SESSION_CACHE_MAX, max_bytes: int = SESSION_CACHE_BYTES,
+                 ttl: float = SESSION_CACHE_TTL):
+        """
+        Args:
+            serialize: 会话 → 需要持久化的状态 JSON（没有 AI 化身时返回 None），同时用于估算大小
+            loader: session_id → (会话字典, 状态 JSON)，没有保存过的状态返回 None
+            writer: (session_id, 状态 JSON) → 写回数据库
+        """
+        self.serialize = serialize
+        self.loader = loader
+        self.writer = writer
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._writing: Dict[str, _Entry] = {}  # 已移出、正在写回的会话
+        self._pins: Dict[str, int] = {}        # session_id -> 钉住次数
+        self._touched = set()
+        self._resident_bytes = 0
+        self._lock = threading.RLock()
+        self._stats = {"hits": 0, "misses": 0, "rehydrated": 0, "revived": 0, "evicted_lru": 0, "evicted_ttl": 0,
+                       "evicted_budget": 0, "writebacks": 0, "writebacks_skipped": 0, "writeback_errors": 0}
+
+    # ============ 字典接口（GameService 原先按 dict 使用 game_sessions）============
+
+    def get(self, session_id: str, default=None) -> Optional[Dict]:
+        """取会话：常驻则命中，否则尝试从数据库重建"""
+        session = self._lookup(session_id, pin=False)
+        self._enforce()
+        return default if session is None else session
+
+    def acquire(self, session_id: str, default=None) -> Optional[Dict]:
+        """
+        取会话并钉住：钉住期间该会话不会被淘汰，调用方可以放心修改取到的字典（跨越 LLM 调用等慢操作），
+        用完必须调用 release。按 session_id 钉住，未命中时随后放入的会话同样受保护
+        """
+        session = self._lookup(session_id, pin=True)
+        self._enforce()
+        return default if session is None else session
+
+    def release(self, session_id: str):
+        """解除 acquire 的钉住"""
+        with self._lock:
+            count = self._pins.get(session_id, 0) - 1
+            if count > 0:
+                self._pins[session_id] = count
+            else:
+                self._pins.pop(session_id, None)
+
+    @contextmanager
+    def checkout(self, session_id: str, default=None):
+        """acquire / release 的上下文管理器形式"""
+        session = self.acquire(session_id, default)
+        try:
+            yield session
+        finally:
+            self.release(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __getitem__(self, session_id: str) -> Dict:
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def __setitem__(self, session_id: str, session: Dict):
+        with self._lock:
+            entry = self._entries.get(session_id) or self._writing.get(session_id)
+            self._put(session_id, session, entry.persisted if entry else None)
+        self._enforce()
+
+    def pop(self, session_id: str, default=None):
+        """移除会话，不写回（删除角色时使用）"""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            self._touched.discard(session_id)
+            if entry is None:
+                return default
+            self._resident_bytes -= entry.size
+            return entry.session
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ============ 查找、淘汰与写回 ============
+
+    def _lookup(self, session_id: str, pin: bool) -> Optional[Dict]:
+        with self._lock:
+            if pin:
+                self._pins[session_id] = self._pins.get(session_id, 0) + 1
+            entry = self._hit(session_id)
+            if entry is not None:
+                return entry.session
+
+        # 锁外从数据库读取并重建
+        loaded = self.loader(session_id) if self.loader else None
+        with self._lock:
+            # 加载期间其他线程可能已经放入
+            entry = self._hit(session_id)
+            if entry is not None:
+                return entry.session
+            if loaded is None:
+                self._stats["misses"] += 1
+                return None
+            session, state = loaded
+            self._stats["rehydrated"] += 1
+            self._put(session_id, session, _digest(state))
+            return session
+
+    def _hit(self, session_id: str) -> Optional[_Entry]:
+        """常驻或正在写回的会话（持有 self._lock 时调用）；正在写回的放回缓存，不从数据库读旧状态"""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            entry = self._writing.get(session_id)
+            if entry is None:
+                return None
+            self._entries[session_id] = entry
+            self._resident_bytes += entry.size
+            self._stats["revived"] += 1
+        entry.last_access = time.monotonic()
+        self._entries.move_to_end(session_id)
+        self._touched.add(session_id)
+        self._stats["hits"] += 1
+        return entry
+
+    def _put(self, session_id: str, session: Dict, persisted: Optional[str]):
+        """放入会话（持有 self._lock 时调用），淘汰由调用方在锁外 _enforce"""
+        old = self._entries.pop(session_id, None)
+        if old is not None:
+            self._resident_bytes -= old.size
+        self._entries[session_id] = _Entry(session, persisted)
+        self._touched.add(session_id)
+
+    def _measure(self, session: Dict) -> int:
+        """估算会话常驻字节数：化身状态 JSON + 其余字段的 JSON"""
+        size = len((self.serialize(session) or "").encode("utf-8"))
+        rest = {k: v for k, v in session.items() if k not in ("avatar", "echo_system")}
+        size += len(json.dumps(rest, ensure_ascii=False, default=str).encode("utf-8"))
+        return size
+
+    def _enforce(self):
+        """
+        重新估算被访问过的会话大小，然后按 TTL、条数和内存预算淘汰（跳过钉住的会话）。
+        锁内只做选择，序列化与写回数据库都在锁外执行
+        """
+        now = time.monotonic()
+        with self._lock:
+            stale = []
+            for session_id in list(self._touched):
+                entry = self._entries.get(session_id)
+                if entry is None:
+                    self._touched.discard(session_id)
+                elif entry.measured_at is None or now - entry.measured_at >= MEASURE_INTERVAL:
+                    stale.append((session_id, entry))
+
+        sizes = []
+        for session_id, entry in stale:
+            try:
+                sizes.append((session_id, entry, self._measure(entry.session)))
+            except Exception as e:  # 调用方正在修改会话字典，下次再估算
+                print(f"[SessionCache] 估算会话 {session_id} 大小失败: {e}")
+
+        with self._lock:
+            for session_id, entry, size in sizes:
+                if self._entries.get(session_id) is entry:
+                    self._resident_bytes += size - entry.size
+                    entry.size = size
+                    entry.measured_at = now
+                    self._touched.discard(session_id)
+            victims = self._select_victims(now)
+
+        for session_id, entry in victims:
+            self._write_back(session_id, entry)
+            with self._lock:
+                entry.pending -= 1
+                # 写回期间被重新访问、再次淘汰的会话还有未完成的写回，留在 _writing 中
+                if entry.pending == 0 and self._writing.get(session_id) is entry:
+                    del self._writing[session_id]
+
+    def _select_victims(self, now: float):
+        """从最久未访问的会话开始选出要淘汰的会话，移入 _writing 等待写回（持有 self._lock 时调用）"""
+        chosen = []
+        count, resident = len(self._entries), self._resident_bytes
+        for session_id, entry in self._entries.items():
+            if session_id in self._pins:
+                continue
+            if now - entry.last_access > self.ttl:
+                reason = "evicted_ttl"
+            elif count > self.max_entries:
+                reason = "evicted_lru"
+            elif resident > self.max_bytes and count > 1:
+                reason = "evicted_budget"
+            else:
+                break
+            chosen.append((session_id, entry, reason))
+            count -= 1
+            resident -= entry.size
+
+        victims = []
+        for session_id, entry, reason in chosen:
+            del self._entries[session_id]
+            self._resident_bytes -= entry.size
+            self._touched.discard(session_id)
+            self._stats[reason] += 1
+            entry.pending += 1
+            self._writing[session_id] = entry
+            victims.append((session_id, entry))
+        return victims
+
+    def _write_back(self, session_id: str, entry: _Entry):
+        if not self.writer:
+            return
+        with entry.write_lock:
+            self._write_entry(session_id, entry)
+
+    def _write_entry(self, session_id: str, entry: _Entry):
+        try:
+            state = self.serialize(entry.session)
+            digest = _digest(state)
+            if state is None or digest == entry.persisted:
+                with self._lock:
+                    self._stats["writebacks_skipped"] += 1
+                return
+            self.writer(session_id, state)
+            entry.persisted = digest
+            with self._lock:
+                self._stats["writebacks"] += 1
+        except Exception as e:
+            with self._lock:
+                self._stats["writeback_errors"] += 1
+            print(f"[SessionCache] 写回会话 {session_id} 失败: {e}")
+
+    def flush(self):
+        """把所有常驻会话写回数据库（进程退出前调用），会话仍然常驻"""
+        with self._lock:
+            entries = list(self._entries.items())
+        for session_id, entry in entries:
+            self._write_back(session_id, entry)
+
+    def expire(self):
+        """主动清理空闲超时的会话"""
+        self._enforce()
+
+    def get_stats(self) -> Dict:
+        """命中率、常驻会话数与估算字节数、各类淘汰与写回次数"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["rehydrated"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                pinned=len(self._pins),
+                resident_bytes=self._resident_bytes,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes,
+                ttl=self.ttl,
+                hit_rate=round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            )
@@ -0,0 +1,41 @@
+"""
+流式响应服务 - 以 Server-Sent Events 转发 LLM 生成的文本
+事件格式：
+- event: delta  data: {"text": "..."}      增量文本
+- event: done   data: {...}                完整结果（与非流式接口的 JSON 结构一致）
+- event: error  data: {"error": "..."}     生成失败
+客户端断开时 Starlette 会取消响应任务，取消沿异步生成器传到传输层并关闭上游连接。
+"""
+import json
+from typing import AsyncIterator, Callable, Dict
+
+from fastapi.responses import StreamingResponse
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # 关闭 nginx 缓冲，保证逐段下发
+}
+
+
+def sse_event(event: str, data: Dict) -> str:
+    """格式化一条 SSE 事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _relay(chunks: AsyncIterator[str], on_done: Callable[[str], Dict]) -> AsyncIterator[str]:
+    parts = []
+    try:
+        async for text in chunks:
+            parts.append(text)
+            yield sse_event("delta", {"text": text})
+    except Exception as e:
+        print(f"[SSE] 流式生成失败: {e}")
+        yield sse_event("error", {"error": str(e)})
+        return
+    yield sse_event("done", on_done("".join(parts)))
+
+
+def sse_response(chunks: AsyncIterator[str], on_done: Callable[[str], Dict]) -> StreamingResponse:
+    """把文本分段流包装为 SSE 响应；on_done 接收完整文本，返回 done 事件的数据"""
+    return StreamingResponse(_relay(chunks, on_done), media_type="text/event-stream", headers=SSE_HEADERS)
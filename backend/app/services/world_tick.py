@@ -0,0 +1,435 @@
+"""
+世界时钟批量推进 - 一次推进成千上万个会话（挂机 / 托管 / 离线玩家）
+原先会话只能通过 /session/advance 逐个推进，每次都单独推进宏观经济、读写十几次数据库。批量推进：
+- 宏观与市场共用：整批会话只推进一次宏观经济，市场月报按会话所到的月份各取一次
+- 集合化 SQL：选中的会话写入临时表 tick_sessions，投资收益 / 到期兑付、贷款月供、保费、租金
+  用 GROUP BY 一次算出；读取时把参与计算的投资 / 贷款 / 保单行号记入临时表，提交时只结算这些行：
+  投资剩余月数递减与到期删除、贷款摊还、保单剩余月数递减各是一条 UPDATE/DELETE
+- 进程池：需要会话状态和随机数的部分（职业工资、副业、基本开支、生活状态、事件、成就）
+  按 TICK_CHUNK 个会话一组分给进程池，复用月度推进流水线的计算阶段，每个会话在自己的种子上下文中计算；
+  进程池在第一次批量推进时创建并常驻（spawn 启动的子进程要重新导入模拟系统，启动开销只付一次），
+  子进程通过 SQLite 会话状态存储读取会话状态，变化随结果带回，不在子进程中写回
+- 整批一个读事务、一个写事务；提交时按月份做乐观检查，期间已被单独推进（或会话状态已被改动）的会话跳过，
+  只为通过检查的会话写入会话状态（与写事务一起提交）；现金按本月变化量累加，不覆盖期间其他请求的写入。
+  反过来，单独推进在批量推进提交之后才提交时，同样按月份检查失败并整体回滚（advance_pipeline.commit_month_state）
+不生成情境 / 反思（这些只在玩家在线推进时需要），也不调用 LLM。
+
+命令行：python backend/run_world_tick.py --help
+"""
+import os
+import io
+import json
+import time
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.services.advance_pipeline import (
+    MonthState, compute_achievements, compute_cashflow, compute_events, compute_life_status,
+    compute_side_business, compute_salary, record_month,
+)
+from core.systems.sim_random import simulation
+
+TICK_WORKERS = int(os.getenv("ECHOPOLIS_TICK_WORKERS", str(os.cpu_count() or 1)))  # 进程池大小（0 或 1 表示在本进程内计算）
+TICK_CHUNK = int(os.getenv("ECHOPOLIS_TICK_CHUNK", "256"))                          # 每个进程池任务的会话数
+
+# 进程池中执行的计算阶段（投资、房产、贷款、保险、居住由集合化 SQL 算出）
+TICK_STAGES = [
+    ("career", compute_salary),
+    ("side_business", compute_side_business),
+    ("cashflow", compute_cashflow),
+    ("life_status", compute_life_status),
+    ("record", record_month),
+    ("events", compute_events),
+    ("achievements", compute_achievements),
+]
+
+# 投资：本月收益（按资产类型应用宏观影响）、本月到期兑付、到期后的剩余投资额
+# 与 compute_investments 逐行计算的结果一致：浮点运算顺序相同，CAST 与 int() 一样向零取整
+INVESTMENT_SQL = '''
+    SELECT session_id,
+        SUM(CASE WHEN remaining_months > 0 AND return_rate > 0 THEN CAST(amount * return_rate / 12 * (
+            CASE WHEN instr(investment_type, '股票') OR instr(investment_type, '基金') THEN :stock
+                 WHEN instr(investment_type, '房产') THEN :real_estate
+                 WHEN instr(investment_type, '债券') THEN :bond
+                 ELSE 1.0 END) AS INTEGER) ELSE 0 END),
+        SUM(CASE WHEN remaining_months <= 1 THEN CAST(amount * (
+            CASE WHEN instr(investment_type, '股票') THEN :stock ELSE 1.0 END) AS INTEGER) ELSE 0 END),
+        SUM(CASE WHEN remaining_months > 1 THEN amount ELSE 0 END)
+    FROM investments
+    WHERE id IN (SELECT id FROM tick_investments)
+    GROUP BY session_id
+'''
+
+# 读取时参与计算的行：临时表 -> 读取这些行号的语句（同一个读事务中执行）
+TICK_ROWS = {
+    "tick_investments": "SELECT id, session_id FROM investments WHERE session_id IN (SELECT session_id FROM tick_sessions)",
+    "tick_loans": '''SELECT id, session_id FROM loans
+                     WHERE remaining_months > 0 AND session_id IN (SELECT session_id FROM tick_sessions)''',
+    "tick_policies": '''SELECT id, session_id FROM insurance_policies
+                        WHERE remaining_months > 0 AND session_id IN (SELECT session_id FROM tick_sessions)''',
+}
+
+# 提交时的集合化更新：只作用于读取时记下、且所属会话仍保留在 tick_sessions 中的行
+# （读写之间新增的行不会被提前结算，已被单独推进结算过的会话整体跳过）
+SETTLE_SQL = (
+    '''UPDATE investments SET remaining_months = remaining_months - 1
+       WHERE remaining_months > 0 AND id IN (SELECT id FROM tick_investments)''',
+    '''DELETE FROM investments
+       WHERE remaining_months <= 0 AND id IN (SELECT id FROM tick_investments)''',
+    '''UPDATE loans SET remaining_months = remaining_months - 1,
+           remaining_principal = remaining_principal - CAST(remaining_principal / remaining_months AS INTEGER)
+       WHERE remaining_months > 0 AND id IN (SELECT id FROM tick_loans)''',
+    '''UPDATE insurance_policies SET remaining_months = remaining_months - 1
+       WHERE remaining_months > 0 AND id IN (SELECT id FROM tick_policies)''',
+)
+
+
+_worker_store: Optional[str] = None  # 子进程当前使用的会话状态存储库文件
+
+
+def _init_worker():
+    """进程池初始化：静默导入模拟系统（导入时的数据库初始化输出不需要）"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        import core.systems.session_state  # noqa: F401
+        import core.systems.career_system  # noqa: F401
+        import core.systems.event_system  # noqa: F401
+
+
+def _advance_chunk(store_path: Optional[str],
+                   items: List[Tuple[Optional[int], MonthState]]) -> List[Tuple[MonthState, Optional[str], Dict, Dict]]:
+    """
+    计算一组会话的本月结果：每个会话在自己的会话作用域与种子上下文中执行 TICK_STAGES
+    store_path 为父进程 SQLite 会话状态存储的库文件（在进程池中执行时传入），为空时使用当前存储
+    会话状态不在这里写回：返回 (状态, 错误, 会话状态变化, 变化前的内容)，由 _commit 只为推进成功的会话写入
+    """
+    global _worker_store
+    from core.systems.session_state import session_state, SQLiteSessionStore
+    if store_path and store_path != _worker_store:
+        session_state.use_store(SQLiteSessionStore(store_path))
+        _worker_store = store_path
+    results = []
+    for seed, state in items:
+        try:
+            with session_state.scope(state.session_id, write_back=False) as scope, simulation(seed, state.new_month):
+                for _, stage in TICK_STAGES:
+                    stage(state)
+            results.append((state, None, scope.changes, scope.base))
+        except Exception as e:
+            results.append((state, str(e), {}, {}))
+    return results
+
+
+class WorldTick:
+    """批量推进一批会话一个月"""
+
+    def __init__(self, db=None):
+        self._db = db
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_workers = 0
+        self._totals = {"ticks": 0, "sessions": 0, "advanced": 0, "conflicts": 0, "failed": 0, "seconds": 0.0}
+        self.last_tick: Optional[Dict] = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            from core.database.database import db
+            self._db = db
+        return self._db
+
+    def run(self, session_ids: Optional[List[str]] = None, idle_minutes: Optional[float] = None,
+            limit: Optional[int] = None, workers: int = TICK_WORKERS) -> Dict:
+        """
+        推进一批会话一个月
+        Args:
+            session_ids: 指定会话；为空时选择所有会话
+            idle_minutes: 只推进超过这么多分钟没有推进过的会话（sessions.updated_at）
+            limit: 最多推进的会话数（最久未推进的优先）
+            workers: 进程池大小，0 或 1 表示在本进程内计算
+        """
+        started = time.perf_counter()
+        timings = {}
+
+        def mark(name: str, since: float) -> float:
+            now = time.perf_counter()
+            timings[name] = round((now - since) * 1000, 1)
+            return now
+
+        conn = self.db.connect()
+        count = self._select(conn, session_ids, idle_minutes, limit)
+        t = mark("select", started)
+        if not count:
+            return self._finish(started, timings, 0, [], 0, 0, None, workers=0)
+
+        macro_stats, asset_impact = self._shared_step(conn)
+        t = mark("macro_market", t)
+        items = self._load(conn, macro_stats, asset_impact)
+        t = mark("load", t)
+        computed, workers = self._compute(items, workers)
+        t = mark("compute", t)
+        advanced, conflicts, failed = self._commit(conn, computed)
+        mark("commit", t)
+        return self._finish(started, timings, count, advanced, conflicts, failed, macro_stats, workers)
+
+    # ============ 各步骤 ============
+
+    def _select(self, conn, session_ids, idle_minutes, limit) -> int:
+        """选出本次推进的会话，写入连接上的临时表 tick_sessions"""
+        where, params = ["1 = 1"], []
+        if session_ids is not None:
+            where.append("s.session_id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(list(session_ids)))
+        if idle_minutes:
+            where.append("s.updated_at <= datetime('now', ?)")
+            params.append(f"-{float(idle_minutes)} minutes")
+        params.append(limit if limit else -1)
+        with conn:
+            conn.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS tick_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    current_month INTEGER NOT NULL,
+                    sim_seed INTEGER
+                )
+            ''')
+            conn.execute('DELETE FROM tick_sessions')
+            for table in TICK_ROWS:
+                conn.execute(f'CREATE TEMP TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, session_id TEXT NOT NULL)')
+                conn.execute(f'DELETE FROM {table}')
+            conn.execute(f'''
+                INSERT INTO tick_sessions (session_id, current_month, sim_seed)
+                SELECT s.session_id, s.current_month, s.sim_seed
+                FROM sessions s JOIN users u ON u.session_id = s.session_id
+                WHERE {" AND ".join(where)}
+                ORDER BY s.updated_at
+                LIMIT ?
+            ''', params)
+            return conn.execute('SELECT COUNT(*) FROM tick_sessions').fetchone()[0]
+
+    def _shared_step(self, conn) -> Tuple[Dict, Dict]:
+        """整批共用的宏观经济推进；市场时间线按会话所到的每个月份各取一次月报"""
+        from core.systems.macro_economy import macro_economy
+        macro_stats = macro_economy.advance_month()
+        asset_impact = macro_economy.get_asset_impact()
+        try:
+            from core.systems.market_timeline import market_timeline
+            months = [m for (m,) in conn.execute('SELECT DISTINCT current_month + 1 FROM tick_sessions ORDER BY 1')]
+            for month in months:
+                market_timeline.report_for(month, macro_stats.get('phase', 'expansion'))
+        except Exception as e:
+            print(f"[WorldTick] Market timeline update failed: {e}")
+        return macro_stats, asset_impact
+
+    def _load(self, conn, macro_stats: Dict, asset_impact: Dict) -> List[Tuple[Optional[int], MonthState]]:
+        """一个读事务：用户状态逐会话读出，投资 / 贷款 / 保费 / 租金按会话聚合"""
+        has_stats = self.db.has_column('users', 'happiness')
+        stats_columns = ", u.happiness, u.energy, u.health" if has_stats else ""
+        in_tick = "session_id IN (SELECT session_id FROM tick_sessions)"
+        items, states = [], {}
+        with conn:
+            conn.execute("BEGIN")
+            for row in conn.execute(f'''
+                SELECT t.session_id, t.current_month, t.sim_seed, u.credits{stats_columns}
+                FROM tick_sessions t JOIN users u ON u.session_id = t.session_id
+            '''):
+                state = MonthState(session_id=row[0], new_month=row[1] + 1, verbose=False, has_stats=has_stats,
+                                   cash=row[3], opening_cash=row[3],
+                                   macro_stats=macro_stats, asset_impact=asset_impact,
+                                   income={"investment": 0, "matured": 0, "property": 0},
+                                   expense={"loan": 0, "insurance": 0, "living": 800})
+                if has_stats:
+                    state.happiness, state.energy, state.health = row[4:7]
+                states[state.session_id] = state
+                items.append((row[2], state))
+
+            for table, select in TICK_ROWS.items():
+                conn.execute(f'INSERT INTO {table} (id, session_id) {select}')
+            for sid, income, matured, invested in conn.execute(INVESTMENT_SQL, asset_impact):
+                state = states[sid]
+                state.income["investment"], state.income["matured"] = income or 0, matured or 0
+                state.invested_assets = invested or 0
+            for sid, rent in conn.execute(f'''
+                SELECT session_id, SUM(COALESCE(monthly_rent, 0)) FROM properties
+                WHERE is_rented = 1 AND {in_tick} GROUP BY session_id
+            '''):
+                states[sid].income["property"] = rent
+            for sid, payment in conn.execute('''
+                SELECT session_id, SUM(monthly_payment) FROM loans
+                WHERE id IN (SELECT id FROM tick_loans) GROUP BY session_id
+            '''):
+                states[sid].expense["loan"] = payment
+            for sid, premium in conn.execute(f'''
+                SELECT session_id, SUM(monthly_premium) FROM insurance_policies
+                WHERE is_active = 1 AND {in_tick} GROUP BY session_id
+            '''):
+                states[sid].expense["insurance"] = premium
+            for sid, cost, effect in conn.execute(f'''
+                SELECT session_id, monthly_cost, happiness_effect FROM living_status WHERE {in_tick}
+            '''):
+                states[sid].living = (cost, effect)
+                states[sid].expense["living"] = cost
+            for sid, expected, risk in conn.execute(f'''
+                SELECT session_id, expected_return, risk_rate FROM side_businesses
+                WHERE status = 'running' AND {in_tick} ORDER BY session_id, id
+            '''):
+                states[sid].side_businesses.append((expected, risk))
+            for sid, achievement_id, month in conn.execute(f'''
+                SELECT session_id, achievement_id, unlocked_month FROM achievements_unlocked WHERE {in_tick}
+            '''):
+                states[sid].unlocked_achievements.append({"achievement_id": achievement_id, "unlocked_month": month})
+        return items
+
+    def _compute(self, items, workers: int) -> Tuple[List[Tuple[MonthState, Optional[str]]], int]:
+        """在进程池（或本进程）中计算每个会话的本月结果"""
+        chunks = [items[i:i + TICK_CHUNK] for i in range(0, len(items), TICK_CHUNK)]
+        store = self._shared_store_path()
+        if workers <= 1 or len(chunks) <= 1 or store is None:
+            # 内存会话状态存储无法跨进程共享，只能在本进程内计算
+            return [result for chunk in chunks for result in _advance_chunk(None, chunk)], 0
+
+        pool = self.pool(workers)
+        results = pool.map(_advance_chunk, [store] * len(chunks), chunks)
+        return [result for chunk_results in results for result in chunk_results], workers
+
+    def pool(self, workers: int) -> ProcessPoolExecutor:
+        """常驻进程池（大小变化时重建）"""
+        with self._lock:
+            if self._pool is None or self._pool_workers != workers:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_worker)
+                self._pool_workers = workers
+            return self._pool
+
+    def warm_up(self, workers: int = TICK_WORKERS):
+        """提前启动进程池的全部子进程（子进程要重新导入模拟系统，启动需要数秒）"""
+        if workers > 1:
+            list(self.pool(workers).map(time.sleep, [0.2] * workers))
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    @staticmethod
+    def _shared_store_path() -> Optional[str]:
+        from core.systems.session_state import session_state, SQLiteSessionStore
+        store = session_state.store
+        return store.db_path if isinstance(store, SQLiteSessionStore) else None
+
+    def _commit(self, conn, computed) -> Tuple[List[MonthState], int, int]:
+        """
+        一个写事务：按月份（以及会话状态）乐观检查后，集合化结算读取时记下的投资 / 贷款 / 保单行，
+        再批量写入用户（现金按本月变化量累加）、现金流、快照、成就，以及推进成功的会话的会话状态
+        """
+        from core.systems.session_state import session_state
+        store = session_state.store
+        # 会话状态存储与主库是同一个库文件时，会话状态与本月结果在同一个写事务中提交
+        same_db = session_state.shares_db(self.db.db_path)
+        advanced, conflicts, failed, session_changes = [], 0, 0, []
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for state, error, changes, base in computed:
+                if error is None:
+                    moved = 0
+                    if not changes or self._state_unchanged(store, state.session_id, base, conn if same_db else None):
+                        moved = conn.execute('''
+                            UPDATE sessions SET current_month = ?, updated_at = CURRENT_TIMESTAMP
+                            WHERE session_id = ? AND current_month = ?
+                        ''', (state.new_month, state.session_id, state.new_month - 1)).rowcount
+                    if moved:
+                        advanced.append(state)
+                        if changes:
+                            session_changes.append((state.session_id, changes))
+                        continue
+                    conflicts += 1
+                else:
+                    print(f"[WorldTick] 会话 {state.session_id} 推进失败: {error}")
+                    failed += 1
+                conn.execute('DELETE FROM tick_sessions WHERE session_id = ?', (state.session_id,))
+            for table in TICK_ROWS:
+                conn.execute(f'DELETE FROM {table} WHERE session_id NOT IN (SELECT session_id FROM tick_sessions)')
+
+            for statement in SETTLE_SQL:
+                conn.execute(statement)
+            if advanced and advanced[0].has_stats:
+                conn.executemany('''
+                    UPDATE users SET credits = credits + ?, happiness = ?, energy = ?, health = ? WHERE session_id = ?
+                ''', [(s.cash - s.opening_cash, s.happiness, s.energy, s.health, s.session_id)
+                      for s in advanced])
+            else:
+                conn.executemany('UPDATE users SET credits = credits + ? WHERE session_id = ?',
+                                 [(s.cash - s.opening_cash, s.session_id) for s in advanced])
+            for state in advanced:
+                for record in state.records:
+                    self.db.save_monthly_cashflow(
+                        state.session_id, record["month"], record["total_income"], record["total_expense"],
+                        record["net_cashflow"], record["saving_rate"], record["cash"], conn=conn
+                    )
+                    self.db.save_monthly_snapshot(
+                        session_id=state.session_id,
+                        month=record["month"],
+                        total_assets=record["total_assets"],
+                        cash=record["cash"],
+                        invested_assets=record["invested_assets"],
+                        happiness=record["happiness"],
+                        conn=conn,
+                    )
+                for row in state.achievement_rows:
+                    self.db.save_achievement_unlock(state.session_id, row, conn=conn)
+            if same_db:
+                for session_id, changes in session_changes:
+                    store.save(session_id, changes, conn=conn)
+        if not same_db:
+            for session_id, changes in session_changes:
+                store.save(session_id, changes)
+        return advanced, conflicts, failed
+
+    @staticmethod
+    def _state_unchanged(store, session_id: str, base: Dict[str, Optional[str]], conn=None) -> bool:
+        """子进程读取之后，这些命名空间的会话状态没有被其他请求改动过"""
+        current = store.load(session_id, conn=conn)
+        return all(current.get(namespace) == state for namespace, state in base.items())
+
+    def _finish(self, started, timings, count, advanced, conflicts, failed, macro_stats, workers) -> Dict:
+        seconds = time.perf_counter() - started
+        summary = {
+            "success": True,
+            "sessions": count,
+            "advanced": len(advanced),
+            "conflicts": conflicts,
+            "failed": failed,
+            "workers": workers,
+            "seconds": round(seconds, 3),
+            "sessions_per_second": round(len(advanced) / seconds, 1) if seconds > 0 else 0.0,
+            "timings": timings,
+            "macro_economy": macro_stats,
+        }
+        with self._lock:
+            self._totals["ticks"] += 1
+            self._totals["sessions"] += count
+            self._totals["advanced"] += len(advanced)
+            self._totals["conflicts"] += conflicts
+            self._totals["failed"] += failed
+            self._totals["seconds"] += seconds
+            self.last_tick = summary
+        print(f"[WorldTick] 推进 {len(advanced)}/{count} 个会话，冲突 {conflicts}，失败 {failed}，"
+              f"{seconds:.2f}s（{summary['sessions_per_second']} 会话/秒，{workers or 1} 个进程）")
+        return summary
+
+    def get_stats(self) -> Dict:
+        """累计批次数、推进 / 冲突 / 失败的会话数、平均吞吐，以及最近一次批量推进的摘要"""
+        with self._lock:
+            totals = dict(self._totals)
+            totals["sessions_per_second"] = (round(totals["advanced"] / totals["seconds"], 1)
+                                             if totals["seconds"] else 0.0)
+            totals["seconds"] = round(totals["seconds"], 3)
+            return {"totals": totals, "last_tick": self.last_tick}
+
+
+# 全局实例
+world_tick = WorldTick()
@@ -0,0 +1,160 @@
+"""
+月度推进流水线测试
+在临时库中创建一批带投资、贷款、保单、出租房产、副业和居住状态的会话，逐月推进，给出：
+1. 每次推进执行的 SQL 语句数与事务数（sqlite trace 统计）
+2. 各阶段的平均耗时与占比（advance_pipeline 的统计）
+3. 重放检查：相同种子的会话重新推进一遍，结果与写入的现金流 / 快照完全一致
+
+用法：
+    python backend/benchmark_advance_pipeline.py [--sessions 20] [--months 12] [--seed 42]
+
+数据写入临时目录中的新库，不写 echopolis.db；不调用 LLM（使用模板情境），市场使用内存中的股票池。
+"""
+import sys
+import os
+import io
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.dirname(__file__))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import core.database.connection  # noqa: F401  core.database 包初始化时会打开主库，提前在静默状态下导入
+    import core.systems.macro_economy as macro_module
+    import core.systems.market_timeline as timeline_module
+    from core.database.database import FinAIDatabase
+    from core.systems.market_engine import MarketEngine
+    from core.systems.session_state import session_state, MemorySessionStore
+    from core.systems.behavior_insight_system import BehaviorInsightSystem
+    from app.services.game_service import GameService
+    from app.services.advance_pipeline import advance_pipeline
+
+FIXTURE = [
+    ('''INSERT INTO investments (username, session_id, name, amount, investment_type, remaining_months,
+            monthly_return, return_rate, created_round) VALUES ('bench', ?, '基金', 20000, '股票基金', 3, 0, 0.15, 1)'''),
+    ('''INSERT INTO investments (username, session_id, name, amount, investment_type, remaining_months,
+            monthly_return, return_rate, created_round) VALUES ('bench', ?, '定期', 30000, '债券', 12, 0, 0.03, 1)'''),
+    ('''INSERT INTO loans (session_id, loan_id, loan_type, product_name, principal, remaining_principal, annual_rate,
+            term_months, remaining_months, monthly_payment, repayment_method, start_month)
+            VALUES (?, 'L-' || hex(randomblob(6)), 'consumer', '消费贷', 60000, 60000, 0.06, 12, 12, 5300, 'equal', 1)'''),
+    ('''INSERT INTO insurance_policies (session_id, policy_id, product_id, product_name, insurance_type, monthly_premium,
+            coverage_amount, deductible, coverage_ratio, start_month, remaining_months, max_claims)
+            VALUES (?, 'P-' || hex(randomblob(6)), 'health', '医疗险', 'health', 200, 100000, 0, 0.8, 1, 6, 3)'''),
+    ('''INSERT INTO properties (session_id, name, property_type, purchase_price, current_value, monthly_rent,
+            is_rented, buy_month) VALUES (?, '公寓', 'apartment', 800000, 800000, 3000, 1, 1)'''),
+    ('''INSERT INTO side_businesses (session_id, business_id, name, investment, expected_return, risk_rate, start_month)
+            VALUES (?, 'milk_tea', '奶茶店', 10000, 2000, 0.3, 1)'''),
+    ('''INSERT INTO living_status (session_id, living_type, property_name, monthly_cost, happiness_effect)
+            VALUES (?, 'rent', '合租公寓', 1500, -2)'''),
+]
+
+
+class StatementCounter:
+    """sqlite trace 回调：统计执行的语句数与事务数"""
+
+    def __init__(self):
+        self.statements = 0
+        self.transactions = 0
+
+    def __call__(self, sql: str):
+        keyword = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+        if keyword == "BEGIN":
+            self.transactions += 1
+        elif keyword in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+            self.statements += 1
+
+
+def new_world(db_path: str, seed: int):
+    """全新的库、宏观经济与市场时间线（模块级实例替换为新实例，重放时从同一起点开始）"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = FinAIDatabase(db_path)
+        macro_module.macro_economy = macro_module.MacroEconomy()
+        timeline_module.market_timeline = timeline_module.MarketTimeline(MarketEngine(seed=seed, persist=False))
+        service = GameService()
+    service.db = db
+    service.ai_engine = None
+    service.behavior_system = BehaviorInsightSystem(db)
+    return service
+
+
+def create_sessions(service, count: int, seed: int):
+    session_ids = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(count):
+            session_id = service.start_session(f"bench{i}", f"玩家{i}", "INTJ", seed=seed + i)["session_id"]
+            with service.db.connect() as conn:
+                for sql in FIXTURE:
+                    conn.execute(sql, (session_id,))
+            session_ids.append(session_id)
+    return session_ids
+
+
+def run(service, session_ids, months: int, counter=None):
+    """逐月推进所有会话，返回每个会话的结果序列与写入的现金流 / 快照"""
+    conn = service.db.connect()
+    conn.set_trace_callback(counter)
+    results = {sid: [] for sid in session_ids}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(months):
+                for sid in session_ids:
+                    result = service.advance_session(sid)
+                    result.pop("timings")
+                    results[sid].append(result)
+    finally:
+        conn.set_trace_callback(None)
+
+    trace = []
+    for index, sid in enumerate(session_ids):
+        rows = [conn.execute(f"SELECT {columns} FROM {table} WHERE session_id = ? ORDER BY month", (sid,)).fetchall()
+                for table, columns in (("monthly_cashflow", "month, total_income, total_expense, cash_balance"),
+                                       ("monthly_snapshots", "month, total_assets, cash, invested_assets, happiness"))]
+        # 会话 ID 每次不同，比较时替换为序号
+        trace.append(json.dumps([results[sid], rows], ensure_ascii=False, default=str).replace(sid, f"#{index}"))
+    return trace
+
+
+def main():
+    parser = argparse.ArgumentParser(description="月度推进流水线测试")
+    parser.add_argument("--sessions", type=int, default=20, help="会话数")
+    parser.add_argument("--months", type=int, default=12, help="推进月数")
+    parser.add_argument("--seed", type=int, default=42, help="模拟种子")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="echopolis_advance_")
+    try:
+        session_state.use_store(MemorySessionStore())
+        service = new_world(os.path.join(workdir, "first.db"), args.seed)
+        session_ids = create_sessions(service, args.sessions, args.seed)
+        counter = StatementCounter()
+        started = time.perf_counter()
+        first = run(service, session_ids, args.months, counter)
+        seconds = time.perf_counter() - started
+        stats = advance_pipeline.get_stats()
+
+        advances = args.sessions * args.months
+        print(f"{args.sessions} 个会话 × {args.months} 个月，共 {advances} 次推进")
+        print(f"  每次推进: SQL 语句 {counter.statements / advances:.1f} 条，事务 {counter.transactions / advances:.1f} 个")
+        stages = stats["stages"]
+        total = sum(s["total_ms"] for s in stages.values())
+        print(f"  平均耗时 {seconds / advances * 1000:.2f}ms/次（含会话作用域），流水线各阶段合计 {total / advances:.2f}ms/次")
+        print(f"  {'阶段':<16}{'平均':>10}{'最大':>10}{'占比':>8}")
+        for name, s in stages.items():
+            print(f"  {name:<16}{s['avg_ms']:>8.3f}ms{s['max_ms']:>8.2f}ms{s['total_ms'] / total:>8.1%}")
+
+        session_state.use_store(MemorySessionStore())
+        replay_service = new_world(os.path.join(workdir, "replay.db"), args.seed)
+        replay = run(replay_service, create_sessions(replay_service, args.sessions, args.seed), args.months)
+        print(f"相同种子重放，结果与写入的现金流 / 快照一致: {first == replay}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
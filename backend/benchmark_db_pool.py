@@ -0,0 +1,87 @@
+"""
+数据库连接池基准测试
+对比 /api/avatar/status 与 /api/session/advance 在"每次新建连接"和"线程本地池化连接"
+两种模式下的吞吐量（requests/sec）。
+
+用法：
+    python backend/benchmark_db_pool.py [--requests 200] [--advance-requests 20]
+
+基准使用临时数据库，不会修改项目根目录下的 echopolis.db。
+"""
+import sys
+import os
+import io
+import time
+import sqlite3
+import tempfile
+import argparse
+import contextlib
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+backend_path = os.path.dirname(__file__)
+sys.path.insert(0, backend_path)
+
+
+def _run(client, method: str, path: str, count: int, **kwargs) -> float:
+    """连续请求 count 次，返回 requests/sec（屏蔽路由内部的调试输出）"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(count):
+            resp = client.request(method, path, **kwargs)
+            if resp.status_code != 200:
+                raise RuntimeError(f"{path} 返回 {resp.status_code}: {resp.text}")
+        elapsed = time.perf_counter() - start
+    return count / elapsed if elapsed > 0 else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库连接池基准测试")
+    parser.add_argument("--requests", type=int, default=200, help="/avatar/status 请求次数")
+    parser.add_argument("--advance-requests", type=int, default=20, help="/session/advance 请求次数")
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from core.database.database import FinAIDatabase, db
+    from core.database.connection import pool_stats
+
+    # 切换到临时数据库
+    tmp_dir = tempfile.mkdtemp(prefix="echopolis_bench_")
+    db.db_path = os.path.join(tmp_dir, "bench.db")
+    db.init_database()
+
+    # 以上下文方式使用 TestClient：所有请求共用同一个事件循环线程（与 uvicorn 一致）
+    client = TestClient(app)
+    client.__enter__()
+    pooled_connect = FinAIDatabase.connect
+    raw_connect = lambda self: sqlite3.connect(self.db_path)
+
+    results = {}
+    for mode, connect in (("raw", raw_connect), ("pooled", pooled_connect)):
+        FinAIDatabase.connect = connect
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = client.post("/api/session/start", json={
+                "username": f"bench_{mode}", "name": "Bench", "mbti": "INTJ"
+            }).json()
+        session_id = started["session_id"]
+
+        status_rps = _run(client, "GET", "/api/avatar/status", args.requests,
+                          params={"session_id": session_id})
+        advance_rps = _run(client, "POST", "/api/session/advance", args.advance_requests,
+                           json={"session_id": session_id})
+        results[mode] = (status_rps, advance_rps)
+
+    FinAIDatabase.connect = pooled_connect
+    client.__exit__(None, None, None)
+
+    print(f"{'endpoint':<24}{'raw req/s':>12}{'pooled req/s':>14}{'speedup':>10}")
+    for idx, endpoint in enumerate(("/api/avatar/status", "/api/session/advance")):
+        raw, pooled = results["raw"][idx], results["pooled"][idx]
+        speedup = pooled / raw if raw else 0
+        print(f"{endpoint:<24}{raw:>12.1f}{pooled:>14.1f}{speedup:>9.2f}x")
+    print(f"连接池统计: {pool_stats()}")
+
+
+if __name__ == "__main__":
+    main()
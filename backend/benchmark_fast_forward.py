@@ -0,0 +1,89 @@
+"""
+单会话快进测试
+在临时库中创建一批会话（随机的投资、贷款、保单、出租房产、副业和居住状态），分别用三种方式把每个会话推进 N 个月：
+1. 逐月调用 advance_session（N 次），作为参照
+2. advance_session(months=N) 一次快进
+3. 分段快进（每段 --step 个月）
+检查写入的用户、投资、贷款、保单、月份、现金流、快照与成就完全一致，并对比耗时、SQL 语句数与事务数。
+
+用法：
+    python backend/benchmark_fast_forward.py [--sessions 100] [--months 12] [--step 5] [--seed 42]
+
+数据写入临时目录中的新库，不写 echopolis.db；市场使用内存中的股票池，不调用 LLM。
+"""
+import sys
+import os
+import io
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.dirname(__file__))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from benchmark_world_tick import build, copy_db, dump, fresh_world
+    from benchmark_advance_pipeline import StatementCounter
+    from app.services.game_service import GameService
+
+
+def run(db, session_ids, months: int, step: int):
+    """每个会话以 step 个月为一段推进 months 个月，返回耗时、语句统计与最后一段的结果"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        service = GameService()
+    service.db, service.ai_engine, service.behavior_system = db, None, None
+    counter = StatementCounter()
+    conn = db.connect()
+    conn.set_trace_callback(counter)
+    result = None
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for sid in session_ids:
+                done = 0
+                while done < months:
+                    k = min(step, months - done)
+                    result = service.advance_session(sid, months=k)
+                    done += k
+    finally:
+        conn.set_trace_callback(None)
+    return time.perf_counter() - started, counter, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="单会话快进测试")
+    parser.add_argument("--sessions", type=int, default=100, help="会话数")
+    parser.add_argument("--months", type=int, default=12, help="每个会话推进的月数")
+    parser.add_argument("--step", type=int, default=5, help="分段快进时每段的月数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="echopolis_ff_")
+    try:
+        base = os.path.join(workdir, "base.db")
+        session_ids = build(base, args.sessions, args.seed)
+        n = len(session_ids)
+        print(f"{n} 个会话各推进 {args.months} 个月")
+
+        reference = None
+        runs = (("逐月推进（参照）", 1), (f"快进 {args.months} 个月", args.months),
+                (f"分段快进（每段 {args.step} 个月）", args.step))
+        for index, (label, step) in enumerate(runs):
+            path = copy_db(base, os.path.join(workdir, f"run{index}.db"))
+            seconds, counter, result = run(fresh_world(path, args.seed), session_ids, args.months, step)
+            print(f"  {label:<18}: {seconds:6.2f}s，{n * args.months / seconds:8.0f} 月/秒，"
+                  f"每会话 SQL 语句 {counter.statements / n:.1f} 条，事务 {counter.transactions / n:.1f} 个")
+            rows = dump(path)
+            if reference is None:
+                reference = rows
+            else:
+                print(f"    写入结果与逐月推进一致: {rows == reference}，序列长度 {len(result.get('series', []))}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+增量技术指标基准测试
+advance_day 每天需要全部股票的统计特征（收益率均值/波动、趋势、动量、支撑/阻力位、均量），
+对比对整个 365 天窗口重新统计（market_kernel.pattern_stats，原 advance_day 的做法）
+与增量统计（IndicatorEngine.pattern_stats，每天只追赶新增的一列K线）的耗时，并校验两者结果一致；
+同时用直接计算的参考值校验 MA、布林带、RSI、MACD。
+
+用法：
+    python backend/benchmark_indicators.py [--stocks 200] [--days 44] [--seed 42]
+
+基准引擎使用内存中的股票池（persist=False），不读写 stock.db。
+"""
+import sys
+import os
+import io
+import time
+import argparse
+import contextlib
+
+import numpy as np
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from core.systems.market_engine import MarketEngine
+    from core.systems.market_kernel import pattern_stats
+    from core.systems.indicators import MA_PERIODS, RSI_PERIOD, MACD_FAST, MACD_SLOW, MACD_SIGNAL
+    from benchmark_market_kernel import build_pool
+
+
+def reference_indicators(closes: np.ndarray):
+    """直接按定义计算的参考值"""
+    result = {f"ma{p}": closes[-p:].mean() for p in MA_PERIODS}
+    result["boll_upper"] = closes[-20:].mean() + 2 * closes[-20:].std()
+
+    changes = np.diff(closes)
+    gains, losses = np.maximum(changes, 0), np.maximum(-changes, 0)
+    avg_gain, avg_loss = gains[:RSI_PERIOD].mean(), losses[:RSI_PERIOD].mean()
+    for g, l in zip(gains[RSI_PERIOD:], losses[RSI_PERIOD:]):
+        avg_gain = (avg_gain * (RSI_PERIOD - 1) + g) / RSI_PERIOD
+        avg_loss = (avg_loss * (RSI_PERIOD - 1) + l) / RSI_PERIOD
+    result["rsi"] = 100 - 100 / (1 + avg_gain / avg_loss) if avg_loss else 100.0
+
+    def ema(values, span):
+        alpha, out = 2 / (span + 1), []
+        for v in values:
+            out.append(v if not out else out[-1] + alpha * (v - out[-1]))
+        return np.array(out)
+
+    dif = ema(closes, MACD_FAST) - ema(closes, MACD_SLOW)
+    result["macd_dif"], result["macd_dea"] = dif[-1], ema(dif, MACD_SIGNAL)[-1]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量技术指标基准测试")
+    parser.add_argument("--stocks", type=int, default=200, help="股票数量")
+    parser.add_argument("--days", type=int, default=44, help="模拟交易日数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine = MarketEngine(stock_pool=build_pool(args.stocks), seed=args.seed, persist=False)
+        while engine.kline_store.span() < engine.kline_store.window:  # 先把历史填满 365 天
+            engine.advance_month_with_report("expansion")
+    codes, store = engine._codes, engine.kline_store
+    # 增量指标首次读取时从窗口内历史构建一次，不计入稳态耗时
+    engine.indicators.pattern_stats(store, engine._volatility, engine._volatility)
+
+    full_time = incremental_time = advance_time = 0.0
+    pattern_ok = True
+    for _ in range(args.days):
+        prev_close = np.array([engine.current_prices[code] for code in codes])
+        start = time.perf_counter()
+        full = pattern_stats(store.matrix(), engine._volatility, prev_close)
+        full_time += time.perf_counter() - start
+        start = time.perf_counter()
+        incremental = engine.indicators.pattern_stats(store, engine._volatility, prev_close)
+        incremental_time += time.perf_counter() - start
+        pattern_ok &= all(np.allclose(full[key], incremental[key], rtol=1e-7, atol=1e-12, equal_nan=True)
+                          for key in full)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            engine.advance_day()
+            advance_time += time.perf_counter() - start
+
+    print(f"{args.stocks} 只股票 × {args.days} 个交易日（advance_day 每天统计一次全部股票）")
+    print(f"  整窗口重新统计 : {full_time * 1000:9.1f}ms")
+    print(f"  增量指标       : {incremental_time * 1000:9.1f}ms  ({full_time / incremental_time:.1f}x)")
+    print(f"  advance_day 合计（含增量统计、生成与写入）: {advance_time * 1000:9.1f}ms")
+    print(f"统计特征一致: {pattern_ok}")
+
+    indicators_ok = True
+    for code in codes:
+        snapshot = engine.get_indicators(code)
+        closes = engine.kline_store.matrix()["close"][engine.kline_store.rows[code]]
+        reference = reference_indicators(closes[~np.isnan(closes)])
+        actual = {f"ma{p}": snapshot[f"ma{p}"] for p in MA_PERIODS}
+        actual.update(boll_upper=snapshot["boll"]["upper"], rsi=snapshot["rsi"],
+                      macd_dif=snapshot["macd"]["dif"], macd_dea=snapshot["macd"]["dea"])
+        indicators_ok &= all(abs(actual[key] - reference[key]) < 1e-3 for key in reference)
+    print(f"MA/布林带/RSI/MACD 与参考值一致: {indicators_ok}")
+
+
+if __name__ == "__main__":
+    main()
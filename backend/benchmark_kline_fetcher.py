@@ -0,0 +1,203 @@
+"""
+历史K线抓取器测试台（本地假行情服务，不访问 Longbridge）
+启动一个本地 HTTP 假行情服务（每次请求固定延迟，超过服务端限速返回 429），依次检查：
+1. 原实现的串行抓取方式（逐只请求 + 每只之间 sleep 0.5s）与并发抓取器的耗时，两者写入的K线一致
+2. 断点续传：部分股票持续失败后重跑，只请求失败股票的区间
+3. 增量抓取：行情日期前进 N 天后重跑，每只股票只请求新增的 N 天
+4. 已是最新时重跑不发请求
+5. K线缓存中只有 MarketEngine 写入的模拟K线时，仍然抓取每只股票的完整窗口
+
+用法：
+    python backend/benchmark_kline_fetcher.py [--days 365] [--latency 0.15] [--workers 8] [--rate 12]
+
+所有数据写入临时目录中的新库，不修改 stock.db。
+"""
+import sys
+import os
+import io
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+import threading
+import contextlib
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from core.systems.longbridge_client import LongbridgeClient, STOCK_MAPPING, scale_klines
+    from core.systems.kline_fetcher import KlineFetcher, HttpQuoteSource, TokenBucket
+
+END = date(2025, 6, 30)
+
+
+class FakeQuoteServer:
+    """假行情服务：工作日生成确定性的日K；failing 中的代码返回 500"""
+
+    def __init__(self, latency: float, rate_limit: float):
+        self.latency = latency
+        self.limiter = TokenBucket(rate_limit, int(rate_limit))
+        self.failing = set()
+        self.requests = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.handle(self)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def _allow(self) -> bool:
+        """服务端限速：没有令牌时直接拒绝（不排队）"""
+        bucket = self.limiter
+        with bucket._lock:
+            now = time.monotonic()
+            bucket.tokens = min(bucket.capacity, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return True
+            return False
+
+    @staticmethod
+    def candles(symbol: str, start: date, end: date):
+        price = 10 + int(hashlib.md5(symbol.encode()).hexdigest()[:4], 16) % 90
+        result, day = [], start
+        while day <= end:
+            if day.weekday() < 5:
+                seed = int(hashlib.md5(f"{symbol}{day}".encode()).hexdigest()[:8], 16)
+                close = round(price * (1 + (seed % 2001 - 1000) / 50000 + (day.toordinal() % 97) / 500), 2)
+                result.append({"timestamp": datetime(day.year, day.month, day.day).timestamp(),
+                               "open": round(close * 0.99, 2), "high": round(close * 1.02, 2),
+                               "low": round(close * 0.97, 2), "close": close, "volume": seed % 1000000})
+            day += timedelta(days=1)
+        return result
+
+    def handle(self, request):
+        with self._lock:
+            self.requests += 1
+        query = parse_qs(urlparse(request.path).query)
+        symbol = query["symbol"][0]
+        if not self._allow():
+            with self._lock:
+                self.rejected += 1
+            request.send_response(429)
+            request.send_header("Retry-After", "0.2")
+            request.end_headers()
+            return
+        time.sleep(self.latency)
+        if symbol in self.failing:
+            request.send_response(500)
+            request.end_headers()
+            return
+        body = json.dumps({"candles": self.candles(symbol, date.fromisoformat(query["start"][0]),
+                                                   date.fromisoformat(query["end"][0]))}).encode()
+        request.send_response(200)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+def legacy_fetch(client, source, days: int):
+    """原实现的抓取方式：逐只请求完整窗口，每只之间 sleep 0.5s，整段写入"""
+    for game_code, mapping in STOCK_MAPPING.items():
+        klines = source.fetch(mapping[0], END - timedelta(days=days - 1), END)
+        client.save_kline_to_db(game_code, scale_klines(klines, mapping[2]))
+        time.sleep(0.5)
+
+
+def dump(db_path: str):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT game_code, date, open, high, low, close, volume, change_pct "
+                            "FROM stock_kline_cache ORDER BY game_code, date").fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史K线抓取器测试台")
+    parser.add_argument("--days", type=int, default=365, help="回溯天数")
+    parser.add_argument("--latency", type=float, default=0.15, help="假行情服务每次请求的延迟（秒）")
+    parser.add_argument("--workers", type=int, default=8, help="并发抓取线程数")
+    parser.add_argument("--rate", type=float, default=12, help="抓取器限速（每秒请求数）")
+    parser.add_argument("--server-rate", type=float, default=10, help="假行情服务限速（每秒请求数），低于 --rate 时会触发 429")
+    args = parser.parse_args()
+
+    server = FakeQuoteServer(args.latency, args.server_rate)
+    source = HttpQuoteSource(server.url)
+    workdir = tempfile.mkdtemp(prefix="echopolis_fetch_")
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    def client_for(name):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return LongbridgeClient(db_path=os.path.join(workdir, f"{name}.db"))
+
+    def fetch(client, end=END):
+        fetcher = KlineFetcher(client, source, workers=args.workers, rate=args.rate, burst=args.workers, end=end)
+        with contextlib.redirect_stdout(io.StringIO()):
+            fetcher.run(args.days)
+        return fetcher.stats
+
+    try:
+        print(f"{len(STOCK_MAPPING)} 只股票 × {args.days} 天，服务延迟 {args.latency * 1000:.0f}ms，"
+              f"服务端限速 {args.server_rate}/s")
+
+        legacy_client = client_for("legacy")
+        start = time.perf_counter()
+        with quiet:
+            legacy_fetch(legacy_client, source, args.days)
+        legacy_seconds = time.perf_counter() - start
+
+        client = client_for("parallel")
+        stats = fetch(client)
+        print(f"  原实现（串行 + 0.5s 间隔）: {legacy_seconds:6.2f}s")
+        print(f"  并发抓取器                : {stats['seconds']:6.2f}s（{legacy_seconds / stats['seconds']:.1f}x），"
+              f"请求 {stats['requests']}，429 {stats['rate_limited']}，重试 {stats['retries']}，写入 {stats['rows']} 行")
+        print(f"  两种方式写入的K线一致: {dump(legacy_client.db_path) == dump(client.db_path)}")
+
+        # 断点续传：后 6 只股票持续失败
+        resumed = client_for("resume")
+        broken = [mapping[0] for mapping in list(STOCK_MAPPING.values())[-6:]]
+        server.failing.update(broken)
+        stats = fetch(resumed)
+        print(f"断点续传: 首次运行 {stats['symbols_fetched']} 只成功，{stats['symbols_failed']} 只失败")
+        server.failing.clear()
+        stats = fetch(resumed)
+        print(f"  恢复后重跑: 请求 {stats['requests']} 次，抓取 {stats['symbols_fetched']} 只，"
+              f"跳过已完成 {stats['symbols_up_to_date']} 只；结果与完整抓取一致: {dump(resumed.db_path) == dump(client.db_path)}")
+
+        # 增量抓取：日期前进 5 天
+        later = END + timedelta(days=5)
+        stats = fetch(client, later)
+        print(f"增量抓取（+5 天）: 请求 {stats['requests']} 次，写入 {stats['rows']} 行，耗时 {stats['seconds']:.2f}s")
+        stats = fetch(client, later)
+        print(f"已是最新时重跑: 请求 {stats['requests']} 次")
+
+        # 只有模拟K线（MarketEngine 推进时写入的缓存行）不算已抓取
+        simulated = client_for("simulated")
+        simulated.save_market_tick([(game_code, (END - timedelta(days=i)).isoformat(), 1, 1, 1, 1, 0, 0)
+                                    for game_code in STOCK_MAPPING for i in range(3)])
+        stats = fetch(simulated)
+        print(f"缓存中只有模拟K线: 抓取 {stats['symbols_fetched']} 只，跳过 {stats['symbols_up_to_date']} 只，"
+              f"写入 {stats['rows']} 行")
+        print(f"假行情服务共收到 {server.requests} 个请求，拒绝（429）{server.rejected} 个")
+    finally:
+        server.httpd.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+多周期K线金字塔基准测试
+对比 /market/kline 周K/月K的两种取数方式：
+- 原实现：每次请求读取 days*5 根日K，逐根解析日期现场聚合（_aggregate_kline_weekly/_aggregate_kline_monthly）
+- K线金字塔：随日K追加增量维护，请求时直接切片
+并校验推进若干交易日后，增量维护的周K/月K与由同一段日K现场聚合的结果一致。
+
+用法：
+    python backend/benchmark_kline_pyramid.py [--stocks 200] [--days 66] [--repeat 5] [--seed 42]
+
+基准引擎使用内存中的股票池（persist=False），不读写 stock.db。
+"""
+import sys
+import os
+import io
+import time
+import argparse
+import contextlib
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.dirname(__file__))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from core.systems.market_engine import MarketEngine
+    from app.api.routes import KLINE_PERIOD_BARS, _aggregate_kline_weekly, _aggregate_kline_monthly
+    from benchmark_market_kernel import build_pool
+
+AGGREGATE = {"week": _aggregate_kline_weekly, "month": _aggregate_kline_monthly}
+
+
+def legacy_bars(engine: MarketEngine, code: str, period: str):
+    """原实现：取 days*5 根日K（dict）后现场聚合"""
+    days = KLINE_PERIOD_BARS[period]
+    daily = engine.kline_store.bars(code, "day", days * 5)
+    return AGGREGATE[period](daily)[-days:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多周期K线金字塔基准测试")
+    parser.add_argument("--stocks", type=int, default=200, help="股票数量")
+    parser.add_argument("--days", type=int, default=66, help="校验前推进的交易日数")
+    parser.add_argument("--repeat", type=int, default=5, help="每只股票每个周期的请求次数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine = MarketEngine(stock_pool=build_pool(args.stocks), seed=args.seed, persist=False)
+        for _ in range(args.days):
+            engine.advance_day()
+    codes = engine._codes
+    engine.kline_store.pyramid  # 首次访问时由日K窗口构建，不计入请求耗时
+
+    print(f"{args.stocks} 只股票 × {args.repeat} 次请求")
+    for period in AGGREGATE:
+        days = KLINE_PERIOD_BARS[period]
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            legacy = {code: legacy_bars(engine, code, period) for code in codes}
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            pyramid = {code: engine.get_stock_kline(code, days, period) for code in codes}
+        pyramid_time = time.perf_counter() - start
+        print(f"  {period:<6} 现场聚合 {legacy_time * 1000:8.1f}ms  金字塔 {pyramid_time * 1000:8.1f}ms"
+              f"  ({legacy_time / pyramid_time:.1f}x)")
+
+        # 现场聚合只能覆盖日K窗口，比较两者共同覆盖、且第一根完整的部分
+        consistent = True
+        for code in codes:
+            expected = legacy[code][1:]
+            actual = pyramid[code][-len(expected):] if expected else []
+            consistent &= len(actual) == len(expected) and all(
+                a["date"] == e["date"] and all(abs(a[f] - e[f]) < 1e-6 for f in ("open", "high", "low", "close", "volume"))
+                for a, e in zip(actual, expected)
+            )
+        print(f"  {period:<6} 增量维护与现场聚合一致: {consistent}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+列式K线存储基准测试
+对比三种启动加载方式与两类常用统计的耗时：
+- 启动：逐股票 get_kline_from_db + 构造 OHLCV（原实现） / 单连接查询元组并重建列式存储 / mmap 打开已持久化的存储
+- 统计：52周高低点、20日收盘均值与标准差（List[OHLCV] 遍历 vs 列式存储切片/前缀和）
+
+用法：
+    python backend/benchmark_kline_store.py [--repeat 20]
+
+在临时目录中复制 stock.db 并写入内存映射文件，不修改项目中的数据。
+"""
+import sys
+import os
+import io
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import statistics
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from core.systems.longbridge_client import LongbridgeClient, longbridge_client
+    from core.systems.market_engine import MarketEngine, OHLCV
+    from core.systems.kline_store import KlineStore
+    from core.systems.market_kernel import HISTORY_DAYS
+
+
+def load_legacy(client: LongbridgeClient, codes):
+    """原实现：每只股票一次查询，构造 dict 后再构造 OHLCV"""
+    history = {}
+    for code in codes:
+        history[code] = [
+            OHLCV(date=k.get("date", ""), open=float(k.get("open", 0)), high=float(k.get("high", 0)),
+                  low=float(k.get("low", 0)), close=float(k.get("close", 0)), volume=int(k.get("volume", 0)),
+                  change_pct=float(k.get("change_pct", 0)))
+            for k in client.get_kline_from_db(code, HISTORY_DAYS)
+        ]
+    return history
+
+
+def stats_legacy(history):
+    result = {}
+    for code, candles in history.items():
+        recent = candles[-252:]
+        closes = [k.close for k in candles[-20:]]
+        mean = sum(closes) / len(closes)
+        std = (sum((c - mean) ** 2 for c in closes) / len(closes)) ** 0.5
+        result[code] = (max(k.high for k in recent), min(k.low for k in recent), mean, std)
+    return result
+
+
+def stats_store(store: KlineStore):
+    highs, lows = store.high_low(252)
+    return highs, lows, store.moving_mean(20), store.moving_std(20)
+
+
+def _median_ms(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列式K线存储基准测试")
+    parser.add_argument("--repeat", type=int, default=20, help="每项重复次数（取中位数）")
+    args = parser.parse_args()
+
+    codes = [s.code for s in MarketEngine.STOCK_POOL]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "stock.db")
+        shutil.copy(longbridge_client.db_path, db_path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            client = LongbridgeClient(db_path=db_path)
+        store_dir = os.path.join(tmp, "kline_store")
+        KlineStore.from_records(codes, client.get_recent_klines(codes, HISTORY_DAYS)).save(store_dir)
+
+        history = load_legacy(client, codes)
+        store = KlineStore.open(store_dir, codes)
+        rows = sum(len(v) for v in history.values())
+        print(f"{len(codes)} 只股票，共 {rows} 根K线")
+
+        print("启动加载（中位数）:")
+        print(f"  逐股票查询 + OHLCV : {_median_ms(lambda: load_legacy(client, codes), args.repeat):8.2f}ms")
+        print(f"  单连接查询重建存储: "
+              f"{_median_ms(lambda: KlineStore.from_records(codes, client.get_recent_klines(codes, HISTORY_DAYS)), args.repeat):8.2f}ms")
+        print(f"  mmap 打开存储      : {_median_ms(lambda: KlineStore.open(store_dir, codes), args.repeat):8.2f}ms")
+
+        print("52周高低点 + 20日均值/标准差（中位数）:")
+        print(f"  List[OHLCV]        : {_median_ms(lambda: stats_legacy(history), args.repeat):8.3f}ms")
+        print(f"  列式存储           : {_median_ms(lambda: stats_store(store), args.repeat):8.3f}ms")
+
+        legacy = stats_legacy(history)
+        highs, lows, means, stds = stats_store(store)
+        consistent = all(
+            abs(legacy[code][0] - highs[i]) < 1e-9 and abs(legacy[code][1] - lows[i]) < 1e-9
+            and abs(legacy[code][2] - means[i]) < 1e-6 and abs(legacy[code][3] - stds[i]) < 1e-6
+            for i, code in enumerate(codes) if history[code]
+        )
+        print(f"结果一致: {consistent}")
+
+
+if __name__ == "__main__":
+    main()
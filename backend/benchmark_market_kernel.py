@@ -0,0 +1,154 @@
+"""
+市场模拟内核基准测试
+对比逐股票、逐日的 Python 循环（原实现）与 NumPy 批量内核在不同股票池规模下的耗时：
+- 月度推进：advance_month_with_report 中生成全部股票约 22 个交易日的K线
+- 单日推进：advance_day 中基于历史统计特征生成全部股票的下一交易日K线
+
+用法：
+    python backend/benchmark_market_kernel.py [--sizes 20,100,500,1000,5000] [--seed 42]
+
+基准引擎使用内存中的股票池（persist=False），不读写 stock.db（导入模块时全局实例仍会照常加载）。
+"""
+import sys
+import os
+import io
+import time
+import random
+import argparse
+import contextlib
+from datetime import timedelta
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+
+import numpy as np
+
+from core.systems.market_engine import MarketEngine, StockInfo, OHLCV
+from core.systems.market_kernel import KLINE_FIELDS
+
+
+def build_pool(size: int):
+    """按内置股票池循环扩展出 size 只股票"""
+    base = MarketEngine.STOCK_POOL
+    pool = []
+    for i in range(size):
+        tpl = base[i % len(base)]
+        pool.append(StockInfo(f"SIM{i:05d}", f"{tpl.name}{i}", tpl.sector, tpl.base_price, tpl.volatility,
+                              tpl.beta, tpl.dividend_yield, tpl.pe_ratio, tpl.description))
+    return pool
+
+
+def _append_legacy(engine: MarketEngine, days, dates):
+    """把逐条生成的K线（每日 [OHLCV]，按 engine._codes 顺序）写入列式存储"""
+    batch = {field: np.array([[getattr(c, field) for c in day] for day in days]) for field in KLINE_FIELDS}
+    engine.kline_store.append(batch, dates)
+    engine.current_prices.update(zip(engine._codes, batch["close"][-1].tolist()))
+
+
+def legacy_month(engine: MarketEngine, trading_days: int = 22, seed: int = 42):
+    """原实现：逐股票、逐日生成单日K线"""
+    rng = random.Random(seed)
+    paths = []
+    for stock_code in engine._codes:
+        stock_info = engine.stocks[stock_code]
+        prev_price = engine.current_prices[stock_code]
+        path = []
+        for day in range(trading_days):
+            ohlcv = engine._generate_daily_candle_deterministic(stock_info, prev_price, rng)
+            path.append(ohlcv)
+            prev_price = ohlcv.close
+        paths.append(path)
+    dates = [(engine.current_game_date + timedelta(days=day)).strftime("%Y-%m-%d") for day in range(trading_days)]
+    _append_legacy(engine, list(zip(*paths)), dates)
+
+
+def legacy_pattern(engine: MarketEngine, stock_code: str):
+    """原实现：从完整历史重新统计单只股票的统计特征"""
+    history = list(engine.kline_store.series(stock_code))
+    closes = [k[4] for k in history]
+    returns = [(closes[i] - closes[i - 1]) / closes[i - 1] for i in range(1, len(closes)) if closes[i - 1] > 0]
+    avg_return = sum(returns) / len(returns)
+    volatility = (sum((r - avg_return) ** 2 for r in returns) / len(returns)) ** 0.5
+    recent_20 = returns[-20:]
+    trend = sum(recent_20) / len(recent_20)
+    momentum = sum(returns[-5:]) / len(returns[-5:]) - trend
+    recent = history[-60:]
+    return {
+        "volatility": volatility,
+        "avg_return": avg_return,
+        "trend": trend,
+        "momentum": momentum,
+        "support": min(k[3] for k in recent),
+        "resistance": max(k[2] for k in recent),
+        "avg_volume": sum(k[5] for k in history[-20:]) / len(history[-20:]),
+    }
+
+
+def legacy_day(engine: MarketEngine, rng: random.Random):
+    """原实现：逐股票从完整历史重新统计，再生成下一交易日K线"""
+    candles = []
+    for stock_code in engine._codes:
+        stock = engine.stocks[stock_code]
+        prev_close = engine.current_prices[stock_code]
+        pattern = legacy_pattern(engine, stock_code)
+        daily_return = (pattern["avg_return"] + rng.gauss(0, pattern["volatility"])
+                        + pattern["trend"] * 0.3 * rng.uniform(0.5, 1.5) + pattern["momentum"] * 0.2)
+        if prev_close < pattern["support"]:
+            daily_return += (pattern["support"] - prev_close) / prev_close * 0.1
+        elif prev_close > pattern["resistance"]:
+            daily_return += (pattern["resistance"] - prev_close) / prev_close * 0.1
+        daily_return += engine.market_state.trend_strength * stock.beta * 0.005
+        max_change = 0.20 if "688" in stock_code else 0.10
+        daily_return = max(-max_change, min(max_change, daily_return))
+        close = prev_close * (1 + daily_return)
+        intraday_vol = pattern["volatility"] * 0.6
+        open_price = prev_close * (1 + rng.gauss(0, pattern["volatility"] * 0.3))
+        high = max(max(open_price, close) * (1 + rng.uniform(0, intraday_vol)), open_price, close)
+        low = min(min(open_price, close) * (1 - rng.uniform(0, intraday_vol)), open_price, close)
+        volume = int(pattern["avg_volume"] * (1 + abs(daily_return) * 5) * rng.uniform(0.7, 1.3))
+        candles.append(OHLCV("", round(open_price, 2), round(high, 2), round(low, 2), round(close, 2),
+                             volume, round(daily_return * 100, 2)))
+    next_date = engine.current_game_date + timedelta(days=1)
+    _append_legacy(engine, [candles], [next_date.strftime("%Y-%m-%d")])
+
+
+def _timed(func) -> float:
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="市场模拟内核基准测试")
+    parser.add_argument("--sizes", default="20,100,500,1000,5000", help="股票池规模，逗号分隔")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    print(f"{'stocks':>7}{'month loop':>13}{'month numpy':>13}{'speedup':>9}"
+          f"{'day loop':>11}{'day numpy':>11}{'speedup':>9}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        pool = build_pool(size)
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy = MarketEngine(stock_pool=pool, seed=args.seed, persist=False)
+            vectorized = MarketEngine(stock_pool=pool, seed=args.seed, persist=False)
+
+        month_loop = _timed(lambda: legacy_month(legacy, seed=args.seed))
+        month_numpy = _timed(lambda: vectorized.advance_month_with_report("expansion"))
+        day_loop = _timed(lambda: legacy_day(legacy, random.Random(args.seed)))
+        day_numpy = _timed(vectorized.advance_day)
+
+        print(f"{size:>7}{month_loop * 1000:>11.1f}ms{month_numpy * 1000:>11.1f}ms{month_loop / month_numpy:>8.1f}x"
+              f"{day_loop * 1000:>9.1f}ms{day_numpy * 1000:>9.1f}ms{day_loop / day_numpy:>8.1f}x")
+
+    # 相同种子的两次模拟必须得到相同结果
+    with contextlib.redirect_stdout(io.StringIO()):
+        runs = []
+        for _ in range(2):
+            engine = MarketEngine(stock_pool=build_pool(50), seed=args.seed, persist=False)
+            runs.append((engine.advance_month_with_report("expansion"), engine.advance_day()))
+    print(f"相同种子结果一致: {runs[0] == runs[1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+市场时间线基准测试
+N 个玩家各推进 M 个月，对比：
+- 原实现：每次推进都调用 advance_month_with_report（共享市场前进 N×M 个月）
+- 市场时间线：世界时钟每个月只模拟一次，其余玩家查表（共享市场前进 M 个月）
+
+用法：
+    python backend/benchmark_market_timeline.py [--players 20] [--months 12] [--seed 42]
+
+基准引擎使用内存中的股票池（persist=False），不读写 stock.db。
+"""
+import sys
+import os
+import io
+import time
+import argparse
+import contextlib
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from core.systems.market_engine import MarketEngine
+    from core.systems.market_timeline import MarketTimeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="市场时间线基准测试")
+    parser.add_argument("--players", type=int, default=20, help="玩家数量")
+    parser.add_argument("--months", type=int, default=12, help="每个玩家推进的月数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        legacy_engine = MarketEngine(seed=args.seed, persist=False)
+        timeline = MarketTimeline(MarketEngine(seed=args.seed, persist=False))
+
+    # 玩家轮流推进（与真实服务中的交错请求一致）
+    legacy_samples, timeline_samples, reports = [], [], {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for month in range(1, args.months + 1):
+            for player in range(args.players):
+                start = time.perf_counter()
+                legacy_engine.advance_month_with_report("expansion")
+                legacy_samples.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                report = timeline.report_for(month, "expansion")
+                timeline_samples.append(time.perf_counter() - start)
+                reports.setdefault(month, set()).add(id(report))
+
+    calls = args.players * args.months
+    print(f"{args.players} 个玩家 × {args.months} 个月（共 {calls} 次推进）")
+    print(f"  原实现     : 总计 {sum(legacy_samples) * 1000:8.1f}ms，每次 {sum(legacy_samples) / calls * 1000:.2f}ms，"
+          f"共享市场前进 {legacy_engine.month_count} 个月")
+    hits = sorted(timeline_samples)[:calls - args.months]  # 除每月第一个到达的玩家外都是查表
+    print(f"  市场时间线 : 总计 {sum(timeline_samples) * 1000:8.1f}ms，查表每次 {sum(hits) / max(len(hits), 1) * 1e6:.1f}us，"
+          f"共享市场前进 {timeline.world_month} 个月")
+    print(f"  时间线统计 : {timeline.get_stats()}")
+    print(f"同一月份所有玩家读到同一份月报: {all(len(ids) == 1 for ids in reports.values())}")
+
+
+if __name__ == "__main__":
+    main()
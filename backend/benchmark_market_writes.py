@@ -0,0 +1,124 @@
+"""
+市场数据写入基准测试
+对比每次推进后写回 stock.db 的两种方式：
+- 原实现：每只股票单独写当前价格，并逐行 INSERT OR REPLACE 最近 60 根K线（日推进还要额外写当天K线）
+- 批量写入：只 upsert 新增或变化的K线，与当前价格一起在单个事务内 executemany
+
+用法：
+    python backend/benchmark_market_writes.py [--months 6] [--days 22] [--seed 42]
+
+在临时目录中复制 stock.db，不修改项目中的数据。
+"""
+import sys
+import os
+import io
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("KLINE_STORE_DIR", os.path.join(_tmp.name, "kline_store"))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from core.database.connection import get_connection
+    from core.systems import market_engine as market_engine_module
+    from core.systems.longbridge_client import LongbridgeClient, longbridge_client
+    from core.systems.market_engine import MarketEngine, TRADING_DAYS_PER_MONTH
+
+
+def legacy_sync(engine: MarketEngine, db_path: str, new_day: bool = False) -> int:
+    """原实现的写入方式，返回写入的行数"""
+    rows = 0
+    if new_day:  # advance_day 先逐只写入当天K线
+        for code in engine._codes:
+            with get_connection(db_path) as conn:
+                conn.execute('INSERT OR REPLACE INTO stock_kline_cache (game_code, date, open, high, low, close, volume, change_pct) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (code, *engine.kline_store.series(code)[-1]))
+                conn.commit()
+            rows += 1
+    for code, price in engine.current_prices.items():
+        history = engine.kline_store.series(code)
+        with get_connection(db_path) as conn:
+            conn.execute('INSERT OR REPLACE INTO stock_current_prices (code, current_price, data_source) VALUES (?, ?, ?)',
+                         (code, price, "ai_generated"))
+            conn.commit()
+        rows += 1
+        with get_connection(db_path) as conn:
+            for k in history[-60:]:
+                conn.execute('INSERT OR REPLACE INTO stock_kline_cache (game_code, date, open, high, low, close, volume, change_pct) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (code, *k))
+                rows += 1
+            conn.commit()
+    return rows
+
+
+def bulk_sync(engine: MarketEngine, client: LongbridgeClient) -> int:
+    """批量写入（MarketEngine._sync_prices_to_db），返回写入的行数"""
+    before = engine.write_stats["kline_rows_written"] + engine.write_stats["price_rows_written"]
+    market_engine_module.longbridge_client = client
+    engine.persist = True
+    try:
+        engine._sync_prices_to_db()
+    finally:
+        engine.persist = False
+        market_engine_module.longbridge_client = longbridge_client
+    return engine.write_stats["kline_rows_written"] + engine.write_stats["price_rows_written"] - before
+
+
+def measure(engine: MarketEngine, step, sync, ticks: int):
+    """推进 ticks 次，只对写入计时；返回 (写入行数, 写入耗时秒, 模拟月数)"""
+    start_days = engine.write_stats["trading_days"]
+    rows, elapsed = 0, 0.0
+    for _ in range(ticks):
+        with contextlib.redirect_stdout(io.StringIO()):
+            step()
+            start = time.perf_counter()
+            rows += sync()
+            elapsed += time.perf_counter() - start
+    return rows, elapsed, (engine.write_stats["trading_days"] - start_days) / TRADING_DAYS_PER_MONTH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="市场数据写入基准测试")
+    parser.add_argument("--months", type=int, default=6, help="月推进次数")
+    parser.add_argument("--days", type=int, default=22, help="日推进次数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    databases = {}
+    for name in ("legacy", "bulk"):
+        databases[name] = os.path.join(_tmp.name, f"{name}.db")
+        shutil.copy(longbridge_client.db_path, databases[name])
+    with contextlib.redirect_stdout(io.StringIO()):
+        bulk_client = LongbridgeClient(db_path=databases["bulk"])
+        engines = {name: MarketEngine(seed=args.seed, persist=False) for name in databases}
+    for engine in engines.values():
+        # 初始生成的历史不计入，只统计推进产生的写入
+        engine._unsynced_days = 0
+        engine.write_stats = dict.fromkeys(engine.write_stats, 0)
+
+    for title, step_name, ticks in (("月推进", "advance_month_with_report", args.months),
+                                    ("日推进", "advance_day", args.days)):
+        print(f"{title} × {ticks}")
+        print(f"  {'':<10}{'rows':>10}{'rows/month':>14}{'write':>13}{'per month':>15}")
+        for name, engine in engines.items():
+            step = getattr(engine, step_name)
+            if name == "legacy":
+                sync = lambda e=engine: legacy_sync(e, databases["legacy"], new_day=step_name == "advance_day")
+            else:
+                sync = lambda e=engine: bulk_sync(e, bulk_client)
+            rows, elapsed, months = measure(engine, step, sync, ticks)
+            print(f"  {name:<10}{rows:>10}{rows / months:>14.1f}{elapsed * 1000:>11.1f}ms"
+                  f"{elapsed * 1000 / months:>13.1f}ms")
+    print(f"批量写入指标: {engines['bulk'].get_write_stats()}")
+    print(f"批量写入事务: {bulk_client.write_stats}")
+    _tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+WebSocket 推送扇出基准测试
+在一个事件循环中挂起大量空闲连接（进程内的模拟连接，不经过网络），推进行情若干次，统计：
+- 每次推进后扇出到所有正常客户端（都收到增量帧）的耗时
+- 每个连接的内存占用
+- 慢客户端（收第一帧后不再读取）：待发消息被合并、发送超时后断开，内存不随推进次数增长
+
+用法：
+    python backend/benchmark_push_hub.py [--clients 5000] [--slow 50] [--ticks 20]
+
+基准使用的行情引擎关闭写回（persist=False），不修改 stock.db。
+"""
+import sys
+import os
+import io
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.dirname(__file__))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("KLINE_STORE_DIR", os.path.join(_tmp.name, "kline_store"))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from core.systems.market_engine import market_engine
+    from app.services import push_hub as push_hub_module
+    from app.services.push_hub import PushHub, MARKET_TOPIC
+
+
+class FakeSocket:
+    """进程内的 WebSocket：记录收到的帧；slow 为 True 时收到第一帧后发送永远阻塞"""
+
+    def __init__(self, slow: bool = False):
+        self.slow = slow
+        self.frames = 0
+        self.version = None
+        self.received = asyncio.Event()
+        self._closed = asyncio.Event()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.slow and self.frames:
+            await asyncio.Event().wait()
+        self.frames += 1
+        self.version = int(text[text.index('"version":') + 10:text.index(',"base"')])
+        self.received.set()
+
+    async def receive(self):
+        await self._closed.wait()
+        return {"type": "websocket.disconnect"}
+
+    def close(self):
+        self._closed.set()
+
+
+async def run(args):
+    push_hub_module.SEND_TIMEOUT = args.timeout
+    hub = PushHub()
+    market_engine.persist = False
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sockets = [FakeSocket() for _ in range(args.clients)] + [FakeSocket(slow=True) for _ in range(args.slow)]
+    tasks = [asyncio.create_task(hub.serve(sock, [MARKET_TOPIC])) for sock in sockets]
+    while hub.stats["frames_sent"] < len(sockets):
+        await asyncio.sleep(0.01)
+    per_connection = (tracemalloc.get_traced_memory()[0] - before) / len(sockets)
+    tracemalloc.stop()
+    print(f"{args.clients} 个空闲连接 + {args.slow} 个慢连接，每个连接约 {per_connection / 1024:.1f}KB")
+
+    fast = sockets[:args.clients]
+    latencies = []
+    for _ in range(args.ticks):
+        for sock in fast:
+            sock.received.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            await asyncio.to_thread(market_engine.advance_day)
+            start = time.perf_counter()  # 发布已投递到事件循环，从这里开始计扇出耗时
+            for sock in fast:
+                await sock.received.wait()
+        latencies.append((time.perf_counter() - start) * 1000)
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.sleep(args.timeout + 0.2)  # 等慢连接发送超时
+
+    version = market_engine.quote_board.snapshot.version
+    latencies.sort()
+    print(f"推进 {args.ticks} 次：所有正常客户端收到增量帧 中位数 {latencies[len(latencies) // 2]:.1f}ms，"
+          f"最大 {latencies[-1]:.1f}ms")
+    print(f"正常客户端均收到最新版本: {all(sock.version == version for sock in fast)}")
+    stats = hub.get_stats()
+    print(f"合并的消息 {stats['coalesced']}，慢连接断开 {stats['slow_disconnects']}/{args.slow}，"
+          f"剩余连接 {stats['connections']}")
+
+    for sock in sockets:
+        sock.close()
+    await asyncio.gather(*tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket 推送扇出基准测试")
+    parser.add_argument("--clients", type=int, default=5000, help="空闲连接数")
+    parser.add_argument("--slow", type=int, default=50, help="慢连接数")
+    parser.add_argument("--ticks", type=int, default=20, help="行情推进次数")
+    parser.add_argument("--timeout", type=float, default=0.5, help="单帧发送超时（秒）")
+    asyncio.run(run(parser.parse_args()))
+    _tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+行情快照板基准测试
+对比轮询接口的三种取数方式：
+- 原 /market/stocks：每只股票单独 get_kline_from_db(code, 2)（每次一个新查询），再拼装报价
+- 原 /market/state：get_market_overview 对每只股票调用 get_stock_quote 后排序
+- 快照板：读取当前快照 + 缓存的 JSON 编码（完整 / 紧凑格式），以及 ETag 命中时的 304
+并校验快照中的报价与 get_stock_quote 一致。
+
+用法：
+    python backend/benchmark_quote_board.py [--repeat 50]
+
+在临时目录中复制 stock.db，不修改项目中的数据。
+"""
+import sys
+import os
+import io
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import contextlib
+import statistics
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("KLINE_STORE_DIR", os.path.join(_tmp.name, "kline_store"))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from core.systems import market_engine as market_engine_module
+    from core.systems.longbridge_client import LongbridgeClient, longbridge_client, STOCK_MAPPING
+    from core.systems.market_engine import MarketEngine
+
+
+def legacy_stocks(engine: MarketEngine, client: LongbridgeClient) -> bytes:
+    """原 /market/stocks：逐只查询最近 2 根K线"""
+    stocks = []
+    for game_code, mapping in STOCK_MAPPING.items():
+        kline = client.get_kline_from_db(game_code, 2)
+        latest = kline[-1]
+        prev = kline[-2] if len(kline) > 1 else latest
+        price = latest.get("close", 0)
+        change_pct = (price - prev["close"]) / prev["close"] * 100 if prev.get("close", 0) > 0 else 0
+        stock_info = engine.stocks.get(game_code)
+        stocks.append({"code": game_code, "name": stock_info.name, "real_name": mapping[3], "real_symbol": mapping[0],
+                       "sector": stock_info.sector.value, "price": round(price, 2), "change_pct": round(change_pct, 2),
+                       "pe_ratio": stock_info.pe_ratio, "dividend_yield": stock_info.dividend_yield * 100,
+                       "description": stock_info.description})
+    return json.dumps({"success": True, "stocks": stocks}, ensure_ascii=False).encode("utf-8")
+
+
+def legacy_state(engine: MarketEngine) -> bytes:
+    """原 /market/state：每只股票 get_stock_quote 后排序"""
+    all_quotes = engine.get_all_stocks()
+    gainers = sorted([q for q in all_quotes if q["change_pct"] > 0], key=lambda x: x["change_pct"], reverse=True)
+    losers = sorted([q for q in all_quotes if q["change_pct"] < 0], key=lambda x: x["change_pct"])
+    state = {"top_gainers": gainers[:3], "top_losers": losers[:3], "total_stocks": len(all_quotes)}
+    return json.dumps({"success": True, "state": state}, ensure_ascii=False).encode("utf-8")
+
+
+def board_read(engine: MarketEngine, kind: str, if_none_match: str = None):
+    """快照板：与 routes._snapshot_response 相同的取数路径"""
+    snapshot = engine.quote_board.snapshot
+    if if_none_match == snapshot.etag(kind):
+        return None
+    return snapshot.encode(kind)
+
+
+def _median_us(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="行情快照板基准测试")
+    parser.add_argument("--repeat", type=int, default=50, help="每项重复次数（取中位数）")
+    args = parser.parse_args()
+
+    db_path = os.path.join(_tmp.name, "stock.db")
+    shutil.copy(longbridge_client.db_path, db_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        client = LongbridgeClient(db_path=db_path)
+        market_engine_module.longbridge_client = client
+        engine = MarketEngine(seed=42)
+        engine.advance_day()
+    etag = engine.quote_board.snapshot.etag("stocks")
+
+    print(f"{len(engine.stocks)} 只股票，每次请求耗时（中位数，含 JSON 编码）:")
+    results = [
+        ("原 /market/stocks（逐只查询）", lambda: legacy_stocks(engine, client)),
+        ("原 /market/state（逐只报价）", lambda: legacy_state(engine)),
+        ("快照板 stocks", lambda: board_read(engine, "stocks")),
+        ("快照板 compact", lambda: board_read(engine, "compact")),
+        ("快照板 state", lambda: board_read(engine, "state")),
+        ("快照板 304", lambda: board_read(engine, "stocks", etag)),
+    ]
+    for name, func in results:
+        print(f"  {name:<24}{_median_us(func, args.repeat):10.1f}us")
+    print(f"响应大小: stocks {len(board_read(engine, 'stocks'))}B, compact {len(board_read(engine, 'compact'))}B")
+
+    snapshot = engine.quote_board.snapshot
+    consistent = all(
+        quote[key] == engine.get_stock_quote(quote["code"])[key]
+        for quote in snapshot.quotes for key in ("price", "change", "change_pct", "volume", "high_52w", "low_52w")
+    )
+    print(f"快照与 get_stock_quote 一致: {consistent}")
+    market_engine_module.longbridge_client = longbridge_client
+    _tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+AI 化身会话缓存测试
+模拟长时间运行的 worker：大量会话按 Zipf 分布反复访问，每次访问给化身追加一条决策记录
+（带一段 AI 思考文本，对应 /echo、/auto-decision 的增长方式），对比：
+- 原实现：普通字典，所有会话一直常驻
+- SessionCache：LRU + 内存预算，淘汰时写回（这里写入一个字典代替数据库），未命中时经 AIAvatar.load_state 重建
+并检查每个会话最终的决策记录条数等于它被访问的次数（淘汰、写回、重建过程中没有丢失状态）。
+并发部分：多个线程取到会话后跨越一段慢操作（对应 LLM 调用）再修改，缓存很小、写回很慢，淘汰频繁发生：
+- get：取到的字典在持有期间可能被淘汰写回，之后的修改丢失
+- checkout：持有期间会话被钉住不会淘汰；写回在锁外执行，不阻塞其他线程的命中
+
+用法：
+    python backend/benchmark_session_cache.py [--sessions 3000] [--accesses 30000] [--budget-mb 8] [--threads 8]
+"""
+import sys
+import os
+import io
+import json
+import time
+import random
+import argparse
+import threading
+import contextlib
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.dirname(__file__))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from core.avatar.ai_avatar import AIAvatar
+    from core.systems.mbti_traits import MBTIType
+    from app.services.session_cache import SessionCache
+
+THOUGHT = "考虑到当前现金流和市场波动，我决定先保留一部分应急资金，再把剩余资金分散投入指数基金与国债。" * 3
+
+
+def serialize(session):
+    avatar = session.get("avatar")
+    return json.dumps(avatar.save_state(), ensure_ascii=False) if avatar else None
+
+
+def new_session(session_id: str):
+    avatar = AIAvatar(f"玩家{session_id[-4:]}", random.choice(list(MBTIType)), session_id)
+    return {"avatar": avatar, "avatar_data": {"name": avatar.attributes.name, "credits": avatar.attributes.credits}}
+
+
+def touch(session, step: int):
+    """一次请求：追加决策记录并修改属性"""
+    avatar = session["avatar"]
+    avatar.decision_history.append({"round": step, "option": "分散投资", "thoughts": THOUGHT})
+    avatar.attributes.credits += 100
+
+
+def concurrent_run(mode: str, threads: int, ops: int, seed: int):
+    """并发持有会话：返回 (丢失修改的会话数, 会话数, 命中的最大耗时 ms, 统计)"""
+    rng = random.Random(seed)
+    ids = [f"conc_{i:03d}" for i in range(16)]
+    database = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for sid in ids:
+            database[sid] = serialize(new_session(sid))
+
+    def loader(sid):
+        state = database.get(sid)
+        if state is None:
+            return None
+        avatar = AIAvatar.from_state(json.loads(state), sid)
+        return {"avatar": avatar, "avatar_data": {"name": avatar.attributes.name}}, state
+
+    def writer(sid, state):
+        time.sleep(0.005)  # 慢的数据库写入
+        database[sid] = state
+
+    cache = SessionCache(serialize, loader, writer, max_entries=4, max_bytes=1 << 30)
+    plans = [[rng.choice(ids) for _ in range(ops)] for _ in range(threads)]
+    hit_max = [0.0]
+
+    def request(sid, step):
+        started = time.perf_counter()
+        if mode == "checkout":
+            with cache.checkout(sid) as session:
+                hit_max[0] = max(hit_max[0], time.perf_counter() - started)
+                time.sleep(0.001)  # 持有期间的慢操作
+                touch(session, step)
+        else:
+            session = cache.get(sid)
+            hit_max[0] = max(hit_max[0], time.perf_counter() - started)
+            time.sleep(0.001)
+            touch(session, step)
+
+    def run(plan):
+        for step, sid in enumerate(plan):
+            request(sid, step)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        workers = [threading.Thread(target=run, args=(plan,)) for plan in plans]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        cache.flush()
+    expected = {sid: sum(plan.count(sid) for plan in plans) for sid in ids}
+    lost = sum(1 for sid, n in expected.items() if len(json.loads(database[sid])["decision_history"]) != n)
+    return lost, len(ids), hit_max[0] * 1000, cache.get_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI 化身会话缓存测试")
+    parser.add_argument("--sessions", type=int, default=3000, help="会话数")
+    parser.add_argument("--accesses", type=int, default=30000, help="访问次数")
+    parser.add_argument("--budget-mb", type=float, default=8, help="缓存内存预算（MB）")
+    parser.add_argument("--zipf", type=float, default=1.1, help="访问分布的 Zipf 指数（越大越集中在热门会话）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--threads", type=int, default=8, help="并发部分的线程数")
+    parser.add_argument("--ops", type=int, default=100, help="并发部分每个线程的请求数")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    ids = [f"bench_{i:05d}" for i in range(args.sessions)]
+    weights = [1 / (rank + 1) ** args.zipf for rank in range(args.sessions)]
+    trace = random.choices(ids, weights=weights, k=args.accesses)
+    counts = {sid: trace.count(sid) for sid in set(trace)}
+
+    # 原实现：普通字典
+    with contextlib.redirect_stdout(io.StringIO()):
+        plain = {}
+        started = time.perf_counter()
+        for step, sid in enumerate(trace):
+            if sid not in plain:
+                plain[sid] = new_session(sid)
+            touch(plain[sid], step)
+        plain_seconds = time.perf_counter() - started
+    plain_bytes = sum(len(serialize(s).encode("utf-8")) for s in plain.values())
+
+    # SessionCache：写回到字典（代替 avatar_states 表）
+    database = {}
+
+    def loader(sid):
+        state = database.get(sid)
+        if state is None:
+            return None
+        avatar = AIAvatar.from_state(json.loads(state), sid)
+        return {"avatar": avatar, "avatar_data": {"name": avatar.attributes.name}}, state
+
+    cache = SessionCache(serialize, loader, database.__setitem__,
+                         max_entries=args.sessions, max_bytes=int(args.budget_mb * 1024 * 1024))
+    peak = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        for step, sid in enumerate(trace):
+            session = cache.get(sid)
+            if session is None:
+                session = new_session(sid)
+                cache[sid] = session
+            touch(session, step)
+            peak = max(peak, cache.get_stats()["resident_bytes"])
+        cache_seconds = time.perf_counter() - started
+        cache.flush()
+    stats = cache.get_stats()
+
+    lost = sum(1 for sid, n in counts.items()
+               if len(json.loads(database[sid])["decision_history"]) != n)
+    sample = AIAvatar.from_state(json.loads(database[trace[0]]), trace[0])
+
+    print(f"{args.sessions} 个会话，{args.accesses} 次访问（Zipf {args.zipf}），预算 {args.budget_mb}MB")
+    print(f"  普通字典    : 常驻 {len(plain)} 个会话，{plain_bytes / 1024 / 1024:.1f}MB，"
+          f"{plain_seconds / args.accesses * 1e6:.0f}µs/次")
+    print(f"  SessionCache: 常驻 {stats['entries']} 个会话，{stats['resident_bytes'] / 1024 / 1024:.1f}MB"
+          f"（峰值 {peak / 1024 / 1024:.1f}MB），{cache_seconds / args.accesses * 1e6:.0f}µs/次")
+    print(f"  命中率 {stats['hit_rate']:.1%}，重建 {stats['rehydrated']}，预算淘汰 {stats['evicted_budget']}，"
+          f"写回 {stats['writebacks']}（跳过未变化 {stats['writebacks_skipped']}）")
+    print(f"  决策记录条数与访问次数不一致的会话: {lost} / {len(counts)}")
+    print(f"  重建的化身枚举字段类型正确: {isinstance(sample.attributes.mbti_type, MBTIType)}，"
+          f"再次保存与写回内容一致: {json.dumps(sample.save_state(), ensure_ascii=False) == database[trace[0]]}")
+
+    print(f"并发：{args.threads} 线程 × {args.ops} 次请求，16 个会话，缓存 4 条，每次写回 5ms")
+    for mode in ("get", "checkout"):
+        lost, total, hit_ms, stats = concurrent_run(mode, args.threads, args.ops, args.seed)
+        print(f"  {mode:<8}: 丢失修改的会话 {lost} / {total}，取会话最大耗时 {hit_ms:.1f}ms，"
+              f"淘汰 {stats['evicted_lru']}，写回中被重新访问 {stats['revived']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+会话状态存储多 worker 正确性测试
+模拟 uvicorn --workers N：启动多个独立进程（每个进程再开多个线程，对应路由的线程池），
+反复对同一批会话执行读-改-写（career_system.advance_month 让工作月数 +1、
+event_system.apply_event_choice 追加一条已触发事件），最后核对每个会话的计数：
+1. SQLite 存储（默认）：所有 worker 共享一个库文件，按会话加锁 → 没有丢失的更新
+2. 去掉会话锁的 SQLite 存储：并发的读-改-写互相覆盖 → 丢失更新
+3. 各进程独立的内存存储（即原先模块级单例的行为）：每个 worker 只看到自己的那一部分
+另外给出单进程内一次会话作用域（加锁 + 读取 + 写回）的开销。
+
+用法：
+    python backend/benchmark_session_state.py [--workers 4] [--threads 4] [--sessions 8] [--ops 200]
+
+会话状态写入临时目录中的新库，不写 echopolis.db。
+"""
+import sys
+import os
+import io
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import contextlib
+import multiprocessing
+from contextlib import nullcontext
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import core.database.connection  # noqa: F401  core.database 包初始化时会打开主库，提前在静默状态下导入
+    from core.database.database import FinAIDatabase
+    from core.systems.session_state import session_state, MemorySessionStore, SQLiteSessionStore
+    from core.systems.career_system import career_system, Industry
+    from core.systems.event_system import event_system
+
+
+class UnlockedSQLiteStore(SQLiteSessionStore):
+    """对照组：不加会话锁"""
+
+    def lock(self, session_id: str):
+        return nullcontext()
+
+
+STORES = {"sqlite": SQLiteSessionStore, "sqlite-unlocked": UnlockedSQLiteStore}
+
+
+def make_store(kind: str, db_path: str):
+    if kind == "memory":
+        return MemorySessionStore()
+    with contextlib.redirect_stdout(io.StringIO()):
+        FinAIDatabase(db_path)  # 建表并执行迁移（session_state / session_locks 由迁移 v5 创建）
+    return STORES[kind](db_path)
+
+
+def session_ids(count: int):
+    return [f"bench-session-{i}" for i in range(count)]
+
+
+def apply_op(session_id: str, event):
+    """一次请求：在会话作用域内修改两个子系统的会话状态"""
+    with session_state.scope(session_id):
+        career_system.advance_month(session_id)
+        event_system.apply_event_choice(session_id, event, 0, 1)
+
+
+def read_counts(session_id: str):
+    with session_state.scope(session_id):
+        career = career_system.careers.get(session_id)
+        return (career.total_experience if career else 0,
+                len(event_system.triggered_events.get(session_id, [])))
+
+
+def setup(sessions):
+    for session_id in sessions:
+        with session_state.scope(session_id):
+            career_system.create_career(session_id, Industry.TECH)
+            career_system.careers[session_id].total_experience = 0
+
+
+def worker(kind: str, db_path: str, sessions, ops: int, threads: int, worker_index: int, results):
+    """一个 worker 进程：threads 个线程，每个线程执行 ops 次请求，轮流落在各个会话上"""
+    session_state.use_store(make_store(kind, db_path))
+    if kind == "memory":
+        with contextlib.redirect_stdout(io.StringIO()):
+            setup(sessions)
+    event = event_system.all_events[0]
+
+    def run(thread_index: int):
+        for i in range(ops):
+            apply_op(sessions[(worker_index + thread_index + i) % len(sessions)], event)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    seconds = time.perf_counter() - started
+    # 内存存储只能在本进程内读到结果
+    counts = {sid: read_counts(sid) for sid in sessions} if kind == "memory" else None
+    results.put((worker_index, seconds, counts))
+
+
+def run_workers(kind: str, args, workdir: str):
+    db_path = os.path.join(workdir, f"{kind}.db")
+    sessions = session_ids(args.sessions)
+    if kind != "memory":
+        session_state.use_store(make_store(kind, db_path))
+        with contextlib.redirect_stdout(io.StringIO()):
+            setup(sessions)
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(kind, db_path, sessions, args.ops, args.threads, w, results))
+                 for w in range(args.workers)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    seconds = time.perf_counter() - started
+
+    expected = args.workers * args.threads * args.ops
+    if kind == "memory":
+        # 每个 worker 各自的视图：取看到最多更新的那个
+        seen = max(sum(c[0] for c in counts.values()) for _, _, counts in reports)
+        events = max(sum(c[1] for c in counts.values()) for _, _, counts in reports)
+    else:
+        session_state.use_store(make_store(kind, db_path))
+        counts = [read_counts(sid) for sid in sessions]
+        seen = sum(c[0] for c in counts)
+        events = sum(c[1] for c in counts)
+    return expected, seen, events, seconds
+
+
+def scope_overhead(kind: str, workdir: str, n: int = 2000):
+    """单进程、单线程下一次会话作用域的平均耗时（毫秒）"""
+    session_state.use_store(make_store(kind, os.path.join(workdir, f"overhead-{kind}.db")))
+    sessions = session_ids(8)
+    with contextlib.redirect_stdout(io.StringIO()):
+        setup(sessions)
+    event = event_system.all_events[0]
+    started = time.perf_counter()
+    for i in range(n):
+        apply_op(sessions[i % len(sessions)], event)
+    return (time.perf_counter() - started) / n * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话状态存储多 worker 正确性测试")
+    parser.add_argument("--workers", type=int, default=4, help="worker 进程数")
+    parser.add_argument("--threads", type=int, default=4, help="每个 worker 的线程数")
+    parser.add_argument("--sessions", type=int, default=8, help="会话数（越少冲突越多）")
+    parser.add_argument("--ops", type=int, default=200, help="每个线程的请求数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="echopolis_session_state_")
+    try:
+        print(f"{args.workers} 个 worker 进程 × {args.threads} 线程 × {args.ops} 次请求，落在 {args.sessions} 个会话上")
+        print(f"{'存储':<28}{'期望':>8}{'工作月数':>10}{'已触发事件':>12}{'丢失':>8}{'耗时':>9}{'请求/秒':>10}")
+        labels = {"sqlite": "SQLite（按会话加锁）", "sqlite-unlocked": "SQLite（不加锁）",
+                  "memory": "各进程内存（原单例行为）"}
+        for kind in ("sqlite", "sqlite-unlocked", "memory"):
+            expected, seen, events, seconds = run_workers(kind, args, workdir)
+            lost = expected - min(seen, events)
+            print(f"{labels[kind]:<24}{expected:>8}{seen:>12}{events:>14}{lost:>9}"
+                  f"{seconds:>8.2f}s{expected / seconds:>10.0f}")
+        for kind in ("memory", "sqlite"):
+            print(f"单次会话作用域开销（{kind}）: {scope_overhead(kind, workdir):.3f}ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
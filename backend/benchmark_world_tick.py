@@ -0,0 +1,311 @@
+"""
+世界时钟批量推进测试
+在临时库中创建一批会话（随机的投资、贷款、保单、出租房产、副业和居住状态），分别用三种方式推进一个月：
+1. 逐会话流水线：每个会话单独 load → 计算 → commit（与批量推进使用同一份宏观经济结果），作为参照
+2. 批量推进，本进程内计算
+3. 批量推进，进程池计算
+检查三种方式写入的用户、投资、贷款、保单、月份、现金流、快照、成就与会话状态完全一致（集合化 SQL 与逐行计算等价），
+并对比逐个调用 advance_session 与批量推进的吞吐（会话/秒）。
+最后在批量推进计算完成、提交之前插入其他请求的写入，检查提交不会覆盖这些写入，也不会重复结算；
+以及反过来的顺序：单独推进读取之后批量推进先提交，单独推进的提交被回滚，不会跳过月份或重复写入。
+
+用法：
+    python backend/benchmark_world_tick.py [--sessions 2000] [--workers 4] [--seed 42]
+
+数据写入临时目录中的新库，不写 echopolis.db；市场使用内存中的股票池，不调用 LLM。
+"""
+import sys
+import os
+import io
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import contextlib
+from typing import Dict
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.dirname(__file__))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import core.database.connection  # noqa: F401  core.database 包初始化时会打开主库，提前在静默状态下导入
+    import core.systems.macro_economy as macro_module
+    import core.systems.market_timeline as timeline_module
+    from core.database.database import FinAIDatabase
+    from core.systems.market_engine import MarketEngine
+    from core.systems.session_state import session_state, SQLiteSessionStore
+    from core.systems.sim_random import simulation
+    from app.services.game_service import GameService
+    from app.services.world_tick import WorldTick
+    from app.services.advance_pipeline import (
+        COMPUTE_STAGES, MonthState, SessionConflict, load_month_state, commit_month_state,
+    )
+
+INVESTMENT_TYPES = ["股票基金", "债券", "房产信托", "短期", "指数基金"]
+DUMP = (
+    ("users", "session_id, credits, happiness, energy, health"),
+    ("sessions", "session_id, current_month"),
+    ("investments", "session_id, id, amount, remaining_months"),
+    ("loans", "session_id, loan_id, remaining_principal, remaining_months"),
+    ("insurance_policies", "session_id, policy_id, remaining_months"),
+    ("monthly_cashflow", "session_id, month, total_income, total_expense, net_cashflow, saving_rate, cash_balance"),
+    ("monthly_snapshots", "session_id, month, total_assets, cash, invested_assets, happiness"),
+    ("achievements_unlocked", "session_id, achievement_id, unlocked_month"),
+    ("session_state", "session_id, namespace"),  # 状态内容含解锁时间戳，只比较写入了哪些命名空间
+)
+
+
+def build(db_path: str, sessions: int, seed: int):
+    """创建会话与随机的财务明细"""
+    rng = random.Random(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = FinAIDatabase(db_path)
+        service = GameService()
+    service.db = db
+    with contextlib.redirect_stdout(io.StringIO()):
+        session_ids = [service.start_session(f"bench{i}", f"玩家{i}", "ENFP", seed=seed + i)["session_id"]
+                       for i in range(sessions)]
+    with db.connect() as conn:
+        for i, sid in enumerate(session_ids):
+            conn.execute('UPDATE users SET credits = ? WHERE session_id = ?', (rng.randint(0, 2000000), sid))
+            for _ in range(rng.randint(0, 4)):
+                conn.execute('''
+                    INSERT INTO investments (username, session_id, name, amount, investment_type, remaining_months,
+                        monthly_return, return_rate, created_round) VALUES (?, ?, '理财', ?, ?, ?, 0, ?, 1)
+                ''', (f"bench{i}", sid, rng.randint(1000, 200000), rng.choice(INVESTMENT_TYPES),
+                      rng.randint(0, 12), round(rng.uniform(-0.02, 0.2), 4)))
+            for n in range(rng.randint(0, 2)):
+                principal = rng.randint(10000, 500000)
+                months = rng.randint(1, 36)
+                conn.execute('''
+                    INSERT INTO loans (session_id, loan_id, loan_type, product_name, principal, remaining_principal,
+                        annual_rate, term_months, remaining_months, monthly_payment, repayment_method, start_month)
+                    VALUES (?, ?, 'consumer', '消费贷', ?, ?, 0.06, ?, ?, ?, 'equal', 1)
+                ''', (sid, f"L{i}-{n}", principal, principal, months, months, principal // months + 100))
+            for n in range(rng.randint(0, 2)):
+                conn.execute('''
+                    INSERT INTO insurance_policies (session_id, policy_id, product_id, product_name, insurance_type,
+                        monthly_premium, coverage_amount, deductible, coverage_ratio, start_month, remaining_months,
+                        max_claims, is_active) VALUES (?, ?, 'health', '医疗险', 'health', ?, 100000, 0, 0.8, 1, ?, 3, ?)
+                ''', (sid, f"P{i}-{n}", rng.randint(50, 800), rng.randint(0, 12), rng.choice([0, 1, 1])))
+            if rng.random() < 0.4:
+                conn.execute('''
+                    INSERT INTO properties (session_id, name, property_type, purchase_price, current_value,
+                        monthly_rent, is_rented, buy_month) VALUES (?, '公寓', 'apartment', 1, 1, ?, ?, 1)
+                ''', (sid, rng.randint(1000, 8000), rng.choice([0, 1])))
+            for n in range(rng.randint(0, 2)):
+                conn.execute('''
+                    INSERT INTO side_businesses (session_id, business_id, name, investment, expected_return,
+                        risk_rate, start_month) VALUES (?, ?, '副业', 1000, ?, ?, 1)
+                ''', (sid, f"b{n}", rng.randint(500, 5000), round(rng.uniform(0.1, 0.6), 2)))
+            if rng.random() < 0.7:
+                conn.execute('''
+                    INSERT INTO living_status (session_id, living_type, property_name, monthly_cost, happiness_effect)
+                    VALUES (?, 'rent', '公寓', ?, ?)
+                ''', (sid, rng.randint(800, 6000), rng.randint(-5, 5)))
+    return session_ids
+
+
+def fresh_world(db_path: str, seed: int):
+    """复制出的库：会话状态存储指向它，宏观经济与市场时间线换成新实例（各种方式从同一起点开始）"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = FinAIDatabase(db_path)
+        session_state.use_store(SQLiteSessionStore(db_path))
+        macro_module.macro_economy = macro_module.MacroEconomy()
+        timeline_module.market_timeline = timeline_module.MarketTimeline(MarketEngine(seed=seed, persist=False))
+    return db
+
+
+def copy_db(source: str, target: str) -> str:
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+    return target
+
+
+def dump(db_path: str):
+    with sqlite3.connect(db_path) as conn:
+        return [conn.execute(f"SELECT {columns} FROM {table} ORDER BY 1, 2").fetchall() for table, columns in DUMP]
+
+
+def dump_session(conn, session_id: str):
+    """一个会话在 DUMP 各表中的行（会话状态除外）"""
+    return [conn.execute(f"SELECT {columns} FROM {table} WHERE session_id = ? ORDER BY 1, 2", (session_id,)).fetchall()
+            for table, columns in DUMP[:-1]]
+
+
+def run_reference(db, session_ids, seed: int) -> float:
+    """逐会话流水线（与批量推进共用一次宏观经济推进），返回耗时"""
+    with simulation(seed, 0):
+        macro_stats = macro_module.macro_economy.advance_month()
+        asset_impact = macro_module.macro_economy.get_asset_impact()
+
+    def shared(state):
+        state.macro_stats, state.asset_impact = macro_stats, asset_impact
+
+    stages = [shared, lambda s: load_month_state(db, s), *[stage for _, stage in COMPUTE_STAGES],
+              lambda s: commit_month_state(db, s)]
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for sid in session_ids:
+            with session_state.scope(sid):
+                month = db.get_session_month(sid) + 1
+                with simulation(db.get_session_seed(sid), month):
+                    state = MonthState(session_id=sid, new_month=month)
+                    for stage in stages:
+                        stage(state)
+    return time.perf_counter() - started
+
+
+def run_tick(tick, db, seed: int, workers: int):
+    tick._db = db
+    with contextlib.redirect_stdout(io.StringIO()), simulation(seed, 0):
+        return tick.run(workers=workers)
+
+
+def run_advance_session(db, session_ids) -> float:
+    """逐个调用 advance_session（原先唯一的推进方式）"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        service = GameService()
+    service.db, service.ai_engine, service.behavior_system = db, None, None
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for sid in session_ids:
+            service.advance_session(sid)
+    return time.perf_counter() - started
+
+
+class InterleavedTick(WorldTick):
+    """计算完成、提交之前执行 interleave（模拟批量推进期间其他请求的写入）"""
+
+    def __init__(self, interleave):
+        super().__init__()
+        self.interleave = interleave
+
+    def _compute(self, items, workers):
+        computed = super()._compute(items, workers)
+        self.interleave()
+        return computed
+
+
+def run_interleaved(base: str, workdir: str, session_ids, seed: int) -> Dict[str, bool]:
+    """
+    批量推进计算完成、提交之前插入其他请求的写入：
+    - 会话 0 的现金增加 12345 → 提交后等于不插入写入时批量推进的结果 + 12345
+    - 会话 1 新买入一笔投资 → 不被本次结算
+    - 会话 2 已被单独推进一个月 → 月份冲突，投资 / 贷款 / 保单与会话状态都不被本次写入
+    - 会话 3 的成就状态被其他请求改动 → 冲突，月份不变，其他请求写入的成就状态保留
+    - 会话 4 的单独推进在批量推进提交之前读取、之后提交 → 单独推进的提交抛出 SessionConflict 并回滚，
+      会话停在批量推进后的月份，现金与不插入写入时一致，没有重复的现金流 / 快照
+    """
+    s0, s1, s2, s3, s4 = session_ids[:5]
+    path = copy_db(base, os.path.join(workdir, "plain.db"))
+    run_tick(WorldTick(), fresh_world(path, seed), seed, 0)
+    user_credits = lambda conn, sid: conn.execute('SELECT credits FROM users WHERE session_id = ?',
+                                                  (sid,)).fetchone()[0]
+    with sqlite3.connect(path) as conn:
+        plain_credits = user_credits(conn, s0)
+        plain_s4 = dump_session(conn, s4)
+
+    path = copy_db(base, os.path.join(workdir, "interleaved.db"))
+    db = fresh_world(path, seed)
+    rows_s2 = lambda conn: [conn.execute(f"SELECT {columns} FROM {table} WHERE session_id = ? ORDER BY 1, 2",
+                                         (s2,)).fetchall() for table, columns in DUMP[2:5]]
+    with sqlite3.connect(path) as conn:
+        before_s2 = rows_s2(conn)
+        month_s3 = conn.execute('SELECT current_month FROM sessions WHERE session_id = ?', (s3,)).fetchone()[0]
+    written = {}
+
+    def interleave():
+        with db.connect() as conn:
+            conn.execute('UPDATE users SET credits = credits + 12345 WHERE session_id = ?', (s0,))
+            written["investment"] = conn.execute('''
+                INSERT INTO investments (username, session_id, name, amount, investment_type, remaining_months,
+                    monthly_return, return_rate, created_round) VALUES ('bench1', ?, '新买入', 5000, '债券', 3, 0, 0.05, 1)
+            ''', (s1,)).lastrowid
+            conn.execute('UPDATE sessions SET current_month = current_month + 1 WHERE session_id = ?', (s2,))
+        with session_state.scope(s3) as scope:
+            achievements = scope.instance("achievements")
+            achievement_id = next(a.id for a in achievements.achievements.values() if not a.prerequisite)
+            achievements.check_and_unlock(achievement_id, 1)
+        written["achievements"] = session_state.store.load(s3).get("achievements")
+        # 会话 4 的单独推进：批量推进提交之前读取并算完本月，提交留到批量推进提交之后
+        with session_state.scope(s4, write_back=False):
+            month = db.get_session_month(s4) + 1
+            with simulation(db.get_session_seed(s4), month):
+                written["state"] = state = MonthState(session_id=s4, new_month=month)
+                state.asset_impact = macro_module.macro_economy.get_asset_impact()
+                load_month_state(db, state)
+                for _, stage in COMPUTE_STAGES:
+                    stage(state)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = run_tick(InterleavedTick(interleave), db, seed, 0)
+    try:
+        commit_month_state(db, written["state"])
+        rejected = False
+    except SessionConflict:
+        rejected = True
+    with sqlite3.connect(path) as conn:
+        credits = conn.execute('SELECT credits FROM users WHERE session_id = ?', (s0,)).fetchone()[0]
+        remaining = conn.execute('SELECT remaining_months FROM investments WHERE id = ?',
+                                 (written["investment"],)).fetchone()[0]
+        after_s2 = rows_s2(conn)
+        after_month_s3 = conn.execute('SELECT current_month FROM sessions WHERE session_id = ?', (s3,)).fetchone()[0]
+        after_s4 = dump_session(conn, s4)
+    return {
+        "冲突会话数为 2": summary["conflicts"] == 2,
+        "现金累加未覆盖": credits == plain_credits + 12345,
+        "新投资未被结算": remaining == 3,
+        "冲突会话未被结算": after_s2 == before_s2 and not session_state.store.load(s2),
+        "会话状态未被覆盖": (after_month_s3 == month_s3
+                       and session_state.store.load(s3).get("achievements") == written["achievements"]),
+        "后提交的单独推进被回滚": rejected and after_s4 == plain_s4,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="世界时钟批量推进测试")
+    parser.add_argument("--sessions", type=int, default=2000, help="会话数")
+    parser.add_argument("--workers", type=int, default=4, help="进程池大小")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="echopolis_tick_")
+    try:
+        base = os.path.join(workdir, "base.db")
+        session_ids = build(base, args.sessions, args.seed)
+        n = len(session_ids)
+        print(f"{n} 个会话推进一个月")
+
+        path = copy_db(base, os.path.join(workdir, "advance.db"))
+        seconds = run_advance_session(fresh_world(path, args.seed), session_ids)
+        print(f"  逐个调用 advance_session     : {seconds:6.2f}s，{n / seconds:8.0f} 会话/秒")
+
+        path = copy_db(base, os.path.join(workdir, "reference.db"))
+        seconds = run_reference(fresh_world(path, args.seed), session_ids, args.seed)
+        reference = dump(path)
+        print(f"  逐会话流水线（参照）         : {seconds:6.2f}s，{n / seconds:8.0f} 会话/秒")
+
+        tick = WorldTick()
+        runs = (("批量推进（本进程）", 0), (f"批量推进（{args.workers} 进程，冷启动）", args.workers),
+                (f"批量推进（{args.workers} 进程，常驻）", args.workers))
+        for index, (label, workers) in enumerate(runs):
+            path = copy_db(base, os.path.join(workdir, f"tick{index}.db"))
+            summary = run_tick(tick, fresh_world(path, args.seed), args.seed, workers)
+            timings = "，".join(f"{name} {ms:.0f}ms" for name, ms in summary["timings"].items())
+            print(f"  {label:<22}: {summary['seconds']:6.2f}s，{summary['sessions_per_second']:8.0f} 会话/秒"
+                  f"（推进 {summary['advanced']}，{timings}）")
+            print(f"    写入结果与逐会话流水线一致: {dump(path) == reference}")
+        tick.close()
+
+        checks = run_interleaved(base, workdir, session_ids, args.seed)
+        print("  提交前插入其他请求的写入: " + "，".join(f"{name} {ok}" for name, ok in checks.items()))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+LLM 负载测试 - 使用本地桩服务模拟 DeepSeek
+在若干 /api/ai/chat、/api/echo、/api/auto-decision 请求（每个都要等待慢速 LLM）进行期间，
+持续探测 /api/mbti-types，验证 LLM 调用不会阻塞事件循环。
+/echo 与 /auto-decision 需要带 AI 化身和当前情况的会话，加压前先通过 /create-avatar、/generate-situation 准备。
+
+用法：
+    python backend/loadtest_llm_stub.py [--llm-delay 2.0] [--concurrency 8] [--max-probe-latency 0.5]
+
+探测请求的最大延迟超过阈值时以非零状态退出。不会访问真实的 DeepSeek 接口。
+"""
+import sys
+import os
+import io
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+backend_path = os.path.dirname(__file__)
+sys.path.insert(0, backend_path)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_llm(delay: float) -> int:
+    """启动桩 LLM 服务：每个请求等待 delay 秒后返回固定回复"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            time.sleep(delay)
+            body = json.dumps({
+                "choices": [{"message": {"content": "情况：桩服务回复\n选项1：A\n选项2：B\n选项3：C"}}]
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    port = _free_port()
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return port
+
+
+def start_api_server():
+    """在后台线程中启动 uvicorn，返回 (server, port)"""
+    import uvicorn
+    from app.main import app
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, port
+
+
+# 加压的 LLM 接口，按请求序号轮流使用
+LLM_ENDPOINTS = ("/api/ai/chat", "/api/echo", "/api/auto-decision")
+
+
+async def prepare_session(client, i: int) -> str:
+    """创建 AI 化身并生成当前情况，供 /echo 与 /auto-decision 使用"""
+    session_id = f"load_{i}"
+    resp = await client.post("/api/create-avatar", json={"name": f"负载{i}", "mbti": "INTJ", "session_id": session_id})
+    resp.raise_for_status()
+    resp = await client.post("/api/generate-situation", json={"session_id": session_id})
+    resp.raise_for_status()
+    return session_id
+
+
+async def run_load(base: str, concurrency: int) -> dict:
+    import httpx
+
+    probe_latencies = []
+    async with httpx.AsyncClient(base_url=base, timeout=120) as client:
+        session_ids = await asyncio.gather(*(prepare_session(client, i) for i in range(concurrency)))
+
+        async def llm_call(i: int) -> float:
+            endpoint = LLM_ENDPOINTS[i % len(LLM_ENDPOINTS)]
+            payload = {
+                "/api/ai/chat": {"message": f"load test {i}"},
+                "/api/echo": {"session_id": session_ids[i], "echo_text": "稳健一点，别冒险"},
+                "/api/auto-decision": {"session_id": session_ids[i]},
+            }[endpoint]
+            start = time.perf_counter()
+            resp = await client.post(endpoint, json=payload)
+            resp.raise_for_status()
+            return time.perf_counter() - start
+
+        llm_tasks = [asyncio.create_task(llm_call(i)) for i in range(concurrency)]
+        await asyncio.sleep(0.2)  # 确保 LLM 请求已经在途
+
+        while not all(task.done() for task in llm_tasks):
+            start = time.perf_counter()
+            resp = await client.get("/api/mbti-types")
+            resp.raise_for_status()
+            probe_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.05)
+
+        llm_durations = await asyncio.gather(*llm_tasks)
+
+    probe_latencies.sort()
+    return {
+        "llm_calls": len(llm_durations),
+        "llm_wall_max": max(llm_durations),
+        "probes": len(probe_latencies),
+        "probe_p50": probe_latencies[len(probe_latencies) // 2] if probe_latencies else 0.0,
+        "probe_max": probe_latencies[-1] if probe_latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 事件循环阻塞负载测试")
+    parser.add_argument("--llm-delay", type=float, default=2.0, help="桩 LLM 每次响应耗时（秒）")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时在途的 LLM 请求数")
+    parser.add_argument("--max-probe-latency", type=float, default=0.5, help="探测请求允许的最大延迟（秒）")
+    args = parser.parse_args()
+
+    # 必须在导入应用之前指向桩服务（load_dotenv 不会覆盖已有环境变量）
+    stub_port = start_stub_llm(args.llm_delay)
+    os.environ["DEEPSEEK_BASE_URL"] = f"http://127.0.0.1:{stub_port}"
+    os.environ["DEEPSEEK_API_KEY"] = "stub-key"
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from core.database.database import db
+        db.db_path = os.path.join(tempfile.mkdtemp(prefix="echopolis_load_"), "load.db")
+        db.init_database()
+        server, api_port = start_api_server()
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = asyncio.run(run_load(f"http://127.0.0.1:{api_port}", args.concurrency))
+    finally:
+        server.should_exit = True
+
+    print(f"LLM 请求: {result['llm_calls']} 个，最长耗时 {result['llm_wall_max']:.2f}s（桩延迟 {args.llm_delay}s）")
+    print(f"探测请求: {result['probes']} 次，p50 {result['probe_p50'] * 1000:.1f}ms，最大 {result['probe_max'] * 1000:.1f}ms")
+
+    if result["probe_max"] > args.max_probe_latency:
+        print(f"❌ LLM 调用期间事件循环被阻塞（最大延迟超过 {args.max_probe_latency}s）")
+        sys.exit(1)
+    print("✅ LLM 调用期间其他接口保持响应")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+世界时钟批量推进（命令行）
+把挂机 / 托管 / 离线玩家的会话各推进一个月，可由 cron 或 systemd timer 定时执行。
+
+用法：
+    python backend/run_world_tick.py [--idle-minutes 30] [--limit 5000] [--workers 4] [--session ID ...] [--ticks 1]
+"""
+import sys
+import os
+import argparse
+
+# 添加项目根目录与 backend 目录到Python路径
+project_root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.dirname(__file__))
+
+
+def main():
+    from app.services.world_tick import world_tick, TICK_WORKERS
+
+    parser = argparse.ArgumentParser(description="世界时钟批量推进")
+    parser.add_argument("--idle-minutes", type=float, default=None, help="只推进超过这么多分钟没有推进过的会话")
+    parser.add_argument("--limit", type=int, default=None, help="最多推进的会话数（最久未推进的优先）")
+    parser.add_argument("--workers", type=int, default=TICK_WORKERS, help="进程池大小，0 表示在本进程内计算")
+    parser.add_argument("--session", action="append", dest="session_ids", help="只推进指定会话（可重复）")
+    parser.add_argument("--ticks", type=int, default=1, help="连续推进的月数")
+    args = parser.parse_args()
+
+    for _ in range(args.ticks):
+        summary = world_tick.run(session_ids=args.session_ids, idle_minutes=args.idle_minutes,
+                                 limit=args.limit, workers=args.workers)
+        timings = ", ".join(f"{name}={ms}ms" for name, ms in summary["timings"].items())
+        print(f"推进 {summary['advanced']}/{summary['sessions']} 个会话，冲突 {summary['conflicts']}，"
+              f"失败 {summary['failed']}，{summary['seconds']}s，{summary['sessions_per_second']} 会话/秒（{timings}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+检查热点查询的执行计划
+对 core/database/migrations.py 中登记的 HOT_QUERIES 执行 EXPLAIN QUERY PLAN，
+如有查询退化为全表扫描或临时排序则以非零状态退出（可用于 CI）。
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.database.database import FinAIDatabase
+from core.database.migrations import HOT_QUERIES, find_table_scans
+
+# 使用全新的临时库，验证迁移本身产生的索引
+tmp_dir = tempfile.mkdtemp(prefix="echopolis_plan_")
+test_db = FinAIDatabase(os.path.join(tmp_dir, "plan_check.db"))
+
+with test_db.connect() as conn:
+    offenders = find_table_scans(conn)
+
+print(f"\n检查热点查询: {len(HOT_QUERIES)} 条")
+if offenders:
+    for item in offenders:
+        print(f"\n❌ {item['sql']}")
+        for step in item['plan']:
+            print(f"   {step}")
+    sys.exit(1)
+
+print("✅ 所有热点查询均命中索引")
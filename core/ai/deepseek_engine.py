@@ -2,10 +2,13 @@
 """
 DeepSeek AI引擎 - FinAI AI决策模块
 """
-import requests
 import json
-from typing import Dict, List, Optional
+import hashlib
+from typing import AsyncIterator, Dict, List, Optional
 from ..systems.market_sentiment_system import market_sentiment_system
+from .llm_transport import get_transport, LLMTransportError
+from .response_cache import llm_cache, fingerprint, personalize, depersonalize
+from .single_flight import llm_single_flight
 
 class DeepSeekEngine:
     def __init__(self, api_key: str = None):
@@ -22,6 +25,9 @@ class DeepSeekEngine:
             print(f"[INFO] DeepSeek Engine initialized. Key: {self.api_key[:5]}...")
         else:
             print("[WARN] DeepSeek Engine initialized WITHOUT API Key.")
+        
+        # 同一接口地址的引擎实例共用连接池
+        self.transport = get_transport(self.base_url)
 
     def _load_config(self):
         """从环境变量或配置文件加载配置"""
@@ -63,32 +69,138 @@ class DeepSeekEngine:
                 base_url = base_url + "/chat/completions"
                 
         self.base_url = base_url
+        self.transport = get_transport(self.base_url)
         print(f"[INFO] DeepSeek Base URL: {self.base_url}")
     
+    def _build_payload(self, messages: List[Dict], **params) -> Dict:
+        """构建 chat/completions 请求体"""
+        payload = {"model": "deepseek-chat", "messages": messages}
+        payload.update(params)
+        return payload
+    
+    def complete(self, messages: List[Dict], timeout: float = 30, cache_namespace: str = None,
+                 persona_name: str = None, coalesce: bool = True, **params) -> str:
+        """同步调用（供线程中的既有调用方使用），返回回复文本
+        
+        指定 cache_namespace 时按规范化提示词指纹走响应缓存；persona_name 为角色名，
+        缓存时替换为占位符，命中后还原为当前角色名。
+        coalesce 为 True 时，并发的相同请求只向上游发起一次并共享结果。
+        """
+        if not self.api_key:
+            raise LLMTransportError("DeepSeek API key is missing")
+        cache_key = fingerprint(cache_namespace, messages, params, persona_name) if cache_namespace else None
+        if cache_key:
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                return personalize(cached, persona_name)
+        payload = self._build_payload(messages, **params)
+        if coalesce:
+            content = llm_single_flight.do(cache_key or self._payload_key(payload),
+                                           self._fetch, payload, timeout, cache_key, persona_name)
+        else:
+            content = self._fetch(payload, timeout, cache_key, persona_name)
+        return personalize(content, persona_name)
+    
+    async def complete_async(self, messages: List[Dict], timeout: float = 30, cache_namespace: str = None,
+                             persona_name: str = None, coalesce: bool = True, **params) -> str:
+        """异步调用，不阻塞事件循环，返回回复文本（缓存与合并参数同 complete）"""
+        if not self.api_key:
+            raise LLMTransportError("DeepSeek API key is missing")
+        cache_key = fingerprint(cache_namespace, messages, params, persona_name) if cache_namespace else None
+        if cache_key:
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                return personalize(cached, persona_name)
+        payload = self._build_payload(messages, **params)
+        if coalesce:
+            content = await llm_single_flight.do_async(cache_key or self._payload_key(payload),
+                                                       self._fetch_async, payload, timeout, cache_key, persona_name)
+        else:
+            content = await self._fetch_async(payload, timeout, cache_key, persona_name)
+        return personalize(content, persona_name)
+    
+    def _fetch(self, payload: Dict, timeout: float, cache_key: Optional[str], persona_name: Optional[str]) -> str:
+        """请求上游，返回去掉角色名的回复文本并写入缓存（合并请求的各方各自还原角色名）"""
+        result = self.transport.post_json(self.headers, payload, timeout=timeout)
+        content = depersonalize(result["choices"][0]["message"]["content"], persona_name)
+        if cache_key:
+            llm_cache.set(cache_key, content)
+        return content
+    
+    async def _fetch_async(self, payload: Dict, timeout: float, cache_key: Optional[str],
+                           persona_name: Optional[str]) -> str:
+        """_fetch 的异步版本"""
+        result = await self.transport.post_json_async(self.headers, payload, timeout=timeout)
+        content = depersonalize(result["choices"][0]["message"]["content"], persona_name)
+        if cache_key:
+            llm_cache.set(cache_key, content)
+        return content
+    
+    def _payload_key(self, payload: Dict) -> str:
+        """未走缓存的请求按完整请求体合并"""
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return f"{self.base_url}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+    
+    def _call_api(self, prompt: str) -> str:
+        """单轮提示词调用（事件池筛选与事件转化使用）"""
+        return self.complete(
+            [{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=500
+        )
+    
+    async def complete_stream(self, messages: List[Dict], timeout: float = 60, cache_namespace: str = None,
+                              persona_name: str = None, **params) -> AsyncIterator[str]:
+        """流式调用，逐段产出回复文本（缓存参数同 complete；命中缓存时一次性产出完整文本）"""
+        if not self.api_key:
+            raise LLMTransportError("DeepSeek API key is missing")
+        cache_key = fingerprint(cache_namespace, messages, params, persona_name) if cache_namespace else None
+        if cache_key:
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                yield personalize(cached, persona_name)
+                return
+        
+        parts = []
+        payload = self._build_payload(messages, stream=True, **params)
+        async for chunk in self.transport.stream_json_async(self.headers, payload, timeout=timeout):
+            choice = (chunk.get("choices") or [{}])[0]
+            # 流式分片在 delta 中；未安装 httpx 时退化为完整结果，文本在 message 中
+            text = (choice.get("delta") or choice.get("message") or {}).get("content")
+            if text:
+                parts.append(text)
+                yield text
+        
+        # 只缓存完整生成的结果（客户端中途断开时不会执行到这里）
+        if cache_key:
+            llm_cache.set(cache_key, depersonalize("".join(parts), persona_name))
+    
     def make_decision(self, context: Dict) -> Dict:
         """强制使用DeepSeek AI做决策"""
         if not self.api_key:
             raise Exception("DeepSeek API key is required for decision making")
         
         prompt = self._build_decision_prompt(context)
-        
-        response = requests.post(
-            self.base_url,
-            headers=self.headers,
-            json={
-                "model": "deepseek-chat",
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.7,
-                "max_tokens": 250
-            },
-            timeout=30
+        ai_response = self.complete(
+            [{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=250
         )
+        parsed_result = self._parse_ai_response(ai_response, context["options"])
+        print(f"[DEBUG] Parsed AI decision result: {parsed_result}")
+        return parsed_result
+    
+    async def make_decision_async(self, context: Dict) -> Dict:
+        """make_decision 的异步版本（供 async 路由直接 await）"""
+        if not self.api_key:
+            raise Exception("DeepSeek API key is required for decision making")
         
-        if response.status_code != 200:
-            raise Exception(f"DeepSeek API error: {response.status_code} - {response.text}")
-        
-        result = response.json()
-        ai_response = result["choices"][0]["message"]["content"]
+        prompt = self._build_decision_prompt(context)
+        ai_response = await self.complete_async(
+            [{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=250
+        )
         parsed_result = self._parse_ai_response(ai_response, context["options"])
         print(f"[DEBUG] Parsed AI decision result: {parsed_result}")
         return parsed_result
@@ -238,82 +350,59 @@ class DeepSeekEngine:
                 "raw_response": response
             }
     
-    async def generate_response_async(self, prompt: str) -> Optional[str]:
+    async def generate_response_async(self, prompt: str, cache_namespace: str = None) -> Optional[str]:
         """异步生成AI响应（用于行为洞察等功能）"""
         if not self.api_key:
             print("[WARN] generate_response_async: API Key missing")
             return None
         
         try:
-            response = requests.post(
-                self.base_url,
-                headers=self.headers,
-                json={
-                    "model": "deepseek-chat",
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.7,
-                    "max_tokens": 1000
-                },
-                timeout=30
+            return await self.complete_async(
+                [{"role": "user", "content": prompt}],
+                cache_namespace=cache_namespace,
+                temperature=0.7,
+                max_tokens=1000
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-                return content
-            else:
-                print(f"[ERROR] generate_response_async failed: {response.status_code} - {response.text}")
-                return None
-                
+        except LLMTransportError as e:
+            print(f"[ERROR] generate_response_async failed: {e}")
+            return None
         except Exception as e:
             print(f"[ERROR] generate_response_async exception: {e}")
             return None
     
-    def generate_situation(self, context: Dict):
-        """使用DeepSeek AI生成情况"""
+    async def generate_response_stream(self, prompt: str, cache_namespace: str = None) -> AsyncIterator[str]:
+        """generate_response_async 的流式版本，逐段产出回复文本"""
+        async for text in self.complete_stream(
+            [{"role": "user", "content": prompt}],
+            cache_namespace=cache_namespace,
+            temperature=0.7,
+            max_tokens=1000
+        ):
+            yield text
+    
+    def generate_situation(self, context: Dict, use_cache: bool = True):
+        """使用DeepSeek AI生成情况（情况池补充时关闭缓存与请求合并，避免生成重复的情况）"""
         if not self.api_key:
             raise Exception("DeepSeek API key is required for situation generation")
         
         prompt = self._build_situation_prompt(context)
         
-        # 添加重试机制处理网络不稳定
-        max_retries = 3
-        last_error = None
-        
-        for attempt in range(max_retries):
-            try:
-                # 使用更高的 temperature 增加多样性
-                response = requests.post(
-                    self.base_url,
-                    headers=self.headers,
-                    json={
-                        "model": "deepseek-chat",
-                        "messages": [{"role": "user", "content": prompt}],
-                        "temperature": 0.95,  # 提高多样性
-                        "max_tokens": 500,
-                        "presence_penalty": 0.6,  # 减少重复
-                        "frequency_penalty": 0.5   # 鼓励新内容
-                    },
-                    timeout=45  # 增加超时时间
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    ai_response = result["choices"][0]["message"]["content"]
-                    return self._parse_situation_response(ai_response)
-                else:
-                    raise Exception(f"DeepSeek situation API error: {response.status_code} - {response.text}")
-                    
-            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
-                last_error = e
-                print(f"[WARN] AI situation generation attempt {attempt + 1}/{max_retries} failed: {e}")
-                if attempt < max_retries - 1:
-                    import time
-                    time.sleep(2)  # 等待2秒后重试
-                continue
-        
-        # 所有重试都失败
-        raise Exception(f"AI situation generation failed after {max_retries} attempts: {last_error}")
+        # 网络抖动由传输层的抖动退避重试处理
+        try:
+            ai_response = self.complete(
+                [{"role": "user", "content": prompt}],
+                timeout=45,  # 增加超时时间
+                cache_namespace="situation" if use_cache else None,
+                coalesce=use_cache,
+                persona_name=context.get("name"),
+                temperature=0.95,  # 提高多样性
+                max_tokens=500,
+                presence_penalty=0.6,  # 减少重复
+                frequency_penalty=0.5   # 鼓励新内容
+            )
+        except LLMTransportError as e:
+            raise Exception(f"AI situation generation failed: {e}")
+        return self._parse_situation_response(ai_response)
     
     def _build_situation_prompt(self, context: Dict) -> str:
         """构建情况生成提示词"""
@@ -359,7 +448,11 @@ class DeepSeekEngine:
             salary = career_info.get("salary", 0)
             months_employed = career_info.get("months_employed", 0)
             company_str = f"在{company}" if company else ""
-            career_desc = f"目前{company_str}担任{job_title}，月薪{salary:,}CP，已工作{months_employed}个月"
+            career_desc = f"目前{company_str}担任{job_title}"
+            if salary:
+                career_desc += f"，月薪{salary:,}CP"
+            if months_employed:
+                career_desc += f"，已工作{months_employed}个月"
         else:
             job_history_count = career_info.get("job_history_count", 0)
             if job_history_count > 0:
@@ -658,6 +751,40 @@ class DeepSeekEngine:
                 "monologue": "连接断开"
             }
         
+        messages = self._build_chat_messages(message, context)
+
+        try:
+            content = await self.complete_async(
+                messages,
+                temperature=0.7,
+                max_tokens=200
+            )
+            return {
+                "response": content,
+                "reflection": "数据流分析完成",
+                "monologue": "记录人类交互样本"
+            }
+        except LLMTransportError as e:
+            print(f"[WARN] Chat API unavailable: {e}")
+            return {"response": "通讯干扰...", "reflection": "连接不稳定", "monologue": "重试中"}
+        except Exception as e:
+            print(f"[ERROR] Chat API failed: {e}")
+            return {"response": "系统错误", "reflection": "核心异常", "monologue": "需要维护"}
+
+    async def chat_stream(self, message: str, session_id: str = None, context: Dict = None) -> AsyncIterator[str]:
+        """流式聊天接口，逐段产出回复文本（调用方停止迭代时上游请求随之取消）"""
+        if not self.api_key:
+            raise LLMTransportError("DeepSeek API key is missing")
+        
+        async for text in self.complete_stream(
+            self._build_chat_messages(message, context),
+            temperature=0.7,
+            max_tokens=200
+        ):
+            yield text
+
+    def _build_chat_messages(self, message: str, context: Dict = None) -> List[Dict]:
+        """构建聊天消息（系统提示词 + 实时数据 + 用户输入）"""
         system_prompt = """身份设定：你是指挥未来城市'FinAI'经济系统的中央AI核心。
 背景：这是一个为南京大学学生设计的金融素养提升模拟沙盘游戏。用户是正在学习金融知识的大学生，通过这个游戏来培养理财意识和投资能力。
 核心指令：
@@ -691,36 +818,10 @@ class DeepSeekEngine:
                 system_prompt += "\n\n=== 实时数据流 ===\n" + "\n".join(info_parts)
                 system_prompt += "\n\n指令：基于上述数据流，对用户的输入进行战术分析与回应。"
 
-        try:
-            response = requests.post(
-                self.base_url,
-                headers=self.headers,
-                json={
-                    "model": "deepseek-chat",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": message}
-                    ],
-                    "temperature": 0.7,
-                    "max_tokens": 200
-                },
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                content = result["choices"][0]["message"]["content"]
-                return {
-                    "response": content,
-                    "reflection": "数据流分析完成",
-                    "monologue": "记录人类交互样本"
-                }
-            else:
-                return {"response": "通讯干扰...", "reflection": "连接不稳定", "monologue": "重试中"}
-                
-        except Exception as e:
-            print(f"[ERROR] Chat API failed: {e}")
-            return {"response": "系统错误", "reflection": "核心异常", "monologue": "需要维护"}
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": message}
+        ]
 
     def generate_district_event(self, context: Dict) -> Dict:
         """生成区域事件"""
@@ -742,42 +843,32 @@ class DeepSeekEngine:
 选项3：[选项内容]"""
 
         try:
-            response = requests.post(
-                self.base_url,
-                headers=self.headers,
-                json={
-                    "model": "deepseek-chat",
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.8,
-                    "max_tokens": 200
-                },
-                timeout=30
+            content = self.complete(
+                [{"role": "user", "content": prompt}],
+                cache_namespace="district_event",
+                temperature=0.8,
+                max_tokens=200
             )
             
-            if response.status_code == 200:
-                result = response.json()
-                content = result["choices"][0]["message"]["content"]
-                
-                # 解析返回
-                lines = content.strip().split('\n')
-                event_desc = "区域数据波动异常..."
-                options = []
-                
-                for line in lines:
-                    if line.startswith("事件："):
-                        event_desc = line.replace("事件：", "").strip()
-                    elif line.startswith("选项") and "：" in line:
-                        options.append(line.split("：", 1)[1].strip())
+            # 解析返回
+            lines = content.strip().split('\n')
+            event_desc = "区域数据波动异常..."
+            options = []
+            
+            for line in lines:
+                if line.startswith("事件："):
+                    event_desc = line.replace("事件：", "").strip()
+                elif line.startswith("选项") and "：" in line:
+                    options.append(line.split("：", 1)[1].strip())
+            
+            # 补全选项
+            while len(options) < 3:
+                options.append("静观其变")
                 
-                # 补全选项
-                while len(options) < 3:
-                    options.append("静观其变")
-                    
-                return {
-                    "description": event_desc,
-                    "options": options[:3]
-                }
-            return None
+            return {
+                "description": event_desc,
+                "options": options[:3]
+            }
         except Exception as e:
             print(f"[ERROR] District event generation failed: {e}")
             return None
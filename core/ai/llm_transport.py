@@ -0,0 +1,293 @@
+"""
+LLM HTTP 传输层 - 共享连接池、并发限制、超时与抖动退避重试
+同一个接口地址的所有 DeepSeekEngine 实例共用一个传输对象：
+- 同步调用：requests.Session 长连接池
+- 异步调用：httpx.AsyncClient 长连接池，每个事件循环一个客户端（未安装 httpx 时放到线程中执行同步调用）；
+  事件循环结束前（API 的 shutdown 事件）由 aclose_transports() 关闭本循环上的客户端
+- 同步与异步调用共用一个线程信号量，整个进程同时进行的请求不超过 max_concurrency
+  （异步调用以非阻塞方式获取，取不到时 asyncio.sleep 退避重试，不阻塞事件循环）
+"""
+import os
+import json
+import random
+import time
+import asyncio
+import threading
+import contextlib
+from typing import AsyncIterator, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 尝试导入 httpx（异步客户端）
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+    print("[LLMTransport] httpx not installed, async calls fall back to a worker thread. Run: pip install httpx")
+
+
+# 传输配置
+MAX_CONCURRENCY = int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", "8"))
+DEFAULT_TIMEOUT = 30.0      # 读超时（秒）
+CONNECT_TIMEOUT = 5.0       # 建连超时（秒）
+MAX_RETRIES = 3             # 总尝试次数
+BACKOFF_BASE = 0.5          # 退避基数（秒）
+BACKOFF_MAX = 8.0           # 单次退避上限（秒）
+RETRY_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+SLOT_POLL = 0.005           # 异步调用等待并发名额的初始轮询间隔（秒）
+SLOT_POLL_MAX = 0.05        # 轮询间隔上限（秒）
+
+
+class LLMTransportError(Exception):
+    """LLM 请求失败（已用尽重试或遇到不可重试的状态码）"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LLMTransport:
+    """面向单个接口地址的 HTTP 传输"""
+
+    def __init__(self, url: str, max_concurrency: int = MAX_CONCURRENCY,
+                 timeout: float = DEFAULT_TIMEOUT, max_retries: int = MAX_RETRIES):
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        # 同步通道
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        # 同步与异步调用共用的并发名额
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        # 异步通道：事件循环 -> 该循环上的客户端
+        self._async_clients: Dict[asyncio.AbstractEventLoop, "httpx.AsyncClient"] = {}
+        self._clients_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "failures": 0, "in_flight": 0}
+
+    # ============ 公共接口 ============
+
+    def post_json(self, headers: Dict, payload: Dict, timeout: float = None) -> Dict:
+        """同步 POST，返回解析后的 JSON"""
+        timeout = timeout or self.timeout
+        last_error = None
+        for attempt in range(self.max_retries):
+            with self._slots:
+                self._track("in_flight", 1)
+                try:
+                    response = self._session.post(
+                        self.url, headers=headers, json=payload,
+                        timeout=(CONNECT_TIMEOUT, timeout)
+                    )
+                    status, retry_after = response.status_code, response.headers.get("Retry-After")
+                    if status == 200:
+                        self._track("requests", 1)
+                        return response.json()
+                    last_error = LLMTransportError(f"HTTP {status}: {response.text[:200]}", status)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    status, retry_after = None, None
+                    last_error = LLMTransportError(f"{type(e).__name__}: {e}")
+                finally:
+                    self._track("in_flight", -1)
+
+            if not self._should_retry(status, attempt):
+                break
+            delay = self._backoff(attempt, retry_after)
+            print(f"[LLMTransport] 第 {attempt + 1}/{self.max_retries} 次请求失败，{delay:.2f}s 后重试: {last_error}")
+            time.sleep(delay)
+
+        self._track("failures", 1)
+        raise last_error
+
+    async def post_json_async(self, headers: Dict, payload: Dict, timeout: float = None) -> Dict:
+        """异步 POST，不阻塞事件循环"""
+        if not HAS_HTTPX:
+            return await asyncio.to_thread(self.post_json, headers, payload, timeout)
+
+        timeout = timeout or self.timeout
+        client = self._get_async_client()
+        last_error = None
+        for attempt in range(self.max_retries):
+            async with self._async_slot():
+                self._track("in_flight", 1)
+                try:
+                    response = await client.post(
+                        self.url, headers=headers, json=payload,
+                        timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT)
+                    )
+                    status, retry_after = response.status_code, response.headers.get("Retry-After")
+                    if status == 200:
+                        self._track("requests", 1)
+                        return response.json()
+                    last_error = LLMTransportError(f"HTTP {status}: {response.text[:200]}", status)
+                except (httpx.TransportError, httpx.TimeoutException) as e:
+                    status, retry_after = None, None
+                    last_error = LLMTransportError(f"{type(e).__name__}: {e}")
+                finally:
+                    self._track("in_flight", -1)
+
+            if not self._should_retry(status, attempt):
+                break
+            delay = self._backoff(attempt, retry_after)
+            print(f"[LLMTransport] 第 {attempt + 1}/{self.max_retries} 次异步请求失败，{delay:.2f}s 后重试: {last_error}")
+            await asyncio.sleep(delay)
+
+        self._track("failures", 1)
+        raise last_error
+
+    async def stream_json_async(self, headers: Dict, payload: Dict, timeout: float = None) -> AsyncIterator[Dict]:
+        """
+        异步流式 POST（服务端以 SSE 返回），逐个产出 data 行解析后的 JSON。
+        只在收到首个字节之前重试；调用方停止迭代（如客户端断开）时关闭上游连接，上游随之停止生成。
+        """
+        if not HAS_HTTPX:
+            # 没有 httpx 时退化为一次性返回完整结果
+            yield await self.post_json_async(headers, dict(payload, stream=False), timeout)
+            return
+
+        timeout = timeout or self.timeout
+        client = self._get_async_client()
+        last_error = None
+        streamed = False
+        for attempt in range(self.max_retries):
+            async with self._async_slot():
+                self._track("in_flight", 1)
+                try:
+                    async with client.stream(
+                        "POST", self.url, headers=headers, json=payload,
+                        timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT)
+                    ) as response:
+                        status, retry_after = response.status_code, response.headers.get("Retry-After")
+                        if status == 200:
+                            self._track("requests", 1)
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    return
+                                try:
+                                    chunk = json.loads(data)
+                                except ValueError:
+                                    continue
+                                streamed = True
+                                yield chunk
+                            return
+                        body = await response.aread()
+                        last_error = LLMTransportError(f"HTTP {status}: {body[:200].decode('utf-8', 'replace')}", status)
+                except (httpx.TransportError, httpx.TimeoutException) as e:
+                    status, retry_after = None, None
+                    last_error = LLMTransportError(f"{type(e).__name__}: {e}")
+                    # 已经向调用方输出过内容，重试会导致重复输出
+                    if streamed:
+                        self._track("failures", 1)
+                        raise last_error
+                finally:
+                    self._track("in_flight", -1)
+
+            if not self._should_retry(status, attempt):
+                break
+            delay = self._backoff(attempt, retry_after)
+            print(f"[LLMTransport] 第 {attempt + 1}/{self.max_retries} 次流式请求失败，{delay:.2f}s 后重试: {last_error}")
+            await asyncio.sleep(delay)
+
+        self._track("failures", 1)
+        raise last_error
+
+    async def aclose(self):
+        """关闭当前事件循环上的异步客户端（在事件循环结束前调用）"""
+        with self._clients_lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def get_stats(self) -> Dict:
+        """请求统计"""
+        with self._clients_lock:
+            async_clients = len(self._async_clients)
+        with self._stats_lock:
+            return dict(self._stats, url=self.url, max_concurrency=self.max_concurrency, async_clients=async_clients)
+
+    # ============ 内部方法 ============
+
+    def _get_async_client(self) -> "httpx.AsyncClient":
+        """在当前事件循环上获取（或创建）异步客户端"""
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                # 已关闭的事件循环上的客户端无法再 aclose，移除引用，连接随客户端回收时关闭
+                for closed in [other for other in self._async_clients if other.is_closed()]:
+                    print("[LLMTransport] 事件循环结束前未关闭异步客户端（应调用 aclose_transports）")
+                    del self._async_clients[closed]
+                client = self._async_clients[loop] = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_concurrency,
+                        max_keepalive_connections=self.max_concurrency
+                    )
+                )
+            return client
+
+    @contextlib.asynccontextmanager
+    async def _async_slot(self):
+        """非阻塞地获取进程级并发名额，取不到时退避等待"""
+        delay = SLOT_POLL
+        while not self._slots.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, SLOT_POLL_MAX)
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def _should_retry(self, status: Optional[int], attempt: int) -> bool:
+        if attempt >= self.max_retries - 1:
+            return False
+        # status 为 None 表示网络错误或超时
+        if status is not None and status not in RETRY_STATUS:
+            return False
+        self._track("retries", 1)
+        return True
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+        """全抖动指数退避；服务端给出 Retry-After 时优先遵守"""
+        if retry_after:
+            try:
+                return min(BACKOFF_MAX, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+    def _track(self, key: str, delta: int):
+        with self._stats_lock:
+            self._stats[key] += delta
+
+
+_transports: Dict[str, LLMTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(url: str) -> LLMTransport:
+    """按接口地址获取共享传输对象"""
+    with _transports_lock:
+        transport = _transports.get(url)
+        if transport is None:
+            transport = _transports[url] = LLMTransport(url)
+        return transport
+
+
+async def aclose_transports():
+    """关闭所有传输对象在当前事件循环上的异步客户端（API 的 shutdown 事件中调用）"""
+    with _transports_lock:
+        transports = list(_transports.values())
+    for transport in transports:
+        await transport.aclose()
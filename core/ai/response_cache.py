@@ -0,0 +1,218 @@
+"""
+LLM 响应缓存 - 按规范化的提示词指纹缓存生成结果
+情况生成、区域事件、行为洞察等提示词大多只在数值上略有差异（同样的 MBTI、命运背景、
+相近的现金区间），这里把提示词中的数字分桶后再计算指纹，让相近的请求命中同一条缓存。
+- 内存层：LRU + TTL
+- 持久层（可选）：SQLite，设置 LLM_CACHE_DB 后启用，重启后仍可命中
+"""
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# 缓存配置
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(6 * 3600)))  # 秒
+CACHE_DB = os.getenv("LLM_CACHE_DB", "")                       # 为空表示不启用持久层
+BUCKETS_PER_DECADE = 8      # 数值按对数分桶：每 10 倍划分 8 档（相邻档相差约 33%）
+PRUNE_EVERY = 200           # 持久层每写入多少次清理一次过期数据
+NAME_PLACEHOLDER = "{{name}}"
+
+_NUMBER_RE = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+
+
+def _bucket_number(match) -> str:
+    """把提示词中的数字替换为所在分桶的标记"""
+    text = match.group(0)
+    try:
+        value = float(text.replace(",", ""))
+    except ValueError:
+        return text
+    magnitude = abs(value)
+    # 小数值（月份、评分、0-1 指数等）保留原值，只对小数取一位
+    if magnitude < 10:
+        return f"{value:.1f}" if "." in text else str(int(value))
+    sign = "-" if value < 0 else ""
+    return f"<{sign}b{round(math.log10(magnitude) * BUCKETS_PER_DECADE)}>"
+
+
+def normalize_prompt(text: str) -> str:
+    """规范化提示词：数字分桶、压缩空白"""
+    text = _NUMBER_RE.sub(_bucket_number, text)
+    return " ".join(text.split())
+
+
+def depersonalize(text: str, name: Optional[str]) -> str:
+    """把角色名替换为占位符，使不同角色可以共享同一条缓存"""
+    # 单字名字容易误伤正文，不做替换
+    if not text or not name or len(name) < 2:
+        return text
+    return text.replace(name, NAME_PLACEHOLDER)
+
+
+def personalize(text: str, name: Optional[str]) -> str:
+    """把占位符还原为当前角色名"""
+    if not text or not name:
+        return text
+    return text.replace(NAME_PLACEHOLDER, name)
+
+
+def fingerprint(namespace: str, messages: List[Dict], params: Dict = None,
+                persona_name: str = None) -> str:
+    """计算缓存键：命名空间 + 规范化后的消息 + 采样参数"""
+    normalized = [
+        {"role": m.get("role"), "content": normalize_prompt(depersonalize(m.get("content", ""), persona_name))}
+        for m in messages
+    ]
+    raw = json.dumps({"messages": normalized, "params": params or {}}, ensure_ascii=False, sort_keys=True)
+    return f"{namespace}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+
+class LLMResponseCache:
+    """带 TTL 的 LRU 缓存，可选 SQLite 持久层"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL,
+                 db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {"hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        if self.db_path:
+            self._init_persistent()
+
+    # ============ 公共接口 ============
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中或已过期返回 None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._entries[key]
+                self._stats["expired"] += 1
+
+        value = self._get_persistent(key, now)
+        with self._lock:
+            if value is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["persistent_hits"] += 1
+        # 持久层命中后提升到内存层
+        self._set_memory(key, value, now)
+        return value
+
+    def set(self, key: str, value: str):
+        """写入缓存"""
+        if not value:
+            return
+        now = time.time()
+        self._set_memory(key, value, now)
+        self._set_persistent(key, value, now)
+
+    def clear(self):
+        """清空内存层与持久层"""
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM llm_response_cache")
+
+    def get_stats(self) -> Dict:
+        """命中率等统计"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["persistent_hits"] + self._stats["misses"]
+            hits = self._stats["hits"] + self._stats["persistent_hits"]
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                max_entries=self.max_entries,
+                ttl=self.ttl,
+                hit_rate=round(hits / lookups, 4) if lookups else 0.0,
+                persistent=bool(self.db_path),
+            )
+
+    # ============ 内部方法 ============
+
+    def _set_memory(self, key: str, value: str, now: float):
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _connect(self):
+        from ..database.connection import get_connection
+        return get_connection(self.db_path)
+
+    def _init_persistent(self):
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS llm_response_cache (
+                        cache_key TEXT PRIMARY KEY,
+                        response TEXT NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                ''')
+        except Exception as e:
+            print(f"[LLMCache] 持久层初始化失败，仅使用内存缓存: {e}")
+            self.db_path = None
+
+    def _get_persistent(self, key: str, now: float) -> Optional[str]:
+        if not self.db_path:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT response FROM llm_response_cache WHERE cache_key = ? AND expires_at > ?",
+                    (key, now)
+                ).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            print(f"[LLMCache] 持久层读取失败: {e}")
+            return None
+
+    def _set_persistent(self, key: str, value: str, now: float):
+        if not self.db_path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_response_cache (cache_key, response, expires_at) VALUES (?, ?, ?)",
+                    (key, value, now + self.ttl)
+                )
+                with self._lock:
+                    self._writes += 1
+                    prune = self._writes % PRUNE_EVERY == 0
+                if prune:
+                    conn.execute("DELETE FROM llm_response_cache WHERE expires_at <= ?", (now,))
+        except Exception as e:
+            print(f"[LLMCache] 持久层写入失败: {e}")
+
+
+def _resolve_db_path(path: str) -> Optional[str]:
+    """相对路径按项目根目录解析"""
+    if not path:
+        return None
+    if os.path.isabs(path):
+        return path
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    return os.path.join(project_root, path)
+
+
+# 全局缓存实例
+llm_cache = LLMResponseCache(db_path=_resolve_db_path(CACHE_DB))
@@ -0,0 +1,95 @@
+"""
+LLM 请求合并（single-flight）- 并发的相同请求只向上游发起一次
+同一批玩家同时开局时，事件筛选、事件转化、情况生成会并发发出完全相同的提示词。
+第一个请求成为 leader 真正调用上游，其余请求等待并共享 leader 的结果（或异常）。
+- 同步调用：线程间通过 Event 等待
+- 异步调用：上游调用放在独立任务中，等待方通过 shield 共享；任何一个等待方被取消都不会影响其他人
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Call:
+    """一次进行中的同步调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """按键合并并发调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[tuple, asyncio.Task] = {}
+        self._stats = {"upstream_calls": 0, "deduplicated": 0}
+
+    def do(self, key: str, func: Callable, *args, **kwargs) -> Any:
+        """同步调用：相同 key 的并发调用共享一次 func 的结果"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["upstream_calls"] += 1
+            else:
+                self._stats["deduplicated"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def do_async(self, key: str, func: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """异步调用：相同 key 的并发调用共享一次 func 协程的结果"""
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = loop.create_task(func(*args, **kwargs))
+                self._tasks[task_key] = task
+                self._stats["upstream_calls"] += 1
+                task.add_done_callback(lambda t, k=task_key: self._forget(k, t))
+            else:
+                self._stats["deduplicated"] += 1
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> Dict:
+        """合并统计：上游调用次数、被合并的调用次数"""
+        with self._lock:
+            upstream, deduplicated = self._stats["upstream_calls"], self._stats["deduplicated"]
+            total = upstream + deduplicated
+            return {
+                "upstream_calls": upstream,
+                "deduplicated": deduplicated,
+                "in_flight": len(self._calls) + len(self._tasks),
+                "dedup_ratio": round(deduplicated / total, 4) if total else 0.0,
+            }
+
+    def _forget(self, task_key: tuple, task: asyncio.Task):
+        with self._lock:
+            self._tasks.pop(task_key, None)
+        # 所有等待方都已取消时，避免 "Task exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+
+# 全局实例
+llm_single_flight = SingleFlight()
@@ -0,0 +1,216 @@
+"""
+情况预生成池 - 按角色原型预先生成决策情况
+原型 = MBTI × 命运 × 财富档位 × 身份（在校学生 / 应届毕业生 / 职场人士）× 人生阶段 × 是否在职，
+即情况生成提示词中会改变场景类型的字段。补充时只用原型本身构造角色上下文（archetype_context），
+不带请求者的职业细节、技能、标签、画像和属性，生成的情况可以分给同一原型的任何角色。
+请求到来时直接从队列取出已生成的情况，不再同步等待 LLM；
+队列低于水位线时由后台线程异步补充。队列为空时调用方使用预设情况兜底。
+"""
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from .response_cache import depersonalize, personalize
+
+# 池配置
+POOL_TARGET = int(os.getenv("SITUATION_POOL_SIZE", "4"))        # 每个原型的目标库存，0 表示禁用
+POOL_WORKERS = int(os.getenv("SITUATION_POOL_WORKERS", "2"))    # 后台补充线程数
+
+# 财富档位，与情况生成提示词中的金额建议区间一致
+WEALTH_BUCKETS = [
+    (5000, "micro"),
+    (15000, "small"),
+    (50000, "medium"),
+    (None, "large"),
+]
+
+MICRO_CASH = 1000  # 最低档位生成情况时使用的现金（其余档位取档位下限，金额对档位内所有角色都可承受）
+
+# 用户标签中的身份，按情况生成提示词中的优先级排列
+IDENTITY_TAGS = ("student", "new_graduate", "working")
+
+# 人生阶段对应的代表年龄
+LIFE_STAGE_AGES = {"startup": 22, "exploration": 26, "struggle": 35, "accumulation": 50, "retirement": 62}
+
+POOL_PERSONA = "林安"  # 生成时使用的角色名，入队前替换为占位符，取出时还原为请求者的名字
+
+# (MBTI, 命运, 财富档位, 身份, 人生阶段, 在职 employed / unemployed)
+Archetype = Tuple[str, str, str, str, str, str]
+
+
+def wealth_bucket(cash: float) -> str:
+    """现金对应的财富档位"""
+    for upper, label in WEALTH_BUCKETS:
+        if upper is None or cash < upper:
+            return label
+    return WEALTH_BUCKETS[-1][1]
+
+
+def bucket_cash(label: str) -> int:
+    """财富档位生成情况时使用的现金"""
+    lower = MICRO_CASH
+    for upper, bucket in WEALTH_BUCKETS:
+        if bucket == label:
+            return lower
+        lower = upper
+    return lower
+
+
+def identity(user_tags: Optional[str]) -> str:
+    """用户标签中的身份（与情况生成提示词的判断一致），没有时为 none"""
+    for tag in IDENTITY_TAGS:
+        if tag in (user_tags or ''):
+            return tag
+    return "none"
+
+
+def archetype_of(context: Dict, fate: str) -> Archetype:
+    """角色上下文（AIAvatar._build_situation_context）所属的原型"""
+    has_job = (context.get("career") or {}).get("has_job")
+    return (context["mbti"], fate, wealth_bucket(context["cash"]), identity(context.get("user_tags")),
+            context["life_stage"], "employed" if has_job else "unemployed")
+
+
+def archetype_context(archetype: Archetype) -> Dict:
+    """只由原型决定的情况生成上下文：其余属性取新角色的默认值，不含任何请求者的个人信息"""
+    mbti, fate, wealth, tag, life_stage, job = archetype
+    employed = job == "employed"
+    return {
+        "name": POOL_PERSONA,
+        "age": LIFE_STAGE_AGES.get(life_stage, 22),
+        "mbti": mbti,
+        "cash": bucket_cash(wealth),
+        "health": 100,
+        "happiness": 50,
+        "stress": 0,
+        "energy": 100,
+        "life_stage": life_stage,
+        "background": fate,
+        "traits": "",
+        "decision_count": 0,
+        "user_tags": "" if tag == "none" else tag,
+        "career": {
+            "has_job": employed,
+            "job_title": "员工" if employed else "无业",
+            "company": "",
+            "salary": 0,
+            "months_employed": 0,
+            "skills": [],
+            "job_history_count": 0,
+        },
+    }
+
+
+class _Bucket:
+    """单个原型的队列与统计"""
+
+    def __init__(self):
+        self.queue = deque()
+        self.refilling = 0
+        self.served = 0
+        self.empty = 0
+        self.generated = 0
+        self.failed = 0
+
+
+class SituationPool:
+    """按原型分桶的情况预生成池"""
+
+    def __init__(self, target: int = POOL_TARGET, workers: int = POOL_WORKERS):
+        self.target = target
+        self.low_watermark = max(1, target // 2)  # 低于该库存时触发补充
+        self._buckets: Dict[Archetype, _Bucket] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="situation-pool")
+
+    @property
+    def enabled(self) -> bool:
+        return self.target > 0
+
+    def take(self, archetype: Archetype, name: Optional[str], ai_engine) -> Optional[Dict]:
+        """
+        取出一个预生成情况（{"description", "choices"}，角色名还原为 name），队列为空时返回 None。
+        库存不足时安排后台补充。
+        """
+        with self._lock:
+            bucket = self._buckets.setdefault(archetype, _Bucket())
+            item = bucket.queue.popleft() if bucket.queue else None
+            if item:
+                bucket.served += 1
+            else:
+                bucket.empty += 1
+            missing = self._missing(bucket)
+            bucket.refilling += missing
+
+        for _ in range(missing):
+            self._executor.submit(self._refill_one, archetype, ai_engine)
+
+        if not item:
+            return None
+        return {
+            "description": personalize(item["description"], name),
+            "choices": [personalize(choice, name) for choice in item["choices"]],
+        }
+
+    def get_stats(self) -> Dict:
+        """每个原型的库存水位"""
+        with self._lock:
+            buckets = {
+                "|".join(archetype): {
+                    "depth": len(bucket.queue),
+                    "target": self.target,
+                    "fill": round(len(bucket.queue) / self.target, 2) if self.target else 0.0,
+                    "refilling": bucket.refilling,
+                    "served": bucket.served,
+                    "empty": bucket.empty,
+                    "generated": bucket.generated,
+                    "failed": bucket.failed,
+                }
+                for archetype, bucket in self._buckets.items()
+            }
+        return {
+            "enabled": self.enabled,
+            "target": self.target,
+            "low_watermark": self.low_watermark,
+            "served": sum(b["served"] for b in buckets.values()),
+            "empty": sum(b["empty"] for b in buckets.values()),
+            "buckets": buckets,
+        }
+
+    # ============ 内部方法 ============
+
+    def _missing(self, bucket: _Bucket) -> int:
+        """需要补充的数量（调用方持有锁）"""
+        stock = len(bucket.queue) + bucket.refilling
+        if len(bucket.queue) >= self.low_watermark or stock >= self.target:
+            return 0
+        return self.target - stock
+
+    def _refill_one(self, archetype: Archetype, ai_engine):
+        """后台线程：按原型的上下文生成一个情况入队"""
+        item = None
+        try:
+            # 不走响应缓存和请求合并：相同上下文只会得到重复的情况
+            result = ai_engine.generate_situation(archetype_context(archetype), use_cache=False)
+            if result:
+                item = {
+                    "description": depersonalize(result["description"], POOL_PERSONA),
+                    "choices": [depersonalize(choice, POOL_PERSONA) for choice in result["choices"]],
+                }
+        except Exception as e:
+            print(f"[SituationPool] {'|'.join(archetype)} 补充失败: {e}")
+
+        with self._lock:
+            bucket = self._buckets[archetype]
+            bucket.refilling -= 1
+            if item:
+                bucket.queue.append(item)
+                bucket.generated += 1
+            else:
+                bucket.failed += 1
+
+
+# 全局情况池实例
+situation_pool = SituationPool()
@@ -4,12 +4,13 @@ AI化身核心系统 - FinAI核心模块
 """
 import random
 import json
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple, get_type_hints
+from dataclasses import dataclass
 from enum import Enum
 
 from ..systems.mbti_traits import MBTIType, mbti_system
-from ..systems.fate_wheel import FateType, fate_wheel
+from ..systems.fate_wheel import FateOutcome, FateType, fate_wheel
+from ..systems.session_state import from_state, to_state
 from ..systems.asset_calculator import asset_calculator
 from ..systems.investment_system import investment_system
 # from ..ai.deepseek_engine import deepseek_engine  # 移除错误的全局导入
@@ -148,8 +149,16 @@ class AIAvatar:
     
     def generate_situation(self, ai_engine=None) -> Optional[DecisionContext]:
         """生成决策情况"""
-        # 使用传入的AI引擎生成情况
-        if ai_engine:
+        from ..ai.situation_pool import situation_pool
+        
+        # 优先从预生成池中取出情况，池为空时由后台线程补充
+        if ai_engine and situation_pool.enabled:
+            pooled_situation = self._take_pooled_situation(ai_engine, situation_pool)
+            if pooled_situation:
+                self.current_situation = pooled_situation
+                return self.current_situation
+        # 未启用情况池时同步调用AI引擎生成情况
+        elif ai_engine:
             ai_situation = self._generate_ai_situation(ai_engine)
             if ai_situation:
                 self.current_situation = ai_situation
@@ -161,12 +170,51 @@ class AIAvatar:
             self.current_situation = fallback_situation
         return self.current_situation
     
+    def _take_pooled_situation(self, ai_engine, pool) -> Optional[DecisionContext]:
+        """从情况池中取出与当前原型（MBTI × 命运 × 财富档位 × 身份 × 人生阶段 × 是否在职）匹配的情况"""
+        from ..ai.situation_pool import archetype_of
+        
+        if not hasattr(ai_engine, 'api_key') or not ai_engine.api_key:
+            return None
+        
+        context = self._build_situation_context()
+        archetype = archetype_of(context, self.attributes.fate_type.value.strip())
+        situation = pool.take(archetype, context["name"], ai_engine)
+        if not situation:
+            print(f"[DEBUG] 情况池 {'|'.join(archetype)} 暂无库存，使用预设情况")
+            return None
+        return DecisionContext(
+            situation=situation["description"],
+            options=situation["choices"],
+            context_type="ai_generated"
+        )
+    
     def _generate_ai_situation(self, ai_engine) -> Optional[DecisionContext]:
         """使用AI生成情况"""
         if not ai_engine or not hasattr(ai_engine, 'api_key') or not ai_engine.api_key:
             print(f"[WARN] AI引擎不可用，跳过AI情况生成")
             return None
         
+        context = self._build_situation_context()
+        
+        try:
+            print(f"[DEBUG] 调用AI情况生成，API Key可用: {ai_engine.api_key is not None}")
+            print(f"[DEBUG] 用户标签: {context.get('user_tags', '无')}, 自动标签: {context.get('auto_tags', '无')}")
+            ai_situation = ai_engine.generate_situation(context)
+            if ai_situation:
+                print(f"[DEBUG] AI生成情况成功")
+                return DecisionContext(
+                    situation=ai_situation["description"],
+                    options=ai_situation["choices"],
+                    context_type="ai_generated"
+                )
+        except Exception as e:
+            print(f"[ERROR] AI情况生成失败: {e}")
+        
+        return None
+    
+    def _build_situation_context(self) -> Dict:
+        """构建情况生成所需的角色上下文"""
         context = {
             "name": self.attributes.name,
             "age": self.attributes.age,
@@ -227,21 +275,7 @@ class AIAvatar:
                 "job_history_count": 0
             }
         
-        try:
-            print(f"[DEBUG] 调用AI情况生成，API Key可用: {ai_engine.api_key is not None}")
-            print(f"[DEBUG] 用户标签: {context.get('user_tags', '无')}, 自动标签: {context.get('auto_tags', '无')}")
-            ai_situation = ai_engine.generate_situation(context)
-            if ai_situation:
-                print(f"[DEBUG] AI生成情况成功")
-                return DecisionContext(
-                    situation=ai_situation["description"],
-                    options=ai_situation["choices"],
-                    context_type="ai_generated"
-                )
-        except Exception as e:
-            print(f"[ERROR] AI情况生成失败: {e}")
-        
-        return None
+        return context
     
     def set_user_tags(self, tags: str):
         """设置用户自选标签"""
@@ -884,10 +918,11 @@ class AIAvatar:
             self.attributes.life_stage = LifeStage.RETIREMENT
     
     def save_state(self) -> Dict:
-        """保存化身状态"""
+        """保存化身状态（可直接 JSON 序列化，枚举保存为值）"""
         return {
-            "attributes": asdict(self.attributes),
-            "fate_background": asdict(self.fate_background),
+            "session_id": self.session_id,
+            "attributes": to_state(self.attributes),
+            "fate_background": to_state(self.fate_background),
             "decision_history": self.decision_history
         }
     
@@ -934,18 +969,36 @@ class AIAvatar:
             del self.attributes.locked_investments[i]
     
     def load_state(self, state_data: Dict):
-        """加载化身状态"""
+        """加载化身状态（save_state 的结果，枚举字段按类型还原）"""
         if "attributes" in state_data:
             attr_data = state_data["attributes"]
+            hints = get_type_hints(AvatarAttributes)
             for key, value in attr_data.items():
                 if hasattr(self.attributes, key):
-                    setattr(self.attributes, key, value)
+                    setattr(self.attributes, key, from_state(hints.get(key), value))
             # 确保 locked_investments 是列表
             if not hasattr(self.attributes, 'locked_investments') or self.attributes.locked_investments is None:
                 self.attributes.locked_investments = []
         
         if "decision_history" in state_data:
             self.decision_history = state_data["decision_history"]
+        
+        if state_data.get("fate_background"):
+            self.fate_background = from_state(FateOutcome, state_data["fate_background"])
+    
+    @classmethod
+    def from_state(cls, state_data: Dict, session_id: str = None) -> "AIAvatar":
+        """由 save_state 的结果重建化身（不转命运轮盘）"""
+        attributes = state_data.get("attributes", {})
+        avatar = cls.__new__(cls)
+        avatar.attributes = AvatarAttributes(name=attributes.get("name", ""))
+        avatar.attributes.locked_investments = []
+        avatar.decision_history = []
+        avatar.current_situation = None
+        avatar.session_id = session_id or state_data.get("session_id")
+        avatar.fate_background = None
+        avatar.load_state(state_data)
+        return avatar
     
     def _generate_fallback_situation(self) -> Optional[DecisionContext]:
         """生成预设情况（当AI不可用时）"""
@@ -0,0 +1,127 @@
+"""
+SQLite 连接池 - 线程本地的可复用连接
+每个线程对每个数据库文件只持有一条长连接，打开时统一配置 WAL、同步级别、
+忙等待超时和预编译语句缓存，避免每次调用都重新建立连接。
+"""
+import sqlite3
+import threading
+from typing import Dict
+
+# 连接配置
+DEFAULT_TIMEOUT = 10.0          # 写锁等待秒数（同时作为 busy_timeout）
+STATEMENT_CACHE_SIZE = 256      # 每条连接缓存的预编译语句数量
+
+
+class PooledConnection(sqlite3.Connection):
+    """池化连接
+
+    兼容原有的 `with sqlite3.connect(...) as conn:` 写法：
+    - with 块退出时照常提交/回滚，但不关闭连接
+    - close() 只回滚未提交的事务，连接留在池中继续复用
+    - 同一线程内嵌套的 with 块（辅助函数在调用方的 with 块中再次 `with db.connect()`）共用这条连接：
+      只有最外层退出时提交 / 回滚；内层进入时外层已有事务则建立 SAVEPOINT，
+      内层正常退出时释放、抛出异常时只回滚到该 SAVEPOINT，不提交也不丢弃外层的修改
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._depth = 0        # with 块嵌套深度
+        self._savepoints = []  # 各层嵌套 with 块的 SAVEPOINT 名（进入时没有事务则为 None）
+
+    def __enter__(self):
+        self._depth += 1
+        if self._depth > 1:
+            name = None
+            if self.in_transaction:
+                name = f"pool_nested_{self._depth}"
+                self.execute(f"SAVEPOINT {name}")
+            self._savepoints.append(name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth = max(0, self._depth - 1)
+        if self._depth == 0:
+            return super().__exit__(exc_type, exc_value, traceback)
+        name = self._savepoints.pop() if self._savepoints else None
+        try:
+            if name is not None:
+                if exc_type is not None:
+                    self.execute(f"ROLLBACK TO {name}")
+                self.execute(f"RELEASE {name}")
+            elif exc_type is not None and self.in_transaction:
+                # 内层开始的事务：外层此前没有未提交的修改，回滚的只是内层的写入
+                self.rollback()
+        except sqlite3.OperationalError:
+            pass  # 内层自行 commit()/rollback() 后 SAVEPOINT 已不存在
+        return False
+
+    def close(self):
+        """归还连接：丢弃未提交的修改（与真正关闭连接的语义一致）"""
+        if self._depth == 0 and self.in_transaction:
+            self.rollback()
+
+    def _reset(self):
+        """复用前清理上一次调用遗留的状态"""
+        if self._depth == 0:
+            if self.in_transaction:
+                print("[DBPool] 回滚上次调用遗留的未提交事务")
+                self.rollback()
+            self.row_factory = None
+
+    def _really_close(self):
+        sqlite3.Connection.close(self)
+
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {"opened": 0, "reused": 0}
+
+
+def _configure(conn: PooledConnection, timeout: float):
+    """新连接只在打开时配置一次"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+def get_connection(db_path: str, timeout: float = DEFAULT_TIMEOUT) -> PooledConnection:
+    """获取当前线程对应 db_path 的连接（不存在则创建）"""
+    pool = getattr(_local, 'pool', None)
+    if pool is None:
+        pool = _local.pool = {}
+
+    conn = pool.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(
+            db_path,
+            timeout=timeout,
+            factory=PooledConnection,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        _configure(conn, timeout)
+        pool[db_path] = conn
+        with _stats_lock:
+            _stats["opened"] += 1
+    else:
+        conn._reset()
+        with _stats_lock:
+            _stats["reused"] += 1
+    return conn
+
+
+def close_thread_connections():
+    """关闭当前线程持有的所有连接"""
+    pool = getattr(_local, 'pool', None) or {}
+    for conn in pool.values():
+        try:
+            conn._really_close()
+        except sqlite3.ProgrammingError:
+            pass
+    pool.clear()
+
+
+def pool_stats() -> Dict:
+    """连接池统计"""
+    with _stats_lock:
+        return dict(_stats)
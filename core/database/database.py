@@ -3,8 +3,12 @@
 """
 import sqlite3
 import os
+from contextlib import contextmanager
 from typing import List, Dict, Optional
 
+from .connection import get_connection
+from .migrations import run_migrations, load_schema
+
 class FinAIDatabase:
     """FinAI数据库管理器"""
     
@@ -24,48 +28,31 @@ class FinAIDatabase:
             db_path = os.path.join(project_root, db_path)
         self.db_path = db_path
         print(f"Database path: {self.db_path}")
+        self.schema = {}
         self.init_database()
     
+    def has_column(self, table: str, column: str) -> bool:
+        """查询启动时缓存的库结构，不在请求路径上执行 PRAGMA"""
+        return column in self.schema.get(table, ())
+    
+    def connect(self) -> sqlite3.Connection:
+        """获取当前线程的池化连接（可直接用于 with 语句）"""
+        return get_connection(self.db_path)
+    
+    @contextmanager
+    def transaction(self, conn: Optional[sqlite3.Connection] = None):
+        """写入用的连接：传入 conn 时在调用方已开启的事务中执行（由调用方提交），否则取池化连接并在结束时提交"""
+        if conn is not None:
+            yield conn
+        else:
+            with self.connect() as own:
+                yield own
+    
     def init_database(self):
         """初始化数据库表"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             
-            # 检查并更新表结构
-            try:
-                cursor.execute("PRAGMA table_info(transactions)")
-                columns = [column[1] for column in cursor.fetchall()]
-                if 'ai_thoughts' not in columns:
-                    cursor.execute('ALTER TABLE transactions ADD COLUMN ai_thoughts TEXT')
-                    print("[INFO] 添加 ai_thoughts 列到 transactions 表")
-            except:
-                pass
-            
-            try:
-                cursor.execute("PRAGMA table_info(investments)")
-                columns = [column[1] for column in cursor.fetchall()]
-                if 'ai_thoughts' not in columns:
-                    cursor.execute('ALTER TABLE investments ADD COLUMN ai_thoughts TEXT')
-                    print("[INFO] 添加 ai_thoughts 列到 investments 表")
-            except:
-                pass
-            
-            # 检查 users 表是否有新属性
-            try:
-                cursor.execute("PRAGMA table_info(users)")
-                columns = [column[1] for column in cursor.fetchall()]
-                if 'happiness' not in columns:
-                    cursor.execute('ALTER TABLE users ADD COLUMN happiness INTEGER DEFAULT 70')
-                if 'energy' not in columns:
-                    cursor.execute('ALTER TABLE users ADD COLUMN energy INTEGER DEFAULT 75')
-                if 'health' not in columns:
-                    cursor.execute('ALTER TABLE users ADD COLUMN health INTEGER DEFAULT 80')
-                if 'tags' not in columns:
-                    cursor.execute('ALTER TABLE users ADD COLUMN tags TEXT DEFAULT ""')
-                    print("[INFO] 添加 tags 列到 users 表")
-            except:
-                pass
-            
             # 账户表
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS accounts (
@@ -492,19 +479,6 @@ class FinAIDatabase:
                 )
             ''')
             
-            # 用户当前装备的头像（在users表添加字段）
-            try:
-                cursor.execute("PRAGMA table_info(users)")
-                columns = [col[1] for col in cursor.fetchall()]
-                if 'current_avatar' not in columns:
-                    cursor.execute('ALTER TABLE users ADD COLUMN current_avatar TEXT DEFAULT "default_orange"')
-                    print("[INFO] 添加 current_avatar 列到 users 表")
-                if 'avatar_coins' not in columns:
-                    cursor.execute('ALTER TABLE users ADD COLUMN avatar_coins INTEGER DEFAULT 0')
-                    print("[INFO] 添加 avatar_coins 列到 users 表")
-            except Exception as e:
-                print(f"[WARN] 添加头像字段失败: {e}")
-
             # ============ 事件池系统表 ============
             
             # 事件池表（存储从真实世界获取的事件）
@@ -557,11 +531,15 @@ class FinAIDatabase:
             ''')
 
             conn.commit()
+            
+            # 执行版本化迁移（补列、索引等），随后缓存库结构
+            run_migrations(conn)
+            self.schema = load_schema(conn)
     
     def create_account(self, username: str, password: str) -> bool:
         """创建账户"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO accounts (username, password)
@@ -575,7 +553,7 @@ class FinAIDatabase:
     def verify_account(self, username: str, password: str) -> bool:
         """验证账户"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT password FROM accounts WHERE username = ?
@@ -604,7 +582,7 @@ class FinAIDatabase:
     
     def get_all_accounts(self) -> List[Dict]:
         """获取所有账户"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT id, username, created_at FROM accounts ORDER BY created_at DESC
@@ -616,7 +594,7 @@ class FinAIDatabase:
     
     def get_all_users(self) -> List[Dict]:
         """获取所有角色/用户"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT u.id, u.username, u.session_id, u.name, u.mbti, u.fate, u.credits,
@@ -639,7 +617,7 @@ class FinAIDatabase:
     def delete_account(self, username: str) -> bool:
         """删除账户及其所有角色"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 
                 # 先获取所有相关的 session_id
@@ -661,7 +639,7 @@ class FinAIDatabase:
     def update_user_credits(self, session_id: str, credits: int) -> bool:
         """更新用户金币"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     UPDATE users SET credits = ?, updated_at = CURRENT_TIMESTAMP
@@ -677,7 +655,7 @@ class FinAIDatabase:
                            energy: int = None, health: int = None) -> bool:
         """更新用户状态"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 updates = []
                 values = []
@@ -708,7 +686,7 @@ class FinAIDatabase:
     
     def get_admin_stats(self) -> Dict:
         """获取管理员统计数据"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             
             # 账户总数
@@ -749,7 +727,7 @@ class FinAIDatabase:
     
     def save_user(self, username: str, session_id: str, name: str, mbti: str, fate: str, credits: int, tags: str = ""):
         """保存用户信息（一个账户可以有多个角色）"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             # 检查session_id是否已存在
             cursor.execute('SELECT id FROM users WHERE session_id = ?', (session_id,))
@@ -773,7 +751,7 @@ class FinAIDatabase:
                        investment_type: str, remaining_months: int, 
                        monthly_return: int, return_rate: float, created_round: int, ai_thoughts: str = None):
         """保存投资记录"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO investments 
@@ -787,7 +765,7 @@ class FinAIDatabase:
     def save_transaction(self, username: str, session_id: str, round_num: int, 
                         transaction_name: str, amount: int, ai_thoughts: str = None):
         """保存交易记录"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO transactions (username, session_id, round_num, transaction_name, amount, ai_thoughts)
@@ -798,7 +776,7 @@ class FinAIDatabase:
     def get_user_info(self, username: str):
         """获取用户信息"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT name, mbti, fate, credits FROM users WHERE username = ?
@@ -818,7 +796,7 @@ class FinAIDatabase:
     
     def get_user_investments(self, username: str) -> List[Dict]:
         """获取用户投资"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT name, amount, investment_type, remaining_months, monthly_return
@@ -840,7 +818,7 @@ class FinAIDatabase:
     
     def get_user_transactions(self, username: str, limit: int = 10) -> List[Dict]:
         """获取用户交易记录"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT round_num, transaction_name, amount
@@ -860,9 +838,9 @@ class FinAIDatabase:
                 })
             return transactions
     
-    def upsert_session(self, session_id: str, username: str) -> None:
-        """创建或确保存在一个会话记录"""
-        with sqlite3.connect(self.db_path) as conn:
+    def upsert_session(self, session_id: str, username: str, sim_seed: Optional[int] = None) -> None:
+        """创建或确保存在一个会话记录；sim_seed 为新会话的模拟种子（已有会话不改变种子）"""
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT id FROM sessions WHERE session_id = ?', (session_id,))
             row = cursor.fetchone()
@@ -873,19 +851,20 @@ class FinAIDatabase:
                 ''', (session_id,))
             else:
                 cursor.execute('''
-                    INSERT INTO sessions (session_id, username, current_month)
-                    VALUES (?, ?, 1)
-                ''', (session_id, username))
+                    INSERT INTO sessions (session_id, username, current_month, sim_seed)
+                    VALUES (?, ?, 1, ?)
+                ''', (session_id, username, sim_seed))
             conn.commit()
     
-    def advance_session_month(self, session_id: str) -> int:
-        """会话月份+1，返回新的月份"""
-        with sqlite3.connect(self.db_path) as conn:
+    def advance_session_month(self, session_id: str, months: int = 1,
+                              conn: Optional[sqlite3.Connection] = None) -> int:
+        """会话月份+months（默认 1），返回新的月份（conn 见 transaction）"""
+        with self.transaction(conn) as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT current_month FROM sessions WHERE session_id = ?', (session_id,))
             row = cursor.fetchone()
             current = row[0] if row else 0
-            new_month = current + 1
+            new_month = current + months
             if row:
                 cursor.execute('''
                     UPDATE sessions
@@ -898,16 +877,35 @@ class FinAIDatabase:
                     INSERT INTO sessions (session_id, username, current_month)
                     VALUES (?, (SELECT username FROM users WHERE session_id = ? LIMIT 1), ?)
                 ''', (session_id, session_id, new_month))
-            conn.commit()
             return new_month
     
     def get_session_month(self, session_id: str) -> int:
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT current_month FROM sessions WHERE session_id = ?', (session_id,))
             row = cursor.fetchone()
             return row[0] if row else 1
     
+    def get_session_seed(self, session_id: str) -> Optional[int]:
+        """会话的模拟种子（迁移前创建的会话为空，推进时使用全局随机数）"""
+        with self.connect() as conn:
+            row = conn.execute('SELECT sim_seed FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+            return row[0] if row else None
+    
+    def save_avatar_state(self, session_id: str, state: str) -> None:
+        """保存 AI 化身状态（AIAvatar.save_state 的 JSON）"""
+        with self.connect() as conn:
+            conn.execute('''
+                INSERT INTO avatar_states (session_id, state, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+            ''', (session_id, state))
+    
+    def get_avatar_state(self, session_id: str) -> Optional[str]:
+        """读取 AI 化身状态 JSON，没有保存过返回 None"""
+        with self.connect() as conn:
+            row = conn.execute('SELECT state FROM avatar_states WHERE session_id = ?', (session_id,)).fetchone()
+            return row[0] if row else None
+    
     def save_monthly_snapshot(
         self,
         session_id: str,
@@ -918,9 +916,10 @@ class FinAIDatabase:
         trust_level: Optional[int] = None,
         happiness: Optional[int] = None,
         stress: Optional[int] = None,
+        conn: Optional[sqlite3.Connection] = None,
     ) -> None:
-        """保存某个月的资产与情绪快照"""
-        with sqlite3.connect(self.db_path) as conn:
+        """保存某个月的资产与情绪快照（conn 见 transaction）"""
+        with self.transaction(conn) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO monthly_snapshots (
@@ -937,11 +936,10 @@ class FinAIDatabase:
                 happiness,
                 stress,
             ))
-            conn.commit()
     
     def get_session_timeline(self, session_id: str, limit: int = 36) -> List[Dict]:
         """获取最近若干个月的快照（按月份升序）"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT month, total_assets, cash, invested_assets,
@@ -977,7 +975,7 @@ class FinAIDatabase:
             ('leisure', 0.4, 0.5, 0.57),
             ('green', 0.44, 0.46, 0.63)
         ]
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT COUNT(1) FROM district_states WHERE session_id = ?', (session_id,))
             count = cursor.fetchone()[0]
@@ -992,7 +990,7 @@ class FinAIDatabase:
             conn.commit()
 
     def get_district_states(self, session_id: str) -> List[Dict]:
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT district_id, influence, heat, prosperity, unlock_level, events_completed, last_event
@@ -1047,7 +1045,7 @@ class FinAIDatabase:
             fields.append('last_event = ?')
             params.append(last_event)
         fields.append('updated_at = CURRENT_TIMESTAMP')
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO district_states (session_id, district_id)
@@ -1060,7 +1058,7 @@ class FinAIDatabase:
             conn.commit()
 
     def get_achievement_progress(self, session_id: str) -> Dict[str, Dict[str, float]]:
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT achievement_id, progress, completed, unlocked_at
@@ -1084,7 +1082,7 @@ class FinAIDatabase:
         progress: float,
         completed: bool
     ) -> None:
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO achievement_progress (session_id, achievement_id, progress, completed, unlocked_at)
@@ -1102,7 +1100,7 @@ class FinAIDatabase:
 
     def get_city_events(self, session_id: str, limit: int = 15) -> List[Dict]:
         """获取城市事件"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT id, session_id, district_id, title, description, type, created_at
@@ -1127,7 +1125,7 @@ class FinAIDatabase:
 
     def save_city_event(self, session_id: str, district_id: str, title: str, description: str, event_type: str = "story") -> None:
         """保存城市事件"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO city_events (session_id, district_id, title, description, type)
@@ -1137,7 +1135,7 @@ class FinAIDatabase:
 
     def get_or_create_district_state(self, session_id: str, district_id: str) -> Dict:
         """获取或创建区块状态"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT influence, heat, prosperity, unlock_level, events_completed, last_event
@@ -1175,7 +1173,7 @@ class FinAIDatabase:
         columns = ', '.join([f"{key} = ?" for key in kwargs.keys()])
         values = list(kwargs.values())
         values.extend([session_id, district_id])
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute(f'''
                 UPDATE district_states
@@ -1187,7 +1185,7 @@ class FinAIDatabase:
     def delete_user(self, session_id: str) -> bool:
         """删除用户及其所有相关数据"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 
                 # 删除相关表中的数据
@@ -1199,7 +1197,8 @@ class FinAIDatabase:
                     'loans', 'loan_payments', 'insurance_policies',
                     'insurance_claims', 'financial_holdings',
                     'cashflow_records', 'monthly_cashflow',
-                    'credit_history', 'achievements_unlocked'
+                    'credit_history', 'achievements_unlocked',
+                    'avatar_states'
                 ]
                 
                 for table in tables:
@@ -1222,7 +1221,7 @@ class FinAIDatabase:
     def save_stock_holding(self, session_id: str, stock_id: str, stock_name: str,
                           shares: int, avg_cost: float, buy_month: int) -> None:
         """保存或更新股票持仓"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO stock_holdings (session_id, stock_id, stock_name, shares, avg_cost, buy_month)
@@ -1235,7 +1234,7 @@ class FinAIDatabase:
     
     def get_stock_holdings(self, session_id: str) -> List[Dict]:
         """获取股票持仓"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT stock_id, stock_name, shares, avg_cost, buy_month
@@ -1255,7 +1254,7 @@ class FinAIDatabase:
     
     def delete_stock_holding(self, session_id: str, stock_id: str) -> None:
         """删除股票持仓（清仓时）"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 DELETE FROM stock_holdings WHERE session_id = ? AND stock_id = ?
@@ -1266,7 +1265,7 @@ class FinAIDatabase:
                                action: str, shares: int, price: float, 
                                total_amount: float, month: int, profit: float = 0) -> None:
         """保存股票交易记录"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO stock_transactions 
@@ -1277,7 +1276,7 @@ class FinAIDatabase:
     
     def get_stock_transactions(self, session_id: str, limit: int = 50) -> List[Dict]:
         """获取股票交易历史"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT stock_id, stock_name, action, shares, price, total_amount, month, profit, created_at
@@ -1303,7 +1302,7 @@ class FinAIDatabase:
     
     def get_stock_profit_stats(self, session_id: str) -> Dict:
         """获取股票盈亏统计"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT SUM(profit), COUNT(*), SUM(CASE WHEN profit > 0 THEN 1 ELSE 0 END)
@@ -1335,7 +1334,7 @@ class FinAIDatabase:
         name_map = {'demand': '活期存款', 'fixed_3m': '3个月定期', 'fixed_1y': '1年定期', 'fixed_3y': '3年定期'}
         product_name = name_map.get(deposit_type, '活期存款')
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             product_id = f"deposit_{deposit_type}_{uuid.uuid4().hex[:8]}"
             cursor.execute('''
@@ -1351,7 +1350,7 @@ class FinAIDatabase:
     
     def get_deposits(self, session_id: str) -> List[Dict]:
         """获取存款列表"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT product_id, product_name, amount, buy_price, current_value, 
@@ -1369,7 +1368,7 @@ class FinAIDatabase:
     
     def get_total_deposits(self, session_id: str) -> int:
         """获取存款总额"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT COALESCE(SUM(amount), 0)
@@ -1382,7 +1381,7 @@ class FinAIDatabase:
     
     def save_loan(self, session_id: str, loan_data: Dict) -> None:
         """保存贷款"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO loans (
@@ -1402,7 +1401,7 @@ class FinAIDatabase:
     
     def get_loans(self, session_id: str, active_only: bool = True) -> List[Dict]:
         """获取贷款列表"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             query = '''
                 SELECT loan_id, loan_type, product_name, principal, remaining_principal,
@@ -1431,7 +1430,7 @@ class FinAIDatabase:
             return
         columns = ', '.join([f"{key} = ?" for key in kwargs.keys()])
         values = list(kwargs.values())
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute(f'''
                 UPDATE loans SET {columns}
@@ -1441,7 +1440,7 @@ class FinAIDatabase:
     
     def save_loan_payment(self, session_id: str, payment_data: Dict) -> None:
         """保存还款记录"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO loan_payments (
@@ -1460,7 +1459,7 @@ class FinAIDatabase:
     
     def save_insurance_policy(self, session_id: str, policy_data: Dict) -> None:
         """保存保险保单"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO insurance_policies (
@@ -1480,7 +1479,7 @@ class FinAIDatabase:
     
     def get_insurance_policies(self, session_id: str, active_only: bool = True) -> List[Dict]:
         """获取保险保单列表"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             query = '''
                 SELECT policy_id, product_id, product_name, insurance_type,
@@ -1509,7 +1508,7 @@ class FinAIDatabase:
             return
         columns = ', '.join([f"{key} = ?" for key in kwargs.keys()])
         values = list(kwargs.values())
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute(f'''
                 UPDATE insurance_policies SET {columns}
@@ -1519,7 +1518,7 @@ class FinAIDatabase:
     
     def save_insurance_claim(self, session_id: str, claim_data: Dict) -> None:
         """保存理赔记录"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO insurance_claims (
@@ -1539,7 +1538,7 @@ class FinAIDatabase:
     def save_cashflow_record(self, session_id: str, month: int, category: str,
                             item_type: str, item_name: str, amount: int, is_income: bool) -> None:
         """保存现金流记录"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO cashflow_records (session_id, month, category, item_type, item_name, amount, is_income)
@@ -1549,9 +1548,10 @@ class FinAIDatabase:
     
     def save_monthly_cashflow(self, session_id: str, month: int, total_income: int,
                              total_expense: int, net_cashflow: int, 
-                             saving_rate: float, cash_balance: int) -> None:
-        """保存月度现金流汇总"""
-        with sqlite3.connect(self.db_path) as conn:
+                             saving_rate: float, cash_balance: int,
+                             conn: Optional[sqlite3.Connection] = None) -> None:
+        """保存月度现金流汇总（conn 见 transaction）"""
+        with self.transaction(conn) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO monthly_cashflow (session_id, month, total_income, total_expense, net_cashflow, saving_rate, cash_balance)
@@ -1563,11 +1563,10 @@ class FinAIDatabase:
                     saving_rate = excluded.saving_rate,
                     cash_balance = excluded.cash_balance
             ''', (session_id, month, total_income, total_expense, net_cashflow, saving_rate, cash_balance))
-            conn.commit()
     
     def get_cashflow_history(self, session_id: str, months: int = 12) -> List[Dict]:
         """获取现金流历史"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT month, total_income, total_expense, net_cashflow, saving_rate, cash_balance
@@ -1589,7 +1588,7 @@ class FinAIDatabase:
     def save_credit_score(self, session_id: str, month: int, 
                          credit_score: int, change_reason: str = None) -> None:
         """保存信用分记录"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO credit_history (session_id, month, credit_score, change_reason)
@@ -1599,7 +1598,7 @@ class FinAIDatabase:
     
     def get_credit_history(self, session_id: str, months: int = 24) -> List[Dict]:
         """获取信用分历史"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT month, credit_score, change_reason, created_at
@@ -1615,7 +1614,7 @@ class FinAIDatabase:
     
     def get_latest_credit_score(self, session_id: str) -> int:
         """获取最新信用分"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT credit_score FROM credit_history
@@ -1627,9 +1626,10 @@ class FinAIDatabase:
     
     # ============ 成就系统方法 ============
     
-    def save_achievement_unlock(self, session_id: str, achievement_data: Dict) -> None:
-        """保存解锁的成就"""
-        with sqlite3.connect(self.db_path) as conn:
+    def save_achievement_unlock(self, session_id: str, achievement_data: Dict,
+                                conn: Optional[sqlite3.Connection] = None) -> None:
+        """保存解锁的成就（conn 见 transaction）"""
+        with self.transaction(conn) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO achievements_unlocked (
@@ -1643,11 +1643,10 @@ class FinAIDatabase:
                 achievement_data.get('reward_coins', 0), achievement_data.get('reward_exp', 0),
                 achievement_data.get('reward_title'), achievement_data['unlocked_month']
             ))
-            conn.commit()
     
     def get_unlocked_achievements(self, session_id: str) -> List[Dict]:
         """获取已解锁成就列表"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT achievement_id, achievement_name, rarity, reward_coins,
@@ -1667,7 +1666,7 @@ class FinAIDatabase:
     
     def get_achievement_stats(self, session_id: str) -> Dict:
         """获取成就统计"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT COUNT(*), SUM(reward_coins), SUM(reward_exp)
@@ -1685,7 +1684,7 @@ class FinAIDatabase:
     
     def get_user_avatar_coins(self, session_id: str) -> int:
         """获取用户的头像金币（等于总成就金币减去已花费的）"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             # 获取总成就金币
             cursor.execute('''
@@ -1704,7 +1703,7 @@ class FinAIDatabase:
     
     def get_user_avatars(self, session_id: str) -> List[str]:
         """获取用户拥有的所有头像ID"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT avatar_id FROM user_avatars WHERE session_id = ?
@@ -1717,7 +1716,7 @@ class FinAIDatabase:
     
     def get_current_avatar(self, session_id: str) -> str:
         """获取用户当前装备的头像"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT current_avatar FROM users WHERE session_id = ?', (session_id,))
             row = cursor.fetchone()
@@ -1726,7 +1725,7 @@ class FinAIDatabase:
     def purchase_avatar(self, session_id: str, avatar_id: str, price: int) -> bool:
         """购买头像"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 # 检查是否已拥有
                 cursor.execute('''
@@ -1754,7 +1753,7 @@ class FinAIDatabase:
     def equip_avatar(self, session_id: str, avatar_id: str) -> bool:
         """装备头像"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 # 检查是否拥有（默认头像无需拥有）
                 if avatar_id != 'default_orange':
@@ -1777,7 +1776,7 @@ class FinAIDatabase:
     
     def save_economic_state(self, month: int, state_data: Dict) -> None:
         """保存宏观经济状态"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO economic_state (
@@ -1805,7 +1804,7 @@ class FinAIDatabase:
     
     def get_economic_history(self, months: int = 36) -> List[Dict]:
         """获取经济历史"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT month, gdp_growth, inflation, interest_rate, unemployment,
@@ -1831,7 +1830,7 @@ class FinAIDatabase:
                     rationality_score: float = None, market_condition: str = None,
                     decision_context: str = None) -> None:
         """记录用户行为日志"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO behavior_logs (
@@ -1844,7 +1843,7 @@ class FinAIDatabase:
     
     def get_behavior_logs(self, session_id: str, months: int = None) -> List[Dict]:
         """获取行为日志"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             if months:
                 cursor.execute('''
@@ -1874,7 +1873,7 @@ class FinAIDatabase:
     
     def update_behavior_profile(self, session_id: str, profile_data: Dict) -> None:
         """更新行为画像"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO behavior_profiles (
@@ -1907,7 +1906,7 @@ class FinAIDatabase:
     
     def get_behavior_profile(self, session_id: str) -> Dict:
         """获取行为画像"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT risk_preference, decision_style, loss_aversion, overconfidence,
@@ -1930,7 +1929,7 @@ class FinAIDatabase:
     
     def save_cohort_insight(self, insight_data: Dict) -> None:
         """保存群体洞察"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO cohort_insights (
@@ -1948,7 +1947,7 @@ class FinAIDatabase:
     
     def get_cohort_insights(self, insight_type: str = None, limit: int = 20) -> List[Dict]:
         """获取群体洞察列表"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             if insight_type:
                 cursor.execute('''
@@ -1982,7 +1981,7 @@ class FinAIDatabase:
     def save_pool_event(self, event_data: Dict) -> bool:
         """保存事件到事件池"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT OR REPLACE INTO event_pool (
@@ -2008,7 +2007,7 @@ class FinAIDatabase:
     
     def get_pool_events(self, category: str = None, limit: int = 100) -> List[Dict]:
         """获取事件池中的事件"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             if category:
                 cursor.execute('''
@@ -2044,7 +2043,7 @@ class FinAIDatabase:
     
     def get_pool_event_count(self) -> int:
         """获取事件池事件数量"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT COUNT(*) FROM event_pool')
             return cursor.fetchone()[0]
@@ -2054,7 +2053,7 @@ class FinAIDatabase:
                                   option_text: str, impact_data: Dict, month: int) -> bool:
         """保存用户对事件的响应"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 import json
                 cursor.execute('''
@@ -2074,7 +2073,7 @@ class FinAIDatabase:
     
     def get_user_event_responses(self, session_id: str, limit: int = 50) -> List[Dict]:
         """获取用户的事件响应历史"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT event_id, game_event_id, option_chosen, option_text,
@@ -2097,7 +2096,7 @@ class FinAIDatabase:
     
     def clear_old_pool_events(self, days: int = 7) -> int:
         """清理过期的事件池事件"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 DELETE FROM event_pool
@@ -0,0 +1,244 @@
+"""
+数据库迁移 - 按版本号顺序执行的结构变更
+已执行的版本记录在 schema_version 表中，每个迁移只会执行一次。
+"""
+import sqlite3
+from typing import Callable, Dict, FrozenSet, List, Tuple, Union
+
+MigrationStep = Union[str, Callable[[sqlite3.Connection], None]]
+
+
+def _add_column(table: str, column: str, definition: str) -> Callable[[sqlite3.Connection], None]:
+    """补列步骤：旧库缺列时才执行 ALTER TABLE（新库建表时已包含的列会被跳过）"""
+    def step(conn: sqlite3.Connection):
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            print(f"[Migration] 添加 {column} 列到 {table} 表")
+    return step
+
+
+# (版本号, 说明, 步骤列表)；新增迁移只能追加，不能修改已发布的版本
+MIGRATIONS: List[Tuple[int, str, List[MigrationStep]]] = [
+    (1, "热点 session_id 查询的复合索引", [
+        # 投资：持仓中的投资 / 按时间倒序的投资记录 / 按用户名查询
+        "CREATE INDEX IF NOT EXISTS idx_investments_session_remaining ON investments(session_id, remaining_months)",
+        "CREATE INDEX IF NOT EXISTS idx_investments_session_created ON investments(session_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_investments_username_created ON investments(username, created_at DESC)",
+        # 交易记录
+        "CREATE INDEX IF NOT EXISTS idx_transactions_session_created ON transactions(session_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_username_created ON transactions(username, created_at DESC)",
+        # 用户按用户名查询（session_id 已有唯一索引）
+        "CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)",
+        # 月度快照 / 时间线
+        "CREATE INDEX IF NOT EXISTS idx_monthly_snapshots_session_month ON monthly_snapshots(session_id, month DESC)",
+        # 城市事件
+        "CREATE INDEX IF NOT EXISTS idx_city_events_session_created ON city_events(session_id, created_at DESC)",
+        # 股票交易（持仓表已有 UNIQUE(session_id, stock_id)）
+        "CREATE INDEX IF NOT EXISTS idx_stock_transactions_session_created ON stock_transactions(session_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_stock_transactions_action_session ON stock_transactions(action, session_id)",
+        # 贷款与还款
+        "CREATE INDEX IF NOT EXISTS idx_loans_session_remaining ON loans(session_id, remaining_months)",
+        "CREATE INDEX IF NOT EXISTS idx_loans_session_created ON loans(session_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_loan_payments_session_loan ON loan_payments(session_id, loan_id, month)",
+        # 保险
+        "CREATE INDEX IF NOT EXISTS idx_insurance_policies_session_active ON insurance_policies(session_id, is_active)",
+        "CREATE INDEX IF NOT EXISTS idx_insurance_claims_session_policy ON insurance_claims(session_id, policy_id)",
+        # 理财持仓
+        "CREATE INDEX IF NOT EXISTS idx_financial_holdings_session_type ON financial_holdings(session_id, product_type, is_active)",
+        # 现金流与信用（monthly_cashflow 已有 UNIQUE(session_id, month)）
+        "CREATE INDEX IF NOT EXISTS idx_cashflow_records_session_month ON cashflow_records(session_id, month DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_credit_history_session_month ON credit_history(session_id, month DESC)",
+        # 行为日志
+        "CREATE INDEX IF NOT EXISTS idx_behavior_logs_session_month ON behavior_logs(session_id, month DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_behavior_logs_session_created ON behavior_logs(session_id, created_at DESC)",
+        # 群体洞察
+        "CREATE INDEX IF NOT EXISTS idx_cohort_insights_type_month ON cohort_insights(insight_type, generated_month DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_cohort_insights_month ON cohort_insights(generated_month DESC)",
+        # 事件池
+        "CREATE INDEX IF NOT EXISTS idx_event_pool_category_created ON event_pool(category, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_event_pool_created ON event_pool(created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_user_event_responses_session_month ON user_event_responses(session_id, month DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_event_filter_logs_session_created ON event_filter_logs(session_id, created_at DESC)",
+    ]),
+    (2, "补齐历史列，并创建原先由请求处理函数临时建立的表", [
+        _add_column("transactions", "ai_thoughts", "TEXT"),
+        _add_column("investments", "ai_thoughts", "TEXT"),
+        _add_column("users", "happiness", "INTEGER DEFAULT 70"),
+        _add_column("users", "energy", "INTEGER DEFAULT 75"),
+        _add_column("users", "health", "INTEGER DEFAULT 80"),
+        _add_column("users", "tags", 'TEXT DEFAULT ""'),
+        _add_column("users", "current_avatar", 'TEXT DEFAULT "default_orange"'),
+        _add_column("users", "avatar_coins", "INTEGER DEFAULT 0"),
+        _add_column("behavior_profiles", "auto_tags", 'TEXT DEFAULT ""'),
+        # 房产
+        '''
+        CREATE TABLE IF NOT EXISTS properties (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            property_type TEXT NOT NULL,
+            purchase_price INTEGER NOT NULL,
+            current_value INTEGER NOT NULL,
+            monthly_rent INTEGER DEFAULT 0,
+            is_rented INTEGER DEFAULT 0,
+            is_self_living INTEGER DEFAULT 0,
+            buy_month INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_properties_session ON properties(session_id)",
+        # 居住状态
+        '''
+        CREATE TABLE IF NOT EXISTS living_status (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT UNIQUE NOT NULL,
+            living_type TEXT NOT NULL,
+            property_name TEXT NOT NULL,
+            monthly_cost INTEGER NOT NULL,
+            happiness_effect INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # 生活活动记录
+        '''
+        CREATE TABLE IF NOT EXISTS lifestyle_activities (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            activity_id TEXT NOT NULL,
+            cost INTEGER NOT NULL,
+            effects TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # 副业
+        '''
+        CREATE TABLE IF NOT EXISTS side_businesses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            business_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            investment INTEGER NOT NULL,
+            expected_return INTEGER NOT NULL,
+            risk_rate REAL NOT NULL,
+            status TEXT DEFAULT 'running',
+            start_month INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(session_id, business_id)
+        )
+        ''',
+    ]),
+    (3, "会话模拟种子（按种子重放会话推进）", [
+        _add_column("sessions", "sim_seed", "INTEGER"),
+    ]),
+    (4, "AI 化身状态（会话缓存淘汰时写回，再次访问时重建）", [
+        '''
+        CREATE TABLE IF NOT EXISTS avatar_states (
+            session_id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (5, "会话状态存储与跨 worker 会话锁（session_state.SQLiteSessionStore）", [
+        '''
+        CREATE TABLE IF NOT EXISTS session_state (
+            session_id TEXT NOT NULL,
+            namespace TEXT NOT NULL,
+            state TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (session_id, namespace)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS session_locks (
+            session_id TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        ''',
+    ]),
+]
+
+
+# 热点查询：迁移后这些查询都不应出现全表扫描（参数用占位值即可）
+HOT_QUERIES: List[Tuple[str, tuple]] = [
+    ("SELECT * FROM users WHERE session_id = ?", ("s",)),
+    ("SELECT * FROM users WHERE username = ?", ("u",)),
+    ("SELECT SUM(amount) FROM investments WHERE session_id = ? AND remaining_months > 0", ("s",)),
+    ("SELECT * FROM investments WHERE session_id = ? ORDER BY created_at DESC LIMIT ?", ("s", 20)),
+    ("SELECT * FROM investments WHERE username = ? AND remaining_months > 0 ORDER BY created_at DESC", ("u",)),
+    ("SELECT * FROM transactions WHERE session_id = ? ORDER BY created_at DESC LIMIT ?", ("s", 20)),
+    ("SELECT * FROM transactions WHERE username = ? ORDER BY created_at DESC LIMIT ?", ("u", 20)),
+    ("SELECT * FROM monthly_snapshots WHERE session_id = ? ORDER BY month DESC LIMIT ?", ("s", 12)),
+    ("SELECT * FROM city_events WHERE session_id = ? ORDER BY created_at DESC LIMIT ?", ("s", 10)),
+    ("SELECT * FROM stock_holdings WHERE session_id = ? AND shares > 0", ("s",)),
+    ("SELECT * FROM stock_transactions WHERE session_id = ? ORDER BY created_at DESC LIMIT ?", ("s", 20)),
+    ("SELECT * FROM loans WHERE session_id = ? AND remaining_months > 0", ("s",)),
+    ("SELECT * FROM insurance_policies WHERE session_id = ? AND is_active = 1", ("s",)),
+    ("SELECT * FROM financial_holdings WHERE session_id = ? AND product_type = ? AND is_active = 1", ("s", "deposit")),
+    ("SELECT * FROM cashflow_records WHERE session_id = ? AND month = ?", ("s", 1)),
+    ("SELECT * FROM monthly_cashflow WHERE session_id = ? ORDER BY month DESC LIMIT ?", ("s", 12)),
+    ("SELECT * FROM credit_history WHERE session_id = ? ORDER BY month DESC LIMIT 1", ("s",)),
+    ("SELECT * FROM achievements_unlocked WHERE session_id = ?", ("s",)),
+    ("SELECT * FROM behavior_logs WHERE session_id = ? ORDER BY month DESC LIMIT ?", ("s", 50)),
+    ("SELECT * FROM behavior_logs WHERE session_id = ? ORDER BY created_at DESC LIMIT ?", ("s", 50)),
+    ("SELECT * FROM cohort_insights WHERE insight_type = ? ORDER BY generated_month DESC LIMIT ?", ("t", 10)),
+    ("SELECT * FROM event_pool WHERE category = ? ORDER BY created_at DESC LIMIT ?", ("c", 10)),
+    ("SELECT * FROM user_event_responses WHERE session_id = ? ORDER BY month DESC LIMIT ?", ("s", 10)),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """当前已执行到的迁移版本"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """执行所有未执行的迁移，返回最新版本号"""
+    current = get_schema_version(conn)
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        for step in steps:
+            if callable(step):
+                step(conn)
+            else:
+                conn.execute(step)
+        conn.execute(
+            'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+            (version, description)
+        )
+        conn.commit()
+        current = version
+        print(f"[Migration] 已执行迁移 v{version}: {description}")
+    return current
+
+
+def load_schema(conn: sqlite3.Connection) -> Dict[str, FrozenSet[str]]:
+    """读取当前库结构：表名 -> 列名集合（只在启动迁移后调用一次）"""
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    ).fetchall()]
+    return {
+        table: frozenset(row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall())
+        for table in tables
+    }
+
+
+def find_table_scans(conn: sqlite3.Connection) -> List[Dict]:
+    """对热点查询执行 EXPLAIN QUERY PLAN，返回仍然全表扫描或需要临时排序的查询"""
+    offenders = []
+    for sql, params in HOT_QUERIES:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+        if any(step.startswith('SCAN') or 'TEMP B-TREE' in step for step in plan):
+            offenders.append({"sql": sql, "plan": plan})
+    return offenders
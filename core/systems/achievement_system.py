@@ -7,6 +7,8 @@ from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Callable, Any
 from enum import Enum
 
+from .session_state import from_state, to_state
+
 
 class AchievementCategory(Enum):
     """成就类别"""
@@ -1062,6 +1064,26 @@ class AchievementSystem:
                     "rarity": ach.rarity.value
                 })
         return result
+    
+    def export_state(self) -> Dict:
+        """导出本会话的成就状态（供会话状态存储）"""
+        return {
+            "unlocked": to_state(self.unlocked),
+            "progress": self.progress,
+            "total_coins_earned": self.total_coins_earned,
+            "total_exp_earned": self.total_exp_earned,
+            "current_title": self.current_title,
+            "available_titles": self.available_titles,
+        }
+    
+    def import_state(self, state: Dict):
+        """从会话状态存储还原"""
+        self.unlocked = from_state(Dict[str, UnlockedAchievement], state.get("unlocked", {}))
+        self.progress = state.get("progress", {})
+        self.total_coins_earned = state.get("total_coins_earned", 0)
+        self.total_exp_earned = state.get("total_exp_earned", 0)
+        self.current_title = state.get("current_title")
+        self.available_titles = state.get("available_titles", [])
 
 
 # 全局实例
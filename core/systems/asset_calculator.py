@@ -2,9 +2,9 @@
 资产计算系统 - 实时计算决策对资产的影响
 """
 import re
-import random
 from typing import Dict, Tuple
 from .investment_system import investment_system, InvestmentType
+from .sim_random import sim_rng
 
 class AssetCalculator:
     """资产影响计算器"""
@@ -16,6 +16,7 @@ class AssetCalculator:
         Returns:
             Tuple[int, str]: (资产变化, 变化描述)
         """
+        rng = sim_rng("assets")
         option_lower = chosen_option.lower()
         
         # 投资相关决策
@@ -42,7 +43,7 @@ class AssetCalculator:
             return change, desc
         
         # 默认小幅随机变化
-        change = random.randint(-500, 1000)
+        change = rng.randint(-500, 1000)
         desc = "日常开支" if change < 0 else "意外收入"
         investment_system.add_transaction(current_round, desc, change)
         return change, desc
@@ -50,6 +51,7 @@ class AssetCalculator:
     @staticmethod
     def _calculate_investment_impact(option: str, credits: int, current_round: int = 1) -> Tuple[int, str, str]:
         """计算投资影响"""
+        rng = sim_rng("assets")
         # 提取投资金额
         amounts = re.findall(r'(\d+)万', option)
         if amounts:
@@ -66,20 +68,20 @@ class AssetCalculator:
         # 判断投资类型和期限
         if "基金" in option or "月收益" in option:
             inv_type = InvestmentType.MONTHLY
-            duration = random.randint(12, 36)
-            return_rate = random.uniform(0.06, 0.12)  # 年化6-12%
+            duration = rng.randint(12, 36)
+            return_rate = rng.uniform(0.06, 0.12)  # 年化6-12%
         elif "短期" in option or "3个月" in option:
             inv_type = InvestmentType.SHORT_TERM
-            duration = random.randint(1, 3)
-            return_rate = random.uniform(0.02, 0.08)
+            duration = rng.randint(1, 3)
+            return_rate = rng.uniform(0.02, 0.08)
         elif "长期" in option or "年" in option:
             inv_type = InvestmentType.LONG_TERM
-            duration = random.randint(12, 24)
-            return_rate = random.uniform(0.08, 0.20)
+            duration = rng.randint(12, 24)
+            return_rate = rng.uniform(0.08, 0.20)
         else:
             inv_type = InvestmentType.MEDIUM_TERM
-            duration = random.randint(3, 12)
-            return_rate = random.uniform(0.05, 0.15)
+            duration = rng.randint(3, 12)
+            return_rate = rng.uniform(0.05, 0.15)
         
         # 生成投资名称
         if "股票" in option:
@@ -104,6 +106,7 @@ class AssetCalculator:
     @staticmethod
     def _calculate_purchase_impact(option: str, credits: int) -> Tuple[int, str, str]:
         """计算购买影响"""
+        rng = sim_rng("assets")
         # 检查是否为购房决策
         if any(keyword in option for keyword in ["购房", "首付", "80%"]):
             # 购房：使用80%资金作为首付
@@ -119,11 +122,11 @@ class AssetCalculator:
         else:
             # 根据物品类型估算
             if any(item in option for item in ["房", "车", "房产"]):
-                change = -random.randint(50000, 200000)
+                change = -rng.randint(50000, 200000)
             elif any(item in option for item in ["电脑", "手机", "设备"]):
-                change = -random.randint(3000, 15000)
+                change = -rng.randint(3000, 15000)
             else:
-                change = -random.randint(500, 5000)
+                change = -rng.randint(500, 5000)
         
         desc = "购买支出"
         return change, desc, "short_term"
@@ -131,12 +134,13 @@ class AssetCalculator:
     @staticmethod
     def _calculate_savings_impact(option: str, credits: int) -> Tuple[int, str, str]:
         """计算储蓄影响"""
+        rng = sim_rng("assets")
         # 储蓄通常是正收益
         if "定存" in option:
-            change = int(credits * random.uniform(0.02, 0.05))
+            change = int(credits * rng.uniform(0.02, 0.05))
             desc = "定存利息"
         else:
-            change = int(credits * random.uniform(0.01, 0.03))
+            change = int(credits * rng.uniform(0.01, 0.03))
             desc = "储蓄收益"
         
         return change, desc, "long_term"
@@ -144,17 +148,18 @@ class AssetCalculator:
     @staticmethod
     def _calculate_work_impact(option: str, credits: int) -> Tuple[int, str, str]:
         """计算工作影响"""
+        rng = sim_rng("assets")
         if "加班" in option:
-            change = random.randint(1000, 3000)
+            change = rng.randint(1000, 3000)
             desc = "加班收入"
         elif "兼职" in option:
-            change = random.randint(2000, 8000)
+            change = rng.randint(2000, 8000)
             desc = "兼职收入"
         elif "跳槽" in option or "换工作" in option:
-            change = random.randint(-5000, 15000)
+            change = rng.randint(-5000, 15000)
             desc = "工作变动" if change > 0 else "跳槽成本"
         else:
-            change = random.randint(3000, 8000)
+            change = rng.randint(3000, 8000)
             desc = "工作收入"
         
         return change, desc, "short_term"
@@ -3,6 +3,7 @@
 记录和分析玩家的金融决策行为，生成个人画像和群体洞察
 支持 AI 驱动的个性化洞察生成
 """
+import asyncio
 from typing import Dict, List, Optional, Tuple
 import numpy as np
 from collections import defaultdict
@@ -995,6 +996,22 @@ class BehaviorInsightSystem:
         if not self.ai_engine:
             return None
         
+        # 组装提示词要读取多张表，放到线程中执行，不阻塞事件循环
+        prompt = await asyncio.to_thread(self.build_ai_insight_prompt, session_id)
+        if not prompt:
+            return None
+
+        try:
+            response = await self.ai_engine.generate_response_async(prompt, cache_namespace="insight")
+            if response:
+                return self.parse_ai_insight(response, current_month)
+        except Exception as e:
+            print(f"[BehaviorInsight] AI insight generation failed: {e}")
+        
+        return None
+    
+    def build_ai_insight_prompt(self, session_id: str) -> Optional[str]:
+        """构建AI洞察提示词，行为数据不足时返回 None（流式接口与 generate_ai_insight 共用）"""
         # 获取用户数据
         profile = self.db.get_behavior_profile(session_id)
         logs = self.db.get_behavior_logs(session_id, months=6)
@@ -1005,7 +1022,7 @@ class BehaviorInsightSystem:
         # 构建分析上下文
         context = self._build_ai_context(profile, logs)
         
-        # 调用AI生成洞察
+        # 构建洞察提示词
         prompt = f"""你是一位专业的金融行为分析师，专注于Z世代（95后-00后）的投资行为研究。
 请根据以下用户行为数据，生成一份简洁的个性化洞察报告。
 
@@ -1030,39 +1047,35 @@ class BehaviorInsightSystem:
   "suggestions": ["建议1", "建议2", "建议3"],
   "risk_alert": "如果发现高风险行为模式，给出警告；否则为null"
 }}"""
-
+        return prompt
+    
+    def parse_ai_insight(self, response: str, current_month: int) -> Dict:
+        """解析AI返回的洞察文本"""
+        # 尝试解析JSON
         try:
-            response = await self.ai_engine.generate_response_async(prompt)
-            if response:
-                # 尝试解析JSON
-                try:
-                    # 清理可能的markdown代码块标记
-                    clean_response = response.strip()
-                    if clean_response.startswith('```'):
-                        clean_response = clean_response.split('```')[1]
-                        if clean_response.startswith('json'):
-                            clean_response = clean_response[4:]
-                    clean_response = clean_response.strip()
-                    
-                    insight = json.loads(clean_response)
-                    insight['generated_by'] = 'ai'
-                    insight['generated_month'] = current_month
-                    return insight
-                except json.JSONDecodeError:
-                    # 如果JSON解析失败，返回原始文本
-                    return {
-                        'title': '行为分析报告',
-                        'summary': response[:100],
-                        'analysis': response,
-                        'suggestions': [],
-                        'risk_alert': None,
-                        'generated_by': 'ai',
-                        'generated_month': current_month
-                    }
-        except Exception as e:
-            print(f"[BehaviorInsight] AI insight generation failed: {e}")
-        
-        return None
+            # 清理可能的markdown代码块标记
+            clean_response = response.strip()
+            if clean_response.startswith('```'):
+                clean_response = clean_response.split('```')[1]
+                if clean_response.startswith('json'):
+                    clean_response = clean_response[4:]
+            clean_response = clean_response.strip()
+            
+            insight = json.loads(clean_response)
+            insight['generated_by'] = 'ai'
+            insight['generated_month'] = current_month
+            return insight
+        except json.JSONDecodeError:
+            # 如果JSON解析失败，返回原始文本
+            return {
+                'title': '行为分析报告',
+                'summary': response[:100],
+                'analysis': response,
+                'suggestions': [],
+                'risk_alert': None,
+                'generated_by': 'ai',
+                'generated_month': current_month
+            }
     
     def _build_ai_context(self, profile: Dict, logs: List[Dict]) -> str:
         """构建AI分析的上下文信息"""
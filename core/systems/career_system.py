@@ -2,11 +2,13 @@
 职业与收入系统 - EchoPolis
 实现职业发展、跳槽升职、副业创业、被动收入
 """
-import random
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Tuple
 from enum import Enum
 
+from .sim_random import sim_rng
+from .session_state import from_state, to_state
+
 
 class CareerLevel(Enum):
     """职业等级"""
@@ -162,16 +164,17 @@ class CareerSystem:
     def create_career(self, session_id: str, industry: Industry = None, 
                      level: CareerLevel = CareerLevel.JUNIOR) -> Career:
         """创建职业"""
+        rng = sim_rng("career")
         if industry is None:
-            industry = random.choice(list(Industry))
+            industry = rng.choice(list(Industry))
         
         # 生成薪资
         salary_range = SALARY_TABLE.get(industry, DEFAULT_SALARY).get(level, (8000, 15000))
-        base_salary = random.randint(salary_range[0], salary_range[1])
+        base_salary = rng.randint(salary_range[0], salary_range[1])
         
         # 公司规模影响
         company_sizes = ["startup", "medium", "large", "multinational"]
-        company_size = random.choice(company_sizes)
+        company_size = rng.choice(company_sizes)
         
         size_multipliers = {
             "startup": 0.85,
@@ -183,10 +186,10 @@ class CareerSystem:
         
         # 年终奖系数
         bonus_rates = {
-            "startup": random.uniform(0, 2),      # 0-2个月，不稳定
-            "medium": random.uniform(1, 3),       # 1-3个月
-            "large": random.uniform(2, 4),        # 2-4个月
-            "multinational": random.uniform(3, 6) # 3-6个月
+            "startup": rng.uniform(0, 2),      # 0-2个月，不稳定
+            "medium": rng.uniform(1, 3),       # 1-3个月
+            "large": rng.uniform(2, 4),        # 2-4个月
+            "multinational": rng.uniform(3, 6) # 3-6个月
         }
         
         career = Career(
@@ -195,7 +198,7 @@ class CareerSystem:
             company_size=company_size,
             base_salary=base_salary,
             bonus_rate=round(bonus_rates[company_size], 1),
-            stock_options=0 if company_size != "startup" else random.randint(0, 50000),
+            stock_options=0 if company_size != "startup" else rng.randint(0, 50000),
             years_in_position=0,
             total_experience=0,
             skills=[],
@@ -208,6 +211,7 @@ class CareerSystem:
     
     def get_monthly_salary(self, session_id: str) -> Dict:
         """获取月薪信息"""
+        rng = sim_rng("career")
         career = self.careers.get(session_id)
         if not career:
             return {"base_salary": 0, "total": 0}
@@ -216,7 +220,7 @@ class CareerSystem:
         base = career.base_salary
         
         # 绩效浮动 (-10% ~ +20%)
-        performance = random.uniform(-0.1, 0.2)
+        performance = rng.uniform(-0.1, 0.2)
         performance_bonus = int(base * performance)
         
         # 加班费（如果burnout高）
@@ -235,6 +239,7 @@ class CareerSystem:
     
     def get_annual_bonus(self, session_id: str, month: int) -> int:
         """获取年终奖（12月发放）"""
+        rng = sim_rng("career")
         if month != 12:
             return 0
         
@@ -243,13 +248,14 @@ class CareerSystem:
             return 0
         
         # 年终奖 = 月薪 × 系数 × 绩效调整
-        performance_factor = random.uniform(0.8, 1.5)
+        performance_factor = rng.uniform(0.8, 1.5)
         bonus = int(career.base_salary * career.bonus_rate * performance_factor)
         
         return bonus
     
     def check_promotion(self, session_id: str) -> Optional[Dict]:
         """检查是否有升职机会"""
+        rng = sim_rng("career")
         career = self.careers.get(session_id)
         if not career:
             return None
@@ -279,12 +285,12 @@ class CareerSystem:
         total_prob = base_prob + reputation_bonus + skill_bonus - burnout_penalty
         total_prob = max(0.05, min(0.5, total_prob))
         
-        if random.random() < total_prob:
+        if rng.random() < total_prob:
             next_level = self.LEVEL_ORDER[current_idx + 1]
             
             # 计算新薪资
             salary_range = SALARY_TABLE.get(career.industry, DEFAULT_SALARY).get(next_level, (20000, 35000))
-            new_salary = random.randint(salary_range[0], salary_range[1])
+            new_salary = rng.randint(salary_range[0], salary_range[1])
             
             # 确保涨薪
             new_salary = max(new_salary, int(career.base_salary * 1.2))
@@ -312,36 +318,37 @@ class CareerSystem:
     
     def check_job_opportunity(self, session_id: str) -> Optional[Dict]:
         """检查跳槽机会"""
+        rng = sim_rng("career")
         career = self.careers.get(session_id)
         if not career:
             return None
         
         # 每月5%概率收到猎头邀请
-        if random.random() > 0.05:
+        if rng.random() > 0.05:
             return None
         
         # 生成新机会
-        new_industry = random.choice(list(Industry))
+        new_industry = rng.choice(list(Industry))
         
         # 可能升一级或平级
         current_idx = self.LEVEL_ORDER.index(career.level)
-        if random.random() < 0.3 and current_idx < len(self.LEVEL_ORDER) - 1:
+        if rng.random() < 0.3 and current_idx < len(self.LEVEL_ORDER) - 1:
             new_level = self.LEVEL_ORDER[current_idx + 1]
         else:
             new_level = career.level
         
         # 新公司薪资（通常有溢价）
         salary_range = SALARY_TABLE.get(new_industry, DEFAULT_SALARY).get(new_level, (15000, 30000))
-        base_offer = random.randint(salary_range[0], salary_range[1])
+        base_offer = rng.randint(salary_range[0], salary_range[1])
         
         # 跳槽溢价 10-30%
-        premium = random.uniform(1.1, 1.3)
+        premium = rng.uniform(1.1, 1.3)
         offer_salary = int(base_offer * premium)
         
         # 确保比现在高
         offer_salary = max(offer_salary, int(career.base_salary * 1.15))
         
-        company_size = random.choice(["startup", "medium", "large", "multinational"])
+        company_size = rng.choice(["startup", "medium", "large", "multinational"])
         
         return {
             "type": "job_offer",
@@ -351,8 +358,8 @@ class CareerSystem:
             "offer_salary": offer_salary,
             "current_salary": career.base_salary,
             "increase_rate": round((offer_salary - career.base_salary) / career.base_salary * 100, 1),
-            "new_bonus_rate": round(random.uniform(1, 4), 1),
-            "stock_options": random.randint(0, 100000) if company_size == "startup" else 0
+            "new_bonus_rate": round(rng.uniform(1, 4), 1),
+            "stock_options": rng.randint(0, 100000) if company_size == "startup" else 0
         }
     
     def accept_job_offer(self, session_id: str, offer: Dict):
@@ -372,6 +379,7 @@ class CareerSystem:
     
     def check_layoff(self, session_id: str, economic_phase: str) -> Optional[Dict]:
         """检查裁员风险"""
+        rng = sim_rng("career")
         career = self.careers.get(session_id)
         if not career:
             return None
@@ -393,7 +401,7 @@ class CareerSystem:
         if career.reputation < 40:
             base_prob += 0.02
         
-        if random.random() < base_prob:
+        if rng.random() < base_prob:
             # 计算遣散费（N+1）
             months_worked = career.total_experience
             severance = career.base_salary * (months_worked // 12 + 1)
@@ -402,8 +410,8 @@ class CareerSystem:
             return {
                 "type": "layoff",
                 "severance": severance,
-                "unemployment_months": random.randint(1, 6),
-                "reason": random.choice([
+                "unemployment_months": rng.randint(1, 6),
+                "reason": rng.choice([
                     "公司业务调整",
                     "部门裁撤",
                     "经济下行裁员",
@@ -416,6 +424,7 @@ class CareerSystem:
     def start_side_business(self, session_id: str, business_type: SideBusinessType,
                            investment: int, current_month: int) -> Tuple[bool, str]:
         """开始副业"""
+        rng = sim_rng("career")
         if session_id not in self.side_businesses:
             self.side_businesses[session_id] = []
         
@@ -480,7 +489,7 @@ class CareerSystem:
             business_type=business_type,
             name=f"我的{business_type.value}",
             monthly_revenue=0,  # 初始没有收入
-            monthly_cost=random.randint(*config["cost_range"]),
+            monthly_cost=rng.randint(*config["cost_range"]),
             time_required=config["time_required"],
             start_month=current_month,
             success_rate=config["success_rate"],
@@ -492,6 +501,7 @@ class CareerSystem:
     
     def update_side_businesses(self, session_id: str, current_month: int) -> List[Dict]:
         """更新副业状态（每月调用）"""
+        rng = sim_rng("career")
         if session_id not in self.side_businesses:
             return []
         
@@ -506,7 +516,7 @@ class CareerSystem:
             # 成功概率随时间增加
             adjusted_rate = min(0.9, business.success_rate + months_running * 0.02)
             
-            if random.random() < adjusted_rate:
+            if rng.random() < adjusted_rate:
                 # 副业成功，产生收入
                 config = {
                     SideBusinessType.FREELANCE: (2000, 8000),
@@ -519,7 +529,7 @@ class CareerSystem:
                 
                 # 收入随经验增长
                 growth_factor = 1 + months_running * 0.05
-                revenue = int(random.randint(*revenue_range) * growth_factor)
+                revenue = int(rng.randint(*revenue_range) * growth_factor)
                 business.monthly_revenue = revenue
                 
                 net_income = revenue - business.monthly_cost
@@ -609,6 +619,7 @@ class CareerSystem:
     
     def advance_month(self, session_id: str):
         """月度更新"""
+        rng = sim_rng("career")
         career = self.careers.get(session_id)
         if career:
             career.years_in_position += 1
@@ -616,12 +627,40 @@ class CareerSystem:
             
             # 倦怠累积
             if career.burnout < 80:
-                career.burnout += random.randint(0, 3)
+                career.burnout += rng.randint(0, 3)
             
             # 休假可以降低倦怠（简化处理）
-            if random.random() < 0.1:
+            if rng.random() < 0.1:
                 career.burnout = max(0, career.burnout - 10)
     
+    def export_session(self, session_id: str) -> Dict:
+        """导出会话的职业状态（供会话状态存储）"""
+        state = {}
+        if session_id in self.careers:
+            state["career"] = to_state(self.careers[session_id])
+        if self.side_businesses.get(session_id):
+            state["side_businesses"] = to_state(self.side_businesses[session_id])
+        if self.passive_incomes.get(session_id):
+            state["passive_incomes"] = to_state(self.passive_incomes[session_id])
+        return state
+    
+    def import_session(self, session_id: str, state: Optional[Dict]):
+        """从会话状态存储还原职业状态"""
+        self.drop_session(session_id)
+        state = state or {}
+        if state.get("career"):
+            self.careers[session_id] = from_state(Career, state["career"])
+        if state.get("side_businesses"):
+            self.side_businesses[session_id] = from_state(List[SideBusiness], state["side_businesses"])
+        if state.get("passive_incomes"):
+            self.passive_incomes[session_id] = from_state(List[PassiveIncome], state["passive_incomes"])
+    
+    def drop_session(self, session_id: str):
+        """从内存中移除会话状态"""
+        self.careers.pop(session_id, None)
+        self.side_businesses.pop(session_id, None)
+        self.passive_incomes.pop(session_id, None)
+    
     def get_career_summary(self, session_id: str) -> Dict:
         """获取职业摘要"""
         career = self.careers.get(session_id)
@@ -798,6 +837,7 @@ class CareerSystem:
     
     def apply_for_job(self, session_id: str, job_id: str, player_skills: Dict = None) -> Dict:
         """申请职位"""
+        rng = sim_rng("career")
         try:
             parts = job_id.split("_")
             industry = Industry(parts[0])
@@ -807,7 +847,7 @@ class CareerSystem:
             career = Career(
                 industry=industry,
                 level=level,
-                company_size=random.choice(["small", "medium", "large"]),
+                company_size=rng.choice(["small", "medium", "large"]),
                 base_salary=self._calculate_base_salary(industry, level)
             )
             self.careers[session_id] = career
@@ -7,6 +7,8 @@ from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Tuple
 from enum import Enum
 
+from .session_state import from_state, to_state
+
 
 class IncomeType(Enum):
     """收入类型"""
@@ -491,6 +493,22 @@ class CashFlowSystem:
             "income_sources": len([i for i in self.incomes.values() if i.months_remaining != 0]),
             "expense_items": len([e for e in self.expenses.values() if e.months_remaining != 0])
         }
+    
+    def export_state(self) -> Dict:
+        """导出本会话的收支项与现金流记录（供会话状态存储）"""
+        return {
+            "city_level": self.city_level,
+            "incomes": to_state(self.incomes),
+            "expenses": to_state(self.expenses),
+            "history": self.history,
+        }
+    
+    def import_state(self, state: Dict):
+        """从会话状态存储还原"""
+        self.city_level = state.get("city_level", self.city_level)
+        self.incomes = from_state(Dict[str, IncomeItem], state.get("incomes", {}))
+        self.expenses = from_state(Dict[str, ExpenseItem], state.get("expenses", {}))
+        self.history = state.get("history", [])
 
 
 # 全局实例
@@ -8,6 +8,8 @@ from typing import Dict, List, Optional
 from enum import Enum
 from datetime import datetime
 
+from .session_state import from_state, to_state
+
 
 class LoanType(Enum):
     """贷款类型"""
@@ -464,6 +466,20 @@ class DebtSystem:
             }
             for loan in self.loans.values()
         ]
+    
+    def export_state(self) -> Dict:
+        """导出本会话的贷款与信用（供会话状态存储）"""
+        return {
+            "loans": to_state(self.loans),
+            "credit_score": self.credit_score,
+            "total_credit_limit": self.total_credit_limit,
+        }
+    
+    def import_state(self, state: Dict):
+        """从会话状态存储还原"""
+        self.loans = from_state(Dict[str, Loan], state.get("loans", {}))
+        self.credit_score = state.get("credit_score", 700)
+        self.total_credit_limit = state.get("total_credit_limit", 100000)
 
 
 # 全局实例
@@ -2,11 +2,12 @@
 事件系统 - EchoPolis
 丰富的随机事件：宏观事件、个人事件、投资机会事件
 """
-import random
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Callable
 from enum import Enum
 
+from .sim_random import sim_rng
+
 
 class EventCategory(Enum):
     """事件类别"""
@@ -598,6 +599,7 @@ class EventSystem:
     def get_random_events(self, session_id: str, current_month: int, 
                          total_assets: int, economic_phase: str = "expansion") -> List[GameEvent]:
         """获取本月可能触发的事件"""
+        rng = sim_rng("events")
         available_events = []
         triggered = self.triggered_events.get(session_id, [])
         
@@ -627,25 +629,26 @@ class EventSystem:
                 adjusted_prob *= 1.3
             
             # 随机决定是否触发
-            if random.random() < adjusted_prob:
+            if rng.random() < adjusted_prob:
                 available_events.append(event)
         
         # 限制每月最多3个事件
         if len(available_events) > 3:
-            available_events = random.sample(available_events, 3)
+            available_events = rng.sample(available_events, 3)
         
         return available_events
     
     def apply_event_choice(self, session_id: str, event: GameEvent, 
                           option_index: int, current_month: int) -> Dict:
         """应用事件选择的结果"""
+        rng = sim_rng("events")
         if option_index < 0 or option_index >= len(event.options):
             return {"success": False, "error": "无效选项"}
         
         option = event.options[option_index]
         
         # 判断成功/失败
-        is_success = random.random() < option.success_rate
+        is_success = rng.random() < option.success_rate
         impacts = option.impacts if is_success else option.fail_impacts
         
         # 记录触发
@@ -706,6 +709,29 @@ class EventSystem:
         self.active_effects[session_id] = remaining
         return active
     
+    def export_session(self, session_id: str) -> Dict:
+        """导出会话的事件状态（供会话状态存储）"""
+        state = {}
+        if self.triggered_events.get(session_id):
+            state["triggered_events"] = list(self.triggered_events[session_id])
+        if self.active_effects.get(session_id):
+            state["active_effects"] = [dict(effect) for effect in self.active_effects[session_id]]
+        return state
+    
+    def import_session(self, session_id: str, state: Optional[Dict]):
+        """从会话状态存储还原事件状态"""
+        state = state or {}
+        self.drop_session(session_id)
+        if state.get("triggered_events"):
+            self.triggered_events[session_id] = list(state["triggered_events"])
+        if state.get("active_effects"):
+            self.active_effects[session_id] = [dict(effect) for effect in state["active_effects"]]
+    
+    def drop_session(self, session_id: str):
+        """从内存中移除会话状态"""
+        self.triggered_events.pop(session_id, None)
+        self.active_effects.pop(session_id, None)
+    
     def get_event_by_id(self, event_id: str) -> Optional[GameEvent]:
         """根据ID获取事件"""
         for event in self.all_events:
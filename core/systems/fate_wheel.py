@@ -2,11 +2,12 @@
 命运轮盘系统 - FinAI核心模块
 决定AI化身的初始出身背景和特殊特质
 """
-import random
 from enum import Enum
 from typing import Dict, List, Tuple
 from dataclasses import dataclass
 
+from .sim_random import sim_rng
+
 class FateType(Enum):
     """命运类型枚举"""
     BILLIONAIRE = "亿万富豪"      # 亿万富豪
@@ -161,9 +162,10 @@ class FateWheelSystem:
     
     def spin_wheel(self) -> FateOutcome:
         """转动命运轮盘，随机选择一个命运"""
+        rng = sim_rng("fate")
         # 根据概率权重随机选择
         weights = [fate.probability for fate in self.fate_outcomes]
-        chosen_fate = random.choices(self.fate_outcomes, weights=weights)[0]
+        chosen_fate = rng.choices(self.fate_outcomes, weights=weights)[0]
         return chosen_fate
     
     def get_fate_by_type(self, fate_type: FateType) -> FateOutcome:
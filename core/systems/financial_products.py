@@ -2,11 +2,12 @@
 金融产品体系 - EchoPolis
 定义各类金融产品的风险收益特性
 """
-import random
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Callable
 from enum import Enum
 
+from .sim_random import sim_rng
+
 
 class RiskLevel(Enum):
     """风险等级"""
@@ -40,6 +41,7 @@ class ReturnProfile:
     
     def calculate_monthly_return(self, market_modifier: float = 0) -> float:
         """计算月度收益率"""
+        rng = sim_rng("products")
         if self.is_fixed:
             return self.expected_annual_return / 12
         
@@ -47,7 +49,7 @@ class ReturnProfile:
         monthly_vol = self.volatility / (12 ** 0.5)
         monthly_expected = self.expected_annual_return / 12
         
-        raw_return = random.gauss(monthly_expected, monthly_vol)
+        raw_return = rng.gauss(monthly_expected, monthly_vol)
         raw_return += market_modifier
         
         # 限制在合理范围内
@@ -553,6 +555,44 @@ class FinancialProductLibrary:
             "monthly_returns": [round(r * 100, 2) for r in monthly_returns]
         }
     
+    def _require_products(self, product_ids: List[str]) -> List[FinancialProduct]:
+        missing = [pid for pid in product_ids if pid not in self.products]
+        if missing:
+            raise ValueError(f"产品不存在: {', '.join(missing)}")
+        return [self.products[pid] for pid in product_ids]
+    
+    def simulate_scenarios(self,
+                           allocations: Dict[str, int],
+                           months: int,
+                           n_paths: int = 5000,
+                           seed: Optional[int] = None,
+                           market_modifier: float = 0) -> Dict:
+        """组合蒙特卡洛情景：分位带、VaR/CVaR、爆仓概率
+        
+        Args:
+            allocations: 产品ID -> 投资金额
+            months: 持有月数
+            n_paths: 模拟路径数
+            seed: 随机种子，相同种子结果相同
+            market_modifier: 市场影响因子
+        """
+        from .product_scenarios import simulate_portfolio
+        products = self._require_products(list(allocations))
+        return simulate_portfolio([(p, allocations[p.id]) for p in products],
+                                  months, n_paths, seed, market_modifier)
+    
+    def compare_products(self,
+                         product_ids: List[str],
+                         amount: int,
+                         months: int,
+                         n_paths: int = 5000,
+                         seed: Optional[int] = None,
+                         market_modifier: float = 0) -> List[Dict]:
+        """同一金额投入不同产品的蒙特卡洛情景对比"""
+        from .product_scenarios import compare_products
+        return compare_products(self._require_products(product_ids), amount, months,
+                                n_paths, seed, market_modifier)
+    
     def get_product_summary(self) -> Dict:
         """获取产品库摘要"""
         summary = {
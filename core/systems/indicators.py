@@ -0,0 +1,315 @@
+"""
+增量技术指标 - 每根新K线 O(1) 更新，不再每次从完整历史重新统计
+基础结构：
+- RollingStats: 固定窗口的均值/方差（Welford 算法，窗口满时先移除最旧值）
+- EMA: 指数移动平均
+- RollingExtreme: 单调队列维护窗口最大/最小值（每个元素最多入队出队一次）
+在此之上 StockIndicators 维护单只股票的 MA5/10/20/60、布林带、RSI、MACD、支撑位和阻力位；
+PatternStats 以向量方式维护全部股票的收益率统计，供 MarketEngine.advance_day 生成下一交易日
+（口径与 market_kernel.pattern_stats 整窗口重新统计一致，每个交易日 O(N) 更新）。
+"""
+import math
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+
+from .market_kernel import MIN_PATTERN_DAYS
+
+MA_PERIODS = (5, 10, 20, 60)
+BOLL_PERIOD, BOLL_WIDTH = 20, 2.0
+RSI_PERIOD = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+PATTERN_TREND_DAYS, PATTERN_MOMENTUM_DAYS = 20, 5
+SUPPORT_DAYS = 60
+VOLUME_DAYS = 20
+PATTERN_RESYNC_DAYS = 250  # PatternStats 的累计和每隔这么多个交易日从窗口重新统计一次，避免浮点误差累积
+
+
+class RollingStats:
+    """固定窗口的均值与总体方差（Welford）"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.values = deque()
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def push(self, x: float):
+        if len(self.values) == self.size:
+            old = self.values.popleft()
+            n = len(self.values)
+            if n == 0:
+                self.mean, self._m2 = 0.0, 0.0
+            else:
+                delta = old - self.mean
+                self.mean -= delta / n
+                self._m2 -= delta * (old - self.mean)
+        self.values.append(x)
+        delta = x - self.mean
+        self.mean += delta / len(self.values)
+        self._m2 += delta * (x - self.mean)
+
+    @property
+    def count(self) -> int:
+        return len(self.values)
+
+    @property
+    def full(self) -> bool:
+        return len(self.values) == self.size
+
+    @property
+    def variance(self) -> float:
+        return max(self._m2, 0.0) / len(self.values) if self.values else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class EMA:
+    """指数移动平均，以第一个值为初值"""
+
+    def __init__(self, span: int):
+        self.alpha = 2.0 / (span + 1)
+        self.value: Optional[float] = None
+
+    def push(self, x: float) -> float:
+        self.value = x if self.value is None else self.value + self.alpha * (x - self.value)
+        return self.value
+
+
+class RollingExtreme:
+    """单调队列：窗口内最大值（mode="max"）或最小值（mode="min"）"""
+
+    def __init__(self, size: int, mode: str = "max"):
+        self.size = size
+        self._better = (lambda a, b: a >= b) if mode == "max" else (lambda a, b: a <= b)
+        self._queue = deque()  # (序号, 值)，值单调
+        self._index = 0
+
+    def push(self, x: float):
+        while self._queue and self._better(x, self._queue[-1][1]):
+            self._queue.pop()
+        self._queue.append((self._index, x))
+        if self._queue[0][0] <= self._index - self.size:
+            self._queue.popleft()
+        self._index += 1
+
+    @property
+    def value(self) -> Optional[float]:
+        return self._queue[0][1] if self._queue else None
+
+
+class RSI:
+    """相对强弱指数（Wilder 平滑）"""
+
+    def __init__(self, period: int = RSI_PERIOD):
+        self.period = period
+        self._count = 0
+        self._gain = 0.0
+        self._loss = 0.0
+
+    def push(self, change: float):
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        if self._count < self.period:
+            # 前 period 个变化取简单平均
+            self._count += 1
+            self._gain += (gain - self._gain) / self._count
+            self._loss += (loss - self._loss) / self._count
+        else:
+            self._gain = (self._gain * (self.period - 1) + gain) / self.period
+            self._loss = (self._loss * (self.period - 1) + loss) / self.period
+
+    @property
+    def value(self) -> Optional[float]:
+        if self._count < self.period:
+            return None
+        if self._loss == 0:
+            return 100.0
+        return 100.0 - 100.0 / (1.0 + self._gain / self._loss)
+
+
+class StockIndicators:
+    """单只股票的增量指标，按时间顺序逐根喂入K线"""
+
+    def __init__(self):
+        self.count = 0
+        self.last_close: Optional[float] = None
+        self.ma = {period: RollingStats(period) for period in MA_PERIODS}
+        self.rsi = RSI()
+        self.ema_fast, self.ema_slow, self.dea = EMA(MACD_FAST), EMA(MACD_SLOW), EMA(MACD_SIGNAL)
+        self.dif: Optional[float] = None
+        self.support = RollingExtreme(SUPPORT_DAYS, "min")
+        self.resistance = RollingExtreme(SUPPORT_DAYS, "max")
+
+    def push(self, high: float, low: float, close: float, volume: float):
+        """喂入一根K线，O(1)"""
+        if self.last_close is not None:
+            self.rsi.push(close - self.last_close)
+        for stats in self.ma.values():
+            stats.push(close)
+        self.dif = self.ema_fast.push(close) - self.ema_slow.push(close)
+        self.dea.push(self.dif)
+        self.support.push(low)
+        self.resistance.push(high)
+        self.last_close = close
+        self.count += 1
+
+    def snapshot(self) -> Dict:
+        """技术指标快照：MA5/10/20/60、布林带、RSI、MACD（数据不足时为 None）"""
+        def _round(value):
+            return round(value, 4) if value is not None else None
+
+        result = {f"ma{period}": _round(stats.mean) if stats.full else None for period, stats in self.ma.items()}
+        boll = self.ma[BOLL_PERIOD]
+        result["boll"] = {
+            "mid": _round(boll.mean),
+            "upper": _round(boll.mean + BOLL_WIDTH * boll.std),
+            "lower": _round(boll.mean - BOLL_WIDTH * boll.std),
+        } if boll.full else None
+        result["rsi"] = _round(self.rsi.value)
+        result["macd"] = {
+            "dif": _round(self.dif),
+            "dea": _round(self.dea.value),
+            "hist": _round(2 * (self.dif - self.dea.value)),
+        } if self.dif is not None else None
+        result["support"] = _round(self.support.value)
+        result["resistance"] = _round(self.resistance.value)
+        result["candles"] = self.count
+        return result
+
+
+class PatternStats:
+    """
+    全部股票的收益率统计（向量化）：窗口内收益率的环形缓冲区 + 累计和 / 平方和 / 个数，
+    每个交易日只加入一列新收益率、减去移出窗口的一列，O(N)。
+    近 20/5 日收益率均值取环形缓冲区的最近几列，近 60 日高低点和近 20 日均量取 KlineStore 的窄窗口。
+    """
+
+    def __init__(self, store):
+        n = len(store.codes)
+        self.size = store.window - 1  # 窗口内 window 根收盘价对应 window - 1 个收益率
+        self.returns = np.full((n, self.size), np.nan)
+        self.head = 0  # 下一个收益率写入的列
+        close = store.matrix()["close"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            prev = close[:, :-1]
+            returns = np.where(prev > 0, (close[:, 1:] - prev) / prev, np.nan)
+        days = returns.shape[1]
+        if days:
+            self.returns[:, :days] = returns
+        self.head = days % self.size
+        valid = ~np.isnan(self.returns)
+        filled = np.where(valid, self.returns, 0.0)
+        self.sum = filled.sum(axis=1)
+        self.squares = (filled ** 2).sum(axis=1)
+        self.count = valid.sum(axis=1)
+        self.last_close = store.latest("close").copy()
+        self.pushed = 0
+
+    def push(self, close: np.ndarray):
+        """加入一个交易日的收盘价（N,）"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ret = np.where(self.last_close > 0, (close - self.last_close) / self.last_close, np.nan)
+        old = self.returns[:, self.head]
+        for value, sign in ((old, -1.0), (ret, 1.0)):
+            valid = ~np.isnan(value)
+            filled = np.where(valid, value, 0.0)
+            self.sum += sign * filled
+            self.squares += sign * filled ** 2
+            self.count += (sign * valid).astype(self.count.dtype)
+        self.returns[:, self.head] = ret
+        self.head = (self.head + 1) % self.size
+        self.last_close = np.array(close, dtype=float)
+        self.pushed += 1
+
+    def _recent_mean(self, days: int) -> np.ndarray:
+        columns = [(self.head - 1 - k) % self.size for k in range(min(days, self.size))]
+        with np.errstate(invalid="ignore"):
+            recent = self.returns[:, columns]
+            count = np.sum(~np.isnan(recent), axis=1)
+            return np.where(count > 0, np.nansum(recent, axis=1) / np.maximum(count, 1), np.nan)
+
+    def stats(self, store, volatility: np.ndarray, prev_close: np.ndarray) -> Dict[str, np.ndarray]:
+        """字段与口径同 market_kernel.pattern_stats"""
+        days = np.minimum(store.lengths, store.span())
+        valid = days >= MIN_PATTERN_DAYS
+        has_returns = self.count > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(has_returns, self.sum / np.maximum(self.count, 1), 0.0)
+            variance = np.maximum(np.where(has_returns, self.squares / np.maximum(self.count, 1), 0.0) - mean ** 2,
+                                  0.0)
+            trend = np.where(has_returns, self._recent_mean(PATTERN_TREND_DAYS), 0.0)
+            momentum = np.where(has_returns, self._recent_mean(PATTERN_MOMENTUM_DAYS), 0.0) - trend
+            recent = store.matrix(SUPPORT_DAYS)
+            support = np.nanmin(np.where(valid[:, None], recent["low"], 0.0), axis=1)
+            resistance = np.nanmax(np.where(valid[:, None], recent["high"], 0.0), axis=1)
+            volume = store.matrix(VOLUME_DAYS)["volume"]
+            avg_volume = np.nanmean(np.where(days[:, None] > 0, volume, 0.0), axis=1)
+        return {
+            "volatility": np.where(valid, np.sqrt(variance), volatility),
+            "avg_return": np.where(valid, mean, 0.0),
+            "trend": np.where(valid, trend, 0.0),
+            "momentum": np.where(valid, momentum, 0.0),
+            "support": np.where(valid, support, prev_close * 0.9),
+            "resistance": np.where(valid, resistance, prev_close * 1.1),
+            "avg_volume": np.where(days > 0, avg_volume, np.nan),
+        }
+
+
+class IndicatorEngine:
+    """
+    所有股票的增量指标。按需追赶：读取某只股票的指标时，只把上次读取之后新追加到
+    KlineStore 的K线喂入（每根 O(1)），推进行情的热路径不受影响。
+    advance_day 的统计特征由 PatternStats 维护，每个交易日只追赶新增的一列。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states: Dict[str, StockIndicators] = {}
+        self._seen: Dict[str, int] = {}   # 已喂入的K线对应的 KlineStore.appended 位置
+        self._store_id: Optional[int] = None
+        self._pattern: Optional[PatternStats] = None
+        self._pattern_seen = 0
+        self._pattern_store_id: Optional[int] = None
+
+    def get(self, store, code: str) -> StockIndicators:
+        """返回与 store 最新数据同步的指标"""
+        with self._lock:
+            if self._store_id != id(store):
+                # 存储被替换（重新加载/重新生成）时全部重建
+                self._states.clear()
+                self._seen.clear()
+                self._store_id = id(store)
+
+            length = int(store.lengths[store.rows[code]])
+            state = self._states.get(code)
+            missing = store.appended - self._seen.get(code, 0)
+            if state is None or missing > length:
+                # 首次读取，或落后太多（缺失的K线已移出窗口）：从窗口内全部历史重建
+                state = self._states[code] = StockIndicators()
+                missing = length
+            if missing > 0:
+                for _, _, high, low, close, volume, _ in store.records(code, length - missing, length):
+                    state.push(high, low, close, volume)
+            self._seen[code] = store.appended
+            return state
+
+    def pattern_stats(self, store, volatility: np.ndarray, prev_close: np.ndarray) -> Dict[str, np.ndarray]:
+        """advance_day 使用的全部股票统计特征（与 market_kernel.pattern_stats 同口径），先追赶新增的交易日"""
+        with self._lock:
+            missing = store.appended - self._pattern_seen
+            pattern = self._pattern
+            if (pattern is None or self._pattern_store_id != id(store) or missing > store.span()
+                    or pattern.pushed + missing > PATTERN_RESYNC_DAYS):
+                # 首次使用、存储被替换、落后超过窗口，或累计和需要校准：从窗口重新统计
+                pattern = self._pattern = PatternStats(store)
+                self._pattern_store_id = id(store)
+            elif missing > 0:
+                close = store.matrix(missing)["close"]
+                for day in range(close.shape[1]):
+                    pattern.push(close[:, day])
+            self._pattern_seen = store.appended
+            return pattern.stats(store, volatility, prev_close)
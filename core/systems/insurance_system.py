@@ -3,11 +3,13 @@
 提供各类保险产品，抵御风险事件
 """
 import time
-import random
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional
 from enum import Enum
 
+from .sim_random import sim_rng
+from .session_state import from_state, to_state
+
 
 class InsuranceType(Enum):
     """保险类型"""
@@ -364,6 +366,7 @@ class InsuranceSystem:
         Returns:
             (success, claim_result)
         """
+        rng = sim_rng("insurance")
         policy = self.policies.get(policy_id)
         if not policy:
             return False, "保单不存在"
@@ -380,7 +383,7 @@ class InsuranceSystem:
         payout = int(after_deductible * policy.coverage_ratio)
         
         # 模拟理赔审核（90%通过率）
-        approved = random.random() < 0.9
+        approved = rng.random() < 0.9
         
         claim = InsuranceClaim(
             id=f"CLM_{int(time.time())}",
@@ -475,6 +478,20 @@ class InsuranceSystem:
             advice.append("✅ 当前保险配置合理")
         
         return advice
+    
+    def export_state(self) -> Dict:
+        """导出本会话的保单与理赔（供会话状态存储）"""
+        return {
+            "policies": to_state(self.policies),
+            "claims": to_state(self.claims),
+            "current_month": self.current_month,
+        }
+    
+    def import_state(self, state: Dict):
+        """从会话状态存储还原"""
+        self.policies = from_state(Dict[str, InsurancePolicy], state.get("policies", {}))
+        self.claims = from_state(List[InsuranceClaim], state.get("claims", []))
+        self.current_month = state.get("current_month", 0)
 
 
 # 全局实例
@@ -0,0 +1,221 @@
+"""
+历史K线抓取器 - 并发抓取各股票缺失的日期区间
+替代原先逐只股票串行抓取、每只之间固定 sleep 0.5 秒的做法：
+- 令牌桶限速：所有工作线程共用一个桶，平均请求速率不超过 rate，允许 burst 个请求的突发；
+  数据源返回限流（HTTP 429）时清空令牌桶，所有线程一起退避
+- 增量抓取：每只股票只请求 (已覆盖日期, 结束日期] 区间，已是最新的股票不发请求
+- 断点续传：每抓完一段就在同一事务里写入K线并推进该股票的断点（kline_fetch_checkpoints），
+  中途失败或进程退出后重跑只会抓取剩下的区间；没有交易日的区间（停牌、节假日）同样记入断点，不会反复请求
+- 较长的区间按 chunk_days 天分段请求，每段一个断点
+数据源只需实现 fetch(symbol, start, end) -> [{"timestamp", "open", "high", "low", "close", "volume"}, ...]。
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+FETCH_WORKERS = int(os.getenv("ECHOPOLIS_KLINE_FETCH_WORKERS", "4"))   # 并发抓取线程数
+FETCH_RATE = float(os.getenv("ECHOPOLIS_KLINE_FETCH_RATE", "5"))       # 平均每秒请求数
+FETCH_BURST = int(os.getenv("ECHOPOLIS_KLINE_FETCH_BURST", "4"))       # 令牌桶容量（允许的突发请求数）
+QUOTE_SOURCE_URL = os.getenv("ECHOPOLIS_QUOTE_SOURCE_URL")            # 设置后使用 HTTP 数据源
+CHUNK_DAYS = 365       # 单次请求的最大日历天数
+MAX_ATTEMPTS = 4       # 单段请求的最多尝试次数
+RETRY_BACKOFF = 0.5    # 重试退避基数（秒），按 2 的幂增长
+
+
+class RateLimited(Exception):
+    """数据源要求限流（HTTP 429）"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """线程安全的令牌桶"""
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，没有令牌时阻塞到下一个令牌生成"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """清空令牌并透支 seconds 秒：所有线程在这段时间内都拿不到令牌"""
+        with self._lock:
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class SdkQuoteSource:
+    """Longbridge SDK 数据源"""
+
+    def __init__(self, client):
+        self.client = client
+
+    @property
+    def available(self) -> bool:
+        return self.client._init_quote_context() is not None
+
+    def fetch(self, symbol: str, start: date, end: date) -> List[Dict]:
+        return self.client.get_kline_range(symbol, start, end)
+
+
+class HttpQuoteSource:
+    """
+    HTTP 数据源：GET {base_url}/v1/candlesticks?symbol=&start=YYYY-MM-DD&end=YYYY-MM-DD
+    返回 {"candles": [...]}；429 响应按 Retry-After 退避。用于本地行情代理和测试用的假行情服务。
+    """
+
+    available = True
+
+    def __init__(self, base_url: str, timeout: float = 10.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def fetch(self, symbol: str, start: date, end: date) -> List[Dict]:
+        resp = self._session().get(f"{self.base_url}/v1/candlesticks", timeout=self.timeout, params={
+            "symbol": symbol, "start": start.isoformat(), "end": end.isoformat(),
+        })
+        if resp.status_code == 429:
+            raise RateLimited(float(resp.headers.get("Retry-After", 1)))
+        resp.raise_for_status()
+        return resp.json().get("candles", [])
+
+
+def default_quote_source(client):
+    """默认数据源：设置了 ECHOPOLIS_QUOTE_SOURCE_URL 时用 HTTP 数据源，否则用 Longbridge SDK"""
+    if QUOTE_SOURCE_URL:
+        return HttpQuoteSource(QUOTE_SOURCE_URL)
+    return SdkQuoteSource(client)
+
+
+class KlineFetcher:
+    """并发、限速、可续传的历史K线抓取器"""
+
+    def __init__(self, client, source, workers: int = FETCH_WORKERS, rate: float = FETCH_RATE,
+                 burst: int = FETCH_BURST, chunk_days: int = CHUNK_DAYS, end: Optional[date] = None):
+        """
+        Args:
+            client: LongbridgeClient（读取覆盖日期、写入K线与断点）
+            source: 数据源，fetch(symbol, start, end)
+            end: 抓取的结束日期，默认今天
+        """
+        self.client = client
+        self.source = source
+        self.workers = max(1, workers)
+        self.bucket = TokenBucket(rate, burst)
+        self.chunk_days = chunk_days
+        self.end = end or date.today()
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "rows": 0,
+                      "symbols_fetched": 0, "symbols_up_to_date": 0, "symbols_failed": 0}
+
+    def _count(self, key: str, value: int = 1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def plan(self, days: int) -> Dict[str, List[Tuple[date, date]]]:
+        """每只股票需要请求的日期区间（已分段）；已是最新的股票不在结果中"""
+        from .longbridge_client import STOCK_MAPPING
+        earliest = self.end - timedelta(days=days - 1)  # 含结束日期在内共 days 个日历日
+        covered = self.client.get_kline_fetch_state(list(STOCK_MAPPING))
+        plan = {}
+        for game_code, through in covered.items():
+            start = earliest
+            if through:
+                start = max(start, datetime.strptime(through[:10], "%Y-%m-%d").date() + timedelta(days=1))
+            chunks = []
+            while start <= self.end:
+                chunk_end = min(self.end, start + timedelta(days=self.chunk_days - 1))
+                chunks.append((start, chunk_end))
+                start = chunk_end + timedelta(days=1)
+            if chunks:
+                plan[game_code] = chunks
+        return plan
+
+    def _fetch_chunk(self, symbol: str, start: date, end: date) -> List[Dict]:
+        """带限速和重试的单段请求"""
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self.bucket.acquire()
+            self._count("requests")
+            try:
+                return self.source.fetch(symbol, start, end)
+            except RateLimited as e:
+                self._count("rate_limited")
+                self.bucket.pause(e.retry_after)
+                if attempt == MAX_ATTEMPTS:
+                    raise
+            except Exception:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            self._count("retries")
+
+    def _fetch_symbol(self, game_code: str, chunks: List[Tuple[date, date]]) -> int:
+        """按顺序抓取一只股票的各段区间，每段写入后推进断点"""
+        from .longbridge_client import STOCK_MAPPING, scale_klines
+        real_symbol, _, scale = STOCK_MAPPING[game_code][:3]
+        rows = 0
+        for start, end in chunks:
+            klines = scale_klines(self._fetch_chunk(real_symbol, start, end), scale)
+            self.client.save_kline_chunk(game_code, klines, end.isoformat())
+            rows += len(klines)
+        return rows
+
+    def run(self, days: int = 365) -> Dict[str, int]:
+        """抓取所有股票的缺失区间，返回 {game_code: 本次获取到的K线数量}"""
+        from .longbridge_client import STOCK_MAPPING
+        results = {game_code: 0 for game_code in STOCK_MAPPING}
+        if not getattr(self.source, "available", True):
+            print("[KlineFetcher] 行情数据源不可用，跳过抓取")
+            return results
+
+        started = time.perf_counter()
+        plan = self.plan(days)
+        self.stats["symbols_up_to_date"] = len(STOCK_MAPPING) - len(plan)
+        print(f"[KlineFetcher] {len(plan)} stocks to fetch ({sum(len(c) for c in plan.values())} requests), "
+              f"{self.stats['symbols_up_to_date']} up to date, workers={self.workers}, rate={self.bucket.rate}/s")
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="echopolis-kline-fetch") as pool:
+            futures = {game_code: pool.submit(self._fetch_symbol, game_code, chunks)
+                       for game_code, chunks in plan.items()}
+            for game_code, future in futures.items():
+                try:
+                    results[game_code] = future.result()
+                    self._count("symbols_fetched")
+                    self._count("rows", results[game_code])
+                except Exception as e:
+                    self._count("symbols_failed")
+                    print(f"[KlineFetcher] Error fetching {game_code}: {e}（已完成的区间已保存，重跑时继续）")
+
+        self.stats["seconds"] = round(time.perf_counter() - started, 3)
+        self.stats["throttled_seconds"] = round(self.bucket.waited, 3)
+        print(f"[KlineFetcher] Finished: {self.stats}")
+        return results
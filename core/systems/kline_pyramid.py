@@ -0,0 +1,122 @@
+"""
+多周期K线金字塔 - 周K/月K/季K随日K追加增量维护，与日K一起存放在 KlineStore 中
+每个周期一组 (N, capacity) 数组（开/高/低/收/量 + 首个交易日日期 + 周期编号），每只股票左对齐：
+- 追加一天：周期编号与最后一根相同则就地更新高/低/收/量，否则新开一根（所有股票一次向量化完成）
+- 周期编号直接由日期序数算出，不解析日期字符串：周 = (序数 - 1) // 7（序数 1 为周一），
+  月 = 1970 年以来的月数，季 = 月 // 3
+- 启动时由日K窗口重建；运行期间保留最近 keep 根，比日K窗口覆盖更长的时间
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+
+_EPOCH_ORDINAL = 719163  # date(1970, 1, 1).toordinal()
+
+BAR_FIELDS = ("open", "high", "low", "close", "volume")
+PERIOD_KEEP = {"week": 104, "month": 60, "quarter": 20}  # 每个周期保留的K线根数
+
+
+def period_keys(ordinals: np.ndarray, period: str) -> np.ndarray:
+    """日期序数 → 周期编号（同一周/月/季的日期编号相同）"""
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    if period == "week":
+        return (ordinals - 1) // 7
+    months = (ordinals - _EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    return months if period == "month" else months // 3
+
+
+class BarSeries:
+    """单个周期所有股票的聚合K线"""
+
+    def __init__(self, period: str, n_stocks: int, keep: int):
+        self.period = period
+        self.keep = keep
+        self.capacity = keep * 2
+        shape = (n_stocks, self.capacity)
+        self.columns = {field: np.full(shape, np.nan) for field in BAR_FIELDS}
+        self.dates = np.zeros(shape, dtype=np.int32)
+        self.counts = np.zeros(n_stocks, dtype=np.int64)
+        self.last_key = np.full(n_stocks, -1, dtype=np.int64)
+
+    def build_row(self, row: int, daily: Dict[str, np.ndarray], ordinals: np.ndarray):
+        """由某只股票的日K（已去掉空位，按日期升序）整体重建"""
+        if not len(ordinals):
+            return
+        keys = period_keys(ordinals, self.period)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])[-self.keep:]
+        ends = np.r_[starts[1:], len(keys)] - 1
+        count = len(starts)
+        self.columns["open"][row, :count] = daily["open"][starts]
+        self.columns["high"][row, :count] = np.maximum.reduceat(daily["high"][starts[0]:], starts - starts[0])
+        self.columns["low"][row, :count] = np.minimum.reduceat(daily["low"][starts[0]:], starts - starts[0])
+        self.columns["close"][row, :count] = daily["close"][ends]
+        self.columns["volume"][row, :count] = np.add.reduceat(daily["volume"][starts[0]:], starts - starts[0])
+        self.dates[row, :count] = ordinals[starts]
+        self.counts[row] = count
+        self.last_key[row] = keys[-1]
+
+    def push(self, day: Dict[str, np.ndarray], ordinal: int):
+        """所有股票追加同一交易日的日K（各字段 (N,)），O(N) 向量化"""
+        key = int(period_keys(np.array([ordinal]), self.period)[0])
+        same = (self.last_key == key) & (self.counts > 0)
+        if np.any(self.counts[~same] >= self.capacity):
+            self._compact()
+        rows = np.arange(len(self.counts))
+        col = np.where(same, self.counts - 1, self.counts)
+
+        high, low, volume = self.columns["high"], self.columns["low"], self.columns["volume"]
+        self.columns["open"][rows, col] = np.where(same, self.columns["open"][rows, col], day["open"])
+        high[rows, col] = np.where(same, np.fmax(high[rows, col], day["high"]), day["high"])
+        low[rows, col] = np.where(same, np.fmin(low[rows, col], day["low"]), day["low"])
+        self.columns["close"][rows, col] = day["close"]
+        volume[rows, col] = np.where(same, volume[rows, col] + day["volume"], day["volume"])
+        self.dates[rows, col] = np.where(same, self.dates[rows, col], ordinal)
+        self.counts += ~same
+        self.last_key[:] = key
+
+    def _compact(self):
+        """每只股票只保留最近 keep 根并左移"""
+        shift = np.maximum(self.counts - self.keep, 0)[:, None]
+        index = np.minimum(np.arange(self.capacity)[None, :] + shift, self.capacity - 1)
+        valid = np.arange(self.capacity)[None, :] < (self.counts[:, None] - shift)
+        for field in BAR_FIELDS:
+            self.columns[field] = np.where(valid, np.take_along_axis(self.columns[field], index, axis=1), np.nan)
+        self.dates = np.where(valid, np.take_along_axis(self.dates, index, axis=1), 0).astype(np.int32)
+        self.counts -= shift[:, 0]
+
+    def bars(self, row: int, limit: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """某只股票最近 limit 根K线（各字段一维数组，按日期升序）"""
+        count = int(self.counts[row])
+        lo = max(0, count - limit) if limit else 0
+        result = {field: self.columns[field][row, lo:count] for field in BAR_FIELDS}
+        result["date"] = self.dates[row, lo:count]
+        return result
+
+
+class KlinePyramid:
+    """周K/月K/季K"""
+
+    PERIODS = tuple(PERIOD_KEEP)
+
+    def __init__(self, n_stocks: int):
+        self.series = {period: BarSeries(period, n_stocks, keep) for period, keep in PERIOD_KEEP.items()}
+
+    @classmethod
+    def from_daily(cls, columns: Dict[str, np.ndarray], dates: np.ndarray) -> "KlinePyramid":
+        """由日K矩阵（各字段 (N, T)，空位为 NaN/0）重建"""
+        pyramid = cls(dates.shape[0])
+        for row in range(dates.shape[0]):
+            valid = dates[row] > 0
+            if not valid.any():
+                continue
+            daily = {field: columns[field][row][valid] for field in BAR_FIELDS}
+            for series in pyramid.series.values():
+                series.build_row(row, daily, dates[row][valid])
+        return pyramid
+
+    def push_days(self, batch: Dict[str, np.ndarray], ordinals: List[int]):
+        """追加若干交易日（batch 各字段 (days, N)）"""
+        for d, ordinal in enumerate(ordinals):
+            day = {field: batch[field][d] for field in BAR_FIELDS}
+            for series in self.series.values():
+                series.push(day, ordinal)
@@ -0,0 +1,393 @@
+"""
+列式K线存储 - 所有股票共享的二维数组 + 日期索引，可持久化为内存映射文件
+替代每只股票一个 List[OHLCV] 的存储方式：
+- 每个字段一个 (N, capacity) 的 float64 数组，日期为同形状的 int32（date.toordinal，0 表示空）
+- 所有股票同步追加，第 i 只股票的有效数据位于 [end - lengths[i], end)，左侧以 NaN 填充
+- 写满时把最近 window 列整体搬回开头（均摊 O(1)）
+- 任意长度的近期窗口都是一次切片（视图，不复制）；移动均值/标准差由收盘价前缀和两次相减得到
+- 持久化为 <目录>/<字段>.npy + meta.json，启动时以 mmap 打开，无需逐股票查询数据库
+- 多进程（uvicorn --workers N、世界时钟进程池）共用一个目录时只有一个写入进程：
+  先拿到 writer.lock 独占 flock 的进程以 r+ 映射并负责追加与落盘，其余进程只读打开，
+  在共享锁下把当前数据复制到本进程内存，之后的追加只留在本进程，不写文件；
+  写入进程的追加 / 压缩 / 落盘持有 data.lock 独占锁，读取进程不会读到写了一半的数据
+- 周K/月K/季K（KlinePyramid）随日K一起增量维护
+"""
+import json
+import os
+import uuid
+from collections.abc import Sequence
+from contextlib import contextmanager
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl  # 仅 POSIX 可用；没有时按单进程处理（总是写入进程）
+except ImportError:
+    fcntl = None
+
+from .market_kernel import KLINE_FIELDS, HISTORY_DAYS
+from .kline_pyramid import KlinePyramid, BAR_FIELDS
+
+DATE_FIELD = "date"
+META_FILE = "meta.json"
+RECORD_FIELDS = (DATE_FIELD,) + KLINE_FIELDS  # from_records 接收的记录字段顺序
+WRITER_LOCK = "writer.lock"  # 持有独占锁的进程是该目录唯一的写入进程（持有到进程退出）
+DATA_LOCK = "data.lock"      # 写入时独占、读取快照时共享
+
+_writer_locks: Dict[str, object] = {}  # 本进程已成为写入进程的目录 → 锁文件
+
+
+def _acquire_writer(directory: str) -> bool:
+    """尝试成为 directory 的写入进程（非阻塞），本进程已经是写入进程时直接返回 True"""
+    key = os.path.realpath(directory)
+    if key in _writer_locks:
+        return True
+    if fcntl is not None:
+        os.makedirs(directory, exist_ok=True)
+        handle = open(os.path.join(directory, WRITER_LOCK), "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        _writer_locks[key] = handle
+    else:
+        _writer_locks[key] = None
+    return True
+
+
+@contextmanager
+def _data_lock(directory: Optional[str], exclusive: bool):
+    """目录的数据锁（未持久化或没有 fcntl 时为空操作）"""
+    if not directory or fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, DATA_LOCK), "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _to_ordinal(value: str) -> int:
+    return date.fromisoformat(value[:10]).toordinal() if value else 0
+
+
+def _to_date(ordinal: int) -> str:
+    return date.fromordinal(ordinal).isoformat() if ordinal > 0 else ""
+
+
+def _reduce(ufunc, values: np.ndarray) -> np.ndarray:
+    """沿最后一维归约并忽略 NaN（fmax/fmin），空窗口返回 NaN"""
+    if values.shape[-1] == 0:
+        return np.full(values.shape[:-1], np.nan)
+    return ufunc.reduce(values, axis=-1)
+
+
+class KlineStore:
+    """列式K线存储"""
+
+    def __init__(self, codes: List[str], window: int = HISTORY_DAYS, capacity: Optional[int] = None,
+                 arrays: Optional[Dict[str, np.ndarray]] = None):
+        """
+        Args:
+            codes: 股票代码（行顺序）
+            window: 每只股票保留的最大历史长度
+            capacity: 数组列数，默认 2 × window（写满后压缩）
+            arrays: 已有数组（从内存映射文件打开时使用），默认新建并以 NaN 填充
+        """
+        self.codes = list(codes)
+        self.rows = {code: i for i, code in enumerate(self.codes)}
+        self.window = window
+        self.capacity = capacity or window * 2
+        shape = (len(self.codes), self.capacity)
+        if arrays is None:
+            arrays = {field: np.full(shape, np.nan) for field in KLINE_FIELDS}
+            arrays[DATE_FIELD] = np.zeros(shape, dtype=np.int32)
+        self.columns: Dict[str, np.ndarray] = {field: arrays[field] for field in KLINE_FIELDS}
+        self.dates: np.ndarray = arrays[DATE_FIELD]
+        self.lengths = np.zeros(len(self.codes), dtype=np.int64)
+        self.end = 0
+        self.appended = 0  # 本进程内累计追加的交易日数（压缩不影响），供增量计算定位新数据
+        self.token = uuid.uuid4().hex[:8]  # 存储实例标识，与 appended 一起构成数据版本
+        self._pyramid: Optional[KlinePyramid] = None
+        self.directory: Optional[str] = None
+        self.writable = False  # 是否是 directory 的写入进程（只读打开时追加只留在内存中）
+        self._prefix: Optional[Dict[str, np.ndarray]] = None  # 收盘价前缀和，首次计算移动统计时构建
+
+    # ==================== 构建与持久化 ====================
+
+    @classmethod
+    def from_records(cls, codes: List[str], records: Dict[str, List[tuple]],
+                     window: int = HISTORY_DAYS) -> "KlineStore":
+        """由每只股票按日期升序的 (date, open, high, low, close, volume, change_pct) 记录构建，各股票右对齐"""
+        store = cls(codes, window)
+        span = min(max((len(rows) for rows in records.values()), default=0), window)
+        for code, rows in records.items():
+            row = store.rows.get(code)
+            if row is None or not rows:
+                continue
+            rows = rows[-span:]
+            values = np.array([r[1:] for r in rows], dtype=float)
+            lo = span - len(rows)
+            for j, field in enumerate(KLINE_FIELDS):
+                store.columns[field][row, lo:span] = values[:, j]
+            store.dates[row, lo:span] = [_to_ordinal(r[0]) for r in rows]
+            store.lengths[row] = len(rows)
+        store.end = store.appended = span
+        return store
+
+    @classmethod
+    def open(cls, directory: str, codes: List[str], window: int = HISTORY_DAYS) -> Optional["KlineStore"]:
+        """
+        打开已持久化的存储；不存在、损坏或与股票池不一致时返回 None
+        写入进程以 r+ 映射文件；其他进程在共享锁下把数据复制到内存（只读快照，不写回文件）
+        """
+        try:
+            writable = _acquire_writer(directory)
+            with _data_lock(directory, exclusive=False):
+                with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                if meta.get("codes") != list(codes) or meta.get("window") != window:
+                    return None
+                shape = (len(codes), int(meta["capacity"]))
+                arrays = {}
+                for name in RECORD_FIELDS:
+                    path = os.path.join(directory, f"{name}.npy")
+                    arrays[name] = np.load(path, mmap_mode="r+") if writable else np.array(np.load(path, mmap_mode="r"))
+                    if arrays[name].shape != shape:
+                        return None
+            store = cls(codes, window, shape[1], arrays)
+            store.end = store.appended = int(meta["end"])
+            store.lengths = np.array(meta["lengths"], dtype=np.int64)
+            store.directory = directory
+            store.writable = writable
+            if not writable:
+                print(f"[KlineStore] {directory} 已有写入进程，本进程只读打开")
+            return store
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[KlineStore] 无法打开 {directory}: {e}")
+            return None
+
+    def save(self, directory: str):
+        """把存储写为内存映射文件，此后的追加直接写入文件，flush 时落盘（只有写入进程可以保存）"""
+        if not _acquire_writer(directory):
+            print(f"[KlineStore] {directory} 已有写入进程，不保存")
+            return
+        with _data_lock(directory, exclusive=True):
+            for name in RECORD_FIELDS:
+                source = self.dates if name == DATE_FIELD else self.columns[name]
+                mapped = np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode="w+",
+                                                   dtype=source.dtype, shape=source.shape)
+                mapped[:] = source
+                if name == DATE_FIELD:
+                    self.dates = mapped
+                else:
+                    self.columns[name] = mapped
+            self.directory = directory
+            self.writable = True
+            self._flush()
+
+    def flush(self):
+        """把内存映射的修改与元数据写回磁盘（未持久化或只读打开时忽略）"""
+        if not (self.directory and self.writable):
+            return
+        with _data_lock(self.directory, exclusive=True):
+            self._flush()
+
+    def _flush(self):
+        for array in (*self.columns.values(), self.dates):
+            if isinstance(array, np.memmap):
+                array.flush()
+        meta = {
+            "codes": self.codes,
+            "window": self.window,
+            "capacity": self.capacity,
+            "end": self.end,
+            "lengths": self.lengths.tolist(),
+            "latest_date": self.latest_date(),
+        }
+        path = os.path.join(self.directory, META_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)  # 元数据原子替换，中途崩溃不会留下半截文件
+
+    # ==================== 写入 ====================
+
+    def append(self, batch: Dict[str, np.ndarray], dates: List[str]):
+        """为所有股票追加若干交易日的K线，batch 中各字段为 (days, N)"""
+        if len(dates) > self.window:  # 超出窗口的部分不会被保留
+            batch = {field: batch[field][-self.window:] for field in KLINE_FIELDS}
+            dates = dates[-self.window:]
+        days = len(dates)
+        if not days:
+            return
+        ordinals = [_to_ordinal(d) for d in dates]
+        with _data_lock(self.directory if self.writable else None, exclusive=True):
+            if self.end + days > self.capacity:
+                self._compact(self.window - days)
+            span = slice(self.end, self.end + days)
+            for field in KLINE_FIELDS:
+                self.columns[field][:, span] = batch[field].T
+            self.dates[:, span] = ordinals
+        if self._pyramid is not None:
+            self._pyramid.push_days(batch, ordinals)
+        if self._prefix is not None:
+            self._extend_prefix(self.end, self.end + days)
+        self.end += days
+        self.appended += days
+        self.lengths = np.minimum(self.lengths + days, self.window)
+
+    def _compact(self, keep: int):
+        """只保留最近 keep 列并搬到数组开头"""
+        keep = max(0, min(keep, self.end))
+        recent = slice(self.end - keep, self.end)
+        for field in KLINE_FIELDS:
+            array = self.columns[field]
+            array[:, :keep] = array[:, recent]
+            array[:, keep:] = np.nan
+        self.dates[:, :keep] = self.dates[:, recent]
+        self.dates[:, keep:] = 0
+        self.end = keep
+        self.lengths = np.minimum(self.lengths, keep)
+        self._prefix = None
+
+    # ==================== 读取 ====================
+
+    @property
+    def version(self) -> str:
+        """数据版本：任何追加都会改变，可直接用作 ETag"""
+        return f"{self.token}-{self.appended}"
+
+    @property
+    def pyramid(self) -> KlinePyramid:
+        """周K/月K/季K：首次访问时由日K窗口构建，此后随 append 增量维护"""
+        if self._pyramid is None:
+            lo = self.end - self.span()
+            self._pyramid = KlinePyramid.from_daily(
+                {field: self.columns[field][:, lo:self.end] for field in BAR_FIELDS}, self.dates[:, lo:self.end])
+        return self._pyramid
+
+    def span(self, days: Optional[int] = None) -> int:
+        """最近 days 个交易日（默认整个窗口）实际可用的列数"""
+        return min(days or self.window, self.window, self.end)
+
+    def matrix(self, days: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """最近 days 个交易日各字段的 (N, T) 视图，历史较短的股票左侧为 NaN"""
+        lo = self.end - self.span(days)
+        return {field: self.columns[field][:, lo:self.end] for field in KLINE_FIELDS}
+
+    def latest(self, field: str, offset: int = 0) -> np.ndarray:
+        """所有股票倒数第 offset + 1 个交易日的字段值，历史不足时为 NaN"""
+        if offset >= self.end:
+            return np.full(len(self.codes), np.nan)
+        return self.columns[field][:, self.end - 1 - offset]
+
+    def latest_date(self) -> str:
+        """最新交易日"""
+        return _to_date(int(self.dates[:, self.end - 1].max())) if self.end and self.codes else ""
+
+    def recent_dates(self, days: Optional[int] = None) -> List[List[str]]:
+        """最近 days 个交易日每只股票的日期字符串（无数据的位置为空字符串）"""
+        lo = self.end - self.span(days)
+        return [[_to_date(d) for d in row] for row in self.dates[:, lo:self.end].tolist()]
+
+    def high_low(self, days: int = 252, code: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """最近 days 个交易日的最高价/最低价（指定 code 时只算该股票）"""
+        lo = self.end - self.span(days)
+        rows = slice(None) if code is None else self.rows[code]
+        return (_reduce(np.fmax, self.columns["high"][rows, lo:self.end]),
+                _reduce(np.fmin, self.columns["low"][rows, lo:self.end]))
+
+    def moving_mean(self, days: int) -> np.ndarray:
+        """所有股票最近 days 个交易日收盘价均值，O(1)：前缀和两次相减"""
+        total, _, count = self._window_sums(days)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(count > 0, total / count, np.nan)
+
+    def moving_std(self, days: int) -> np.ndarray:
+        """所有股票最近 days 个交易日收盘价标准差（总体标准差）"""
+        total, squares, count = self._window_sums(days)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+            variance = np.maximum(squares / count - mean ** 2, 0.0)
+            return np.where(count > 0, np.sqrt(variance), np.nan)
+
+    def _window_sums(self, days: int):
+        if self._prefix is None:
+            self._prefix = {
+                name: np.zeros((len(self.codes), self.capacity + 1)) for name in ("sum", "squares", "count")
+            }
+            self._extend_prefix(0, self.end)
+        lo = self.end - self.span(days)
+        return tuple(self._prefix[name][:, self.end] - self._prefix[name][:, lo]
+                     for name in ("sum", "squares", "count"))
+
+    def _extend_prefix(self, lo: int, hi: int):
+        """把 [lo, hi) 列的收盘价累加进前缀和"""
+        close = self.columns["close"][:, lo:hi]
+        valid = ~np.isnan(close)
+        filled = np.where(valid, close, 0.0)
+        for name, values in (("sum", filled), ("squares", filled ** 2), ("count", valid)):
+            prefix = self._prefix[name]
+            prefix[:, lo + 1:hi + 1] = prefix[:, lo:lo + 1] + np.cumsum(values, axis=1)
+
+    def records(self, code: str, lo: int, hi: int, factory: Optional[Callable] = None) -> List:
+        """某只股票第 [lo, hi) 条历史（0 为最早），factory 为空时返回 (date, open, ..., change_pct) 元组"""
+        row = self.rows[code]
+        start = self.end - int(self.lengths[row])
+        lo, hi = start + lo, start + hi
+        columns = [self.columns[field][row, lo:hi].tolist() for field in KLINE_FIELDS]
+        columns[KLINE_FIELDS.index("volume")] = [int(v) for v in columns[KLINE_FIELDS.index("volume")]]
+        dates = [_to_date(d) for d in self.dates[row, lo:hi].tolist()]
+        rows = zip(dates, *columns)
+        return [factory(*values) for values in rows] if factory else list(rows)
+
+    def bars(self, code: str, period: str = "day", limit: Optional[int] = None) -> List[Dict]:
+        """某只股票最近 limit 根K线：period 为 day 时取日K，week/month/quarter 取自K线金字塔"""
+        if period == "day":
+            length = int(self.lengths[self.rows[code]])
+            lo = max(0, length - limit) if limit else 0
+            return [dict(zip(RECORD_FIELDS, record)) for record in self.records(code, lo, length)]
+        bars = self.pyramid.series[period].bars(self.rows[code], limit)
+        columns = {field: bars[field].tolist() for field in BAR_FIELDS}
+        columns["volume"] = [int(v) for v in columns["volume"]]
+        dates = [_to_date(d) for d in bars[DATE_FIELD].tolist()]
+        return [dict(zip(RECORD_FIELDS, values)) for values in zip(dates, *(columns[f] for f in BAR_FIELDS))]
+
+    def series(self, code: str, factory: Optional[Callable] = None) -> "KlineSeries":
+        """某只股票历史的只读序列视图"""
+        return KlineSeries(self, code, factory)
+
+
+class KlineSeries(Sequence):
+    """单只股票历史的只读序列视图，兼容原 List[OHLCV] 的下标/切片/迭代用法，元素按需构造"""
+
+    def __init__(self, store: KlineStore, code: str, factory: Optional[Callable] = None):
+        self.store = store
+        self.code = code
+        self.factory = factory
+
+    def __len__(self) -> int:
+        return int(self.store.lengths[self.store.rows[self.code]])
+
+    def __getitem__(self, index):
+        n = len(self)
+        if isinstance(index, slice):
+            positions = range(*index.indices(n))
+            if not positions:
+                return []
+            lo, hi = min(positions), max(positions) + 1
+            records = self.store.records(self.code, lo, hi, self.factory)
+            return records if positions.step == 1 else [records[p - lo] for p in positions]
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("kline index out of range")
+        return self.store.records(self.code, index, index + 1, self.factory)[0]
+
+    def __iter__(self):
+        return iter(self.store.records(self.code, 0, len(self), self.factory))
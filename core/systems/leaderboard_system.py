@@ -41,10 +41,9 @@ class LeaderboardSystem:
         if not self.db:
             return []
         
-        import sqlite3
         from core.systems.avatar_system import avatar_system
         
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT u.session_id, u.name, u.credits,
@@ -81,10 +80,9 @@ class LeaderboardSystem:
         if not self.db:
             return []
         
-        import sqlite3
         from core.systems.avatar_system import avatar_system
         
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.db.connect() as conn:
             cursor = conn.cursor()
             # 计算最近3个月的增长率
             cursor.execute('''
@@ -138,10 +136,9 @@ class LeaderboardSystem:
         if not self.db:
             return []
         
-        import sqlite3
         from core.systems.avatar_system import avatar_system
         
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT 
@@ -182,10 +179,9 @@ class LeaderboardSystem:
         if not self.db:
             return []
         
-        import sqlite3
         from core.systems.avatar_system import avatar_system
         
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT 
@@ -232,8 +228,7 @@ class LeaderboardSystem:
             "common": 1
         }
         
-        import sqlite3
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT 
@@ -8,12 +8,14 @@ import json
 import time
 import sqlite3
 from typing import Dict, List, Optional, Tuple
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from dataclasses import dataclass
 import hashlib
 import hmac
 import requests
 
+from ..database.connection import get_connection
+
 # 尝试导入 Longbridge SDK
 try:
     from longbridge.openapi import QuoteContext, Config, Period, AdjustType
@@ -86,6 +88,72 @@ STOCK_MAPPING = {
 # 为兼容性提供别名
 STOCK_SYMBOL_MAPPING = STOCK_MAPPING
 
+# K线 upsert：新行插入；已存在的行只有内容变化时才更新，未变化的行不产生写入
+KLINE_UPSERT_SQL = '''
+    INSERT INTO stock_kline_cache (game_code, date, open, high, low, close, volume, change_pct)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(game_code, date) DO UPDATE SET
+        open = excluded.open, high = excluded.high, low = excluded.low, close = excluded.close,
+        volume = excluded.volume, change_pct = excluded.change_pct
+    WHERE open IS NOT excluded.open OR high IS NOT excluded.high OR low IS NOT excluded.low
+       OR close IS NOT excluded.close OR volume IS NOT excluded.volume OR change_pct IS NOT excluded.change_pct
+'''
+
+STOCK_PRICE_UPSERT_SQL = '''
+    INSERT OR REPLACE INTO stock_current_prices
+    (code, current_price, change, change_pct, high_52w, low_52w, volume, data_source, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+'''
+
+
+KLINE_CHECKPOINT_SQL = '''
+    INSERT INTO kline_fetch_checkpoints (game_code, checked_through, rows, updated_at)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(game_code) DO UPDATE SET
+        checked_through = MAX(checked_through, excluded.checked_through),
+        rows = rows + excluded.rows, updated_at = CURRENT_TIMESTAMP
+'''
+
+
+def scale_klines(klines: List[Dict], scale: float) -> List[Dict]:
+    """API 返回的K线（时间戳 + 原始价格）→ 游戏K线（日期字符串 + 缩放后价格）"""
+    scaled_klines = []
+    for k in klines:
+        timestamp = k.get("timestamp", "")
+        # 转换时间戳为日期字符串
+        if isinstance(timestamp, (int, float)):
+            date_str = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+        else:
+            date_str = str(timestamp)[:10] if timestamp else ""
+        
+        open_price = float(k.get("open", 0)) * scale
+        close_price = float(k.get("close", 0)) * scale
+        change_pct = ((close_price - open_price) / open_price * 100) if open_price > 0 else 0
+        
+        scaled_klines.append({
+            "date": date_str,
+            "open": round(open_price, 2),
+            "high": round(float(k.get("high", 0)) * scale, 2),
+            "low": round(float(k.get("low", 0)) * scale, 2),
+            "close": round(close_price, 2),
+            "volume": int(k.get("volume", 0)),
+            "change_pct": round(change_pct, 2)
+        })
+    return scaled_klines
+
+
+def _candle_to_dict(candle) -> Dict:
+    """SDK Candlestick → dict"""
+    return {
+        "timestamp": candle.timestamp.timestamp() if hasattr(candle.timestamp, 'timestamp') else candle.timestamp,
+        "open": float(candle.open),
+        "high": float(candle.high),
+        "low": float(candle.low),
+        "close": float(candle.close),
+        "volume": int(candle.volume),
+        "turnover": float(candle.turnover) if hasattr(candle, 'turnover') else 0
+    }
+
 
 @dataclass
 class RealQuote:
@@ -119,6 +187,7 @@ class LongbridgeClient:
         self.cache_time: Dict[str, float] = {}
         self.cache_ttl = 60  # 缓存60秒
         self._stocks_initialized = False
+        self.write_stats = {"transactions": 0, "kline_rows": 0, "kline_rows_unchanged": 0, "price_rows": 0}
         self._init_db()
         # 注意：不在这里调用 _init_stock_info()，避免循环导入
         # 将在首次访问股票数据时延迟初始化
@@ -132,7 +201,7 @@ class LongbridgeClient:
         
     def _init_db(self):
         """初始化股票数据库表"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             
             # 股票基础信息表
@@ -187,6 +256,16 @@ class LongbridgeClient:
                 )
             ''')
             
+            # 历史K线抓取断点：每只股票已确认抓取到的日期（含无交易日的区间）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS kline_fetch_checkpoints (
+                    game_code TEXT PRIMARY KEY,
+                    checked_through TEXT NOT NULL,
+                    rows INTEGER DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
             # 股票实时价格表（存储当前价格）
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS stock_current_prices (
@@ -209,7 +288,7 @@ class LongbridgeClient:
         # 从 market_engine 导入股票池定义
         from .market_engine import MarketEngine
         
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             
             for stock in MarketEngine.STOCK_POOL:
@@ -248,18 +327,11 @@ class LongbridgeClient:
                          low_52w: float = None, volume: int = 0, 
                          data_source: str = "simulated"):
         """保存股票当前价格到数据库"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO stock_current_prices 
-                (code, current_price, change, change_pct, high_52w, low_52w, volume, data_source, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (code, current_price, change, change_pct, high_52w, low_52w, volume, data_source))
-            conn.commit()
+        self.save_market_tick([], [(code, current_price, change, change_pct, high_52w, low_52w, volume, data_source)])
     
     def get_stock_price_from_db(self, code: str) -> Optional[Dict]:
         """从数据库获取股票当前价格"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT current_price, change, change_pct, high_52w, low_52w, volume, data_source, updated_at
@@ -282,7 +354,7 @@ class LongbridgeClient:
     
     def get_all_stocks_from_db(self) -> List[Dict]:
         """从数据库获取所有股票信息"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute('''
@@ -293,30 +365,45 @@ class LongbridgeClient:
             rows = cursor.fetchall()
             return [dict(row) for row in rows]
     
-    def save_kline_to_db(self, game_code: str, kline_data: List[Dict]):
-        """保存K线数据到数据库"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            for k in kline_data:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO stock_kline_cache 
-                    (game_code, date, open, high, low, close, volume, change_pct)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    game_code,
-                    k.get("date", ""),
-                    k.get("open", 0),
-                    k.get("high", 0),
-                    k.get("low", 0),
-                    k.get("close", 0),
-                    k.get("volume", 0),
-                    k.get("change_pct", 0)
-                ))
-            conn.commit()
+    def save_kline_to_db(self, game_code: str, kline_data: List[Dict]) -> int:
+        """保存K线数据到数据库，返回实际写入的行数"""
+        rows = [
+            (game_code, k.get("date", ""), k.get("open", 0), k.get("high", 0), k.get("low", 0),
+             k.get("close", 0), k.get("volume", 0), k.get("change_pct", 0))
+            for k in kline_data
+        ]
+        return self.save_market_tick(rows)["kline_rows"]
+    
+    def save_market_tick(self, kline_rows: List[tuple], price_rows: List[tuple] = ()) -> Dict[str, int]:
+        """
+        在单个事务内批量写入一次推进产生的K线和当前价格。
+        
+        Args:
+            kline_rows: (game_code, date, open, high, low, close, volume, change_pct)，按 (game_code, date) upsert，
+                        内容未变化的已有行不会被写入
+            price_rows: (code, current_price, change, change_pct, high_52w, low_52w, volume, data_source)
+        
+        Returns:
+            实际写入的行数 {"kline_rows": ..., "price_rows": ...}
+        """
+        if not kline_rows and not price_rows:
+            return {"kline_rows": 0, "price_rows": 0}
+        with get_connection(self.db_path) as conn:
+            before = conn.total_changes
+            conn.executemany(KLINE_UPSERT_SQL, kline_rows)
+            written = conn.total_changes - before
+            conn.executemany(STOCK_PRICE_UPSERT_SQL, price_rows)
+            prices = conn.total_changes - before - written
+        
+        self.write_stats["transactions"] += 1
+        self.write_stats["kline_rows"] += written
+        self.write_stats["kline_rows_unchanged"] += len(kline_rows) - written
+        self.write_stats["price_rows"] += prices
+        return {"kline_rows": written, "price_rows": prices}
     
     def get_kline_from_db(self, game_code: str, days: int = 60) -> List[Dict]:
         """从数据库获取K线数据"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute('''
@@ -328,7 +415,37 @@ class LongbridgeClient:
             ''', (game_code, days))
             rows = cursor.fetchall()
             return [dict(row) for row in reversed(rows)]
-    
+
+    def get_recent_klines(self, game_codes: List[str], days: int = 365) -> Dict[str, List[tuple]]:
+        """在同一连接上获取多只股票最近 days 天的K线，返回 {代码: [(date, open, high, low, close, volume, change_pct), ...]}（日期升序）"""
+        result: Dict[str, List[tuple]] = {}
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            for game_code in game_codes:
+                # 每只股票走 (game_code, date) 唯一索引倒序扫描，比窗口函数全表排序更快
+                cursor.execute('''
+                    SELECT date, open, high, low, close, volume, change_pct
+                    FROM stock_kline_cache
+                    WHERE game_code = ?
+                    ORDER BY date DESC
+                    LIMIT ?
+                ''', (game_code, days))
+                rows = cursor.fetchall()
+                if rows:
+                    result[game_code] = [tuple(row) for row in reversed(rows)]
+        return result
+
+    def get_latest_kline_date(self, game_codes: List[str]) -> Optional[str]:
+        """指定股票在K线缓存表中的最新日期（用于判断列式存储是否过期）"""
+        if not game_codes:
+            return None
+        placeholders = ",".join("?" * len(game_codes))
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT MAX(date) FROM stock_kline_cache WHERE game_code IN ({placeholders})', game_codes)
+            row = cursor.fetchone()
+            return row[0] if row else None
+
     def _init_quote_context(self):
         """初始化 Longbridge QuoteContext"""
         if not HAS_LONGBRIDGE_SDK:
@@ -428,17 +545,7 @@ class LongbridgeClient:
             resp = ctx.candlesticks(symbol, lb_period, count, AdjustType.ForwardAdjust)
             
             if resp:
-                klines = []
-                for candle in resp:
-                    klines.append({
-                        "timestamp": candle.timestamp.timestamp() if hasattr(candle.timestamp, 'timestamp') else candle.timestamp,
-                        "open": float(candle.open),
-                        "high": float(candle.high),
-                        "low": float(candle.low),
-                        "close": float(candle.close),
-                        "volume": int(candle.volume),
-                        "turnover": float(candle.turnover) if hasattr(candle, 'turnover') else 0
-                    })
+                klines = [_candle_to_dict(candle) for candle in resp]
                 print(f"[Longbridge] Got {len(klines)} K-lines for {symbol}")
                 return klines
         except Exception as e:
@@ -446,6 +553,14 @@ class LongbridgeClient:
         
         return []
     
+    def get_kline_range(self, symbol: str, start: date, end: date) -> List[Dict]:
+        """使用 SDK 按日期区间获取日K（前复权）；失败时抛出异常，由调用方决定是否重试"""
+        ctx = self._init_quote_context()
+        if not ctx:
+            raise RuntimeError("QuoteContext not available")
+        resp = ctx.history_candlesticks_by_date(symbol, Period.Day, AdjustType.ForwardAdjust, start, end)
+        return [_candle_to_dict(candle) for candle in resp or []]
+    
     def _save_to_db(self, symbol: str, quote: RealQuote):
         """保存行情到数据库"""
         game_code = None
@@ -454,7 +569,7 @@ class LongbridgeClient:
                 game_code = gc
                 break
         
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT OR REPLACE INTO stock_price_cache 
@@ -466,7 +581,7 @@ class LongbridgeClient:
     
     def _get_from_db(self, symbol: str) -> Optional[RealQuote]:
         """从数据库获取缓存的行情"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT price, prev_close, open_price, high, low, volume, change_pct
@@ -546,29 +661,7 @@ class LongbridgeClient:
             return self.get_kline_from_db(game_code, days)
         
         # 缩放价格并转换格式
-        scaled_klines = []
-        for k in klines:
-            timestamp = k.get("timestamp", "")
-            # 转换时间戳为日期字符串
-            if isinstance(timestamp, (int, float)):
-                date_str = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
-            else:
-                date_str = str(timestamp)[:10] if timestamp else ""
-            
-            open_price = float(k.get("open", 0)) * scale
-            close_price = float(k.get("close", 0)) * scale
-            prev_close = float(k.get("close", open_price))
-            change_pct = ((close_price - open_price) / open_price * 100) if open_price > 0 else 0
-            
-            scaled_klines.append({
-                "date": date_str,
-                "open": round(open_price, 2),
-                "high": round(float(k.get("high", 0)) * scale, 2),
-                "low": round(float(k.get("low", 0)) * scale, 2),
-                "close": round(close_price, 2),
-                "volume": int(k.get("volume", 0)),
-                "change_pct": round(change_pct, 2)
-            })
+        scaled_klines = scale_klines(klines, scale)
         
         # 保存到数据库
         if scaled_klines:
@@ -576,72 +669,56 @@ class LongbridgeClient:
         
         return scaled_klines
     
-    def fetch_and_store_all_klines(self, days: int = 365) -> Dict[str, int]:
-        """从 Longbridge 获取所有股票的K线数据并存入数据库
+    def get_kline_fetch_state(self, game_codes: List[str]) -> Dict[str, Optional[str]]:
+        """
+        每只股票已从行情源抓取到的日期（抓取断点），没有断点为 None
+        只看 kline_fetch_checkpoints：stock_kline_cache 中还有 MarketEngine 写入的模拟K线，
+        其中的最新日期不能说明真实行情已经抓取过（没有断点的历史缓存会重新请求一次，内容未变化的行不会重复写入）
+        """
+        state: Dict[str, Optional[str]] = {code: None for code in game_codes}
+        with get_connection(self.db_path) as conn:
+            rows = conn.execute('SELECT game_code, checked_through FROM kline_fetch_checkpoints').fetchall()
+        for game_code, covered in rows:
+            if game_code in state and covered:
+                state[game_code] = covered
+        return state
+    
+    def save_kline_chunk(self, game_code: str, kline_data: List[Dict], checked_through: str) -> int:
+        """在同一事务内写入一段抓取到的K线并推进该股票的抓取断点，返回实际写入的行数"""
+        rows = [
+            (game_code, k.get("date", ""), k.get("open", 0), k.get("high", 0), k.get("low", 0),
+             k.get("close", 0), k.get("volume", 0), k.get("change_pct", 0))
+            for k in kline_data
+        ]
+        with get_connection(self.db_path) as conn:
+            before = conn.total_changes
+            conn.executemany(KLINE_UPSERT_SQL, rows)
+            written = conn.total_changes - before
+            conn.execute(KLINE_CHECKPOINT_SQL, (game_code, checked_through, len(rows)))
+        
+        self.write_stats["transactions"] += 1
+        self.write_stats["kline_rows"] += written
+        self.write_stats["kline_rows_unchanged"] += len(rows) - written
+        return written
+    
+    def fetch_and_store_all_klines(self, days: int = 365, source=None, **fetcher_options) -> Dict[str, int]:
+        """获取所有股票缺失区间的K线数据并存入数据库（并发 + 令牌桶限速 + 断点续传）
         
         Args:
-            days: 获取多少天的历史数据，默认365天
+            days: 最多回溯多少天的历史数据，默认365天
+            source: 行情数据源，默认 Longbridge SDK（设置 ECHOPOLIS_QUOTE_SOURCE_URL 时使用该 HTTP 数据源）
+            fetcher_options: 传给 KlineFetcher 的参数（workers / rate / end 等）
             
         Returns:
-            {game_code: 获取到的K线数量}
+            {game_code: 本次获取到的K线数量}
         """
-        results = {}
-        
-        print(f"[Longbridge] Starting to fetch K-line data for {len(STOCK_MAPPING)} stocks...")
-        
-        for game_code, mapping in STOCK_MAPPING.items():
-            real_symbol = mapping[0]  # 真实股票代码
-            scale = mapping[2]  # 缩放因子
-            real_name = mapping[3] if len(mapping) > 3 else real_symbol  # 真实名称
-            try:
-                print(f"[Longbridge] Fetching {game_code} -> {real_name} ({real_symbol})...")
-                klines = self.get_kline(real_symbol, "day", days)
-                
-                if klines:
-                    # 缩放价格并转换格式
-                    scaled_klines = []
-                    for k in klines:
-                        timestamp = k.get("timestamp", "")
-                        if isinstance(timestamp, (int, float)):
-                            date_str = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
-                        else:
-                            date_str = str(timestamp)[:10] if timestamp else ""
-                        
-                        open_price = float(k.get("open", 0)) * scale
-                        close_price = float(k.get("close", 0)) * scale
-                        change_pct = ((close_price - open_price) / open_price * 100) if open_price > 0 else 0
-                        
-                        scaled_klines.append({
-                            "date": date_str,
-                            "open": round(open_price, 2),
-                            "high": round(float(k.get("high", 0)) * scale, 2),
-                            "low": round(float(k.get("low", 0)) * scale, 2),
-                            "close": round(close_price, 2),
-                            "volume": int(k.get("volume", 0)),
-                            "change_pct": round(change_pct, 2)
-                        })
-                    
-                    # 保存到数据库
-                    self.save_kline_to_db(game_code, scaled_klines)
-                    results[game_code] = len(scaled_klines)
-                    print(f"[Longbridge] {game_code}: Stored {len(scaled_klines)} K-lines")
-                else:
-                    results[game_code] = 0
-                    print(f"[Longbridge] {game_code}: No data received")
-                
-                # 避免 API 限流，稍微延迟
-                time.sleep(0.5)
-                
-            except Exception as e:
-                print(f"[Longbridge] Error fetching {game_code}: {e}")
-                results[game_code] = 0
-        
-        print(f"[Longbridge] Finished fetching K-line data. Total: {sum(results.values())} K-lines")
-        return results
+        from .kline_fetcher import KlineFetcher, default_quote_source
+        fetcher = KlineFetcher(self, source or default_quote_source(self), **fetcher_options)
+        return fetcher.run(days)
     
     def get_stock_kline_count(self, game_code: str) -> int:
         """获取数据库中某只股票的K线数量"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT COUNT(*) FROM stock_kline_cache WHERE game_code = ?
@@ -650,7 +727,7 @@ class LongbridgeClient:
     
     def get_all_kline_counts(self) -> Dict[str, int]:
         """获取所有股票的K线数量"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT game_code, COUNT(*) as count 
@@ -2,12 +2,13 @@
 宏观经济系统 - EchoPolis 增强版
 模拟经济周期、通胀影响、利率变化，联动税收系统
 """
-import random
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional
 from enum import Enum
 from copy import deepcopy
 
+from .sim_random import sim_rng
+
 
 class EconomicPhase(Enum):
     """经济周期阶段"""
@@ -116,6 +117,7 @@ class MacroEconomy:
         
     def advance_month(self) -> Dict[str, any]:
         """推进一个月，更新经济指标"""
+        rng = sim_rng("macro")
         # 保存历史
         self.history.append(deepcopy(self.state))
         
@@ -135,7 +137,7 @@ class MacroEconomy:
         # 更新股票指数（基于市场情绪和经济周期）
         sentiment_factor = (self.state.market_sentiment - 50) / 500
         cycle_factor = self._get_cycle_stock_factor()
-        self.state.stock_index *= (1 + sentiment_factor + cycle_factor + random.uniform(-0.02, 0.02))
+        self.state.stock_index *= (1 + sentiment_factor + cycle_factor + rng.uniform(-0.02, 0.02))
         self.state.stock_index = max(1000, self.state.stock_index)
         
         # 更新房价指数
@@ -159,13 +161,14 @@ class MacroEconomy:
     
     def _process_economic_cycle(self, prev_state: EconomicState) -> Dict:
         """处理经济周期逻辑"""
+        rng = sim_rng("macro")
         new_sentiment = prev_state.market_sentiment
-        volatility = random.uniform(-2.0, 2.0)
+        volatility = rng.uniform(-2.0, 2.0)
         phase_changed = False
         
         if prev_state.phase == "expansion":
-            new_gdp = min(8.0, prev_state.gdp_growth + 0.1 + random.uniform(-0.1, 0.2))
-            new_inflation = min(10.0, prev_state.inflation + 0.05 + random.uniform(0, 0.1))
+            new_gdp = min(8.0, prev_state.gdp_growth + 0.1 + rng.uniform(-0.1, 0.2))
+            new_inflation = min(10.0, prev_state.inflation + 0.05 + rng.uniform(0, 0.1))
             new_interest = prev_state.interest_rate + (0.02 if new_inflation > 3.0 else 0)
             new_unemployment = max(3.0, prev_state.unemployment - 0.1)
             new_sentiment += 1.0
@@ -176,7 +179,7 @@ class MacroEconomy:
                 phase_changed = True
                 
         elif prev_state.phase == "peak":
-            new_gdp = prev_state.gdp_growth - 0.2 + random.uniform(-0.2, 0.1)
+            new_gdp = prev_state.gdp_growth - 0.2 + rng.uniform(-0.2, 0.1)
             new_inflation = prev_state.inflation + 0.1
             new_interest = prev_state.interest_rate + 0.1
             new_unemployment = prev_state.unemployment + 0.05
@@ -188,7 +191,7 @@ class MacroEconomy:
                 phase_changed = True
                 
         elif prev_state.phase == "contraction":
-            new_gdp = max(-3.0, prev_state.gdp_growth - 0.3 + random.uniform(-0.2, 0.1))
+            new_gdp = max(-3.0, prev_state.gdp_growth - 0.3 + rng.uniform(-0.2, 0.1))
             new_inflation = max(-1.0, prev_state.inflation - 0.2)
             new_interest = max(0.0, prev_state.interest_rate - 0.1)
             new_unemployment = min(15.0, prev_state.unemployment + 0.2)
@@ -200,7 +203,7 @@ class MacroEconomy:
                 phase_changed = True
                 
         else:  # trough
-            new_gdp = prev_state.gdp_growth + 0.2 + random.uniform(0, 0.2)
+            new_gdp = prev_state.gdp_growth + 0.2 + rng.uniform(0, 0.2)
             new_inflation = max(0.0, prev_state.inflation - 0.1)
             new_interest = max(0.0, prev_state.interest_rate - 0.05)
             new_unemployment = max(3.5, prev_state.unemployment - 0.1)
@@ -222,10 +225,11 @@ class MacroEconomy:
     
     def _process_random_events(self) -> List[Dict]:
         """处理随机经济事件"""
+        rng = sim_rng("macro")
         triggered_events = []
         
         for event in self.ECONOMIC_EVENTS:
-            if random.random() < event.probability:
+            if rng.random() < event.probability:
                 # 应用事件影响
                 for key, value in event.impact.items():
                     if hasattr(self.state, key):
@@ -251,11 +255,12 @@ class MacroEconomy:
     
     def _update_house_price_index(self):
         """更新房价指数"""
+        rng = sim_rng("macro")
         # 房价与利率负相关，与GDP正相关
         rate_effect = -0.1 * (self.state.interest_rate - 3.5)
         gdp_effect = 0.05 * (self.state.gdp_growth - 3.0)
         
-        change = (rate_effect + gdp_effect + random.uniform(-0.5, 0.5)) / 100
+        change = (rate_effect + gdp_effect + rng.uniform(-0.5, 0.5)) / 100
         self.state.house_price_index *= (1 + change)
         self.state.house_price_index = max(50, min(200, self.state.house_price_index))
     
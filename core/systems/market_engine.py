@@ -3,14 +3,24 @@
 实现虚拟股票市场的价格波动、K线生成、市场事件联动
 使用 Longbridge API 获取真实市场数据
 """
+import os
 import math
 import random
 import time
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 from typing import Dict, List, Optional, Tuple
 from enum import Enum
 from datetime import datetime, timedelta
 
+import numpy as np
+
+from .market_kernel import (
+    simulate_month, simulate_next_day, KLINE_FIELDS, HISTORY_DAYS
+)
+from .kline_store import KlineStore, KlineSeries
+from .indicators import IndicatorEngine, StockIndicators
+from .quote_board import QuoteBoard
+
 # 导入 Longbridge 客户端（用于数据库操作，不依赖 SDK）
 try:
     from .longbridge_client import longbridge_client, STOCK_SYMBOL_MAPPING
@@ -23,6 +33,14 @@ except ImportError:
 # 为了向后兼容
 HAS_LONGBRIDGE = HAS_LONGBRIDGE_CLIENT
 
+# 市场随机种子（设置后模拟结果可复现）
+MARKET_SEED = os.getenv("ECHOPOLIS_MARKET_SEED")
+
+TRADING_DAYS_PER_MONTH = 22  # 写放大指标按每月 22 个交易日折算
+
+# 列式K线存储的内存映射文件目录，默认位于 stock.db 同目录下的 kline_store/
+KLINE_STORE_DIR = os.getenv("KLINE_STORE_DIR")
+
 
 class Sector(Enum):
     """行业板块"""
@@ -133,10 +151,34 @@ class MarketEngine:
         StockInfo("ECHO20", "基建重工", Sector.INDUSTRIAL, 8.5, 0.022, 0.85, 0.035, 7, "基础设施建设"),
     ]
     
-    def __init__(self):
-        self.stocks: Dict[str, StockInfo] = {s.code: s for s in self.STOCK_POOL}
-        self.current_prices: Dict[str, float] = {s.code: s.base_price for s in self.STOCK_POOL}
-        self.price_history: Dict[str, List[OHLCV]] = {s.code: [] for s in self.STOCK_POOL}
+    def __init__(self, stock_pool: List[StockInfo] = None, seed: Optional[int] = None, persist: bool = True):
+        """
+        Args:
+            stock_pool: 股票池，默认使用 STOCK_POOL
+            seed: 随机种子，默认读取 ECHOPOLIS_MARKET_SEED，都未设置时不可复现
+            persist: 是否从 stock.db 加载历史并把新数据写回（基准测试等场景关闭）
+        """
+        stock_pool = stock_pool or self.STOCK_POOL
+        self.persist = persist
+        if seed is None and MARKET_SEED:
+            seed = int(MARKET_SEED)
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        
+        self.stocks: Dict[str, StockInfo] = {s.code: s for s in stock_pool}
+        self.current_prices: Dict[str, float] = {s.code: s.base_price for s in stock_pool}
+        
+        # 批量模拟内核使用的静态参数（按 self._codes 的顺序排列）
+        sectors = list(Sector)
+        self._codes: List[str] = [s.code for s in stock_pool]
+        self.kline_store = KlineStore(self._codes)  # 所有股票的K线历史（列式存储）
+        self.indicators = IndicatorEngine()  # 增量技术指标（读取时追赶新K线）
+        self.quote_board = QuoteBoard()  # 全市场报价快照（每次推进后整体替换）
+        self._volatility = np.array([s.volatility for s in stock_pool])
+        self._beta = np.array([s.beta for s in stock_pool])
+        self._sector_idx = np.array([sectors.index(s.sector) for s in stock_pool])
+        self._n_sectors = len(sectors)
+        self._limit = np.array([0.20 if "688" in s.code else 0.10 for s in stock_pool])  # 单日涨跌幅限制
         self.market_state = MarketState(
             trend=TrendType.SIDEWAYS,
             index_value=3000.0,
@@ -147,58 +189,73 @@ class MarketEngine:
         self.current_game_date = datetime.now()  # 使用当前日期
         self.month_count = 0
         
+        # 数据库写入：尚未写入的交易日数，以及写放大统计
+        self._unsynced_days = 0
+        self.write_stats = {"syncs": 0, "trading_days": 0, "candles_generated": 0,
+                            "kline_rows_written": 0, "price_rows_written": 0}
+        
         # 从数据库加载历史数据
-        self._load_history_from_db()
+        if self.persist:
+            self._load_history_from_db()
+        else:
+            self._generate_initial_history()
+            self._update_market_index()
+        self._publish_quotes()
+    
+    @property
+    def price_history(self) -> Dict[str, KlineSeries]:
+        """每只股票历史K线的只读序列视图（元素为 OHLCV），数据存放在 kline_store 中"""
+        return {code: self.kline_store.series(code, OHLCV) for code in self._codes}
+    
+    def _kline_store_dir(self) -> str:
+        return KLINE_STORE_DIR or os.path.join(os.path.dirname(longbridge_client.db_path), "kline_store")
     
     def _load_history_from_db(self):
-        """从 stock.db 数据库加载历史 K 线数据，如果没有则生成初始数据"""
+        """
+        加载历史 K 线：优先以 mmap 打开列式存储文件（毫秒级），
+        文件不存在或与 stock.db 最新日期不一致时从数据库重建；都没有数据则生成初始数据
+        """
         if not HAS_LONGBRIDGE_CLIENT or not longbridge_client:
             print("[MarketEngine] Longbridge client not available, generating initial data...")
             self._generate_initial_history()
             return
         
-        print("[MarketEngine] Loading historical data from stock.db...")
-        loaded_count = 0
-        
-        for stock_code in self.stocks.keys():
-            # 从数据库获取历史K线
-            kline_data = longbridge_client.get_kline_from_db(stock_code, 365)
-            
-            if kline_data and len(kline_data) > 0:
-                # 转换为 OHLCV 对象
-                history = []
-                for k in kline_data:
-                    ohlcv = OHLCV(
-                        date=k.get("date", ""),
-                        open=float(k.get("open", 0)),
-                        high=float(k.get("high", 0)),
-                        low=float(k.get("low", 0)),
-                        close=float(k.get("close", 0)),
-                        volume=int(k.get("volume", 0)),
-                        change_pct=float(k.get("change_pct", 0))
-                    )
-                    history.append(ohlcv)
-                
-                self.price_history[stock_code] = history
-                # 设置当前价格为最新收盘价
-                self.current_prices[stock_code] = history[-1].close
-                loaded_count += 1
-                
-                # 更新游戏日期为最新数据日期
-                if history[-1].date:
-                    try:
-                        latest_date = datetime.strptime(history[-1].date, "%Y-%m-%d")
-                        if latest_date > self.current_game_date - timedelta(days=30):
-                            self.current_game_date = latest_date
-                    except:
-                        pass
-        
-        print(f"[MarketEngine] Loaded {loaded_count} stocks from database")
+        print("[MarketEngine] Loading historical data...")
+        started = time.perf_counter()
+        store_dir = self._kline_store_dir()
+        store = KlineStore.open(store_dir, self._codes)
+        db_latest = longbridge_client.get_latest_kline_date(self._codes) or ""
+        source = "kline store"
+        if store is None or store.latest_date() != db_latest[:10]:
+            records = longbridge_client.get_recent_klines(self._codes, HISTORY_DAYS)
+            store = KlineStore.from_records(self._codes, records)
+            source = "stock.db"
+        self.kline_store = store
+        
+        loaded_count = int(np.count_nonzero(store.lengths))
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"[MarketEngine] Loaded {loaded_count} stocks from {source} in {elapsed:.1f}ms")
         
         # 如果没有加载到数据，生成初始历史
         if loaded_count == 0:
             print("[MarketEngine] No data in database, generating initial history...")
             self._generate_initial_history()
+        else:
+            # 设置当前价格为最新收盘价
+            for code, close in zip(self._codes, store.latest("close").tolist()):
+                if not math.isnan(close):
+                    self.current_prices[code] = close
+            # 更新游戏日期为最新数据日期
+            latest_date = datetime.strptime(store.latest_date(), "%Y-%m-%d")
+            if latest_date > self.current_game_date - timedelta(days=30):
+                self.current_game_date = latest_date
+        
+        if self.kline_store.directory is None:
+            try:
+                self.kline_store.save(store_dir)
+            except OSError as e:
+                print(f"[MarketEngine] Failed to save kline store: {e}")
+        if loaded_count == 0:
             # 保存到数据库
             self._sync_prices_to_db()
         
@@ -207,39 +264,15 @@ class MarketEngine:
     
     def _generate_initial_history(self):
         """生成初始60天的K线历史数据"""
-        print("[MarketEngine] Generating initial 60-day history for all stocks...")
-        for stock_code, stock_info in self.stocks.items():
-            history = []
-            current_price = stock_info.base_price
-            current_date = datetime.now() - timedelta(days=60)
-            
-            for day in range(60):
-                # 生成日K线
-                volatility = stock_info.volatility
-                daily_return = random.gauss(0, volatility)
-                
-                open_price = current_price
-                close_price = current_price * (1 + daily_return)
-                high_price = max(open_price, close_price) * (1 + random.uniform(0, volatility * 0.5))
-                low_price = min(open_price, close_price) * (1 - random.uniform(0, volatility * 0.5))
-                volume = random.randint(500000, 5000000)
-                
-                ohlcv = OHLCV(
-                    date=current_date.strftime("%Y-%m-%d"),
-                    open=round(open_price, 2),
-                    high=round(high_price, 2),
-                    low=round(low_price, 2),
-                    close=round(close_price, 2),
-                    volume=volume,
-                    change_pct=round(daily_return * 100, 2)
-                )
-                history.append(ohlcv)
-                
-                current_price = close_price
-                current_date += timedelta(days=1)
-            
-            self.price_history[stock_code] = history
-            self.current_prices[stock_code] = current_price
+        print(f"[MarketEngine] Generating initial 60-day history for {len(self.stocks)} stocks...")
+        prev_close = np.array([self.stocks[code].base_price for code in self._codes])
+        batch = simulate_month(prev_close, self._volatility, self._beta, self._sector_idx,
+                               self._n_sectors, 60, 0.0, 1.0, self.rng)
+        start_date = datetime.now() - timedelta(days=60)
+        dates = [(start_date + timedelta(days=day)).strftime("%Y-%m-%d") for day in range(60)]
+        
+        self.kline_store = KlineStore(self._codes)
+        self._append_candles(batch, dates, build_candles=False)
         
         print(f"[MarketEngine] Generated initial history for {len(self.stocks)} stocks")
     
@@ -252,144 +285,32 @@ class MarketEngine:
         total_value = sum(self.current_prices.values())
         self.market_state.index_value = total_value / len(self.current_prices) * 30  # 缩放到合适范围
     
-    def _analyze_stock_pattern(self, stock_code: str) -> Dict:
-        """分析股票历史数据的统计特征，用于生成符合历史规律的新数据"""
-        history = self.price_history.get(stock_code, [])
-        if len(history) < 20:
-            stock = self.stocks.get(stock_code)
-            return {
-                "volatility": stock.volatility if stock else 0.03,
-                "avg_return": 0,
-                "trend": 0,
-                "momentum": 0,
-                "support": self.current_prices.get(stock_code, 100) * 0.9,
-                "resistance": self.current_prices.get(stock_code, 100) * 1.1
-            }
-        
-        # 计算历史收益率
-        returns = []
-        for i in range(1, len(history)):
-            if history[i-1].close > 0:
-                ret = (history[i].close - history[i-1].close) / history[i-1].close
-                returns.append(ret)
-        
-        # 统计特征
-        avg_return = sum(returns) / len(returns) if returns else 0
-        volatility = (sum((r - avg_return) ** 2 for r in returns) / len(returns)) ** 0.5 if returns else 0.03
-        
-        # 近期趋势 (最近20天)
-        recent_returns = returns[-20:] if len(returns) >= 20 else returns
-        trend = sum(recent_returns) / len(recent_returns) if recent_returns else 0
-        
-        # 动量指标 (最近5天 vs 最近20天)
-        recent_5 = returns[-5:] if len(returns) >= 5 else returns
-        recent_20 = returns[-20:] if len(returns) >= 20 else returns
-        momentum = (sum(recent_5) / len(recent_5)) - (sum(recent_20) / len(recent_20)) if recent_5 and recent_20 else 0
-        
-        # 支撑位和阻力位 (最近60天的最低和最高价)
-        recent_history = history[-60:] if len(history) >= 60 else history
-        support = min(h.low for h in recent_history)
-        resistance = max(h.high for h in recent_history)
-        
-        return {
-            "volatility": volatility,
-            "avg_return": avg_return,
-            "trend": trend,
-            "momentum": momentum,
-            "support": support,
-            "resistance": resistance
-        }
-    
-    def generate_next_day(self, stock_code: str) -> OHLCV:
-        """基于历史数据生成下一个交易日的 K 线数据"""
-        stock = self.stocks.get(stock_code)
-        if not stock:
+    def _stock_indicators(self, stock_code: str) -> Optional[StockIndicators]:
+        """某只股票与最新K线同步的增量指标"""
+        if stock_code not in self.kline_store.rows:
             return None
-        
-        prev_close = self.current_prices.get(stock_code, stock.base_price)
-        pattern = self._analyze_stock_pattern(stock_code)
-        
-        # 基于历史特征生成收益率
-        # 1. 基础收益率：历史均值 + 随机波动
-        base_return = pattern["avg_return"] + random.gauss(0, pattern["volatility"])
-        
-        # 2. 趋势效应：延续近期趋势
-        trend_effect = pattern["trend"] * 0.3 * random.uniform(0.5, 1.5)
-        
-        # 3. 动量效应
-        momentum_effect = pattern["momentum"] * 0.2
-        
-        # 4. 均值回归：如果价格偏离支撑/阻力位太远，会有回归趋势
-        if prev_close < pattern["support"]:
-            reversion = (pattern["support"] - prev_close) / prev_close * 0.1
-        elif prev_close > pattern["resistance"]:
-            reversion = (pattern["resistance"] - prev_close) / prev_close * 0.1
-        else:
-            reversion = 0
-        
-        # 5. 市场情绪影响
-        market_effect = self.market_state.trend_strength * stock.beta * 0.005
-        
-        # 综合收益率
-        daily_return = base_return + trend_effect + momentum_effect + reversion + market_effect
-        
-        # 限制单日涨跌幅 (A股限制 ±10%，科创板 ±20%)
-        max_change = 0.20 if "688" in stock_code else 0.10
-        daily_return = max(-max_change, min(max_change, daily_return))
-        
-        # 生成 OHLCV
-        close = prev_close * (1 + daily_return)
-        
-        # 生成日内波动
-        intraday_vol = pattern["volatility"] * 0.6
-        high_mult = 1 + random.uniform(0, intraday_vol)
-        low_mult = 1 - random.uniform(0, intraday_vol)
-        
-        open_price = prev_close * (1 + random.gauss(0, pattern["volatility"] * 0.3))
-        high = max(open_price, close) * high_mult
-        low = min(open_price, close) * low_mult
-        
-        # 确保逻辑正确
-        high = max(high, open_price, close)
-        low = min(low, open_price, close)
-        
-        # 成交量：基于历史平均和波动
-        history = self.price_history.get(stock_code, [])
-        if history:
-            avg_volume = sum(h.volume for h in history[-20:]) / min(20, len(history))
-            volume = int(avg_volume * (1 + abs(daily_return) * 5) * random.uniform(0.7, 1.3))
-        else:
-            volume = int(1000000 * random.uniform(0.5, 1.5))
-        
-        change_pct = round(daily_return * 100, 2)
-        
-        # 生成日期 (当前游戏日期的下一个交易日)
+        return self.indicators.get(self.kline_store, stock_code)
+    
+    def get_indicators(self, stock_code: str) -> Optional[Dict]:
+        """技术指标快照：MA5/10/20/60、布林带、RSI、MACD、支撑位/阻力位"""
+        indicators = self._stock_indicators(stock_code)
+        return indicators.snapshot() if indicators else None
+    
+    def advance_day(self) -> Dict[str, OHLCV]:
+        """推进一天，为所有股票生成新的 K 线数据（批量计算所有股票）"""
+        prev_close = np.array([self.current_prices[code] for code in self._codes])
+        # 统计特征取自增量指标：只追赶前一天新增的一列K线，不重新统计整个历史窗口
+        stats = self.indicators.pattern_stats(self.kline_store, self._volatility, prev_close)
+        day = simulate_next_day(prev_close, stats, self._beta, self._sector_idx, self._n_sectors,
+                                self._limit, self.market_state.trend_strength, self.rng)
+        
+        # 下一个交易日（跳过周末）
         next_date = self.current_game_date + timedelta(days=1)
-        while next_date.weekday() >= 5:  # 跳过周末
+        while next_date.weekday() >= 5:
             next_date += timedelta(days=1)
         
-        return OHLCV(
-            date=next_date.strftime("%Y-%m-%d"),
-            open=round(open_price, 2),
-            high=round(high, 2),
-            low=round(low, 2),
-            close=round(close, 2),
-            volume=volume,
-            change_pct=change_pct
-        )
-    
-    def advance_day(self) -> Dict[str, OHLCV]:
-        """推进一天，为所有股票生成新的 K 线数据"""
-        new_candles = {}
-        
-        for stock_code in self.stocks.keys():
-            candle = self.generate_next_day(stock_code)
-            if candle:
-                # 更新价格历史
-                self.price_history[stock_code].append(candle)
-                # 更新当前价格
-                self.current_prices[stock_code] = candle.close
-                new_candles[stock_code] = candle
+        new_candles = self._append_candles({k: v[None, :] for k, v in day.items()},
+                                           [next_date.strftime("%Y-%m-%d")])[0]
         
         # 更新游戏日期
         self.current_game_date += timedelta(days=1)
@@ -401,7 +322,8 @@ class MarketEngine:
         self._update_market_index()
         
         # 保存新数据到数据库
-        self._save_new_candles_to_db(new_candles)
+        self._sync_prices_to_db()
+        self._publish_quotes()
         
         return new_candles
     
@@ -414,16 +336,42 @@ class MarketEngine:
         self.month_count += 1
         return all_candles
     
+    def _append_candles(self, batch: Dict[str, np.ndarray], dates: List[str],
+                        build_candles: bool = True) -> List[Dict[str, OHLCV]]:
+        """
+        把内核生成的K线（各字段 (days, N)）追加到列式存储，更新当前价格。
+        build_candles 为 True 时返回每日 {股票代码: OHLCV}。
+        """
+        rounded = {field: np.round(batch[field], 2) for field in ("open", "high", "low", "close", "change_pct")}
+        rounded["volume"] = batch["volume"]
+        self.kline_store.append(rounded, dates)
+        self.kline_store.flush()
+        self._unsynced_days += len(dates)
+        self.write_stats["trading_days"] += len(dates)
+        self.write_stats["candles_generated"] += len(dates) * len(self._codes)
+        self.current_prices.update(zip(self._codes, rounded["close"][-1].tolist()))
+        
+        if not build_candles:
+            return []
+        columns = {field: rounded[field].tolist() for field in KLINE_FIELDS}
+        return [
+            {
+                code: OHLCV(date, columns["open"][d][i], columns["high"][d][i], columns["low"][d][i],
+                            columns["close"][d][i], columns["volume"][d][i], columns["change_pct"][d][i])
+                for i, code in enumerate(self._codes)
+            }
+            for d, date in enumerate(dates)
+        ]
+    
     def _update_market_state(self):
         """更新市场状态（趋势、波动率等）"""
         # 计算市场整体涨跌
-        total_change = 0
-        for stock_code, history in self.price_history.items():
-            if len(history) >= 2:
-                change = (history[-1].close - history[-2].close) / history[-2].close
-                total_change += change
-        
-        avg_change = total_change / len(self.stocks) if self.stocks else 0
+        store = self.kline_store
+        if self.stocks and store.span() >= 2:
+            changes = (store.latest("close") - store.latest("close", 1)) / store.latest("close", 1)
+            avg_change = float(np.nansum(changes)) / len(self.stocks)
+        else:
+            avg_change = 0
         
         # 更新趋势
         if avg_change > 0.005:
@@ -447,73 +395,126 @@ class MarketEngine:
             self.market_state.trend_strength *= 0.9
         
         # 随机调整波动率
-        self.market_state.volatility_multiplier = 0.8 + random.random() * 0.4
-    
-    def _save_new_candles_to_db(self, candles: Dict[str, OHLCV]):
-        """将新生成的 K 线数据保存到数据库"""
-        if not HAS_LONGBRIDGE or not longbridge_client:
-            return
-        
-        for stock_code, candle in candles.items():
-            kline_data = [{
-                "date": candle.date,
-                "open": candle.open,
-                "high": candle.high,
-                "low": candle.low,
-                "close": candle.close,
-                "volume": candle.volume,
-                "change_pct": candle.change_pct
-            }]
-            longbridge_client.save_kline_to_db(stock_code, kline_data)
-        
-        # 同步当前价格到数据库
-        self._sync_prices_to_db()
+        self.market_state.volatility_multiplier = 0.8 + self.rng.random() * 0.4
     
     def _sync_prices_to_db(self):
-        """同步当前价格和K线数据到数据库"""
-        if not HAS_LONGBRIDGE or not longbridge_client:
+        """把尚未写入的新K线和所有股票的当前价格在单个事务内批量写入数据库（每次推进调用一次）"""
+        if not self.persist or not HAS_LONGBRIDGE or not longbridge_client:
             return
         
+        store = self.kline_store
+        days = min(self._unsynced_days, store.span())
+        
+        # 新K线：列式存储最近 days 列
+        kline_rows = []
+        if days:
+            recent = store.matrix(days)
+            columns = [recent[field].tolist() for field in KLINE_FIELDS]
+            volume_idx = KLINE_FIELDS.index("volume")
+            dates = store.recent_dates(days)
+            for row, code in enumerate(self._codes):
+                for j in range(days):
+                    values = [column[row][j] for column in columns]
+                    if math.isnan(values[3]):  # 该股票当天没有数据
+                        continue
+                    values[volume_idx] = int(values[volume_idx])
+                    kline_rows.append((code, dates[row][j], *values))
+        
+        # 当前价格
+        price_rows = [(*row, "ai_generated") for row in self._price_rows()]
+        
+        written = longbridge_client.save_market_tick(kline_rows, price_rows)
+        self._unsynced_days = 0
+        self.write_stats["syncs"] += 1
+        self.write_stats["kline_rows_written"] += written["kline_rows"]
+        self.write_stats["price_rows_written"] += written["price_rows"]
+        print(f"[MarketEngine] Synced {len(price_rows)} stocks to database "
+              f"({written['kline_rows']} kline rows, {written['price_rows']} price rows)")
+    
+    def _price_rows(self) -> List[Tuple]:
+        """
+        所有股票的 (代码, 当前价, 涨跌, 涨跌幅, 52周最高, 52周最低, 成交量)。
+        52周高低点、最新成交量、前收盘都是对列式存储的整列切片
+        """
+        store = self.kline_store
+        highs, lows = store.high_low(252)
+        volumes, prev_closes = store.latest("volume"), store.latest("close", 1)
+        rows = []
         for code, price in self.current_prices.items():
             stock = self.stocks.get(code)
-            if stock:
-                history = self.price_history.get(code, [])
-                high_52w = max([k.high for k in history[-252:]], default=price) if history else price
-                low_52w = min([k.low for k in history[-252:]], default=price) if history else price
-                volume = history[-1].volume if history else 0
-                
-                # 计算涨跌
-                prev_close = history[-2].close if len(history) >= 2 else stock.base_price
-                change = price - prev_close
-                change_pct = (change / prev_close) * 100 if prev_close else 0
-                
-                longbridge_client.save_stock_price(
-                    code=code,
-                    current_price=round(price, 2),
-                    change=round(change, 2),
-                    change_pct=round(change_pct, 2),
-                    high_52w=round(high_52w, 2),
-                    low_52w=round(low_52w, 2),
-                    volume=volume,
-                    data_source="ai_generated"
-                )
-                
-                # 同步K线历史数据到数据库（最近60天）
-                if history:
-                    kline_data = []
-                    for k in history[-60:]:
-                        kline_data.append({
-                            "date": k.date,
-                            "open": round(k.open, 2),
-                            "high": round(k.high, 2),
-                            "low": round(k.low, 2),
-                            "close": round(k.close, 2),
-                            "volume": k.volume,
-                            "change_pct": round(((k.close - k.open) / k.open * 100) if k.open > 0 else 0, 2)
-                        })
-                    longbridge_client.save_kline_to_db(code, kline_data)
-        
-        print(f"[MarketEngine] Synced {len(self.current_prices)} stocks to database")
+            if not stock:
+                continue
+            row = store.rows[code]
+            length = int(store.lengths[row])
+            high_52w = float(highs[row]) if length else price
+            low_52w = float(lows[row]) if length else price
+            volume = int(volumes[row]) if length else 0
+            
+            # 计算涨跌
+            prev_close = float(prev_closes[row]) if length >= 2 else stock.base_price
+            change = price - prev_close
+            change_pct = (change / prev_close) * 100 if prev_close else 0
+            rows.append((code, round(price, 2), round(change, 2), round(change_pct, 2),
+                         round(high_52w, 2), round(low_52w, 2), volume))
+        return rows
+    
+    def _publish_quotes(self):
+        """
+        推进后构建全市场报价与市场概览，整体替换 quote_board 的快照。
+        /market/stocks、/market/state 直接读取快照，不再逐只查询数据库或计算报价
+        """
+        quotes = []
+        for code, price, change, change_pct, high_52w, low_52w, volume in self._price_rows():
+            stock = self.stocks[code]
+            mapping = STOCK_SYMBOL_MAPPING.get(code) or (code,)
+            quotes.append({
+                "code": code,
+                "name": stock.name,
+                "real_name": mapping[3] if len(mapping) > 3 else mapping[0],
+                "real_symbol": mapping[0],
+                "sector": stock.sector.value,
+                "price": price,
+                "change": change,
+                "change_pct": change_pct,
+                "high_52w": high_52w,
+                "low_52w": low_52w,
+                "volume": volume,
+                "pe_ratio": stock.pe_ratio,
+                "dividend_yield": stock.dividend_yield * 100,
+                "volatility": stock.volatility * 100,
+                "beta": stock.beta,
+                "description": stock.description,
+                "data_source": "simulated"
+            })
+        
+        gainers = sorted([q for q in quotes if q["change_pct"] > 0],
+                         key=lambda x: x["change_pct"], reverse=True)
+        losers = sorted([q for q in quotes if q["change_pct"] < 0],
+                        key=lambda x: x["change_pct"])
+        overview = {
+            "index_value": round(self.market_state.index_value, 2),
+            "trend": self.market_state.trend.value,
+            "trend_strength": round(self.market_state.trend_strength, 2),
+            "volatility": round(self.market_state.volatility_multiplier, 2),
+            "game_date": self.current_game_date.strftime("%Y-%m-%d"),
+            "month": self.month_count,
+            "top_gainers": [dict(q, indicators=self.get_indicators(q["code"])) for q in gainers[:3]],
+            "top_losers": [dict(q, indicators=self.get_indicators(q["code"])) for q in losers[:3]],
+            "total_stocks": len(quotes),
+            "advancing": len(gainers),
+            "declining": len(losers),
+        }
+        self.quote_board.publish(quotes, overview)
+    
+    def get_write_stats(self) -> Dict:
+        """数据库写放大指标：每模拟月（按 22 个交易日折算）写入的行数、写入行数 / 生成K线数"""
+        stats = dict(self.write_stats)
+        rows = stats["kline_rows_written"] + stats["price_rows_written"]
+        months = stats["trading_days"] / TRADING_DAYS_PER_MONTH
+        stats["rows_per_month"] = round(rows / months, 1) if months else 0.0
+        stats["write_amplification"] = (round(rows / stats["candles_generated"], 3)
+                                        if stats["candles_generated"] else 0.0)
+        return stats
     
     def _generate_daily_candle_deterministic(self, stock: StockInfo, prev_close: float, rng: random.Random) -> OHLCV:
         """生成单日K线 - 使用传入的随机生成器保证确定性"""
@@ -560,51 +561,6 @@ class MarketEngine:
             change_pct=change_pct
         )
             
-    def _generate_daily_candle(self, stock: StockInfo, prev_close: float) -> OHLCV:
-        """生成单日K线"""
-        # 基于布朗运动 + 趋势 + 随机事件
-        base_return = random.gauss(0, stock.volatility)
-        
-        # 应用市场趋势
-        trend_effect = self.market_state.trend_strength * stock.beta * 0.01
-        
-        # 应用波动率乘数
-        base_return *= self.market_state.volatility_multiplier
-        
-        # 日收益率
-        daily_return = base_return + trend_effect
-        
-        # 生成OHLC
-        close = prev_close * (1 + daily_return)
-        
-        # 日内波动
-        intraday_range = stock.volatility * 0.8
-        high = close * (1 + random.uniform(0, intraday_range))
-        low = close * (1 - random.uniform(0, intraday_range))
-        
-        # 开盘价在前收盘附近
-        open_price = prev_close * (1 + random.uniform(-0.01, 0.01))
-        
-        # 确保逻辑正确
-        high = max(high, open_price, close)
-        low = min(low, open_price, close)
-        
-        # 成交量 (基于波动率)
-        base_volume = 1000000
-        volume = int(base_volume * (1 + abs(daily_return) * 10) * random.uniform(0.5, 1.5))
-        
-        change_pct = round((close - prev_close) / prev_close * 100, 2)
-        
-        return OHLCV(
-            date="",
-            open=round(open_price, 2),
-            high=round(high, 2),
-            low=round(low, 2),
-            close=round(close, 2),
-            volume=volume,
-            change_pct=change_pct
-        )
-    
     def advance_month_with_report(self, economic_phase: str = "expansion") -> Dict[str, any]:
         """推进一个月的市场时间
         
@@ -619,8 +575,8 @@ class MarketEngine:
         # 更新市场趋势
         self._update_market_trend(economic_phase)
         
-        # 生成本月每日K线 (约22个交易日)
-        trading_days = random.randint(20, 23)
+        # 生成本月每日K线 (约22个交易日)，所有股票 × 所有交易日一次性批量生成
+        trading_days = int(self.rng.integers(20, 24))
         month_summary = {
             "gainers": [],      # 涨幅榜
             "losers": [],       # 跌幅榜
@@ -629,50 +585,40 @@ class MarketEngine:
             "market_events": []
         }
         
-        sector_returns = {sector: [] for sector in Sector}
+        month_start = np.array([self.current_prices[code] for code in self._codes])
+        batch = simulate_month(month_start, self._volatility, self._beta, self._sector_idx, self._n_sectors,
+                               trading_days, self.market_state.trend_strength,
+                               self.market_state.volatility_multiplier, self.rng)
+        dates = [(self.current_game_date + timedelta(days=day)).strftime("%Y-%m-%d") for day in range(trading_days)]
+        self._append_candles(batch, dates, build_candles=False)
         
-        for stock_code, stock_info in self.stocks.items():
-            prev_price = self.current_prices[stock_code]
-            month_start_price = prev_price
-            
-            for day in range(trading_days):
-                ohlcv = self._generate_daily_candle(stock_info, prev_price)
-                ohlcv.date = (self.current_game_date + timedelta(days=day)).strftime("%Y-%m-%d")
-                self.price_history[stock_code].append(ohlcv)
-                prev_price = ohlcv.close
-                
-                # 限制历史长度，保留最近365天
-                if len(self.price_history[stock_code]) > 365:
-                    self.price_history[stock_code] = self.price_history[stock_code][-365:]
-            
-            self.current_prices[stock_code] = prev_price
-            
-            # 计算月度涨跌幅
-            month_return = (prev_price - month_start_price) / month_start_price * 100
-            
-            if month_return > 0:
-                month_summary["gainers"].append((stock_code, stock_info.name, round(month_return, 2)))
-            else:
-                month_summary["losers"].append((stock_code, stock_info.name, round(month_return, 2)))
-            
-            sector_returns[stock_info.sector].append(month_return)
+        # 计算月度涨跌幅（以四舍五入后的收盘价计，与K线一致）
+        month_end = np.array([self.current_prices[code] for code in self._codes])
+        month_returns = (month_end - month_start) / month_start * 100
         
         # 更新游戏日期
         self.current_game_date += timedelta(days=30)
         
         # 计算板块表现
-        for sector, returns in sector_returns.items():
-            if returns:
-                avg_return = sum(returns) / len(returns)
-                month_summary["sector_performance"][sector.value] = round(avg_return, 2)
-        
-        # 排序
-        month_summary["gainers"] = sorted(month_summary["gainers"], key=lambda x: x[2], reverse=True)[:5]
-        month_summary["losers"] = sorted(month_summary["losers"], key=lambda x: x[2])[:5]
+        counts = np.bincount(self._sector_idx, minlength=self._n_sectors)
+        sums = np.bincount(self._sector_idx, weights=month_returns, minlength=self._n_sectors)
+        for idx, sector in enumerate(Sector):
+            if counts[idx]:
+                month_summary["sector_performance"][sector.value] = round(float(sums[idx] / counts[idx]), 2)
+        
+        # 涨跌榜
+        order = np.argsort(-month_returns, kind="stable")
+        month_summary["gainers"] = [
+            (self._codes[i], self.stocks[self._codes[i]].name, round(float(month_returns[i]), 2))
+            for i in order if month_returns[i] > 0
+        ][:5]
+        month_summary["losers"] = [
+            (self._codes[i], self.stocks[self._codes[i]].name, round(float(month_returns[i]), 2))
+            for i in order[::-1] if month_returns[i] <= 0
+        ][:5]
         
         # 更新大盘指数
-        all_returns = [r for returns in sector_returns.values() for r in returns]
-        avg_market_return = sum(all_returns) / len(all_returns) if all_returns else 0
+        avg_market_return = float(month_returns.mean()) if len(month_returns) else 0
         self.market_state.index_value *= (1 + avg_market_return / 100)
         month_summary["index_change"] = round(avg_market_return, 2)
         
@@ -681,6 +627,7 @@ class MarketEngine:
         
         # 同步本月数据到数据库
         self._sync_prices_to_db()
+        self._publish_quotes()
         
         return month_summary
     
@@ -691,7 +638,7 @@ class MarketEngine:
         # 趋势转换概率
         trend_change_prob = 0.15 + (self.market_state.days_in_trend / 365) * 0.1
         
-        if random.random() < trend_change_prob:
+        if self.rng.random() < trend_change_prob:
             # 根据经济阶段决定新趋势
             if economic_phase == "expansion":
                 weights = [0.5, 0.2, 0.3]  # 牛市概率高
@@ -702,10 +649,8 @@ class MarketEngine:
             else:  # trough
                 weights = [0.4, 0.3, 0.3]  # 可能反转
             
-            new_trend = random.choices(
-                [TrendType.BULL, TrendType.BEAR, TrendType.SIDEWAYS],
-                weights=weights
-            )[0]
+            trends = [TrendType.BULL, TrendType.BEAR, TrendType.SIDEWAYS]
+            new_trend = trends[self.rng.choice(len(trends), p=np.array(weights) / sum(weights))]
             
             if new_trend != self.market_state.trend:
                 self.market_state.trend = new_trend
@@ -713,17 +658,17 @@ class MarketEngine:
         
         # 更新趋势强度
         if self.market_state.trend == TrendType.BULL:
-            self.market_state.trend_strength = random.uniform(0.2, 0.8)
+            self.market_state.trend_strength = self.rng.uniform(0.2, 0.8)
         elif self.market_state.trend == TrendType.BEAR:
-            self.market_state.trend_strength = random.uniform(-0.8, -0.2)
+            self.market_state.trend_strength = self.rng.uniform(-0.8, -0.2)
         else:
-            self.market_state.trend_strength = random.uniform(-0.2, 0.2)
+            self.market_state.trend_strength = self.rng.uniform(-0.2, 0.2)
         
         # 波动率调整
         if economic_phase in ["peak", "contraction"]:
-            self.market_state.volatility_multiplier = random.uniform(1.2, 1.8)
+            self.market_state.volatility_multiplier = self.rng.uniform(1.2, 1.8)
         else:
-            self.market_state.volatility_multiplier = random.uniform(0.8, 1.2)
+            self.market_state.volatility_multiplier = self.rng.uniform(0.8, 1.2)
     
     def _generate_market_events(self, economic_phase: str) -> List[str]:
         """生成市场事件新闻"""
@@ -753,11 +698,13 @@ class MarketEngine:
         ]
         
         if self.market_state.trend == TrendType.BULL:
-            events.extend(random.sample(bull_events, min(2, len(bull_events))))
+            candidates = bull_events
         elif self.market_state.trend == TrendType.BEAR:
-            events.extend(random.sample(bear_events, min(2, len(bear_events))))
+            candidates = bear_events
         else:
-            events.extend(random.sample(neutral_events, min(2, len(neutral_events))))
+            candidates = neutral_events
+        picks = self.rng.choice(len(candidates), size=min(2, len(candidates)), replace=False)
+        events.extend(candidates[i] for i in picks)
         
         return events
     
@@ -800,14 +747,18 @@ class MarketEngine:
                 "volatility": stock.volatility * 100,
                 "beta": stock.beta,
                 "description": stock.description,
+                "indicators": self.get_indicators(stock_code),
                 "data_source": "realtime"  # 标记数据来源
             }
         
         # 如果无法获取真实数据，使用模拟数据
         current_price = self.current_prices[stock_code]
-        history = self.price_history.get(stock_code, [])
+        store = self.kline_store
+        row = store.rows[stock_code]
+        length = int(store.lengths[row])
+        high_52w, low_52w = store.high_low(252, stock_code)
         
-        prev_close = history[-2].close if len(history) >= 2 else stock.base_price
+        prev_close = float(store.latest("close", 1)[row]) if length >= 2 else stock.base_price
         change = current_price - prev_close
         change_pct = (change / prev_close) * 100 if prev_close else 0
         
@@ -818,42 +769,23 @@ class MarketEngine:
             "price": round(current_price, 2),
             "change": round(change, 2),
             "change_pct": round(change_pct, 2),
-            "high_52w": max([k.high for k in history[-252:]] if history else [current_price]),
-            "low_52w": min([k.low for k in history[-252:]] if history else [current_price]),
-            "volume": history[-1].volume if history else 0,
+            "high_52w": float(high_52w) if length else current_price,
+            "low_52w": float(low_52w) if length else current_price,
+            "volume": int(store.latest("volume")[row]) if length else 0,
             "pe_ratio": stock.pe_ratio,
             "dividend_yield": stock.dividend_yield * 100,
             "volatility": stock.volatility * 100,
             "beta": stock.beta,
             "description": stock.description,
+            "indicators": self.get_indicators(stock_code),
             "data_source": "simulated"  # 标记数据来源
         }
     
-    def get_stock_kline(self, stock_code: str, days: int = 30) -> List[Dict]:
-        """获取K线数据 - 优先使用真实市场数据"""
-        # 尝试从 Longbridge 获取真实 K 线数据
-        if HAS_LONGBRIDGE and longbridge_client:
-            real_kline = longbridge_client.get_kline_history(stock_code, days)
-            if real_kline:
-                return real_kline
-        
-        # 如果无法获取真实数据，使用模拟数据
-        if stock_code not in self.price_history:
+    def get_stock_kline(self, stock_code: str, days: int = 30, period: str = "day") -> List[Dict]:
+        """获取K线数据：日K取自列式存储，周K/月K/季K取自随日K增量维护的K线金字塔（days 为K线根数）"""
+        if stock_code not in self.kline_store.rows:
             return []
-        
-        history = self.price_history[stock_code][-days:]
-        return [
-            {
-                "date": k.date,
-                "open": k.open,
-                "high": k.high,
-                "low": k.low,
-                "close": k.close,
-                "volume": k.volume,
-                "change_pct": k.change_pct
-            }
-            for k in history
-        ]
+        return self.kline_store.bars(stock_code, period, days)
     
     def get_all_stocks(self) -> List[Dict]:
         """获取所有股票列表"""
@@ -873,27 +805,8 @@ class MarketEngine:
         ]
     
     def get_market_overview(self) -> Dict:
-        """获取市场概览"""
-        all_quotes = self.get_all_stocks()
-        
-        gainers = sorted([q for q in all_quotes if q["change_pct"] > 0], 
-                        key=lambda x: x["change_pct"], reverse=True)
-        losers = sorted([q for q in all_quotes if q["change_pct"] < 0], 
-                       key=lambda x: x["change_pct"])
-        
-        return {
-            "index_value": round(self.market_state.index_value, 2),
-            "trend": self.market_state.trend.value,
-            "trend_strength": round(self.market_state.trend_strength, 2),
-            "volatility": round(self.market_state.volatility_multiplier, 2),
-            "game_date": self.current_game_date.strftime("%Y-%m-%d"),
-            "month": self.month_count,
-            "top_gainers": gainers[:3],
-            "top_losers": losers[:3],
-            "total_stocks": len(all_quotes),
-            "advancing": len([q for q in all_quotes if q["change_pct"] > 0]),
-            "declining": len([q for q in all_quotes if q["change_pct"] < 0]),
-        }
+        """获取市场概览（读取最近一次推进后发布的报价快照）"""
+        return self.quote_board.snapshot.overview
     
     def apply_sector_event(self, sector: Sector, impact: float):
         """应用板块事件影响
@@ -906,6 +819,7 @@ class MarketEngine:
             if stock.sector == sector:
                 self.current_prices[code] *= (1 + impact)
                 self.current_prices[code] = round(self.current_prices[code], 2)
+        self._publish_quotes()
     
     def apply_market_shock(self, impact: float):
         """应用全市场冲击事件（如股灾、大牛市）
@@ -920,6 +834,7 @@ class MarketEngine:
             self.current_prices[code] = round(self.current_prices[code], 2)
         
         self.market_state.index_value *= (1 + impact)
+        self._publish_quotes()
 
 
 # 全局实例 - 初始化时自动从数据库加载历史数据
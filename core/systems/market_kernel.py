@@ -0,0 +1,145 @@
+"""
+市场模拟内核 - 基于 NumPy 的批量K线生成
+一次性生成"所有股票 × 所有交易日"的价格路径，替代逐股票、逐日的 Python 循环。
+收益率冲击采用因子结构：大盘因子（按 beta 加载）+ 行业因子 + 个股特质，
+三者权重平方和为 1，因此每只股票的波动率保持不变，只引入了相关性。
+所有随机数来自调用方传入的 numpy Generator，相同种子得到相同结果。
+"""
+from typing import Dict
+
+import numpy as np
+
+MARKET_LOADING = 0.4        # beta = 1 时个股冲击与大盘因子的相关系数
+MAX_MARKET_WEIGHT = 0.85    # 大盘因子权重上限（高 beta 股票）
+SECTOR_LOADING = 0.3        # 个股冲击与行业因子的相关系数
+MIN_PATTERN_DAYS = 20       # 历史不足该天数时使用默认统计特征
+HISTORY_DAYS = 365          # 保留的历史长度
+
+KLINE_FIELDS = ("open", "high", "low", "close", "volume", "change_pct")
+
+
+def factor_weights(beta: np.ndarray):
+    """每只股票在大盘、行业、特质三个因子上的权重"""
+    market_w = np.clip(MARKET_LOADING * beta, 0.0, MAX_MARKET_WEIGHT)
+    sector_w = np.full_like(market_w, SECTOR_LOADING)
+    idio_w = np.sqrt(1.0 - market_w ** 2 - sector_w ** 2)
+    return market_w, sector_w, idio_w
+
+
+def correlated_shocks(rng: np.random.Generator, n_days: int, beta: np.ndarray,
+                      sector_idx: np.ndarray, n_sectors: int) -> np.ndarray:
+    """生成 (n_days, N) 的标准正态冲击，股票间按大盘/行业因子相关"""
+    market_w, sector_w, idio_w = factor_weights(beta)
+    market = rng.standard_normal((n_days, 1))
+    sector = rng.standard_normal((n_days, n_sectors))[:, sector_idx]
+    idio = rng.standard_normal((n_days, beta.shape[0]))
+    return market_w * market + sector_w * sector + idio_w * idio
+
+
+def simulate_month(prev_close: np.ndarray, volatility: np.ndarray, beta: np.ndarray,
+                   sector_idx: np.ndarray, n_sectors: int, n_days: int,
+                   trend_strength: float, vol_multiplier: float,
+                   rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """
+    生成 n_days 个交易日的K线，返回各字段 (n_days, N) 的数组。
+    单日模型与 MarketEngine._generate_daily_candle_deterministic 一致：
+    收益率 = 冲击 × 波动率 × 波动率乘数 + 趋势强度 × beta × 1%
+    """
+    shape = (n_days, prev_close.shape[0])
+    shocks = correlated_shocks(rng, n_days, beta, sector_idx, n_sectors)
+    returns = shocks * volatility * vol_multiplier + trend_strength * beta * 0.01
+    returns = np.maximum(returns, -0.95)  # 防止价格穿透为负
+
+    close = prev_close * np.cumprod(1.0 + returns, axis=0)
+    prev = np.vstack([prev_close[None, :], close[:-1]])
+
+    # 开盘价在前收盘附近，日内振幅与波动率相关
+    open_ = prev * (1.0 + rng.uniform(-0.01, 0.01, shape))
+    intraday_range = volatility * 0.8
+    high = close * (1.0 + rng.random(shape) * intraday_range)
+    low = close * (1.0 - rng.random(shape) * intraday_range)
+    high = np.maximum(high, np.maximum(open_, close))
+    low = np.minimum(low, np.minimum(open_, close))
+
+    volume = (1_000_000 * (1.0 + np.abs(returns) * 10) * rng.uniform(0.5, 1.5, shape)).astype(np.int64)
+    change_pct = (close - prev) / prev * 100
+
+    return {"open": open_, "high": high, "low": low, "close": close,
+            "volume": volume, "change_pct": change_pct}
+
+
+def pattern_stats(history: Dict[str, np.ndarray], volatility: np.ndarray, prev_close: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    对整个历史窗口重新统计每只股票的统计特征（advance_day 使用同口径的增量版本
+    IndicatorEngine.pattern_stats，此函数作为参照）。
+    history 中各字段为 (N, T) 数组，历史较短的股票在左侧以 NaN 填充。
+    """
+    close = history["close"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        prev = close[:, :-1]
+        returns = np.where(prev > 0, (close[:, 1:] - prev) / prev, np.nan)
+        days = np.sum(~np.isnan(close), axis=1)
+        has_returns = np.any(~np.isnan(returns), axis=1)
+        valid = days >= MIN_PATTERN_DAYS
+
+        safe = np.where(has_returns[:, None], returns, 0.0)
+        avg_return = np.nanmean(safe, axis=1)
+        hist_vol = np.nanstd(safe, axis=1)
+        trend = np.nanmean(safe[:, -20:], axis=1)
+        momentum = np.nanmean(safe[:, -5:], axis=1) - trend
+        support = np.nanmin(np.where(valid[:, None], history["low"][:, -60:], 0.0), axis=1)
+        resistance = np.nanmax(np.where(valid[:, None], history["high"][:, -60:], 0.0), axis=1)
+        avg_volume = np.nanmean(np.where(days[:, None] > 0, history["volume"][:, -20:], 0.0), axis=1)
+
+    return {
+        "volatility": np.where(valid, hist_vol, volatility),
+        "avg_return": np.where(valid, avg_return, 0.0),
+        "trend": np.where(valid, trend, 0.0),
+        "momentum": np.where(valid, momentum, 0.0),
+        "support": np.where(valid, support, prev_close * 0.9),
+        "resistance": np.where(valid, resistance, prev_close * 1.1),
+        "avg_volume": np.where(days > 0, avg_volume, np.nan),
+    }
+
+
+def simulate_next_day(prev_close: np.ndarray, stats: Dict[str, np.ndarray], beta: np.ndarray,
+                      sector_idx: np.ndarray, n_sectors: int, limit: np.ndarray,
+                      trend_strength: float, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """
+    基于历史统计特征生成下一交易日K线：历史均值 + 波动、趋势延续、动量、
+    支撑/阻力位均值回归、市场情绪，返回各字段 (N,) 的数组。
+    """
+    n = prev_close.shape[0]
+    vol = stats["volatility"]
+    shocks = correlated_shocks(rng, 1, beta, sector_idx, n_sectors)[0]
+
+    base_return = stats["avg_return"] + shocks * vol
+    trend_effect = stats["trend"] * 0.3 * rng.uniform(0.5, 1.5, n)
+    momentum_effect = stats["momentum"] * 0.2
+    # 价格偏离支撑/阻力位时向其回归
+    reversion = np.where(prev_close < stats["support"], (stats["support"] - prev_close) / prev_close * 0.1,
+                         np.where(prev_close > stats["resistance"],
+                                  (stats["resistance"] - prev_close) / prev_close * 0.1, 0.0))
+    market_effect = trend_strength * beta * 0.005
+
+    returns = np.clip(base_return + trend_effect + momentum_effect + reversion + market_effect, -limit, limit)
+    close = prev_close * (1.0 + returns)
+
+    intraday_vol = vol * 0.6
+    high_mult = 1.0 + rng.random(n) * intraday_vol
+    low_mult = 1.0 - rng.random(n) * intraday_vol
+    open_ = prev_close * (1.0 + rng.standard_normal(n) * vol * 0.3)
+    high = np.maximum(np.maximum(open_, close) * high_mult, np.maximum(open_, close))
+    low = np.minimum(np.minimum(open_, close) * low_mult, np.minimum(open_, close))
+
+    # 成交量：有历史时基于近 20 日均量和涨跌幅，否则随机
+    no_history = np.isnan(stats["avg_volume"])
+    u = rng.random(n)
+    volume = np.where(
+        no_history,
+        1_000_000 * (0.5 + u),
+        np.nan_to_num(stats["avg_volume"]) * (1.0 + np.abs(returns) * 5) * (0.7 + 0.6 * u)
+    ).astype(np.int64)
+
+    return {"open": open_, "high": high, "low": low, "close": close,
+            "volume": volume, "change_pct": returns * 100}
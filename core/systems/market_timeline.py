@@ -0,0 +1,137 @@
+"""
+市场时间线 - 全局市场时钟与各玩家的月份推进解耦
+市场只有一条世界时间线：每个世界月份只模拟一次（advance_month_with_report），月报缓存在时间线上。
+玩家推进到第 m 个月时读取世界第 m 个月的月报：
+- 已经有玩家到过这个月：直接查表，不再模拟（N 个玩家推进同一个月，市场只前进一个月）
+- 该玩家是最先到达的：时钟前进到第 m 个月并缓存月报
+- 请求的月份比世界时钟超前不止一个月（重启后缓存为空、老存档继续游戏）时不补算中间月份，
+  直接把时钟拨到请求的月份
+- 请求的是世界时钟已经走过、但缓存里没有的月份（落后的会话、缓存已淘汰或重启后的老存档）：
+  市场只有一份价格，时钟不能倒拨，也不为单个会话重放历史。返回此前最近一个月（没有则最早）
+  月报的副本，month 为请求的月份，stale=True，source_month 为实际取自的世界月份
+
+冻结的市场：落后于世界时钟的会话看到的股价始终是世界当前的价格，不随该会话自己的月份变化，
+追上世界时钟之前它的持仓市值不会因"自己的"月份而涨跌；月报带 stale 标记时前端应按"市场数据
+取自其他月份"展示，而不是把 index_change 当作这个会话当月的行情。
+可选的后台调度器按固定间隔推进世界时钟（ECHOPOLIS_MARKET_TICK_SECONDS，默认关闭，只按需推进）。
+设置了市场种子（ECHOPOLIS_MARKET_SEED）时，每个世界月份的随机序列只由 (种子, 月份) 决定，可以重放。
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+MARKET_TICK_SECONDS = float(os.getenv("ECHOPOLIS_MARKET_TICK_SECONDS", "0"))  # 后台调度间隔，0 表示关闭
+MAX_CACHED_MONTHS = 240  # 缓存的月报数量上限（20 年）
+
+
+class MarketTimeline:
+    """世界市场时钟 + 月报缓存"""
+
+    def __init__(self, engine, max_months: int = MAX_CACHED_MONTHS):
+        self.engine = engine
+        self.max_months = max_months
+        self.world_month = engine.month_count
+        self.last_phase = "expansion"
+        self._reports: "OrderedDict[int, Dict]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._scheduler: Optional[threading.Thread] = None
+        self.stats = {"ticks": 0, "lookups": 0, "cache_hits": 0, "stale_hits": 0, "tick_seconds": 0.0,
+                      "hit_seconds": 0.0}
+
+    def tick(self, economic_phase: Optional[str] = None) -> Dict:
+        """世界时钟前进一个月，缓存并返回月报"""
+        with self._lock:
+            phase = economic_phase or self.last_phase
+            started = time.perf_counter()
+            if self.engine.seed is not None:
+                # 设置了市场种子时每个世界月份使用固定的随机序列，与此前抽取了多少次无关
+                self.engine.rng = np.random.default_rng([self.engine.seed, self.world_month + 1])
+            report = self.engine.advance_month_with_report(phase)
+            self.world_month += 1
+            report["month"] = self.world_month
+            report["stale"] = False
+            self._reports[self.world_month] = report
+            while len(self._reports) > self.max_months:
+                self._reports.popitem(last=False)
+            self.stats["ticks"] += 1
+            self.stats["tick_seconds"] += time.perf_counter() - started
+            print(f"[MarketTimeline] World month {self.world_month} ({phase}), "
+                  f"index_change={report.get('index_change')}%")
+            return report
+
+    def report_for(self, month: int, economic_phase: str = "expansion") -> Dict:
+        """
+        第 month 个月的市场月报（只读，多个会话共享同一个对象）；月份超过世界时钟时推进时钟。
+        世界时钟已走过但没有缓存的月份返回带 stale 标记的替代月报（见模块说明）。
+        """
+        started = time.perf_counter()
+        with self._lock:
+            self.stats["lookups"] += 1
+            self.last_phase = economic_phase
+            report = self._reports.get(month)
+            if report is not None:
+                self.stats["cache_hits"] += 1
+                self.stats["hit_seconds"] += time.perf_counter() - started
+                return report
+            if month > self.world_month:
+                self.world_month = max(self.world_month, month - 1)  # 不补算中间月份
+                return self.tick(economic_phase)
+            # 没有缓存的历史月份：此前最近一个月，没有则取最早的缓存，标记为替代月报
+            earlier = [m for m in self._reports if m <= month]
+            source = max(earlier) if earlier else next(iter(self._reports), None)
+            if source is None:
+                return self.tick(economic_phase)
+            self.stats["stale_hits"] += 1
+            return {**self._reports[source], "month": month, "stale": True, "source_month": source}
+
+    # ---------- 后台调度 ----------
+
+    def start(self, interval: float = MARKET_TICK_SECONDS):
+        """启动后台调度线程，每 interval 秒推进一次世界时钟"""
+        if interval <= 0 or self._scheduler is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.tick()
+                except Exception as e:
+                    print(f"[MarketTimeline] Scheduled tick failed: {e}")
+
+        self._scheduler = threading.Thread(target=run, name="echopolis-market-clock", daemon=True)
+        self._scheduler.start()
+        print(f"[MarketTimeline] Scheduler started, interval={interval}s")
+
+    def stop(self):
+        self._stop.set()
+        self._scheduler = None
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            lookups, ticks = stats["lookups"], stats["ticks"]
+            stats["world_month"] = self.world_month
+            stats["cached_months"] = len(self._reports)
+            stats["hit_rate"] = round(stats["cache_hits"] / lookups, 3) if lookups else 0.0
+            tick_seconds, hit_seconds = stats.pop("tick_seconds"), stats.pop("hit_seconds")
+            stats["avg_tick_ms"] = round(tick_seconds / ticks * 1000, 2) if ticks else 0.0
+            stats["avg_hit_ms"] = round(hit_seconds / stats["cache_hits"] * 1000, 4) if stats["cache_hits"] else 0.0
+            stats["scheduler"] = self._scheduler is not None
+            return stats
+
+
+def _create_timeline() -> MarketTimeline:
+    from .market_engine import market_engine
+    timeline = MarketTimeline(market_engine)
+    timeline.start()
+    return timeline
+
+
+# 全局实例
+market_timeline = _create_timeline()
@@ -0,0 +1,94 @@
+"""
+行情快照板 - MarketEngine 每次推进后整体替换一份不可变快照（带递增版本号）
+读取方只拿当前快照的引用，不查询数据库，也不逐只计算报价：
+- 快照在写入方构建完成后一次性替换，读取方看到的要么是旧版本，要么是新版本，不会读到一半
+- ETag 由进程令牌 + 版本号组成，数据未变化时接口直接返回 304
+- 紧凑格式：字段名列表 + 每只股票一个数组（array-of-arrays），省去重复的键名
+- 每种格式的 JSON 编码结果缓存在快照内，同一版本只编码一次
+- 发布后依次通知监听者（旧快照, 新快照），供推送通道计算增量
+"""
+import json
+import threading
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 紧凑格式的字段（轮询时需要的动态字段 + 列表展示用的名称/板块）
+COMPACT_FIELDS = ("code", "name", "sector", "price", "change", "change_pct", "volume", "high_52w", "low_52w")
+
+
+class QuoteSnapshot:
+    """某一版本的全市场报价，构建后不再修改"""
+
+    def __init__(self, token: str, version: int, quotes: List[Dict], overview: Dict):
+        self.token = token
+        self.version = version
+        self.quotes = quotes          # 每只股票一个报价 dict，按股票池顺序
+        self.overview = overview      # 市场概览（MarketEngine.get_market_overview 的返回值）
+        self._encoded: Dict[str, bytes] = {}
+        self._rows: Optional[List[list]] = None
+
+    def etag(self, kind: str) -> str:
+        return f'W/"{kind}-{self.token}-{self.version}"'
+
+    def rows(self, fields: Tuple[str, ...] = COMPACT_FIELDS) -> List[list]:
+        """array-of-arrays：每只股票按 fields 顺序取值（紧凑字段的结果缓存在快照内）"""
+        if fields == COMPACT_FIELDS and self._rows is not None:
+            return self._rows
+        rows = [[quote.get(field) for field in fields] for quote in self.quotes]
+        if fields == COMPACT_FIELDS:
+            self._rows = rows
+        return rows
+
+    def changed_rows(self, previous: Optional["QuoteSnapshot"]) -> List[list]:
+        """与 previous 相比发生变化的紧凑行（previous 为空时返回全部）"""
+        rows = self.rows()
+        if previous is None:
+            return rows
+        return [row for row, old in zip(rows, previous.rows()) if row != old]
+
+    def payload(self, kind: str) -> dict:
+        """接口响应体：stocks（完整报价）/ compact（紧凑报价）/ state（市场概览）"""
+        if kind == "stocks":
+            return {"success": True, "version": self.version, "stocks": self.quotes}
+        if kind == "compact":
+            return {"success": True, "version": self.version, "fields": list(COMPACT_FIELDS), "rows": self.rows()}
+        if kind == "state":
+            return {"success": True, "version": self.version, "state": self.overview}
+        raise ValueError(f"未知的快照格式: {kind}")
+
+    def encode(self, kind: str) -> bytes:
+        """响应体的 JSON 编码（按格式缓存；并发首次编码时结果相同，重复计算无害）"""
+        encoded = self._encoded.get(kind)
+        if encoded is None:
+            encoded = json.dumps(self.payload(kind), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self._encoded[kind] = encoded
+        return encoded
+
+
+class QuoteBoard:
+    """全市场报价板：写入方 publish 新快照，读取方读取 snapshot 属性"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.token = uuid.uuid4().hex[:8]  # 区分进程重启前后的版本号
+        self.version = 0
+        self.snapshot: Optional[QuoteSnapshot] = None
+        self._listeners: List[Callable[[Optional[QuoteSnapshot], QuoteSnapshot], None]] = []
+
+    def add_listener(self, listener: Callable[[Optional[QuoteSnapshot], QuoteSnapshot], None]):
+        """注册发布监听者，在发布线程中以 (旧快照, 新快照) 调用"""
+        self._listeners.append(listener)
+
+    def publish(self, quotes: List[Dict], overview: Dict) -> QuoteSnapshot:
+        """用完整构建好的数据替换当前快照（引用赋值，读取方无需加锁）"""
+        with self._lock:
+            previous = self.snapshot
+            self.version += 1
+            snapshot = QuoteSnapshot(self.token, self.version, quotes, overview)
+            self.snapshot = snapshot
+        for listener in self._listeners:
+            try:
+                listener(previous, snapshot)
+            except Exception as e:
+                print(f"[QuoteBoard] 快照监听者执行失败: {e}")
+        return snapshot
@@ -0,0 +1,489 @@
+"""
+会话状态存储 - 把按会话保存的内存状态移出进程，API 可以用多个 uvicorn worker 运行
+原先 career_system / event_system 等模块级单例把每个玩家的状态放在进程内存里，
+多 worker 时同一个玩家的请求落到不同进程就会看到不同的状态；achievement_system 等
+不按会话区分的单例还会被每个请求覆盖。现在：
+- 会话状态按 (session_id, 命名空间) 以 JSON 保存在可替换的存储中：
+  MemorySessionStore（进程内，单 worker）、SQLiteSessionStore（默认，多 worker 共享同一个库文件）
+- session_state.scope(session_id) 进入会话作用域：取得该会话的锁（跨进程互斥，同一会话的请求串行），
+  一次读出该会话的全部状态导入各子系统；退出时只写回有变化的命名空间，并从进程内存中清除
+- 按会话区分的单例（career、events）通过 export_session / import_session / drop_session 接入；
+  不区分会话的系统（成就、保险、负债、现金流）在作用域内每个会话一个实例：scope.instance(命名空间)
+作用域可重入（同一线程内嵌套进入同一会话直接复用）；作用域内抛出异常时不写回，与数据库事务回滚一致。
+scope(session_id, write_back=False) 只计算变化（scope.changes / scope.base），由调用方决定是否写入
+（批量推进只为月份乐观检查通过的会话写入，并与数据库写事务一起提交）。
+session_state.flush(session_id, conn) 在作用域内提前写入已有的变化：存储与主库是同一个库文件时，
+月度推进在提交本月结果的写事务中调用，会话状态与本月结果一起提交；退出作用域时只写回之后的变化。
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import dataclasses
+from contextlib import contextmanager
+from enum import Enum
+from typing import Any, Dict, Optional, Union, get_args, get_origin, get_type_hints
+
+SESSION_STORE = os.getenv("ECHOPOLIS_SESSION_STORE", "sqlite")             # sqlite / memory
+SESSION_STORE_PATH = os.getenv("ECHOPOLIS_SESSION_STORE_PATH")             # 默认使用主库 echopolis.db，另设的库同样执行迁移
+LOCK_LEASE = float(os.getenv("ECHOPOLIS_SESSION_LOCK_LEASE", "120"))       # 会话锁租期（秒），持有进程崩溃后到期自动释放
+LOCK_TIMEOUT = float(os.getenv("ECHOPOLIS_SESSION_LOCK_TIMEOUT", "30"))    # 等待会话锁的最长时间（秒）
+LOCK_POLL = 0.005                                                          # 等待其他进程释放锁的初始轮询间隔（秒）
+LOCK_RENEW = LOCK_LEASE / 3                                                # 持有期间续租的间隔（秒）
+
+
+# ============ 状态序列化 ============
+
+def to_state(value: Any) -> Any:
+    """dataclass / Enum / 容器 → 可 JSON 序列化的结构"""
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {f.name: to_state(getattr(value, f.name)) for f in dataclasses.fields(value)}
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        return {key: to_state(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [to_state(item) for item in value]
+    return value
+
+
+def from_state(hint: Any, data: Any) -> Any:
+    """按类型注解把 to_state 的结果还原（dataclass、Enum、List/Dict/Optional 嵌套）"""
+    if data is None:
+        return None
+    origin = get_origin(hint)
+    if origin is Union:
+        options = [arg for arg in get_args(hint) if arg is not type(None)]
+        return from_state(options[0], data) if len(options) == 1 else data
+    if origin in (list, tuple, set):
+        args = get_args(hint)
+        items = [from_state(args[0], item) for item in data] if args else list(data)
+        return origin(items)
+    if origin is dict:
+        args = get_args(hint)
+        return {key: from_state(args[1], item) for key, item in data.items()} if args else dict(data)
+    if isinstance(hint, type) and issubclass(hint, Enum):
+        return hint(data)
+    if dataclasses.is_dataclass(hint):
+        hints = get_type_hints(hint)
+        kwargs = {f.name: from_state(hints.get(f.name, Any), data[f.name])
+                  for f in dataclasses.fields(hint) if f.init and f.name in data}
+        return hint(**kwargs)
+    return data
+
+
+# ============ 存储 ============
+
+class SessionStateStore:
+    """
+    会话状态存储接口，状态值为 JSON 字符串：
+    - load(session_id) -> {命名空间: JSON}
+    - save(session_id, {命名空间: JSON 或 None(删除)})
+      SQLite 存储的 load / save 可传入 conn，在调用方已开启的事务中执行（由调用方提交）
+    - delete(session_id)
+    - lock(session_id)：上下文管理器，同一会话同一时刻只有一个持有者（跨 worker）
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        # 进程内的会话锁：session_id -> [锁, 持有和等待的线程数]，计数归零时移除（表的大小随并发会话数而不是历史会话数增长）
+        self._thread_locks: Dict[str, list] = {}
+        self.lock_wait = 0.0  # 累计等锁时间（秒）
+
+    def _acquire_local(self, session_id: str):
+        """进程内按会话排队（不必轮询），与 _release_local 成对调用"""
+        with self._guard:
+            entry = self._thread_locks.get(session_id)
+            if entry is None:
+                entry = self._thread_locks[session_id] = [threading.Lock(), 0]
+            entry[1] += 1
+        started = time.monotonic()
+        if not entry[0].acquire(timeout=LOCK_TIMEOUT):
+            self._unref_local(session_id, entry)
+            raise TimeoutError(f"会话 {session_id} 被占用超过 {LOCK_TIMEOUT}s")
+        self._add_wait(time.monotonic() - started)
+
+    def _release_local(self, session_id: str):
+        with self._guard:
+            entry = self._thread_locks[session_id]
+        entry[0].release()
+        self._unref_local(session_id, entry)
+
+    def _unref_local(self, session_id: str, entry: list):
+        with self._guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._thread_locks[session_id]
+
+    def _add_wait(self, seconds: float):
+        with self._guard:
+            self.lock_wait += seconds
+
+    def load(self, session_id: str, conn=None) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def save(self, session_id: str, changes: Dict[str, Optional[str]], conn=None):
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    @contextmanager
+    def lock(self, session_id: str):
+        self._acquire_local(session_id)
+        try:
+            yield
+        finally:
+            self._release_local(session_id)
+
+
+class MemorySessionStore(SessionStateStore):
+    """进程内存储：只适用于单 worker（以及测试）"""
+
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self._data: Dict[str, Dict[str, str]] = {}
+
+    def load(self, session_id: str, conn=None) -> Dict[str, str]:
+        with self._guard:
+            return dict(self._data.get(session_id, {}))
+
+    def save(self, session_id: str, changes: Dict[str, Optional[str]], conn=None):
+        with self._guard:
+            states = self._data.setdefault(session_id, {})
+            for namespace, state in changes.items():
+                if state is None:
+                    states.pop(namespace, None)
+                else:
+                    states[namespace] = state
+
+    def delete(self, session_id: str):
+        with self._guard:
+            self._data.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStateStore):
+    """
+    SQLite 存储：同一台机器上的多个 worker 共享一个库文件（WAL）
+    会话锁是 session_locks 表中带租期的一行：先在进程内排队，再用 upsert 抢占过期或不存在的锁行，
+    抢不到时指数退避轮询；持有锁的进程崩溃后，租期到了其他进程即可接管。
+    持有期间由后台续租线程每 LOCK_RENEW 秒把本进程持有的锁行延长一个租期，
+    作用域内的慢操作（advance_session 中生成情境的 LLM 调用等）超过租期也不会被其他 worker 接管。
+    session_state / session_locks 两张表由数据库迁移 v5 创建，db_path 须是已初始化的 EchoPolis 库
+    （FinAIDatabase(db_path) 会执行迁移）。
+    """
+
+    name = "sqlite"
+
+    ACQUIRE_SQL = '''
+        INSERT INTO session_locks (session_id, owner, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(session_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+        WHERE session_locks.expires_at < ?
+    '''
+
+    def __init__(self, db_path: str):
+        super().__init__()
+        self.db_path = db_path
+        self._held: Dict[str, str] = {}  # 本进程持有的锁：session_id -> owner
+        self._renewer: Optional[threading.Thread] = None
+        self.renewals = 0
+
+    def _connect(self):
+        from ..database.connection import get_connection
+        return get_connection(self.db_path)
+
+    @contextmanager
+    def _transaction(self, conn=None):
+        """传入 conn 时在调用方的事务中执行（由调用方提交），否则取池化连接并在结束时提交"""
+        if conn is not None:
+            yield conn
+        else:
+            with self._connect() as own:
+                yield own
+
+    def load(self, session_id: str, conn=None) -> Dict[str, str]:
+        with self._transaction(conn) as conn:
+            rows = conn.execute('SELECT namespace, state FROM session_state WHERE session_id = ?',
+                                (session_id,)).fetchall()
+        return dict(rows)
+
+    def save(self, session_id: str, changes: Dict[str, Optional[str]], conn=None):
+        now = time.time()
+        with self._transaction(conn) as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO session_state (session_id, namespace, state, updated_at) VALUES (?, ?, ?, ?)',
+                [(session_id, ns, state, now) for ns, state in changes.items() if state is not None])
+            conn.executemany('DELETE FROM session_state WHERE session_id = ? AND namespace = ?',
+                             [(session_id, ns) for ns, state in changes.items() if state is None])
+
+    def delete(self, session_id: str):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM session_state WHERE session_id = ?', (session_id,))
+
+    @contextmanager
+    def lock(self, session_id: str):
+        self._acquire_local(session_id)
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        try:
+            started = time.monotonic()
+            delay = LOCK_POLL
+            while True:
+                now = time.time()
+                with self._connect() as conn:
+                    acquired = conn.execute(self.ACQUIRE_SQL,
+                                            (session_id, owner, now + LOCK_LEASE, now)).rowcount == 1
+                if acquired:
+                    self._hold(session_id, owner)
+                    break
+                if time.monotonic() - started > LOCK_TIMEOUT:
+                    raise TimeoutError(f"会话 {session_id} 被其他 worker 占用超过 {LOCK_TIMEOUT}s")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
+            self._add_wait(time.monotonic() - started)
+            try:
+                yield
+            finally:
+                with self._guard:
+                    self._held.pop(session_id, None)
+                with self._connect() as conn:
+                    conn.execute('DELETE FROM session_locks WHERE session_id = ? AND owner = ?', (session_id, owner))
+        finally:
+            self._release_local(session_id)
+
+    def _hold(self, session_id: str, owner: str):
+        """登记持有的锁，首次持有时启动续租线程"""
+        with self._guard:
+            self._held[session_id] = owner
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_loop, name="echopolis-session-lease", daemon=True)
+                self._renewer.start()
+
+    def _renew_loop(self):
+        while True:
+            time.sleep(LOCK_RENEW)
+            with self._guard:
+                held = list(self._held.items())
+            if not held:
+                continue
+            try:
+                expires_at = time.time() + LOCK_LEASE
+                with self._connect() as conn:
+                    for session_id, owner in held:
+                        renewed = conn.execute(
+                            'UPDATE session_locks SET expires_at = ? WHERE session_id = ? AND owner = ?',
+                            (expires_at, session_id, owner)).rowcount
+                        if not renewed:
+                            print(f"[SessionState] 会话 {session_id} 的锁已被其他 worker 接管")
+                with self._guard:
+                    self.renewals += len(held)
+            except Exception as e:
+                print(f"[SessionState] 续租会话锁失败: {e}")
+
+
+def create_store(kind: str = SESSION_STORE, db_path: Optional[str] = SESSION_STORE_PATH) -> SessionStateStore:
+    """按配置创建存储；SQLite 存储默认与主库共用 echopolis.db"""
+    if kind == "memory":
+        return MemorySessionStore()
+    if kind != "sqlite":
+        raise ValueError(f"未知的会话状态存储: {kind}")
+    if not db_path:
+        from ..database.database import db
+        db_path = db.db_path
+    else:
+        from ..database.database import FinAIDatabase
+        db_path = FinAIDatabase(db_path).db_path  # 单独的会话状态库同样建表并执行迁移
+    return SQLiteSessionStore(db_path)
+
+
+# ============ 会话作用域 ============
+
+class SessionScope:
+    """一次会话作用域：已读出的状态与本会话的子系统实例"""
+
+    def __init__(self, manager: "SessionStateManager", session_id: str, saved: Dict[str, str],
+                 write_back: bool = True):
+        self.manager = manager
+        self.session_id = session_id
+        self.saved = saved
+        self.write_back = write_back
+        self.instances: Dict[str, Any] = {}
+        self.changes: Dict[str, Optional[str]] = {}  # write_back=False 时退出作用域计算出的变化
+        self.base: Dict[str, Optional[str]] = {}     # 这些命名空间进入作用域时的状态（供调用方乐观检查）
+
+    def instance(self, namespace: str):
+        """本会话的子系统实例（achievements / insurance / debt / cashflow），首次访问时从已保存状态还原"""
+        system = self.instances.get(namespace)
+        if system is None:
+            system = self.manager.factories()[namespace]()
+            if namespace in self.saved:
+                system.import_state(json.loads(self.saved[namespace]))
+            self.instances[namespace] = system
+        return system
+
+
+class SessionStateManager:
+    """会话作用域管理：加锁、加载、写回"""
+
+    def __init__(self, store: Optional[SessionStateStore] = None):
+        self._store = store
+        self._lock = threading.Lock()  # 创建存储、更新计数
+        self._local = threading.local()
+        self._keyed = None
+        self._factories = None
+        self.stats = {"scopes": 0, "saves": 0, "unchanged": 0, "discarded": 0}
+
+    @property
+    def store(self) -> SessionStateStore:
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = create_store()
+                    print(f"[SessionState] 使用 {self._store.name} 会话状态存储")
+        return self._store
+
+    def use_store(self, store: SessionStateStore):
+        """替换存储（测试或基准脚本用）"""
+        self._store = store
+
+    def keyed_systems(self) -> Dict[str, Any]:
+        """按 session_id 保存状态的单例：命名空间 -> 实例"""
+        if self._keyed is None:
+            from .career_system import career_system
+            from .event_system import event_system
+            self._keyed = {"career": career_system, "events": event_system}
+        return self._keyed
+
+    def factories(self) -> Dict[str, Any]:
+        """每个会话一个实例的系统：命名空间 -> 类"""
+        if self._factories is None:
+            from .achievement_system import AchievementSystem
+            from .insurance_system import InsuranceSystem
+            from .debt_system import DebtSystem
+            from .cashflow_system import CashFlowSystem
+            self._factories = {"achievements": AchievementSystem, "insurance": InsuranceSystem,
+                               "debt": DebtSystem, "cashflow": CashFlowSystem}
+        return self._factories
+
+    def _active(self) -> Dict[str, SessionScope]:
+        active = getattr(self._local, "scopes", None)
+        if active is None:
+            active = self._local.scopes = {}
+        return active
+
+    def current(self, session_id: str) -> SessionScope:
+        """当前线程已进入的会话作用域"""
+        scope = self._active().get(session_id)
+        if scope is None:
+            raise RuntimeError(f"会话 {session_id} 不在 session_state.scope() 中")
+        return scope
+
+    def instance(self, session_id: str, namespace: str):
+        """当前作用域内本会话的子系统实例"""
+        return self.current(session_id).instance(namespace)
+
+    @contextmanager
+    def scope(self, session_id: str, write_back: bool = True):
+        """进入会话作用域（见模块说明）；write_back=False 时退出时不写回，只把变化留在 scope.changes"""
+        active = self._active()
+        if session_id in active:
+            yield active[session_id]
+            return
+
+        store = self.store
+        keyed = self.keyed_systems()
+        with store.lock(session_id):
+            saved = store.load(session_id)
+            scope = SessionScope(self, session_id, saved, write_back)
+            active[session_id] = scope
+            self._count("scopes")
+            try:
+                for namespace, system in keyed.items():
+                    system.import_session(session_id, json.loads(saved[namespace]) if namespace in saved else None)
+                try:
+                    yield scope
+                except BaseException:
+                    self._count("discarded")
+                    raise
+                if write_back:
+                    self._write_back(scope, keyed)
+                else:
+                    scope.changes = self._changes(scope, keyed)
+                    scope.base = {namespace: saved.get(namespace) for namespace in scope.changes}
+            finally:
+                del active[session_id]
+                for system in keyed.values():
+                    system.drop_session(session_id)
+
+    @staticmethod
+    def _changes(scope: SessionScope, keyed: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """内容有变化的命名空间：命名空间 -> JSON（None 表示删除）"""
+        states = {namespace: system.export_session(scope.session_id) for namespace, system in keyed.items()}
+        states.update({namespace: system.export_state() for namespace, system in scope.instances.items()})
+        changes = {}
+        for namespace, state in states.items():
+            encoded = json.dumps(state, ensure_ascii=False, sort_keys=True) if state else None
+            if encoded != scope.saved.get(namespace):
+                changes[namespace] = encoded
+        return changes
+
+    def shares_db(self, db_path: str) -> bool:
+        """会话状态存储与 db_path 是同一个 SQLite 库文件（可以在该库的事务中写入会话状态）"""
+        store = self.store
+        return (isinstance(store, SQLiteSessionStore)
+                and os.path.realpath(store.db_path) == os.path.realpath(db_path))
+
+    def flush(self, session_id: str, conn=None):
+        """
+        立即写入当前线程会话作用域内已有的变化（conn 为调用方的事务，随其提交），写入的内容记为已保存，
+        退出作用域时只写回之后的变化；不在作用域内或作用域不写回（write_back=False）时什么也不做
+        """
+        scope = self._active().get(session_id)
+        if scope is None or not scope.write_back:
+            return
+        changes = self._changes(scope, self.keyed_systems())
+        if not changes:
+            return
+        self.store.save(session_id, changes, conn=conn)
+        saved = dict(scope.saved)
+        for namespace, state in changes.items():
+            if state is None:
+                saved.pop(namespace, None)
+            else:
+                saved[namespace] = state
+        scope.saved = saved
+        self._count("saves")
+
+    def _write_back(self, scope: SessionScope, keyed: Dict[str, Any]):
+        """只写回内容有变化的命名空间"""
+        changes = self._changes(scope, keyed)
+        if changes:
+            self.store.save(scope.session_id, changes)
+            self._count("saves")
+        else:
+            self._count("unchanged")
+
+    def delete(self, session_id: str):
+        """删除会话的全部状态"""
+        with self.store.lock(session_id):
+            self.store.delete(session_id)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get_stats(self) -> Dict:
+        store = self.store
+        with self._lock:
+            stats = dict(self.stats)
+        with store._guard:
+            lock_wait, renewals = store.lock_wait, getattr(store, "renewals", 0)
+            local_locks = len(store._thread_locks)
+        return {**stats, "store": store.name, "lock_wait_seconds": round(lock_wait, 3),
+                "lease_renewals": renewals, "local_locks": local_locks}
+
+
+# 全局实例
+session_state = SessionStateManager()
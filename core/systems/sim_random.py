@@ -0,0 +1,67 @@
+"""
+模拟随机数上下文 - 让一次会话推进可以按种子精确重放
+每个会话在创建时记录一个种子（sessions.sim_seed）。推进某个月时进入 simulation(seed, month) 上下文，
+各模拟子系统通过 sim_rng("macro") / sim_rng("events") / ... 取随机数生成器：
+- 每个子系统一条独立的流，种子由 (会话种子, 月份, 子系统名) 派生。某个子系统多抽或少抽一次，
+  不会让其他子系统的结果错位
+- 相同种子、相同月份得到完全相同的随机序列，可用于结果缓存和可重复的基准测试
+- 不在 simulation 上下文中时（未记录种子的旧会话、非推进路径）返回全局 random 模块，行为与原来一致
+上下文保存在 contextvars 中，执行器（app.services.executors）提交任务时会复制上下文，跨线程同样生效。
+"""
+import os
+import random
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Union
+
+SIM_SEED = os.getenv("ECHOPOLIS_SIM_SEED")  # 设置后新会话都使用这个种子（基准测试/重放）
+
+RandomSource = Union[random.Random, type(random)]
+
+
+class SimulationRandom:
+    """一次模拟步骤（某个种子的某个月）的随机数：每个子系统一条流，首次使用时创建"""
+
+    def __init__(self, seed: int, month: int):
+        self.seed = seed
+        self.month = month
+        self._streams: Dict[str, random.Random] = {}
+
+    def stream(self, name: str) -> random.Random:
+        rng = self._streams.get(name)
+        if rng is None:
+            rng = self._streams[name] = random.Random(f"{self.seed}:{self.month}:{name}")
+        return rng
+
+
+_current: contextvars.ContextVar[Optional[SimulationRandom]] = contextvars.ContextVar(
+    "echopolis_simulation_random", default=None
+)
+
+
+def sim_rng(stream: str) -> RandomSource:
+    """当前模拟上下文中子系统 stream 的随机数生成器；不在上下文中时返回全局 random 模块"""
+    context = _current.get()
+    return context.stream(stream) if context is not None else random
+
+
+@contextmanager
+def simulation(seed: Optional[int], month: int) -> Iterator[Optional[SimulationRandom]]:
+    """进入某个种子第 month 个月的模拟上下文；seed 为空时不改变随机数来源"""
+    if seed is None:
+        yield None
+        return
+    token = _current.set(SimulationRandom(seed, month))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def new_session_seed(seed: Optional[int] = None) -> int:
+    """新会话的种子：显式指定 > ECHOPOLIS_SIM_SEED > 随机生成（随机生成的种子同样会记录，可事后重放）"""
+    if seed is not None:
+        return int(seed)
+    if SIM_SEED:
+        return int(SIM_SEED)
+    return random.SystemRandom().getrandbits(31)
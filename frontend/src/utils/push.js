@@ -0,0 +1,70 @@
+/**
+ * 推送通道 - 订阅 /api/ws 的行情与会话更新，断线后指数退避重连
+ * 行情帧：base 为 null 是完整快照；否则是相对 base 版本的增量，
+ * 只有 base 与本地版本一致时才能应用，不一致说明漏了帧，断开重连以取得完整快照
+ */
+import { getApiBaseUrl } from './api'
+
+// 构建 WebSocket URL（与页面同源，生产环境带 /echopolis 前缀）
+export const buildWsUrl = (path) => {
+  const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
+  return `${protocol}//${window.location.host}${getApiBaseUrl()}${path}`
+}
+
+/**
+ * 建立推送连接
+ * @param {Object} options
+ * @param {string[]} options.topics - 'market' / 'session'
+ * @param {string} [options.sessionId] - 订阅 session 时必填
+ * @param {Function} [options.onMarket] - (stocks, state)，stocks 为按代码合并后的全部股票
+ * @param {Function} [options.onSession] - (frame)，advance_session 月度摘要
+ * @returns {Function} 关闭连接
+ */
+export const connectPush = ({ topics = ['market'], sessionId = null, onMarket, onSession }) => {
+  let socket = null
+  let closed = false
+  let retryDelay = 1000
+  let version = null
+  const stocks = new Map()
+
+  const applyMarket = (frame) => {
+    if (version !== null && frame.version <= version) return  // 已包含在本地快照中
+    if (frame.base !== null && frame.base !== version) {
+      socket.close()  // 漏帧：重连取完整快照
+      return
+    }
+    if (frame.base === null) stocks.clear()
+    for (const row of frame.rows) {
+      const stock = {}
+      frame.fields.forEach((field, i) => { stock[field] = row[i] })
+      stocks.set(stock.code, stock)
+    }
+    version = frame.version
+    if (onMarket) onMarket(Array.from(stocks.values()), frame.state)
+  }
+
+  const open = () => {
+    const params = new URLSearchParams({ topics: topics.join(',') })
+    if (sessionId) params.set('session_id', sessionId)
+    socket = new WebSocket(buildWsUrl(`/api/ws?${params}`))
+    socket.onopen = () => { retryDelay = 1000 }
+    socket.onmessage = (event) => {
+      if (event.data === 'pong') return
+      const frame = JSON.parse(event.data)
+      if (frame.type === 'market') applyMarket(frame)
+      else if (frame.type === 'session' && onSession) onSession(frame)
+    }
+    socket.onclose = () => {
+      version = null
+      if (closed) return
+      setTimeout(open, retryDelay)
+      retryDelay = Math.min(retryDelay * 2, 30000)
+    }
+  }
+
+  open()
+  return () => {
+    closed = true
+    if (socket) socket.close()
+  }
+}
@@ -17,7 +17,8 @@ export default defineConfig(({ command }) => ({
     proxy: {
       '/api': {
         target: 'http://localhost:8000',
-        changeOrigin: true
+        changeOrigin: true,
+        ws: true  // /api/ws 推送通道
       }
     }
   }